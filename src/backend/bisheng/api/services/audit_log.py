@@ -1,7 +1,5 @@
-import csv
 from datetime import datetime
-from tempfile import NamedTemporaryFile
-from typing import Any, List, Optional, Dict
+from typing import Any, List, Optional, Dict, Iterator, Tuple
 
 from loguru import logger
 
@@ -10,21 +8,18 @@ from bisheng.api.v1.schema.workflow import WorkflowEventType
 from bisheng.api.v1.schemas import resp_200
 from bisheng.common.dependencies.user_deps import UserPayload
 from bisheng.common.errcode.http_error import UnAuthorizedError
-from bisheng.common.services.config_service import settings
-from bisheng.core.storage.minio.minio_manager import get_minio_storage_sync
 from bisheng.database.models.assistant import AssistantDao, Assistant
 from bisheng.database.models.audit_log import AuditLog, SystemId, EventType, ObjectType, AuditLogDao
 from bisheng.database.models.flow import FlowDao, Flow, FlowType
 from bisheng.database.models.group import Group
 from bisheng.database.models.group_resource import GroupResourceDao, ResourceTypeEnum
-from bisheng.database.models.message import ChatMessageDao, LikedType
+from bisheng.database.models.message import ChatMessageDao
 from bisheng.database.models.role import Role
-from bisheng.database.models.session import MessageSessionDao, SensitiveStatus
+from bisheng.database.models.session import MessageSessionDao, SensitiveStatus, MessageSession
 from bisheng.database.models.user_group import UserGroupDao
 from bisheng.knowledge.domain.models.knowledge import KnowledgeDao, Knowledge
 from bisheng.tool.domain.models.gpts_tools import GptsToolsType
 from bisheng.user.domain.models.user import UserDao, User
-from bisheng.utils import generate_uuid
 
 
 # todo change to async or submit thread pool
@@ -534,17 +529,18 @@ class AuditLogService:
         return True, filter_flow_ids
 
     @classmethod
-    def get_session_list(cls, user: UserPayload, flow_ids: List[str], user_ids: List[int], group_ids: List[int],
-                         start_date: datetime, end_date: datetime,
-                         feedback: str, sensitive_status: int, page: int, page_size: int) -> (list, int):
+    def get_session_filters(cls, user: UserPayload, flow_ids: List[str], user_ids: List[int], group_ids: List[int],
+                            start_date: datetime, end_date: datetime, feedback: str,
+                            sensitive_status: int) -> Optional[Dict]:
+        """ build the MessageSessionDao filters, None means the user can see no session """
         flag, filter_flow_ids = cls.get_filter_flow_ids(user, flow_ids, group_ids)
         if not flag:
-            return [], 0
+            return None
         filter_status = []
         if sensitive_status:
             filter_status = [SensitiveStatus(sensitive_status)]
 
-        filters = {
+        return {
             'sensitive_status': filter_status,
             'feedback': feedback,
             'flow_ids': filter_flow_ids,
@@ -554,13 +550,10 @@ class AuditLogService:
             'flow_type': [FlowType.FLOW.value, FlowType.WORKFLOW.value,
                           FlowType.ASSISTANT.value]
         }
-        res = MessageSessionDao.filter_session(**filters, page=page, limit=page_size)
-        total = MessageSessionDao.filter_session_count(**filters)
 
-        res_users = []
-        for one in res:
-            res_users.append(one.user_id)
-        user_list = UserDao.get_user_by_ids(res_users)
+    @classmethod
+    def _to_app_chat_list(cls, user: UserPayload, res: List[MessageSession]) -> List[AppChatList]:
+        user_list = UserDao.get_user_by_ids(list({one.user_id for one in res}))
         user_map = {user.user_id: user.user_name for user in user_list}
         result = []
         for one in res:
@@ -570,74 +563,62 @@ class AuditLogService:
                                       copied_count=one.copied,
                                       user_name=user_map.get(one.user_id, one.user_id),
                                       user_groups=user.get_user_groups(one.user_id)))
+        return result
+
+    @classmethod
+    def get_session_list(cls, user: UserPayload, flow_ids: List[str], user_ids: List[int], group_ids: List[int],
+                         start_date: datetime, end_date: datetime,
+                         feedback: str, sensitive_status: int, page: int, page_size: int) -> (list, int):
+        filters = cls.get_session_filters(user, flow_ids, user_ids, group_ids, start_date, end_date, feedback,
+                                          sensitive_status)
+        if filters is None:
+            return [], 0
+        res = MessageSessionDao.filter_session(**filters, page=page, limit=page_size)
+        total = MessageSessionDao.filter_session_count(**filters)
+        return cls._to_app_chat_list(user, res), total
 
-        return result, total
+    @classmethod
+    def iter_session_messages(cls, user: UserPayload, filters: Dict, cursor: Optional[Tuple[datetime, str]] = None,
+                              page_size: int = 500) -> Iterator[Tuple[List[AppChatList], Tuple[datetime, str]]]:
+        """
+        iterate the sessions with their messages by keyset pagination, newest first
+        :param filters: result of get_session_filters
+        :param cursor: resume after this (create_time, chat_id)
+        :return: (one page of sessions, cursor of the last session in the page)
+        """
+        while True:
+            res = MessageSessionDao.filter_session_by_cursor(cursor=cursor, limit=page_size, **filters)
+            if not res:
+                break
+            cursor = (res[-1].create_time, res[-1].chat_id)
+            yield cls.get_chat_messages(cls._to_app_chat_list(user, res)), cursor
+            if len(res) < page_size:
+                break
 
     @classmethod
     def get_session_messages(cls, user: UserPayload, flow_ids: List[str], user_ids: List[int], group_ids: List[int],
                              start_date: datetime, end_date: datetime, feedback: str,
                              sensitive_status: int) -> List[AppChatList]:
-        page = 1
-        page_size = 50
+        filters = cls.get_session_filters(user, flow_ids, user_ids, group_ids, start_date, end_date, feedback,
+                                          sensitive_status)
+        if filters is None:
+            return []
         res = []
-        while True:
-            result, total = cls.get_session_list(user, flow_ids, user_ids, group_ids, start_date, end_date, feedback,
-                                                 sensitive_status, page, page_size)
-            if not result:
-                break
-            page += 1
-            res.extend(cls.get_chat_messages(result))
+        for chat_list, _ in cls.iter_session_messages(user, filters):
+            res.extend(chat_list)
         return res
 
     @classmethod
     def export_session_messages(cls, user: UserPayload, flow_ids: List[str], user_ids: List[int],
                                 group_ids: List[int],
                                 start_date: datetime, end_date: datetime,
-                                feedback: str, sensitive_status: int) -> str:
-        page = 1
-        page_size = 30
-        excel_data = [
-            ['Session ID', 'Application Name', 'Session creation time', 'Username', 'Message Role',
-             'Message sending time',
-             'Message text content',
-             'Like',
-             'Dislike', 'copy']]
-        bisheng_pro = settings.get_system_login_method().bisheng_pro
-        if bisheng_pro:
-            excel_data[0].append('Does it meet the content security review requirements?')
+                                feedback: str, sensitive_status: int, file_type: str = 'csv') -> str:
+        from bisheng.api.services.session_export import SessionExportParams, SessionMessageExporter
 
-        while True:
-            result, total = cls.get_session_list(user, flow_ids, user_ids, group_ids, start_date, end_date, feedback,
-                                                 sensitive_status, page, page_size)
-            if not result:
-                break
-            page += 1
-            chat_list = cls.get_chat_messages(result)
-            for chat in chat_list:
-                for message in chat.messages:
-                    message_data = [chat.chat_id, chat.flow_name, chat.create_time.strftime('%Y/%m/%d %H:%M:%S'),
-                                    chat.user_name,
-                                    'User' if message.category == 'question' else 'AI',
-                                    message.create_time.strftime('%Y/%m/%d %H:%M:%S'),
-                                    message.message,
-                                    'Yes' if message.liked == LikedType.LIKED.value else 'No',
-                                    'Yes' if message.liked == LikedType.DISLIKED.value else 'No',
-                                    'Yes' if message.copied else 'No']
-                    if bisheng_pro:
-                        message_data.append(
-                            'Yes' if message.sensitive_status == SensitiveStatus.VIOLATIONS.value else 'No')
-                    excel_data.append(message_data)
-
-        minio_client = get_minio_storage_sync()
-        tmp_object_name = f'tmp/session/export_{generate_uuid()}.csv'
-        with NamedTemporaryFile(mode='w', newline='') as tmp_file:
-            csv_writer = csv.writer(tmp_file)
-            csv_writer.writerows(excel_data)
-            tmp_file.seek(0)
-            minio_client.put_object_sync(object_name=tmp_object_name, file=tmp_file.name,
-                                         content_type='application/text',
-                                         bucket_name=minio_client.tmp_bucket)
-        return minio_client.get_share_link_sync(tmp_object_name, minio_client.tmp_bucket)
+        params = SessionExportParams(flow_ids=flow_ids, user_ids=user_ids, group_ids=group_ids,
+                                     start_date=start_date, end_date=end_date, feedback=feedback,
+                                     sensitive_status=sensitive_status, file_type=file_type)
+        return SessionMessageExporter(user, params).export()
 
     @classmethod
     def get_chat_messages(cls, chat_list: List[AppChatList]) -> List[AppChatList]:
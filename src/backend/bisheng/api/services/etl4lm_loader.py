@@ -1,22 +1,20 @@
 # flake8: noqa
 """Loads PDF with semantic splilter."""
+import asyncio
 import base64
 import logging
 import os
 from typing import List
 from uuid import uuid4
 
-import aiofiles
 import cv2
 import fitz
-import requests
 from PIL import Image
-from aiohttp import ClientTimeout
 from langchain_community.docstore.document import Document
 from langchain_community.document_loaders.pdf import BasePDFLoader
 
-from bisheng.core.external.http_client.http_client_manager import get_http_client
 from bisheng.core.storage.minio.minio_manager import get_minio_storage_sync
+from bisheng_langchain.document_loaders.parsers.partition_client import PartitionClient
 
 logger = logging.getLogger(__name__)
 
@@ -172,6 +170,9 @@ class Etl4lmLoader(BasePDFLoader):
             ocr_sdk_url: str = None,
             timeout: int = 60,
             knowledge_id: int = None,
+            shard_pages: int = 50,
+            max_concurrency: int = 4,
+            max_retries: int = 2,
             start: int = 0,
             n: int = None,
             verbose: bool = False,
@@ -192,49 +193,43 @@ class Etl4lmLoader(BasePDFLoader):
         self.extra_kwargs = kwargs
         self.partitions = None
         self.knowledge_id = knowledge_id
+        self.partition_client = PartitionClient(
+            unstructured_api_url,
+            timeout=timeout,
+            shard_pages=shard_pages,
+            max_workers=max_concurrency,
+            max_retries=max_retries,
+        )
         super().__init__(file_path)
 
-    def load(self) -> List[Document]:
-        """Load given path as pages."""
-        b64_data = base64.b64encode(open(self.file_path, "rb").read()).decode()
-        parameters = {"start": self.start, "n": self.n}
-        parameters.update(self.extra_kwargs)
+    def _partition_fields(self) -> dict:
         # TODO: add filter_page_header_footer into payload when elt4llm is ready.
-        payload = dict(
-            filename=os.path.basename(self.file_name),
-            b64_data=[b64_data],
+        return dict(
             mode="partition",
             force_ocr=self.force_ocr,
             enable_formula=self.enable_formular,
             ocr_sdk_url=self.ocr_sdk_url,
-            parameters=parameters,
+            parameters=dict(self.extra_kwargs),
         )
-        try:
-            resp = requests.post(
-                self.unstructured_api_url, headers=self.headers, json=payload, timeout=self.timemout
-            )
-        except requests.Timeout as e:
-            logger.error(f"Request to etl4lm API timed out: {e}")
-            raise Exception("etl4lm server timeout")
-        except Exception as e:
-            if str(e).find("Timeout") != -1:
-                logger.error(f"Request to etl4lm API timed out: {e}")
-                raise Exception("etl4lm server timeout")
-            raise e
-        if resp.status_code != 200:
-            raise Exception(
-                f"file partition {os.path.basename(self.file_name)} failed resp={resp.text}"
-            )
 
-        resp = resp.json()
-        if 200 != resp.get("status_code"):
-            logger.info(
-                f"file partition {os.path.basename(self.file_name)} error resp={resp}"
-            )
-            raise Exception(
-                f"file partition error {os.path.basename(self.file_name)} error resp={resp}"
-            )
-        partitions = resp["partitions"]
+    def load(self) -> List[Document]:
+        """Load given path as pages."""
+        # large pdfs are partitioned in page shards, the body is streamed from the file
+        resp = self.partition_client.partition(
+            self.file_path, self.file_name, self._partition_fields(), start=self.start, n=self.n
+        )
+        return self._parse_partition_resp(resp)
+
+    async def aload(self) -> List[Document]:
+        """Asynchronously load given path as pages."""
+        resp = await asyncio.to_thread(
+            self.partition_client.partition,
+            self.file_path, self.file_name, self._partition_fields(), start=self.start, n=self.n
+        )
+        return await asyncio.to_thread(self._parse_partition_resp, resp)
+
+    def _parse_partition_resp(self, resp: dict) -> List[Document]:
+        partitions = resp.get("partitions")
         if partitions:
             logger.info(f"content_from_partitions")
             self.partitions = partitions
@@ -264,72 +259,3 @@ class Etl4lmLoader(BasePDFLoader):
         metadata["source"] = self.file_name
         doc = Document(page_content=content, metadata=metadata)
         return [doc]
-
-    async def aload(self) -> List[Document]:
-        """Asynchronously load given path as pages."""
-        async with aiofiles.open(self.file_path, "rb") as f:
-            file_data = await f.read()
-        b64_data = base64.b64encode(file_data).decode()
-        parameters = {"start": self.start, "n": self.n}
-        parameters.update(self.extra_kwargs)
-        # TODO: add filter_page_header_footer into payload when elt4llm is ready.
-        payload = dict(
-            filename=os.path.basename(self.file_name),
-            b64_data=[b64_data],
-            mode="partition",
-            force_ocr=self.force_ocr,
-            enable_formula=self.enable_formular,
-            ocr_sdk_url=self.ocr_sdk_url,
-            parameters=parameters,
-        )
-        try:
-
-            http_client = await get_http_client()
-
-            resp = await http_client.post(
-                url=self.unstructured_api_url, headers=self.headers, body=payload,
-                timeout=ClientTimeout(total=self.timemout)
-            )
-        except Exception as e:
-            if str(e).find("Timeout") != -1:
-                logger.error(f"Request to etl4lm API timed out: {e}")
-                raise Exception("etl4lm server timeout")
-            raise e
-        if (resp.status_code != 200) or (resp.body and resp.body.get("status_code") != 200):
-            logger.info(
-                f"file partition {os.path.basename(self.file_name)} error resp={resp}"
-            )
-            raise Exception(
-                f"file partition error {os.path.basename(self.file_name)} error resp={resp}"
-            )
-
-        partitions = resp.body.get("partitions")
-        if partitions:
-            logger.info(f"content_from_partitions")
-            self.partitions = partitions
-            content, metadata = merge_partitions(
-                self.file_path, partitions, self.knowledge_id
-            )
-        elif resp.body.get("text"):
-            logger.info(f"content_from_text")
-            content = resp.body["text"]
-            metadata = {
-                "bboxes": [],
-                "pages": [],
-                "indexes": [],
-                "types": [],
-            }
-        else:
-            logger.warning(f"content_is_empty resp={resp.body}")
-            content = ""
-            metadata = {}
-
-        logger.info(f'unstruct_return code={resp.body.get("status_code")}')
-
-        if resp.body.get("b64_pdf"):
-            with open(self.file_path, "wb") as f:
-                f.write(base64.b64decode(resp.body["b64_pdf"]))
-
-        metadata["source"] = self.file_name
-        doc = Document(page_content=content, metadata=metadata)
-        return [doc]
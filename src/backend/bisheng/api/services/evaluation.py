@@ -2,10 +2,11 @@ import asyncio
 import io
 import json
 import os
+import time
 from collections import defaultdict
 from copy import deepcopy
 from io import BytesIO
-from typing import List
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
 import numpy as np
 import pandas as pd
@@ -23,8 +24,10 @@ from bisheng.api.utils import build_flow, build_input_keys_response
 from bisheng.api.v1.schema.workflow import WorkflowEventType
 from bisheng.api.v1.schemas import (UnifiedResponseModel, resp_200)
 from bisheng.common.dependencies.user_deps import UserPayload
+from bisheng.common.services.config_service import settings
 from bisheng.core.cache import InMemoryCache
 from bisheng.core.cache.redis_manager import get_redis_client_sync
+from bisheng.core.config.settings import EvaluationConf
 from bisheng.core.storage.minio.minio_manager import get_minio_storage_sync
 from bisheng.database.models.assistant import AssistantDao
 from bisheng.database.models.evaluation import (Evaluation, EvaluationDao, ExecType, EvaluationTaskStatus)
@@ -104,7 +107,12 @@ class EvaluationService:
             if one.status != EvaluationTaskStatus.running.value:
                 evaluation_item['progress'] = f'100%'
             elif redis_client.exists(EvaluationService.get_redis_key(one.id)):
-                evaluation_item['progress'] = f'{redis_client.get(EvaluationService.get_redis_key(one.id))}%'
+                progress = redis_client.get(EvaluationService.get_redis_key(one.id))
+                if isinstance(progress, dict):
+                    # answered and scored rows, throughput (questions per minute) and eta (seconds)
+                    evaluation_item['progress_detail'] = progress
+                    progress = progress['progress']
+                evaluation_item['progress'] = f'{progress}%'
             else:
                 evaluation_item['progress'] = f'0%'
 
@@ -122,6 +130,9 @@ class EvaluationService:
             raise HTTPException(status_code=404, detail='Evaluation not found')
 
         EvaluationDao.delete_evaluation(evaluation)
+        redis_client = get_redis_client_sync()
+        redis_client.delete(cls.get_redis_key(evaluation_id))
+        redis_client.delete(cls.get_checkpoint_key(evaluation_id))
         return resp_200()
 
     @classmethod
@@ -190,6 +201,14 @@ class EvaluationService:
     def get_redis_key(cls, evaluation_id: int):
         return f'evaluation_task_progress_{evaluation_id}'
 
+    @classmethod
+    def get_checkpoint_key(cls, evaluation_id: int):
+        return f'evaluation_task_checkpoint_{evaluation_id}'
+
+    @classmethod
+    def get_lock_key(cls, evaluation_id: int):
+        return f'evaluation_task_lock_{evaluation_id}'
+
     @classmethod
     async def get_input_keys(cls, flow_id: str, version_id: int):
         artifacts = {}
@@ -296,19 +315,107 @@ def execute_workflow_get_answer(workflow_info: FlowVersion, evaluation: Evaluati
         raise Exception(f"workflow status is unknown: {status_info}")
 
 
-async def add_evaluation_task(evaluation_id: int):
-    evaluation = EvaluationDao.get_one_evaluation(evaluation_id=evaluation_id)
-    if not evaluation:
-        return
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'{type(value)} is not JSON serializable')
+
+
+# Questions of one target running at the same time in this process, shared by its evaluations
+_target_limits: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+# Resumed evaluations, referenced until they finish
+_resumed_tasks: Set[asyncio.Task] = set()
+
+
+class EvaluationProgress(object):
+    """ Progress of one run, the rows restored from the checkpoint do not count for the rates """
+
+    def __init__(self, total: int, answered: int, scored: int):
+        self.total = total
+        self.answered = answered
+        self.scored = scored
+        self._start_time = time.monotonic()
+        self._start_answered = answered
+        self._start_scored = scored
+
+    def to_dict(self) -> Dict:
+        elapsed = time.monotonic() - self._start_time
+        answer_rate = (self.answered - self._start_answered) / elapsed if elapsed else 0
+        score_rate = (self.scored - self._start_scored) / elapsed if elapsed else 0
+        remaining_answers = self.total - self.answered
+        remaining_scores = self.total - self.scored
+        eta = None
+        if (answer_rate or not remaining_answers) and (score_rate or not remaining_scores):
+            eta = round(max(remaining_answers / answer_rate if remaining_answers else 0,
+                            remaining_scores / score_rate if remaining_scores else 0))
+        return {
+            # answering is 80% of the work, scoring the rest
+            'progress': min(99, round((self.answered * 80 + self.scored * 20) / self.total)),
+            'total': self.total,
+            'answered': self.answered,
+            'scored': self.scored,
+            'throughput': round(answer_rate * 60, 2),  # questions per minute
+            'eta': eta,  # seconds
+        }
 
-    redis_key = EvaluationService.get_redis_key(evaluation_id)
-    redis_client = get_redis_client_sync()
-    try:
-        file_data = EvaluationService.read_csv_file(evaluation.file_path)
-        csv_data = EvaluationService.parse_csv(file_data)
-        progress_increment = 80 / len(csv_data)
-        current_progress = 0
 
+class EvaluationRunner(object):
+    """
+    Runs one evaluation. Questions are answered with bounded concurrency per target, answers and scores are
+    checkpointed in redis so an interrupted evaluation only runs the missing rows, and batches of answers are
+    scored while the other questions are still running.
+    """
+
+    def __init__(self, evaluation: Evaluation, conf: EvaluationConf = None, redis_client=None):
+        self.evaluation = evaluation
+        self.conf = conf or settings.evaluation_conf
+        self.redis_client = redis_client or get_redis_client_sync()
+        self.progress_key = EvaluationService.get_redis_key(evaluation.id)
+        self.checkpoint_key = EvaluationService.get_checkpoint_key(evaluation.id)
+        self.lock_key = EvaluationService.get_lock_key(evaluation.id)
+        self.rows: List[Dict] = []
+        self.answers: Dict[int, Optional[str]] = {}
+        self.scores: Dict[int, Dict] = {}
+        self.progress: Optional[EvaluationProgress] = None
+
+    def acquire(self) -> bool:
+        """ only one process runs an evaluation """
+        return self.redis_client.setNx(self.lock_key, 1, expiration=self.conf.lock_ttl)
+
+    def release(self):
+        self.redis_client.delete(self.lock_key)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(max(1, self.conf.lock_ttl // 3))
+            self.redis_client.expire_key(self.lock_key, self.conf.lock_ttl)
+
+    def _load_checkpoint(self):
+        for field, value in self.redis_client.hgetall(self.checkpoint_key).items():
+            kind, _, index = (field.decode() if isinstance(field, bytes) else field).partition(':')
+            if kind == 'answer':
+                self.answers[int(index)] = json.loads(value)
+            elif kind == 'score':
+                self.scores[int(index)] = json.loads(value)
+
+    def _save_checkpoint(self, field: str, value: Any):
+        self.redis_client.hset(self.checkpoint_key, field, json.dumps(value, ensure_ascii=False, default=_json_default),
+                               expiration=self.conf.checkpoint_expire)
+
+    def _report(self):
+        self.redis_client.set(self.progress_key, self.progress.to_dict())
+
+    def _target_limit(self) -> asyncio.Semaphore:
+        key = (self.evaluation.exec_type, self.evaluation.unique_id)
+        if key not in _target_limits:
+            _target_limits[key] = asyncio.Semaphore(max(1, self.conf.concurrency))
+        return _target_limits[key]
+
+    async def _prepare_answerer(self) -> Callable[[], Callable[[str], Awaitable[Optional[str]]]]:
+        """ returns a factory of the answer function of one worker """
+        evaluation = self.evaluation
         if evaluation.exec_type == ExecType.FLOW.value:
             flow_version = FlowVersionDao.get_version_by_id(version_id=evaluation.version)
             if not flow_version:
@@ -319,52 +426,167 @@ async def add_evaluation_task(evaluation_id: int):
 
             logger.info(f'evaluation task run flow input_keys: {input_keys} first_key: {first_key}')
 
-            for index, one in enumerate(csv_data):
+            async def flow_answer(question: str) -> Optional[str]:
                 input_dict = deepcopy(input_keys)
-                input_dict[first_key] = one.get('question')
+                input_dict[first_key] = question
                 flow_index, flow_result = await FlowService.exec_flow_node(
                     inputs=input_dict,
                     tweaks={},
                     index=0,
                     versions=[flow_version])
-                one["answer"] = flow_result.get(flow_version.id)
-                current_progress += progress_increment
-                redis_client.set(redis_key, round(current_progress))
+                return flow_result.get(flow_version.id)
+
+            return lambda: flow_answer
 
         elif evaluation.exec_type == ExecType.ASSISTANT.value:
             assistant = await AssistantDao.aget_one_assistant(evaluation.unique_id)
             if not assistant:
                 raise Exception("Assistant not found")
-            gpts_agent = AssistantAgent(assistant_info=assistant, chat_id="", invoke_user_id=evaluation.user_id)
-            await gpts_agent.init_assistant()
-            for index, one in enumerate(csv_data):
-                messages = await gpts_agent.run(one.get('question'))
-                if len(messages):
-                    one["answer"] = messages[-1].content
-                current_progress += progress_increment
-                redis_client.set(redis_key, round(current_progress))
+
+            def assistant_answerer():
+                # every worker runs its own agent
+                gpts_agent = None
+
+                async def assistant_answer(question: str) -> Optional[str]:
+                    nonlocal gpts_agent
+                    if gpts_agent is None:
+                        gpts_agent = AssistantAgent(assistant_info=assistant, chat_id="",
+                                                    invoke_user_id=evaluation.user_id)
+                        await gpts_agent.init_assistant()
+                    messages = await gpts_agent.run(question)
+                    return messages[-1].content if len(messages) else None
+
+                return assistant_answer
+
+            return assistant_answerer
+
         elif evaluation.exec_type == ExecType.WORKFLOW.value:
             workflow_info = FlowVersionDao.get_version_by_id(version_id=evaluation.version)
             if not workflow_info or workflow_info.flow_id != evaluation.unique_id:
                 raise Exception("workflow version info not found")
-            for index, one in enumerate(csv_data):
-                one["answer"] = await asyncio.to_thread(execute_workflow_get_answer, workflow_info, evaluation,
-                                                        one.get('question', ""))
 
-        _llm = await LLMService.get_evaluation_llm_object(evaluation.user_id)
-        llm = LangchainLLM(_llm)
+            async def workflow_answer(question: str) -> Optional[str]:
+                return await asyncio.to_thread(execute_workflow_get_answer, workflow_info, evaluation, question)
+
+            return lambda: workflow_answer
+
+        raise Exception(f"unknown exec type: {evaluation.exec_type}")
+
+    async def _answer_worker(self, answer: Callable[[str], Awaitable[Optional[str]]], answer_queue: asyncio.Queue,
+                             score_queue: asyncio.Queue):
+        limit = self._target_limit()
+        while not answer_queue.empty():
+            index = answer_queue.get_nowait()
+            async with limit:
+                result = await answer(self.rows[index].get('question', ""))
+            self.answers[index] = result
+            self._save_checkpoint(f'answer:{index}', result)
+            self.progress.answered += 1
+            self._report()
+            score_queue.put_nowait(index)
+
+    def _evaluate_batch(self, batch: List[int], llm) -> List[Dict]:
+        """ scores a batch of answered rows, runs in a thread """
         data_samples = {
-            "question": [one.get('question') for one in csv_data],
-            "answer": [one.get('answer') for one in csv_data],
-            "ground_truths": [[one.get('ground_truth')] for one in csv_data]
+            "question": [self.rows[index].get('question') for index in batch],
+            "answer": [self.answers[index] for index in batch],
+            "ground_truths": [[self.rows[index].get('ground_truth')] for index in batch]
         }
-
         dataset = Dataset.from_dict(data_samples)
-        answer_correctness_bisheng = AnswerCorrectnessBisheng(llm=llm, human_prompt=evaluation.prompt)
-        score = await asyncio.to_thread(evaluate, dataset, [answer_correctness_bisheng])
-        df = score.to_pandas()
-        result = df.to_dict(orient="list")
-        logger.debug(f'evaluation id = {evaluation_id} result: {result}')
+        answer_correctness_bisheng = AnswerCorrectnessBisheng(llm=llm, human_prompt=self.evaluation.prompt)
+        score = evaluate(dataset, [answer_correctness_bisheng])
+        return score.to_pandas().to_dict(orient="records")
+
+    async def _score_batch(self, batch: List[int], llm, limit: asyncio.Semaphore):
+        async with limit:
+            records = await asyncio.to_thread(self._evaluate_batch, batch, llm)
+        for index, record in zip(batch, records):
+            self.scores[index] = record
+            self._save_checkpoint(f'score:{index}', record)
+        self.progress.scored += len(batch)
+        self._report()
+
+    async def _score_loop(self, score_queue: asyncio.Queue, llm):
+        """ scores the answers as they arrive, the queue ends with None """
+        limit = asyncio.Semaphore(max(1, self.conf.score_concurrency))
+        batch_size = max(1, self.conf.score_batch_size)
+        tasks: List[asyncio.Task] = []
+        batch: List[int] = []
+        finished = False
+        try:
+            while not finished:
+                index = await score_queue.get()
+                if index is None:
+                    finished = True
+                else:
+                    batch.append(index)
+                if batch and (finished or len(batch) >= batch_size):
+                    tasks.append(asyncio.create_task(self._score_batch(batch, llm, limit)))
+                    batch = []
+                # a failed batch fails the evaluation without waiting for the other answers
+                for task in [one for one in tasks if one.done()]:
+                    task.result()
+                    tasks.remove(task)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _answer_all(self, answerer, answer_queue: asyncio.Queue, score_queue: asyncio.Queue):
+        workers = [asyncio.create_task(self._answer_worker(answerer(), answer_queue, score_queue))
+                   for _ in range(min(max(1, self.conf.concurrency), answer_queue.qsize()))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+        score_queue.put_nowait(None)
+
+    def _load_rows(self) -> List[Dict]:
+        return EvaluationService.parse_csv(EvaluationService.read_csv_file(self.evaluation.file_path))
+
+    async def _scoring_llm(self):
+        _llm = await LLMService.get_evaluation_llm_object(self.evaluation.user_id)
+        return LangchainLLM(_llm)
+
+    async def _execute(self):
+        self.rows = self._load_rows()
+        self._load_checkpoint()
+        # marks the evaluation as resumable
+        self._save_checkpoint('total', len(self.rows))
+        if self.answers:
+            logger.info(f'evaluation task resume id={self.evaluation.id} answered={len(self.answers)} '
+                        f'scored={len(self.scores)} total={len(self.rows)}')
+        self.progress = EvaluationProgress(len(self.rows), len(self.answers), len(self.scores))
+        self._report()
+
+        answer_queue = asyncio.Queue()
+        for index in range(len(self.rows)):
+            if index not in self.answers:
+                answer_queue.put_nowait(index)
+        score_queue = asyncio.Queue()
+        for index in sorted(self.answers):
+            if index not in self.scores:
+                score_queue.put_nowait(index)
+
+        answerer = await self._prepare_answerer() if not answer_queue.empty() else None
+        llm = await self._scoring_llm()
+
+        tasks = [asyncio.create_task(self._answer_all(answerer, answer_queue, score_queue)),
+                 asyncio.create_task(self._score_loop(score_queue, llm))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _finish(self):
+        """ writes the result file of the scored rows """
+        result = defaultdict(list)
+        for index in range(len(self.rows)):
+            for key, value in self.scores[index].items():
+                result[key].append(value)
+        logger.debug(f'evaluation id = {self.evaluation.id} result: {dict(result)}')
 
         question = result.get('question', [])
         columns = [
@@ -406,16 +628,58 @@ async def add_evaluation_task(evaluation_id: int):
         df = pd.DataFrame(data=row_list, columns=[one[1] for one in columns])
         result_file_path = EvaluationService.upload_result_file(df)
 
-        evaluation.result_score = total_dict
-        evaluation.status = EvaluationTaskStatus.success.value
-        evaluation.result_file_path = result_file_path
-        EvaluationDao.update_evaluation(evaluation=evaluation)
-        redis_client.delete(redis_key)
-        logger.info(f'evaluation task success id={evaluation_id}')
-
-    except Exception as e:
-        logger.exception(f'evaluation task failed id={evaluation_id} {str(e)}')
-        evaluation.status = EvaluationTaskStatus.failed.value
-        evaluation.description = str(e)[-500:]  # Limit the length of the error description to avoid being too long
-        EvaluationDao.update_evaluation(evaluation=evaluation)
-        redis_client.delete(redis_key)
+        self.evaluation.result_score = total_dict
+        self.evaluation.status = EvaluationTaskStatus.success.value
+        self.evaluation.result_file_path = result_file_path
+        EvaluationDao.update_evaluation(evaluation=self.evaluation)
+
+    async def run(self):
+        """ the lock must be acquired, it is released when the run ends or is cancelled """
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            if self.evaluation.status != EvaluationTaskStatus.running.value:
+                # a manual re-run of a failed evaluation resumes from its checkpoint
+                self.evaluation.status = EvaluationTaskStatus.running.value
+                self.evaluation.description = ''
+                EvaluationDao.update_evaluation(evaluation=self.evaluation)
+            await self._execute()
+            self._finish()
+            self.redis_client.delete(self.progress_key)
+            self.redis_client.delete(self.checkpoint_key)
+            logger.info(f'evaluation task success id={self.evaluation.id}')
+        except Exception as e:
+            logger.exception(f'evaluation task failed id={self.evaluation.id} {str(e)}')
+            self.evaluation.status = EvaluationTaskStatus.failed.value
+            self.evaluation.description = str(e)[-500:]  # Limit the length of the error description to avoid being too long
+            EvaluationDao.update_evaluation(evaluation=self.evaluation)
+            self.redis_client.delete(self.progress_key)
+            # the checkpoint expires with checkpoint_expire, a manual re-run only runs the missing rows
+        finally:
+            # a cancelled run keeps its checkpoint and is resumed by the next process
+            heartbeat.cancel()
+            self.release()
+
+
+async def add_evaluation_task(evaluation_id: int):
+    evaluation = EvaluationDao.get_one_evaluation(evaluation_id=evaluation_id)
+    if not evaluation:
+        return
+
+    runner = EvaluationRunner(evaluation)
+    if not runner.acquire():
+        logger.info(f'evaluation task id={evaluation_id} is running in another process')
+        return
+    await runner.run()
+
+
+async def resume_evaluation_tasks():
+    """ Resume the evaluations interrupted by a stopped process, the checkpointed rows are not run again """
+    # the lock of a running evaluation is refreshed, wait until the locks of stopped processes expired
+    await asyncio.sleep(settings.evaluation_conf.lock_ttl)
+    redis_client = get_redis_client_sync()
+    for evaluation in EvaluationDao.get_running_evaluations():
+        if not redis_client.exists(EvaluationService.get_checkpoint_key(evaluation.id)):
+            continue
+        task = asyncio.create_task(add_evaluation_task(evaluation.id))
+        _resumed_tasks.add(task)
+        task.add_done_callback(_resumed_tasks.discard)
@@ -320,11 +320,14 @@ class KnowledgeService(KnowledgeUtils):
                 # Judgingmilvus Are there any moreentity
                 if vector_client.col.is_empty:
                     vector_client.col.drop()
+            # after the drop, a handle cached in between would point to the dropped collection
+            KnowledgeRag.invalidate_vectorstore(knowledge.collection_name)
         if del_es:
             # <g id="Bold">Medical Treatment:</g> es
             index_name = knowledge.index_name or knowledge.collection_name  # Compatible with older versions
             es_client = decide_vectorstores(index_name, "ElasticKeywordsSearch", embeddings)
             res = es_client.client.indices.delete(index=index_name, ignore=[400, 404])
+            KnowledgeRag.invalidate_vectorstore(index_name)
             logger.info(f"act=delete_es index={index_name} res={res}")
 
     @classmethod
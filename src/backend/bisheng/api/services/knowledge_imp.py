@@ -49,6 +49,7 @@ from bisheng.core.cache.utils import file_download
 from bisheng.core.database import get_sync_db_session
 from bisheng.core.logger import trace_id_var
 from bisheng.core.storage.minio.minio_manager import get_minio_storage_sync, get_minio_storage
+from bisheng.core.storage.minio.upload_manager import ObjectUploadManager
 from bisheng.interface.embeddings.custom import FakeEmbedding
 from bisheng.interface.importing.utils import import_vectorstore
 from bisheng.interface.initialize.loading import instantiate_vectorstore
@@ -217,20 +218,22 @@ class KnowledgeUtils:
         return None
 
 
+def _list_image_objects(local_image_dir, knowledge_id, doc_id) -> List[tuple]:
+    image_dir = KnowledgeUtils.get_knowledge_file_image_dir(doc_id, knowledge_id)
+    return [(f"{local_image_dir}/{file_name}", f"{image_dir}/{file_name}") for file_name in os.listdir(local_image_dir)]
+
+
 def put_images_to_minio(local_image_dir, knowledge_id, doc_id):
     if not os.path.exists(local_image_dir):
         return
 
     minio_client = get_minio_storage_sync()
 
-    files = [f for f in os.listdir(local_image_dir)]
-    for file_name in files:
-        local_file_name = f"{local_image_dir}/{file_name}"
-        object_name = f"{KnowledgeUtils.get_knowledge_file_image_dir(doc_id, knowledge_id)}/{file_name}"
-        with open(local_file_name, "rb") as file_obj:
-            minio_client.put_object_sync(
-                object_name=object_name, file=file_obj.read(), bucket_name=minio_client.bucket
-            )
+    files = _list_image_objects(local_image_dir, knowledge_id, doc_id)
+    stats = ObjectUploadManager(minio_client).upload_files(files, bucket_name=minio_client.bucket)
+    logger.info(f"put_images_to_minio doc_id={doc_id} {stats}")
+    # a missing image breaks the links in the parsed content, fail the file like a failed upload did
+    stats.raise_for_failed()
 
 
 async def async_images_to_minio(local_image_dir, knowledge_id, doc_id):
@@ -239,14 +242,10 @@ async def async_images_to_minio(local_image_dir, knowledge_id, doc_id):
 
     minio_client = await get_minio_storage()
 
-    files = [f for f in os.listdir(local_image_dir)]
-    for file_name in files:
-        local_file_name = f"{local_image_dir}/{file_name}"
-        object_name = f"{KnowledgeUtils.get_knowledge_file_image_dir(doc_id, knowledge_id)}/{file_name}"
-        async with aiofiles.open(local_file_name, "rb") as file_obj:
-            await minio_client.put_object(
-                object_name=object_name, file=await file_obj.read(), bucket_name=minio_client.bucket
-            )
+    files = _list_image_objects(local_image_dir, knowledge_id, doc_id)
+    stats = await ObjectUploadManager(minio_client).aupload_files(files, bucket_name=minio_client.bucket)
+    logger.info(f"async_images_to_minio doc_id={doc_id} {stats}")
+    stats.raise_for_failed()
 
 
 def process_file_task(
@@ -920,6 +919,9 @@ def read_chunk_text(
                     force_ocr=bool(force_ocr),
                     enable_formular=bool(enable_formula),
                     timeout=etl4lm_settings.timeout,
+                    shard_pages=etl4lm_settings.shard_pages,
+                    max_concurrency=etl4lm_settings.max_concurrency,
+                    max_retries=etl4lm_settings.max_retries,
                     filter_page_header_footer=bool(filter_page_header_footer),
                     knowledge_id=knowledge_id,
                 )
@@ -1124,6 +1126,9 @@ async def async_read_chunk_text(
                 force_ocr=bool(force_ocr),
                 enable_formular=bool(enable_formula),
                 timeout=etl4lm_settings.timeout,
+                shard_pages=etl4lm_settings.shard_pages,
+                max_concurrency=etl4lm_settings.max_concurrency,
+                max_retries=etl4lm_settings.max_retries,
                 filter_page_header_footer=bool(filter_page_header_footer),
                 knowledge_id=knowledge_id,
             )
@@ -1285,6 +1290,7 @@ def delete_vector(collection_name: str, partition_key: str):
                 pass
             else:
                 res = vectore_client.col.drop(timeout=1)
+                KnowledgeRag.invalidate_vectorstore(collection_name)
                 logger.info('act=delete_milvus col={} res={}', collection_name, res)
     except Exception as e:
         # Handle situations where a collection does not exist or where there are other errors
@@ -1299,6 +1305,7 @@ def delete_es(index_name: str):
 
         if esvectore_client:
             res = esvectore_client.client.indices.delete(index=index_name, ignore=[400, 404])
+            KnowledgeRag.invalidate_vectorstore(index_name)
             logger.info(f'act=delete_es index={index_name} res={res}')
     except Exception as e:
         # Dealing with non-existent indexes or other errors
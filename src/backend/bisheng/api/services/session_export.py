@@ -0,0 +1,252 @@
+import csv
+import io
+from datetime import datetime
+from enum import Enum
+from tempfile import NamedTemporaryFile
+from typing import Iterator, List, Literal, Optional, Tuple
+
+from loguru import logger
+from openpyxl import Workbook
+from pydantic import BaseModel, Field
+
+from bisheng.api.services.audit_log import AuditLogService
+from bisheng.api.v1.schema.chat_schema import AppChatList
+from bisheng.common.dependencies.user_deps import UserPayload
+from bisheng.common.services.config_service import settings
+from bisheng.core.cache.redis_manager import get_redis_client_sync
+from bisheng.core.storage.minio.minio_manager import get_minio_storage_sync
+from bisheng.database.models.message import LikedType
+from bisheng.database.models.session import SensitiveStatus
+from bisheng.utils import generate_uuid
+
+
+class SessionExportParams(BaseModel):
+    flow_ids: List[str] = Field(default_factory=list)
+    user_ids: List[int] = Field(default_factory=list)
+    group_ids: List[int] = Field(default_factory=list)
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    feedback: Optional[str] = None
+    sensitive_status: Optional[int] = None
+    file_type: Literal['csv', 'xlsx'] = 'csv'
+
+
+class SessionExportStatus(str, Enum):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCESS = 'success'
+    FAILED = 'failed'
+
+
+class SessionExportJob(BaseModel):
+    """ state of a background export, saved in redis after every uploaded part """
+    job_id: str
+    user_id: int
+    user_name: str
+    params: SessionExportParams
+    object_name: str
+    status: SessionExportStatus = SessionExportStatus.PENDING
+    cursor: Optional[Tuple[datetime, str]] = Field(default=None, description='last exported (create_time, chat_id)')
+    parts: List[str] = Field(default_factory=list, description='uploaded part objects, in order')
+    sessions: int = 0
+    rows: int = 0
+    url: Optional[str] = None
+    error: Optional[str] = None
+    update_time: datetime = Field(default_factory=datetime.now)
+
+
+class SessionExportJobManager:
+    key_prefix = 'audit:session_export:'
+    expire = 7 * 86400
+
+    @classmethod
+    def create(cls, user: UserPayload, params: SessionExportParams) -> SessionExportJob:
+        job = SessionExportJob(job_id=generate_uuid(), user_id=user.user_id, user_name=user.user_name,
+                               params=params, object_name=SessionMessageExporter.new_object_name(params.file_type))
+        cls.save(job)
+        return job
+
+    @classmethod
+    def get(cls, job_id: str) -> Optional[SessionExportJob]:
+        return get_redis_client_sync().get(f'{cls.key_prefix}{job_id}')
+
+    @classmethod
+    def save(cls, job: SessionExportJob):
+        job.update_time = datetime.now()
+        get_redis_client_sync().set(f'{cls.key_prefix}{job.job_id}', job, expiration=cls.expire)
+
+
+class SessionMessageExporter:
+    """
+    Export session messages with constant memory.
+
+    Sessions are read by keyset pagination on (create_time, chat_id). CSV rows are written into an in-memory
+    buffer which is uploaded as a part object every `part_size` bytes, and the parts are composed into the
+    final object on the server side. With a job, the cursor and uploaded parts are saved after every part,
+    so a failed export continues from the last part instead of starting over.
+    XLSX is written by the openpyxl write only mode into a temp file and cannot resume from a part.
+    """
+    page_size = 500
+    # minio requires every part except the last one to be at least 5MB
+    part_size = 8 * 1024 * 1024
+    # max rows of one xlsx sheet
+    sheet_max_rows = 1048576
+
+    def __init__(self, user: UserPayload, params: SessionExportParams, job: Optional[SessionExportJob] = None):
+        self.user = user
+        self.params = params
+        self.job = job
+        self.minio_client = get_minio_storage_sync()
+        self.bisheng_pro = settings.get_system_login_method().bisheng_pro
+
+    @staticmethod
+    def new_object_name(file_type: str) -> str:
+        return f'tmp/session/export_{generate_uuid()}.{file_type}'
+
+    def header(self) -> List[str]:
+        res = ['Session ID', 'Application Name', 'Session creation time', 'Username', 'Message Role',
+               'Message sending time',
+               'Message text content',
+               'Like',
+               'Dislike', 'copy']
+        if self.bisheng_pro:
+            res.append('Does it meet the content security review requirements?')
+        return res
+
+    def message_rows(self, chat_list: List[AppChatList]) -> Iterator[List]:
+        for chat in chat_list:
+            for message in chat.messages:
+                message_data = [chat.chat_id, chat.flow_name, chat.create_time.strftime('%Y/%m/%d %H:%M:%S'),
+                                chat.user_name,
+                                'User' if message.category == 'question' else 'AI',
+                                message.create_time.strftime('%Y/%m/%d %H:%M:%S'),
+                                message.message,
+                                'Yes' if message.liked == LikedType.LIKED.value else 'No',
+                                'Yes' if message.liked == LikedType.DISLIKED.value else 'No',
+                                'Yes' if message.copied else 'No']
+                if self.bisheng_pro:
+                    message_data.append(
+                        'Yes' if message.sensitive_status == SensitiveStatus.VIOLATIONS.value else 'No')
+                yield message_data
+
+    def iter_pages(self, cursor: Optional[Tuple[datetime, str]] = None) \
+            -> Iterator[Tuple[List[AppChatList], Tuple[datetime, str]]]:
+        filters = AuditLogService.get_session_filters(self.user, self.params.flow_ids, self.params.user_ids,
+                                                      self.params.group_ids, self.params.start_date,
+                                                      self.params.end_date, self.params.feedback,
+                                                      self.params.sensitive_status)
+        if filters is None:
+            return
+        yield from AuditLogService.iter_session_messages(self.user, filters, cursor=cursor, page_size=self.page_size)
+
+    def export(self) -> str:
+        """ export all messages and return the share link of the file """
+        object_name = self.job.object_name if self.job else self.new_object_name(self.params.file_type)
+        if self.params.file_type == 'xlsx':
+            self._export_xlsx(object_name)
+        else:
+            self._export_csv(object_name)
+        return self.minio_client.get_share_link_sync(object_name, self.minio_client.tmp_bucket)
+
+    def _checkpoint(self, cursor: Optional[Tuple[datetime, str]], sessions: int, rows: int, parts: List[str]):
+        if not self.job:
+            return
+        self.job.cursor = cursor
+        self.job.sessions = sessions
+        self.job.rows = rows
+        self.job.parts = list(parts)
+        SessionExportJobManager.save(self.job)
+
+    def _upload_part(self, object_name: str, parts: List[str], buffer: io.StringIO):
+        part_name = f'{object_name}.part{len(parts):05d}'
+        self.minio_client.put_object_sync(object_name=part_name, file=buffer.getvalue().encode('utf-8'),
+                                          content_type='application/text',
+                                          bucket_name=self.minio_client.tmp_bucket)
+        parts.append(part_name)
+
+    def _export_csv(self, object_name: str):
+        cursor, sessions, rows, parts = None, 0, 0, []
+        if self.job and self.job.parts:
+            cursor, sessions, rows, parts = self.job.cursor, self.job.sessions, self.job.rows, list(self.job.parts)
+            logger.info(f'resume session export job={self.job.job_id} parts={len(parts)} rows={rows}')
+
+        buffer = io.StringIO()
+        csv_writer = csv.writer(buffer)
+        if not parts:
+            csv_writer.writerow(self.header())
+        # only upload at page boundaries, so the saved cursor always matches the uploaded parts
+        for chat_list, cursor in self.iter_pages(cursor):
+            sessions += len(chat_list)
+            for row in self.message_rows(chat_list):
+                csv_writer.writerow(row)
+                rows += 1
+            if buffer.tell() >= self.part_size:
+                self._upload_part(object_name, parts, buffer)
+                buffer.seek(0)
+                buffer.truncate()
+                self._checkpoint(cursor, sessions, rows, parts)
+        if buffer.tell() or not parts:
+            self._upload_part(object_name, parts, buffer)
+            self._checkpoint(cursor, sessions, rows, parts)
+
+        bucket_name = self.minio_client.tmp_bucket
+        if len(parts) == 1:
+            self.minio_client.copy_object_sync(source_bucket=bucket_name, source_object=parts[0],
+                                               dest_bucket=bucket_name, dest_object=object_name)
+        else:
+            self.minio_client.compose_object_sync(bucket_name=bucket_name, object_name=object_name,
+                                                  source_objects=parts)
+        for one in parts:
+            try:
+                self.minio_client.remove_object_sync(bucket_name=bucket_name, object_name=one)
+            except Exception as e:
+                logger.warning(f'remove session export part {one} error: {e}')
+
+    def _export_xlsx(self, object_name: str):
+        workbook = Workbook(write_only=True)
+        header = self.header()
+        sheet, sheet_rows = None, self.sheet_max_rows
+        sessions, rows, cursor = 0, 0, None
+        for chat_list, cursor in self.iter_pages():
+            sessions += len(chat_list)
+            for row in self.message_rows(chat_list):
+                if sheet_rows >= self.sheet_max_rows:
+                    sheet = workbook.create_sheet()
+                    sheet.append(header)
+                    sheet_rows = 1
+                sheet.append(row)
+                sheet_rows += 1
+                rows += 1
+            self._checkpoint(cursor, sessions, rows, [])
+        if sheet is None:
+            workbook.create_sheet().append(header)
+
+        with NamedTemporaryFile(suffix='.xlsx') as tmp_file:
+            workbook.save(tmp_file.name)
+            self.minio_client.put_object_sync(object_name=object_name, file=tmp_file.name,
+                                              content_type='application/vnd.openxmlformats-officedocument'
+                                                           '.spreadsheetml.sheet',
+                                              bucket_name=self.minio_client.tmp_bucket)
+
+    @classmethod
+    def run_job(cls, job_id: str) -> Optional[SessionExportJob]:
+        """ run or resume a background export job """
+        job = SessionExportJobManager.get(job_id)
+        if not job:
+            logger.warning(f'session export job {job_id} not found')
+            return None
+        if job.status == SessionExportStatus.SUCCESS:
+            return job
+        job.status = SessionExportStatus.RUNNING
+        job.error = None
+        SessionExportJobManager.save(job)
+        try:
+            user = UserPayload.init_login_user_sync(user_id=job.user_id, user_name=job.user_name)
+            job.url = cls(user, job.params, job=job).export()
+            job.status = SessionExportStatus.SUCCESS
+        except Exception as e:
+            logger.exception(f'session export job {job_id} failed: {e}')
+            job.status = SessionExportStatus.FAILED
+            job.error = str(e)
+        SessionExportJobManager.save(job)
+        return job
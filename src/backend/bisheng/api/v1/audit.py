@@ -1,11 +1,14 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Literal
 
-from fastapi import APIRouter, Query, Depends
+from fastapi import APIRouter, Query, Depends, Body
 
 from bisheng.api.services.audit_log import AuditLogService
+from bisheng.api.services.session_export import SessionExportParams, SessionExportJobManager
 from bisheng.api.v1.schemas import resp_200
 from bisheng.common.dependencies.user_deps import UserPayload
+from bisheng.common.errcode.http_error import NotFoundError
+from bisheng.worker.audit.session_export import export_session_messages_celery
 
 router = APIRouter(prefix='/audit', tags=['AuditLog'])
 
@@ -64,15 +67,48 @@ def export_session_messages(login_user: UserPayload = Depends(UserPayload.get_lo
                             end_date: Optional[datetime] = Query(default=None, description='End time'),
                             feedback: Optional[str] = Query(default=None,
                                                             description='like LikedislikeUnlikecopiedCopy:'),
-                            sensitive_status: Optional[int] = Query(default=None, description='Sensitive word review status')):
+                            sensitive_status: Optional[int] = Query(default=None, description='Sensitive word review status'),
+                            file_type: Literal['csv', 'xlsx'] = Query(default='csv', description='csv or xlsx')):
     """ Exporting a list of session detailscsvDoc. """
     url = AuditLogService.export_session_messages(login_user, flow_ids, user_ids, group_ids, start_date, end_date,
-                                                  feedback, sensitive_status)
+                                                  feedback, sensitive_status, file_type)
     return resp_200(data={
         'url': url
     })
 
 
+@router.post('/session/export/job')
+def create_session_export_job(login_user: UserPayload = Depends(UserPayload.get_login_user),
+                              params: SessionExportParams = Body(..., description='export filters')):
+    """ Export session details in a background job, for large time ranges """
+    # check the filter permission before the job is queued
+    AuditLogService.get_filter_flow_ids(login_user, params.flow_ids, params.group_ids)
+    job = SessionExportJobManager.create(login_user, params)
+    export_session_messages_celery.delay(job.job_id)
+    return resp_200(data=job)
+
+
+def _get_user_export_job(login_user: UserPayload, job_id: str):
+    job = SessionExportJobManager.get(job_id)
+    if not job or job.user_id != login_user.user_id:
+        raise NotFoundError.http_exception()
+    return job
+
+
+@router.get('/session/export/job/{job_id}')
+def get_session_export_job(job_id: str, login_user: UserPayload = Depends(UserPayload.get_login_user)):
+    """ Status and progress of a session export job, url is set once it succeeds """
+    return resp_200(data=_get_user_export_job(login_user, job_id))
+
+
+@router.post('/session/export/job/{job_id}/resume')
+def resume_session_export_job(job_id: str, login_user: UserPayload = Depends(UserPayload.get_login_user)):
+    """ Continue a failed export job from its last uploaded part """
+    job = _get_user_export_job(login_user, job_id)
+    export_session_messages_celery.delay(job.job_id)
+    return resp_200(data=job)
+
+
 @router.get('/session/export/data')
 def get_session_messages(login_user: UserPayload = Depends(UserPayload.get_login_user),
                          flow_ids: Optional[List[str]] = Query(default=[], description='ApplicationsidVertical'),
@@ -13,7 +13,6 @@
 - GET /scheduled-tasks/workflows: 获取可选工作流列表
 """
 import smtplib
-import threading
 import time
 from datetime import datetime
 from email.mime.text import MIMEText
@@ -207,8 +206,9 @@ async def toggle_task(
     return resp_200(data=task.model_dump())
 
 
+# 数据库, redis 和 celery 派发都是同步调用, 用普通 def 交给线程池执行, 不阻塞事件循环
 @router.post('/{task_id}/run')
-async def run_task_now(
+def run_task_now(
     task_id: int,
     admin_user: UserPayload = Depends(UserPayload.get_admin_user),
 ):
@@ -217,13 +217,10 @@ async def run_task_now(
     if not task:
         raise HTTPException(status_code=404, detail='任务不存在')
 
-    # 在后台线程中执行
-    thread = threading.Thread(
-        target=execute_scheduled_task,
-        args=(task,),
-        daemon=True
-    )
-    thread.start()
+    # 派发到 celery 执行, 不影响任务的下一次调度时间
+    from bisheng.worker.scheduled.scheduler import ScheduledTaskScheduler
+    ScheduledTaskScheduler().start(task.id)
+    ScheduledTaskDao.update_last_run_time(task.id, datetime.now())
 
     return resp_200(message='任务已触发执行')
 
@@ -329,15 +326,6 @@ def execute_scheduled_task(task: ScheduledTask):
             except Exception as mail_err:
                 logger.error(f'Failed to send notification email: {mail_err}')
 
-    # 更新任务的 last_run_time 和 next_run_time
-    try:
-        now = datetime.now()
-        cron = croniter(task.cron_expression, now)
-        next_run = cron.get_next(datetime)
-        ScheduledTaskDao.update_run_times(task.id, now, next_run)
-    except Exception as e:
-        logger.error(f'Failed to update task run times: {e}')
-
 
 def send_failure_notification(task: ScheduledTask, error_msg: str):
     """发送失败通知邮件"""
@@ -389,22 +377,13 @@ def send_failure_notification(task: ScheduledTask, error_msg: str):
 
 def check_and_run_due_tasks():
     """
-    检查并执行到期的定时任务
+    抢占并派发到期的定时任务, next_run_time 在派发前推进
     此函数应被定期调用 (例如每分钟一次)
     """
+    from bisheng.worker.scheduled.scheduler import ScheduledTaskScheduler
     try:
-        tasks = ScheduledTaskDao.get_enabled_tasks()
-        now = datetime.now()
-
-        for task in tasks:
-            if task.next_run_time and task.next_run_time <= now:
-                logger.info(f'Task {task.id} ({task.name}) is due, executing...')
-                # 在后台线程中执行避免阻塞调度器
-                thread = threading.Thread(
-                    target=execute_scheduled_task,
-                    args=(task,),
-                    daemon=True
-                )
-                thread.start()
+        actions = ScheduledTaskScheduler().tick()
+        if actions:
+            logger.info(f'Scheduled tasks dispatched: {actions}')
     except Exception as e:
         logger.error(f'Error checking scheduled tasks: {e}')
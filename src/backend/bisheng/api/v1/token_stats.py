@@ -1,7 +1,8 @@
 """Token consumption statistics API endpoints.
 
 Provides aggregated token usage reports by user and by application,
-querying data from the Elasticsearch telemetry index.
+served from the daily token usage rollups (see TokenUsageRollupService),
+which are rolled up hourly from the Elasticsearch telemetry index.
 """
 import logging
 from datetime import datetime, timedelta
@@ -11,13 +12,23 @@ from fastapi import APIRouter, Depends, Query
 
 from bisheng.common.dependencies.user_deps import UserPayload
 from bisheng.api.v1.schemas import resp_200
-from bisheng.core.search.elasticsearch.manager import get_statistics_es_connection
+from bisheng.telemetry.domain.models.token_usage import TokenUsageRollupDao
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix='/token-stats', tags=['TokenStats'])
 
-INDEX_NAME = 'base_telemetry_events'
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    """ YYYY-MM-DD to the start of the day, daily buckets start at 00:00 UTC """
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
+
+
+def _format_sums(row: dict) -> dict:
+    for key in ('total_tokens', 'input_tokens', 'output_tokens', 'invoke_count'):
+        if key in row:
+            row[key] = int(row[key] or 0)
+    return row
 
 
 @router.get('/by-user')
@@ -35,68 +46,34 @@ async def token_stats_by_user(
     sorted by total_token descending.
     """
     try:
-        es = await get_statistics_es_connection()
-
-        # Build must clauses
-        must_clauses = [{'term': {'event_type': 'model_invoke'}}]
-
-        if user_name:
-            must_clauses.append({'wildcard': {'user_context.user_name': f'*{user_name}*'}})
-
-        if start_date or end_date:
-            range_filter = {}
-            if start_date:
-                range_filter['gte'] = start_date
-            if end_date:
-                range_filter['lte'] = end_date + 'T23:59:59'
-            must_clauses.append({'range': {'timestamp': range_filter}})
-
-        query_body = {
-            'size': 0,
-            'query': {'bool': {'must': must_clauses}},
-            'aggs': {
-                'by_user': {
-                    'terms': {
-                        'field': 'user_context.user_name',
-                        'size': 10000,
-                        'order': {'total_tokens': 'desc'},
-                    },
-                    'aggs': {
-                        'total_tokens': {'sum': {'field': 'event_data.model_invoke_total_token'}},
-                        'input_tokens': {'sum': {'field': 'event_data.model_invoke_input_token'}},
-                        'output_tokens': {'sum': {'field': 'event_data.model_invoke_output_token'}},
-                        'user_id': {'terms': {'field': 'user_context.user_id', 'size': 1}},
-                    }
-                }
-            }
-        }
-
-        result = await es.search(index=INDEX_NAME, body=query_body)
-        buckets = result.get('aggregations', {}).get('by_user', {}).get('buckets', [])
-
-        total = len(buckets)
-        start = (page - 1) * page_size
-        end = start + page_size
-        page_buckets = buckets[start:end]
-
-        data = []
-        for b in page_buckets:
-            user_id_buckets = b.get('user_id', {}).get('buckets', [])
-            data.append({
-                'user_name': b['key'],
-                'user_id': user_id_buckets[0]['key'] if user_id_buckets else None,
-                'total_tokens': int(b['total_tokens']['value']),
-                'input_tokens': int(b['input_tokens']['value']),
-                'output_tokens': int(b['output_tokens']['value']),
-                'invoke_count': b['doc_count'],
-            })
-
+        rows, total = await TokenUsageRollupDao.aget_stats_by_user(_parse_date(start_date), _parse_date(end_date),
+                                                                   user_name, page, page_size)
+        data = [_format_sums({
+            'user_name': one['user_name'],
+            'user_id': one['user_id'],
+            'total_tokens': one['total_tokens'],
+            'input_tokens': one['input_tokens'],
+            'output_tokens': one['output_tokens'],
+            'invoke_count': one['invoke_count'],
+        }) for one in rows]
         return resp_200(data={'list': data, 'total': total, 'page': page, 'page_size': page_size})
     except Exception as e:
         logger.error(f'Error querying user token stats: {e}', exc_info=True)
         return resp_200(data={'list': [], 'total': 0, 'page': page, 'page_size': page_size})
 
 
+def _app_row(one: dict) -> dict:
+    return _format_sums({
+        'app_name': one['app_name'],
+        'app_id': one['app_id'] or None,
+        'app_type': one['app_type'] or None,
+        'total_tokens': one['total_tokens'],
+        'input_tokens': one['input_tokens'],
+        'output_tokens': one['output_tokens'],
+        'invoke_count': one['invoke_count'],
+    })
+
+
 @router.get('/user-detail')
 async def token_stats_user_detail(
         user_name: str = Query(..., description='User name to query'),
@@ -108,64 +85,9 @@ async def token_stats_user_detail(
 ):
     """Get token breakdown by app for a specific user."""
     try:
-        es = await get_statistics_es_connection()
-
-        must_clauses = [
-            {'term': {'event_type': 'model_invoke'}},
-            {'term': {'user_context.user_name': user_name}},
-        ]
-
-        if start_date or end_date:
-            range_filter = {}
-            if start_date:
-                range_filter['gte'] = start_date
-            if end_date:
-                range_filter['lte'] = end_date + 'T23:59:59'
-            must_clauses.append({'range': {'timestamp': range_filter}})
-
-        query_body = {
-            'size': 0,
-            'query': {'bool': {'must': must_clauses}},
-            'aggs': {
-                'by_app': {
-                    'terms': {
-                        'field': 'event_data.model_invoke_app_name',
-                        'size': 10000,
-                        'order': {'total_tokens': 'desc'},
-                    },
-                    'aggs': {
-                        'total_tokens': {'sum': {'field': 'event_data.model_invoke_total_token'}},
-                        'input_tokens': {'sum': {'field': 'event_data.model_invoke_input_token'}},
-                        'output_tokens': {'sum': {'field': 'event_data.model_invoke_output_token'}},
-                        'app_id': {'terms': {'field': 'event_data.model_invoke_app_id', 'size': 1}},
-                        'app_type': {'terms': {'field': 'event_data.model_invoke_app_type', 'size': 1}},
-                    }
-                }
-            }
-        }
-
-        result = await es.search(index=INDEX_NAME, body=query_body)
-        buckets = result.get('aggregations', {}).get('by_app', {}).get('buckets', [])
-
-        total = len(buckets)
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        page_buckets = buckets[start_idx:end_idx]
-
-        data = []
-        for b in page_buckets:
-            app_id_buckets = b.get('app_id', {}).get('buckets', [])
-            app_type_buckets = b.get('app_type', {}).get('buckets', [])
-            data.append({
-                'app_name': b['key'],
-                'app_id': app_id_buckets[0]['key'] if app_id_buckets else None,
-                'app_type': app_type_buckets[0]['key'] if app_type_buckets else None,
-                'total_tokens': int(b['total_tokens']['value']),
-                'input_tokens': int(b['input_tokens']['value']),
-                'output_tokens': int(b['output_tokens']['value']),
-                'invoke_count': b['doc_count'],
-            })
-
+        rows, total = await TokenUsageRollupDao.aget_stats_by_app(_parse_date(start_date), _parse_date(end_date),
+                                                                  None, user_name, page, page_size)
+        data = [_app_row(one) for one in rows]
         return resp_200(data={'list': data, 'total': total, 'page': page, 'page_size': page_size})
     except Exception as e:
         logger.error(f'Error querying user detail token stats: {e}', exc_info=True)
@@ -187,64 +109,9 @@ async def token_stats_by_app(
     sorted by total_token descending.
     """
     try:
-        es = await get_statistics_es_connection()
-
-        must_clauses = [{'term': {'event_type': 'model_invoke'}}]
-
-        if app_name:
-            must_clauses.append({'wildcard': {'event_data.model_invoke_app_name': f'*{app_name}*'}})
-
-        if start_date or end_date:
-            range_filter = {}
-            if start_date:
-                range_filter['gte'] = start_date
-            if end_date:
-                range_filter['lte'] = end_date + 'T23:59:59'
-            must_clauses.append({'range': {'timestamp': range_filter}})
-
-        query_body = {
-            'size': 0,
-            'query': {'bool': {'must': must_clauses}},
-            'aggs': {
-                'by_app': {
-                    'terms': {
-                        'field': 'event_data.model_invoke_app_name',
-                        'size': 10000,
-                        'order': {'total_tokens': 'desc'},
-                    },
-                    'aggs': {
-                        'total_tokens': {'sum': {'field': 'event_data.model_invoke_total_token'}},
-                        'input_tokens': {'sum': {'field': 'event_data.model_invoke_input_token'}},
-                        'output_tokens': {'sum': {'field': 'event_data.model_invoke_output_token'}},
-                        'app_id': {'terms': {'field': 'event_data.model_invoke_app_id', 'size': 1}},
-                        'app_type': {'terms': {'field': 'event_data.model_invoke_app_type', 'size': 1}},
-                    }
-                }
-            }
-        }
-
-        result = await es.search(index=INDEX_NAME, body=query_body)
-        buckets = result.get('aggregations', {}).get('by_app', {}).get('buckets', [])
-
-        total = len(buckets)
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        page_buckets = buckets[start_idx:end_idx]
-
-        data = []
-        for b in page_buckets:
-            app_id_buckets = b.get('app_id', {}).get('buckets', [])
-            app_type_buckets = b.get('app_type', {}).get('buckets', [])
-            data.append({
-                'app_name': b['key'],
-                'app_id': app_id_buckets[0]['key'] if app_id_buckets else None,
-                'app_type': app_type_buckets[0]['key'] if app_type_buckets else None,
-                'total_tokens': int(b['total_tokens']['value']),
-                'input_tokens': int(b['input_tokens']['value']),
-                'output_tokens': int(b['output_tokens']['value']),
-                'invoke_count': b['doc_count'],
-            })
-
+        rows, total = await TokenUsageRollupDao.aget_stats_by_app(_parse_date(start_date), _parse_date(end_date),
+                                                                  app_name, None, page, page_size)
+        data = [_app_row(one) for one in rows]
         return resp_200(data={'list': data, 'total': total, 'page': page, 'page_size': page_size})
     except Exception as e:
         logger.error(f'Error querying app token stats: {e}', exc_info=True)
@@ -260,87 +127,44 @@ async def token_stats_app_detail(
 ):
     """Get daily token breakdown for a specific application."""
     try:
-        es = await get_statistics_es_connection()
-
         # Default to last 30 days if no date range
         if not start_date and not end_date:
             end_dt = datetime.now()
             start_dt = end_dt - timedelta(days=30)
             start_date = start_dt.strftime('%Y-%m-%d')
             end_date = end_dt.strftime('%Y-%m-%d')
+        start_dt, end_dt = _parse_date(start_date), _parse_date(end_date)
 
-        must_clauses = [
-            {'term': {'event_type': 'model_invoke'}},
-            {'term': {'event_data.model_invoke_app_name': app_name}},
-        ]
-
-        range_filter = {}
-        if start_date:
-            range_filter['gte'] = start_date
-        if end_date:
-            range_filter['lte'] = end_date + 'T23:59:59'
-        if range_filter:
-            must_clauses.append({'range': {'timestamp': range_filter}})
-
-        query_body = {
-            'size': 0,
-            'query': {'bool': {'must': must_clauses}},
-            'aggs': {
-                'by_day': {
-                    'date_histogram': {
-                        'field': 'timestamp',
-                        'calendar_interval': 'day',
-                        'format': 'yyyy-MM-dd',
-                        'min_doc_count': 0,
-                        'extended_bounds': {
-                            'min': start_date,
-                            'max': end_date,
-                        }
-                    },
-                    'aggs': {
-                        'total_tokens': {'sum': {'field': 'event_data.model_invoke_total_token'}},
-                        'input_tokens': {'sum': {'field': 'event_data.model_invoke_input_token'}},
-                        'output_tokens': {'sum': {'field': 'event_data.model_invoke_output_token'}},
-                    }
-                },
-                'total_sum': {'sum': {'field': 'event_data.model_invoke_total_token'}},
-                'by_user': {
-                    'terms': {
-                        'field': 'user_context.user_name',
-                        'size': 100,
-                        'order': {'total_tokens': 'desc'},
-                    },
-                    'aggs': {
-                        'total_tokens': {'sum': {'field': 'event_data.model_invoke_total_token'}},
-                    }
-                }
-            }
-        }
-
-        result = await es.search(index=INDEX_NAME, body=query_body)
-        aggs = result.get('aggregations', {})
-
+        daily_rows = await TokenUsageRollupDao.aget_app_daily(app_name, start_dt, end_dt)
+        daily_map = {one['bucket_time'].strftime('%Y-%m-%d'): one for one in daily_rows}
+        # fill the days without usage, like a date histogram with min_doc_count 0
+        first_day = start_dt or (daily_rows[0]['bucket_time'] if daily_rows else end_dt)
+        last_day = end_dt or (daily_rows[-1]['bucket_time'] if daily_rows else start_dt)
         daily = []
-        for b in aggs.get('by_day', {}).get('buckets', []):
-            daily.append({
-                'date': b['key_as_string'],
-                'total_tokens': int(b['total_tokens']['value']),
-                'input_tokens': int(b['input_tokens']['value']),
-                'output_tokens': int(b['output_tokens']['value']),
-                'invoke_count': b['doc_count'],
-            })
+        day = first_day
+        while day and last_day and day <= last_day:
+            key = day.strftime('%Y-%m-%d')
+            one = daily_map.get(key, {})
+            daily.append(_format_sums({
+                'date': key,
+                'total_tokens': one.get('total_tokens'),
+                'input_tokens': one.get('input_tokens'),
+                'output_tokens': one.get('output_tokens'),
+                'invoke_count': one.get('invoke_count'),
+            }))
+            day += timedelta(days=1)
 
         users = []
-        for b in aggs.get('by_user', {}).get('buckets', []):
-            users.append({
-                'user_name': b['key'],
-                'total_tokens': int(b['total_tokens']['value']),
-                'invoke_count': b['doc_count'],
-            })
+        for one in await TokenUsageRollupDao.aget_app_top_users(app_name, start_dt, end_dt):
+            users.append(_format_sums({
+                'user_name': one['user_name'],
+                'total_tokens': one['total_tokens'],
+                'invoke_count': one['invoke_count'],
+            }))
 
         return resp_200(data={
             'app_name': app_name,
-            'total_tokens': int(aggs.get('total_sum', {}).get('value', 0)),
+            'total_tokens': sum(one['total_tokens'] for one in daily),
             'daily': daily,
             'users': users,
             'start_date': start_date,
@@ -19,6 +19,7 @@ from pydantic import BaseModel, Field
 
 from bisheng.api.v1.schemas import resp_200
 from bisheng.common.dependencies.user_deps import UserPayload
+from bisheng.core.cache.permission_version import PermissionVersion
 from bisheng.database.models.role_access import AccessType, RoleAccess, RoleAccessDao
 from bisheng.database.models.workspace_space import (
     WorkspaceSpace, WorkspaceSpaceDao
@@ -148,6 +149,7 @@ async def delete_space(
             RoleAccess.third_id == str(space_id))
         session.exec(stmt)
         session.commit()
+    PermissionVersion.bump_global()
 
     ok = WorkspaceSpaceDao.delete_space(space_id)
     if not ok:
@@ -242,6 +244,7 @@ async def set_space_roles(
                             type=AccessType.SPACE_READ.value)
             session.add(ra)
         session.commit()
+    PermissionVersion.bump_global()
 
     logger.info(f'Space {space_id} roles updated: {req.role_ids}')
     return resp_200(message='授权更新成功')
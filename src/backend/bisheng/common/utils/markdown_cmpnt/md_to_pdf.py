@@ -29,6 +29,7 @@ from pathlib import Path
 from typing import Optional, Union
 
 from bisheng.common.utils.markdown_cmpnt.md_to_docx.parser.ext_md_syntax import ExtMdSyntax
+from bisheng.common.utils.markdown_cmpnt.pdf_render_service import get_pdf_render_service
 
 logger = logging.getLogger(__name__)
 
@@ -350,6 +351,16 @@ class MarkdownToPdfConverter:
         if format_to_use not in self.SUPPORTED_PAGE_FORMATS:
             raise MarkdownToPdfError(f'Unsupported page format: {format_to_use}')
 
+        # Render with the warm browser of this process
+        if render_service := get_pdf_render_service():
+            try:
+                pdf_bytes = render_service.render(html_content, format_to_use, margin_to_use, self.enable_math)
+                output_file.write_bytes(pdf_bytes)
+            except Exception as e:
+                raise MarkdownToPdfError(f'will be HTML Convert To PDF Kalah: {e}') from e
+            logger.info("Slider Created Successfully. PDF: %s", output_file)
+            return
+
         # Create Temporary HTML Doc.
         temp_html_path = None
         try:
@@ -407,6 +418,13 @@ class MarkdownToPdfConverter:
         if format_to_use not in self.SUPPORTED_PAGE_FORMATS:
             raise MarkdownToPdfError(f'Unsupported page format: {format_to_use}')
 
+        # Render with the warm browser of this process
+        if render_service := get_pdf_render_service():
+            try:
+                return render_service.render(html_content, format_to_use, margin_to_use, self.enable_math)
+            except Exception as e:
+                raise MarkdownToPdfError(f'will be HTML Convert To PDF Byte Data Failure: {e}') from e
+
         # Create Temporary HTML Doc.
         temp_html_path = None
         try:
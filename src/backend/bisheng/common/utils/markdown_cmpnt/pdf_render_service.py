@@ -0,0 +1,290 @@
+"""
+Warm headless Chromium for HTML to PDF rendering.
+
+One process keeps one browser, started on the first render. Renders run as pages of one browser
+context on an event loop thread owned by the service, at most `pool_size` at the same time, the
+pages are reused. Callers wait in a bounded queue, a render is refused when the queue is full.
+MathJax is loaded once (from PDF_RENDER_MATHJAX_PATH or the CDN) and served from memory to every page.
+The browser is replaced after `max_jobs` renders or when it crashed.
+
+Configured by environment variables:
+- PDF_RENDER_POOL_SIZE: pages rendering at the same time, 0 disables the service (default 2)
+- PDF_RENDER_MAX_QUEUE: renders waiting for a page (default 16)
+- PDF_RENDER_QUEUE_TIMEOUT: seconds a render waits for a queue slot (default 60)
+- PDF_RENDER_MAX_JOBS: renders served by one browser (default 200)
+- PDF_RENDER_MATHJAX_PATH: local tex-svg.js, the CDN copy is fetched once when not set
+"""
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from playwright.async_api import async_playwright
+
+    ASYNC_PLAYWRIGHT_AVAILABLE = True
+except ImportError:
+    ASYNC_PLAYWRIGHT_AVAILABLE = False
+
+MATHJAX_URL = 'https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-svg.js'
+# latencies kept for the percentiles of the metrics
+LATENCY_WINDOW = 200
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class PdfRenderBusyError(Exception):
+    """The render queue is full"""
+
+
+class PdfRenderService:
+    """Persistent browser with a pool of reusable pages"""
+
+    def __init__(self, pool_size: int = 2, max_queue: int = 16, queue_timeout: int = 60, max_jobs: int = 200,
+                 mathjax_path: Optional[str] = None, timeout: int = 60000):
+        self.pool_size = pool_size
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_jobs = max_jobs
+        self.mathjax_path = mathjax_path
+        self.timeout = timeout
+
+        # renders in the queue plus renders on a page
+        self._slots = threading.BoundedSemaphore(pool_size + max_queue)
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # state of the event loop thread
+        self._loop = asyncio.new_event_loop()
+        self._page_slots = asyncio.Semaphore(pool_size)
+        self._browser_lock = asyncio.Lock()
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._idle_pages = []
+        self._in_flight = 0
+        self._browser_jobs = 0
+        self._mathjax: Optional[bytes] = None
+
+        # metrics
+        self._renders = 0
+        self._errors = 0
+        self._rejected = 0
+        self._browsers_launched = 0
+        self._recycled = 0
+        self._wait_time = 0.0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+        self._thread = threading.Thread(target=self._run_loop, daemon=True, name='pdf-render')
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def render(self, html: str, page_format: str = 'A4', margin_mm: int = 20, enable_math: bool = False) -> bytes:
+        """render html to pdf bytes, blocks the calling thread, never call it from the service loop"""
+        if self._closed:
+            raise RuntimeError('pdf render service is closed')
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._rejected += 1
+            raise PdfRenderBusyError(f'pdf render queue is full, {self.pool_size + self.max_queue} renders waiting')
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                self._render(html, page_format, margin_mm, enable_math, time.monotonic()), self._loop)
+            return future.result()
+        finally:
+            self._slots.release()
+
+    async def _render(self, html: str, page_format: str, margin_mm: int, enable_math: bool,
+                      submitted: float) -> bytes:
+        async with self._page_slots:
+            started = time.monotonic()
+            page = None
+            ok = False
+            self._in_flight += 1
+            try:
+                page = await self._get_page()
+                await page.set_content(html, wait_until='load', timeout=self.timeout)
+                if enable_math:
+                    await self._wait_for_mathjax(page)
+                margin = f'{margin_mm}mm'
+                pdf = await page.pdf(format=page_format, print_background=True,
+                                     margin={'top': margin, 'bottom': margin, 'left': margin, 'right': margin})
+                ok = True
+                return pdf
+            finally:
+                self._in_flight -= 1
+                self._browser_jobs += 1
+                if page is not None:
+                    if ok and self._browser is not None and self._browser.is_connected():
+                        self._idle_pages.append(page)
+                    else:
+                        await self._close_quietly(page)
+                finished = time.monotonic()
+                with self._lock:
+                    self._renders += 1
+                    self._errors += 0 if ok else 1
+                    self._wait_time += started - submitted
+                    self._latencies.append(finished - started)
+                logger.debug('pdf render took %.3fs, waited %.3fs', finished - started, started - submitted)
+                await self._maybe_recycle()
+
+    async def _get_page(self):
+        async with self._browser_lock:
+            if self._browser is None or not self._browser.is_connected():
+                await self._launch()
+        while self._idle_pages:
+            page = self._idle_pages.pop()
+            if not page.is_closed():
+                return page
+        return await self._context.new_page()
+
+    async def _launch(self):
+        await self._shutdown_browser()
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch()
+        self._context = await self._browser.new_context()
+        await self._context.route(MATHJAX_URL, self._serve_mathjax)
+        self._browser_jobs = 0
+        with self._lock:
+            self._browsers_launched += 1
+        logger.info('pdf render browser launched')
+
+    async def _serve_mathjax(self, route):
+        """every page gets MathJax from memory, it is read or downloaded once per process"""
+        if self._mathjax is None:
+            try:
+                if self.mathjax_path:
+                    with open(self.mathjax_path, 'rb') as f:
+                        self._mathjax = f.read()
+                else:
+                    resp = await self._context.request.get(MATHJAX_URL, timeout=self.timeout)
+                    if resp.ok:
+                        self._mathjax = await resp.body()
+            except Exception as e:
+                logger.warning('load mathjax failed: %s', e)
+        if self._mathjax is None:
+            await route.continue_()
+            return
+        await route.fulfill(status=200, content_type='application/javascript', body=self._mathjax)
+
+    async def _wait_for_mathjax(self, page):
+        try:
+            await page.wait_for_function('() => window.MathJax && window.MathJax.typesetPromise',
+                                         timeout=self.timeout)
+            await page.evaluate('() => window.MathJax && window.MathJax.typesetPromise()')
+        except Exception as e:
+            logger.debug('MathJax timeout or not present: %s', e)
+
+    async def _maybe_recycle(self):
+        """replace the browser after max_jobs renders, once no render is using it"""
+        if self._in_flight or self._browser is None:
+            return
+        if self._browser_jobs < self.max_jobs and self._browser.is_connected():
+            return
+        async with self._browser_lock:
+            if self._in_flight:
+                return
+            await self._shutdown_browser()
+            with self._lock:
+                self._recycled += 1
+
+    async def _shutdown_browser(self):
+        pages, self._idle_pages = self._idle_pages, []
+        for page in pages:
+            await self._close_quietly(page)
+        browser, self._browser, self._context = self._browser, None, None
+        if browser is not None:
+            await self._close_quietly(browser)
+
+    @staticmethod
+    async def _close_quietly(obj):
+        try:
+            await obj.close()
+        except Exception as e:
+            logger.debug('close pdf render resource error: %s', e)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            renders = self._renders or 1
+
+            def _percentile(p):
+                return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 4) if latencies else 0
+
+            return {
+                'pool_size': self.pool_size,
+                'max_queue': self.max_queue,
+                'in_flight': self._in_flight,
+                'renders': self._renders,
+                'errors': self._errors,
+                'rejected': self._rejected,
+                'browsers_launched': self._browsers_launched,
+                'recycled': self._recycled,
+                'avg_wait_time': round(self._wait_time / renders, 4),
+                'p50_render_time': _percentile(0.5),
+                'p95_render_time': _percentile(0.95),
+                'max_render_time': round(latencies[-1], 4) if latencies else 0,
+            }
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+
+        async def _close():
+            await self._shutdown_browser()
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+        try:
+            asyncio.run_coroutine_threadsafe(_close(), self._loop).result(timeout=10)
+        except Exception as e:
+            logger.debug('close pdf render service error: %s', e)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_service: Optional[PdfRenderService] = None
+_service_lock = threading.Lock()
+
+
+def get_pdf_render_service() -> Optional[PdfRenderService]:
+    """process wide render service, None when it is disabled or playwright is missing"""
+    global _service
+    if _service is not None:
+        return _service
+    pool_size = _env_int('PDF_RENDER_POOL_SIZE', 2)
+    if pool_size <= 0 or not ASYNC_PLAYWRIGHT_AVAILABLE:
+        return None
+    with _service_lock:
+        if _service is None:
+            _service = PdfRenderService(
+                pool_size=pool_size,
+                max_queue=_env_int('PDF_RENDER_MAX_QUEUE', 16),
+                queue_timeout=_env_int('PDF_RENDER_QUEUE_TIMEOUT', 60),
+                max_jobs=_env_int('PDF_RENDER_MAX_JOBS', 200),
+                mathjax_path=os.getenv('PDF_RENDER_MATHJAX_PATH') or None,
+            )
+            atexit.register(_service.close)
+    return _service
+
+
+def get_pdf_render_metrics() -> Dict[str, Any]:
+    if _service is None:
+        return {'enabled': False}
+    return {'enabled': True, **_service.metrics()}
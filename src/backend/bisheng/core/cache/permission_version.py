@@ -0,0 +1,70 @@
+from typing import Iterable, Tuple
+
+from loguru import logger
+
+from bisheng.core.cache.redis_manager import get_redis_client, get_redis_client_sync
+
+
+class PermissionVersion:
+    """
+    Version counters of user permission data, used to invalidate permission snapshots.
+
+    The global version changes when the resource grants of any role change (role_access, role deleted).
+    The user version changes when the roles or groups of a user change.
+    All counters live in one redis hash so they can be read with a single HMGET.
+    """
+    redis_key = 'permission:version'
+    global_field = 'global'
+
+    @classmethod
+    def _user_field(cls, user_id: int) -> str:
+        return f'user:{user_id}'
+
+    @staticmethod
+    def _parse(values) -> Tuple[int, int]:
+        return tuple(int(one) if one is not None else 0 for one in values)
+
+    @classmethod
+    def get(cls, user_id: int) -> Tuple[int, int]:
+        """ return (global_version, user_version) """
+        redis_client = get_redis_client_sync()
+        return cls._parse(redis_client.hmget(cls.redis_key, [cls.global_field, cls._user_field(user_id)]))
+
+    @classmethod
+    async def aget(cls, user_id: int) -> Tuple[int, int]:
+        """ return (global_version, user_version) """
+        redis_client = await get_redis_client()
+        return cls._parse(await redis_client.ahmget(cls.redis_key, [cls.global_field, cls._user_field(user_id)]))
+
+    @classmethod
+    def bump_global(cls):
+        try:
+            get_redis_client_sync().hincrby(cls.redis_key, cls.global_field)
+        except Exception as e:
+            logger.exception(f'bump permission global version error: {e}')
+
+    @classmethod
+    async def abump_global(cls):
+        try:
+            redis_client = await get_redis_client()
+            await redis_client.ahincrby(cls.redis_key, cls.global_field)
+        except Exception as e:
+            logger.exception(f'bump permission global version error: {e}')
+
+    @classmethod
+    def bump_users(cls, user_ids: Iterable[int]):
+        try:
+            redis_client = get_redis_client_sync()
+            for user_id in set(user_ids):
+                redis_client.hincrby(cls.redis_key, cls._user_field(user_id))
+        except Exception as e:
+            logger.exception(f'bump permission user version error: {e}')
+
+    @classmethod
+    async def abump_users(cls, user_ids: Iterable[int]):
+        try:
+            redis_client = await get_redis_client()
+            for user_id in set(user_ids):
+                await redis_client.ahincrby(cls.redis_key, cls._user_field(user_id))
+        except Exception as e:
+            logger.exception(f'bump permission user version error: {e}')
@@ -295,6 +295,34 @@ class RedisClient:
         except Exception as e:
             raise e
 
+    def hmget(self, name, keys: typing.List[str]) -> typing.List:
+        try:
+            self.cluster_nodes(name)
+            return self.connection.hmget(name, keys)
+        except Exception as e:
+            raise e
+
+    async def ahmget(self, name, keys: typing.List[str]) -> typing.List:
+        try:
+            await self.acluster_nodes(name)
+            return await self.async_connection.hmget(name, keys)
+        except Exception as e:
+            raise e
+
+    def hincrby(self, name, key, amount: int = 1) -> int:
+        try:
+            self.cluster_nodes(name)
+            return self.connection.hincrby(name, key, amount)
+        except Exception as e:
+            raise e
+
+    async def ahincrby(self, name, key, amount: int = 1) -> int:
+        try:
+            await self.acluster_nodes(name)
+            return await self.async_connection.hincrby(name, key, amount)
+        except Exception as e:
+            raise e
+
     def get(self, key):
         try:
             self.cluster_nodes(key)
@@ -5,12 +5,14 @@ import hashlib
 import json
 import os
 import tempfile
+import uuid
 from collections import OrderedDict
 from io import BytesIO
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, AsyncIterable, Dict, Iterable
 from urllib.parse import unquote, urlparse
 
+import aiofiles
 import cchardet
 import requests
 from appdirs import user_cache_dir
@@ -280,16 +282,88 @@ def save_download_file(file_byte, folder_name, filename):
     sha256_hash.update(file_byte)
 
     # Use the hex digest of the hash as the file name
-    hex_dig = sha256_hash.hexdigest()
-    md5_name = hex_dig
-    file_path = folder_path / f'{md5_name}_{filename}'
-    if len(filename) > 60:
-        file_path = folder_path / f'{md5_name}_{filename[-60:]}'
+    file_path = _download_file_path(folder_path, sha256_hash.hexdigest(), filename)
     with open(file_path, 'wb') as new_file:
         new_file.write(file_byte)
     return str(file_path)
 
 
+def _download_file_path(folder_path: Path, hex_dig: str, filename: str) -> Path:
+    if len(filename) > 60:
+        return folder_path / f'{hex_dig}_{filename[-60:]}'
+    return folder_path / f'{hex_dig}_{filename}'
+
+
+def _download_tmp_path(folder_name: str) -> Path:
+    folder_path = Path(CACHE_DIR) / folder_name
+    folder_path.mkdir(parents=True, exist_ok=True)
+    return folder_path / f'.downloading_{os.getpid()}_{uuid.uuid4().hex}'
+
+
+def _finish_download(tmp_path: Path, hex_dig: str, filename: str) -> str:
+    """ move the downloaded temp file to its content addressed name """
+    file_path = _download_file_path(tmp_path.parent, hex_dig, filename)
+    os.replace(tmp_path, file_path)
+    return str(file_path)
+
+
+def save_download_stream(chunks: Iterable[bytes], folder_name: str, filename: str) -> str:
+    """
+    Same as save_download_file, but write the content chunk by chunk and hash it on the way,
+    so the whole file is never held in memory.
+    """
+    tmp_path = _download_tmp_path(folder_name)
+    sha256_hash = hashlib.sha256()
+    try:
+        with open(tmp_path, 'wb') as new_file:
+            for chunk in chunks:
+                sha256_hash.update(chunk)
+                new_file.write(chunk)
+        return _finish_download(tmp_path, sha256_hash.hexdigest(), filename)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+async def asave_download_stream(chunks: AsyncIterable[bytes], folder_name: str, filename: str) -> str:
+    """ async version of save_download_stream """
+    tmp_path = _download_tmp_path(folder_name)
+    sha256_hash = hashlib.sha256()
+    try:
+        async with aiofiles.open(tmp_path, 'wb') as new_file:
+            async for chunk in chunks:
+                sha256_hash.update(chunk)
+                await new_file.write(chunk)
+        return _finish_download(tmp_path, sha256_hash.hexdigest(), filename)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def save_minio_download_file(minio_client, bucket_name: str, object_name: str, folder_name: str,
+                             filename: str) -> str:
+    """ stream a minio object into the download cache folder """
+    tmp_path = _download_tmp_path(folder_name)
+    try:
+        hex_dig, _ = minio_client.download_object_sync(bucket_name, object_name, tmp_path)
+        return _finish_download(tmp_path, hex_dig, filename)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+async def asave_minio_download_file(minio_client, bucket_name: str, object_name: str, folder_name: str,
+                                    filename: str) -> str:
+    """ async version of save_minio_download_file """
+    tmp_path = _download_tmp_path(folder_name)
+    try:
+        hex_dig, _ = await minio_client.download_object(bucket_name, object_name, tmp_path)
+        return _finish_download(tmp_path, hex_dig, filename)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
 def file_download(file_path: str):
     """download file and return path"""
 
@@ -313,19 +387,17 @@ def file_download(file_path: str):
             # download file from minio sdk
             bucket_name, object_name = url_obj.path.replace(minio_share_host, "", 1).lstrip("/").split('/', 1)
             object_name = unquote(object_name)
-            file_content = minio_client.get_object_sync(bucket_name, object_name)
+            file_path = save_minio_download_file(minio_client, bucket_name, object_name, 'bisheng', filename)
         else:
             # download file from http url
-            r = requests.get(file_path, verify=False)
-            if r.status_code != 200:
-                raise ValueError('Check the url of your file; returned status code %s' % r.status_code)
-            # OthersContent-Dispositionheader to find the filename
-            content_disposition = r.headers.get('Content-Disposition')
-            if content_disposition:
-                filename = unquote(content_disposition).split('filename=')[-1].strip("\"'")
-            file_content = r.content
-
-        file_path = save_download_file(file_content, 'bisheng', filename)
+            with requests.get(file_path, verify=False, stream=True) as r:
+                if r.status_code != 200:
+                    raise ValueError('Check the url of your file; returned status code %s' % r.status_code)
+                # OthersContent-Dispositionheader to find the filename
+                content_disposition = r.headers.get('Content-Disposition')
+                if content_disposition:
+                    filename = unquote(content_disposition).split('filename=')[-1].strip("\"'")
+                file_path = save_download_stream(r.iter_content(chunk_size=1024 * 1024), 'bisheng', filename)
         return file_path, filename
 
     # <g id="Bold">Medical Treatment:</g> MinIO Relative path (In / Starts with a signature parameter)
@@ -345,10 +417,9 @@ def file_download(file_path: str):
                 bucket_name, object_name = path_parts
                 # Call Synchronized minio Method download
                 object_name = unquote(object_name)
-                file_content = minio_client.get_object_sync(bucket_name, object_name)
 
                 filename = unquote(object_name.split('/')[-1])
-                file_path = save_download_file(file_content, 'bisheng', filename)
+                file_path = save_minio_download_file(minio_client, bucket_name, object_name, 'bisheng', filename)
                 return file_path, filename
         except Exception as e:
             # If the parsing fails, print the log and let the program continue to throw down ValueError
@@ -387,16 +458,16 @@ async def async_file_download(file_path: str):
             # download file from minio sdk
             bucket_name, object_name = url_obj.path.replace(minio_share_host, "", 1).lstrip("/").split('/', 1)
             object_name = unquote(object_name)
-            file_content = await minio_client.get_object(bucket_name, object_name)
+            file_path = await asave_minio_download_file(minio_client, bucket_name, object_name, 'bisheng', filename)
         else:
-            r = await http_client.get(url=file_path, data_type="binary")
-            if r.status_code != 200:
-                raise ValueError('Check the url of your file; returned status code %s' % r.status_code)
-            content_disposition = r.headers.get('Content-Disposition') if r.headers else None
-            if content_disposition:
-                filename = unquote(content_disposition).split('filename=')[-1].strip("\"'")
-            file_content = r.body
-        file_path = save_download_file(file_content, 'bisheng', filename)
+            client = await http_client.get_aiohttp_client()
+            async with client.get(file_path) as r:
+                if r.status != 200:
+                    raise ValueError('Check the url of your file; returned status code %s' % r.status)
+                content_disposition = r.headers.get('Content-Disposition') if r.headers else None
+                if content_disposition:
+                    filename = unquote(content_disposition).split('filename=')[-1].strip("\"'")
+                file_path = await asave_download_stream(r.content.iter_chunked(1024 * 1024), 'bisheng', filename)
         return file_path, filename
 
     # <g id="Bold">Medical Treatment:</g> MinIO Relative path (In / Starts with a signature parameter)
@@ -413,10 +484,9 @@ async def async_file_download(file_path: str):
                 bucket_name, object_name = path_parts
                 object_name = unquote(object_name)
                 # Directly usable after finished products  leave the factory minio client Download without http Request
-                file_content = await minio_client.get_object(bucket_name, object_name)
-
                 filename = unquote(object_name.split('/')[-1])
-                file_path = save_download_file(file_content, 'bisheng', filename)
+                file_path = await asave_minio_download_file(minio_client, bucket_name, object_name, 'bisheng',
+                                                            filename)
                 return file_path, filename
         except Exception as e:
             # If parsing or downloading fails, log or drop it below ValueError
@@ -144,6 +144,11 @@ class WorkflowConf(BaseModel):
     """ Workflow Configuration """
     max_steps: int = Field(default=50, description="Maximum number of steps a node can run")
     timeout: int = Field(default=720, description="Node timeout (min）")
+    batch_concurrency: int = Field(default=5, description="Maximum items of a batch node running at the same time")
+    report_fetch_concurrency: int = Field(default=8, description="Resources of a report node downloaded at the same time")
+    report_fetch_timeout: int = Field(default=30, description="Timeout of one report resource download (s)")
+    report_max_resource_size: int = Field(default=20 * 1024 * 1024,
+                                          description="Largest report resource downloaded (bytes), 0 means no limit")
 
 
 class CeleryConf(BaseModel):
@@ -178,6 +183,11 @@ class CeleryConf(BaseModel):
                 'task': 'bisheng.worker.telemetry.mid_table.sync_mid_user_interact_dtl',
                 'schedule': crontab('*/30 0 * * *'),  # 00:30 exec every day
             }
+        if 'telemetry_token_usage_rollup' not in self.beat_schedule:
+            self.beat_schedule['telemetry_token_usage_rollup'] = {
+                'task': 'bisheng.worker.telemetry.token_usage.sync_token_usage_rollup',
+                'schedule': crontab('5 * * * *'),  # xx:05 exec every hour
+            }
 
         # 定时任务调度器: 每分钟检查一次待执行的定时任务
         if 'check_scheduled_tasks' not in self.beat_schedule:
@@ -193,6 +203,31 @@ class CeleryConf(BaseModel):
         return self
 
 
+class ScheduledTaskConf(BaseModel):
+    """ Scheduled Task Configuration """
+    due_batch_size: int = Field(default=100, description='Maximum due tasks claimed in one scheduler tick')
+    max_running: int = Field(default=10, description='Maximum scheduled executions running at the same time')
+    misfire_grace_time: int = Field(default=300, description='A run started later than this (seconds) is a misfire')
+    misfire_policy: str = Field(default='run_once', description="Misfired run: 'run_once' runs it once now, 'skip' skips it")
+    concurrency_policy: str = Field(default='skip', description="Previous run still running: 'skip' skips this run, 'allow' runs both")
+    lease_ttl: int = Field(default=43200, description='Seconds a run counts as running when its worker never reports back')
+
+
+class EvaluationConf(BaseModel):
+    """ Evaluation Task Configuration """
+    concurrency: int = Field(default=4, description='Questions of one evaluation target answered at the same time, 1 means serial')
+    score_batch_size: int = Field(default=10, description='Answers scored in one call, a batch is scored as soon as it is answered')
+    score_concurrency: int = Field(default=2, description='Score batches running at the same time')
+    checkpoint_expire: int = Field(default=7 * 86400, description='Seconds the answers and scores of an unfinished evaluation are kept to resume it')
+    lock_ttl: int = Field(default=120, description='Seconds an evaluation counts as running after its process stopped, it is resumed after that')
+
+
+class MetricsConf(BaseModel):
+    """ Prometheus /metrics endpoint Configuration """
+    enabled: bool = Field(default=False, description='Serve request metrics at /metrics, it answers 404 when disabled')
+    token: str = Field(default='', description="Scrapes must send 'Authorization: Bearer <token>', empty means no check")
+
+
 class LinsightConf(BaseModel):
     """ Inspiration Configuration """
     debug: bool = Field(default=False, description='Whether to opendebugMode')
@@ -207,6 +242,7 @@ class LinsightConf(BaseModel):
     retry_temperature: float = Field(default=1, description='reactModejsonModel temperature when retrying after parsing failure')
     file_content_length: int = Field(default=5000, description='The number of characters to read the contents of the file when splitting subtasks, which will be truncated when exceeded')
     max_file_content_num: int = Field(default=3, description='Number of files to read when subtasking, in reverse order by modification time')
+    max_parallel_tasks: int = Field(default=4, description='Maximum first-level tasks executed at the same time, tasks without dependencies between them run in parallel, 1 means serial')
 
 
 class CookieConf(BaseModel):
@@ -227,6 +263,9 @@ class Etl4lmConf(BaseModel):
     url: str = Field(default='', description='etl4lmService Address')
     timeout: int = Field(default=600, description='etl4lmService Request Timeout (sec)')
     ocr_sdk_url: str = Field(default='', description='etl4lm ocr sdkService Address')
+    shard_pages: int = Field(default=50, description='Pages of one shard when a large pdf is partitioned in parallel, 0 disables sharding')
+    max_concurrency: int = Field(default=4, description='Shards of one file partitioned at the same time')
+    max_retries: int = Field(default=2, description='Retries of a shard after a connection error, timeout or 5xx answer')
 
 
 class KnowledgeConf(BaseModel):
@@ -281,6 +320,9 @@ class Settings(BaseModel):
     object_storage: ObjectStore = ObjectStore()
     workflow_conf: WorkflowConf = WorkflowConf()
     celery_task: CeleryConf = CeleryConf()
+    scheduled_task_conf: ScheduledTaskConf = ScheduledTaskConf()
+    evaluation_conf: EvaluationConf = EvaluationConf()
+    metrics_conf: MetricsConf = MetricsConf()
     cookie_conf: CookieConf = CookieConf()
     telemetry_elasticsearch: ElasticsearchConf = ElasticsearchConf()
 
@@ -0,0 +1,36 @@
+"""Add the due task index to the scheduled_task table.
+
+Revision ID: 4c1d7e2a9b3f
+Revises: 9ba42685e830
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1d7e2a9b3f'
+down_revision: Union[str, Sequence[str], None] = '9ba42685e830'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_index() -> bool:
+    # the table and the index are created by create_all on a new install
+    inspector = sa.inspect(op.get_bind())
+    if 'scheduled_task' not in inspector.get_table_names():
+        return True
+    return any(one['name'] == 'scheduled_task_due_idx' for one in inspector.get_indexes('scheduled_task'))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_index():
+        op.create_index('scheduled_task_due_idx', 'scheduled_task', ['status', 'next_run_time'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('scheduled_task_due_idx', table_name='scheduled_task')
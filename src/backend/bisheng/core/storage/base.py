@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Union, BinaryIO
+from typing import Union, BinaryIO, AsyncIterator, Iterator, Tuple, List
 
 
 class BaseStorage(ABC):
@@ -68,6 +68,40 @@ class BaseStorage(ABC):
         """Download an object from a storage bucket (synchronous)."""
         pass
 
+    @abstractmethod
+    def iter_object(self, bucket_name: str, object_name: str, chunk_size: int = 1024 * 1024,
+                    offset: int = 0, length: int = 0) -> AsyncIterator[bytes]:
+        """Iterate over the content of an object in chunks, optionally within a byte range."""
+        pass
+
+    @abstractmethod
+    def iter_object_sync(self, bucket_name: str, object_name: str, chunk_size: int = 1024 * 1024,
+                         offset: int = 0, length: int = 0) -> Iterator[bytes]:
+        """Iterate over the content of an object in chunks, optionally within a byte range (synchronous)."""
+        pass
+
+    @abstractmethod
+    async def get_object_range(self, bucket_name: str, object_name: str, offset: int, length: int) -> bytes:
+        """Read a byte range of an object."""
+        pass
+
+    @abstractmethod
+    def get_object_range_sync(self, bucket_name: str, object_name: str, offset: int, length: int) -> bytes:
+        """Read a byte range of an object (synchronous)."""
+        pass
+
+    @abstractmethod
+    async def download_object(self, bucket_name: str, object_name: str, file_path: Union[Path, str],
+                              hash_algorithm: str = 'sha256') -> Tuple[str, int]:
+        """Stream an object to a local file, return the hex digest and the size of the content."""
+        pass
+
+    @abstractmethod
+    def download_object_sync(self, bucket_name: str, object_name: str, file_path: Union[Path, str],
+                             hash_algorithm: str = 'sha256') -> Tuple[str, int]:
+        """Stream an object to a local file, return the hex digest and the size of the content (synchronous)."""
+        pass
+
     @abstractmethod
     async def object_exists(self, bucket_name: str, object_name: str) -> bool:
         """Check if an object exists in a storage bucket."""
@@ -89,6 +123,16 @@ class BaseStorage(ABC):
         """Copy an object from one storage bucket to another (synchronous)."""
         pass
 
+    @abstractmethod
+    async def compose_object(self, bucket_name: str, object_name: str, source_objects: List[str]) -> None:
+        """Concatenate objects of the bucket into a new object."""
+        pass
+
+    @abstractmethod
+    def compose_object_sync(self, bucket_name: str, object_name: str, source_objects: List[str]) -> None:
+        """Concatenate objects of the bucket into a new object (synchronous)."""
+        pass
+
     @abstractmethod
     async def remove_object(self, bucket_name: str, object_name: str) -> None:
         """Remove an object from a storage bucket."""
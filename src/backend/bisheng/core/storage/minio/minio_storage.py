@@ -1,10 +1,12 @@
+import hashlib
 import json
 from abc import ABC
 from datetime import timedelta
 from io import BytesIO
 from pathlib import Path
-from typing import BinaryIO, Union, Optional
+from typing import BinaryIO, Union, Optional, AsyncIterator, Iterator, Tuple, List
 
+import aiofiles
 import minio
 import miniopy_async
 import miniopy_async.commonconfig as miniopy_async_commonconfig
@@ -242,6 +244,116 @@ class MinioStorage(BaseStorage, ABC):
             response.close()
             response.release_conn()
 
+    async def iter_object(self, bucket_name: Optional[str] = None, object_name: str = None,
+                          chunk_size: int = 1024 * 1024, offset: int = 0, length: int = 0) -> AsyncIterator[bytes]:
+        """
+        Iterate over the object content in chunks without loading the whole object in memory
+        :param offset: start position of the byte range
+        :param length: length of the byte range, 0 means read to the end
+        """
+        if bucket_name is None:
+            bucket_name = self.bucket
+
+        if object_name is None:
+            raise ValueError("iter_object: object_name must be provided")
+
+        response = await self.minio_client.get_object(bucket_name, object_name, offset=offset, length=length)
+        try:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+        finally:
+            response.close()
+
+    def iter_object_sync(self, bucket_name: Optional[str] = None, object_name: str = None,
+                         chunk_size: int = 1024 * 1024, offset: int = 0, length: int = 0) -> Iterator[bytes]:
+        """
+        Iterate over the object content in chunks without loading the whole object in memory
+        :param offset: start position of the byte range
+        :param length: length of the byte range, 0 means read to the end
+        """
+        if bucket_name is None:
+            bucket_name = self.bucket
+
+        if object_name is None:
+            raise ValueError("iter_object_sync: object_name must be provided")
+
+        response = self.minio_client_sync.get_object(bucket_name, object_name, offset=offset, length=length)
+        try:
+            for chunk in response.stream(chunk_size):
+                yield chunk
+        finally:
+            response.close()
+            response.release_conn()
+
+    async def get_object_range(self, bucket_name: Optional[str] = None, object_name: str = None,
+                               offset: int = 0, length: int = 0) -> bytes:
+        """ read the byte range [offset, offset + length) of the object """
+        if bucket_name is None:
+            bucket_name = self.bucket
+
+        if object_name is None:
+            raise ValueError("get_object_range: object_name must be provided")
+
+        response = await self.minio_client.get_object(bucket_name, object_name, offset=offset, length=length)
+        try:
+            return await response.read()
+        finally:
+            response.close()
+
+    def get_object_range_sync(self, bucket_name: Optional[str] = None, object_name: str = None,
+                              offset: int = 0, length: int = 0) -> bytes:
+        """ read the byte range [offset, offset + length) of the object """
+        if bucket_name is None:
+            bucket_name = self.bucket
+
+        if object_name is None:
+            raise ValueError("get_object_range_sync: object_name must be provided")
+
+        response = self.minio_client_sync.get_object(bucket_name, object_name, offset=offset, length=length)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    async def download_object(self, bucket_name: Optional[str] = None, object_name: str = None,
+                              file_path: Union[Path, str] = None, hash_algorithm: str = 'sha256',
+                              chunk_size: int = 1024 * 1024) -> Tuple[str, int]:
+        """
+        Stream the object to file_path and hash the content on the way
+        :return: (hex digest of the content, size of the content)
+        """
+        if file_path is None:
+            raise ValueError("download_object: file_path must be provided")
+
+        hasher = hashlib.new(hash_algorithm)
+        size = 0
+        async with aiofiles.open(file_path, 'wb') as f:
+            async for chunk in self.iter_object(bucket_name, object_name, chunk_size=chunk_size):
+                hasher.update(chunk)
+                size += len(chunk)
+                await f.write(chunk)
+        return hasher.hexdigest(), size
+
+    def download_object_sync(self, bucket_name: Optional[str] = None, object_name: str = None,
+                             file_path: Union[Path, str] = None, hash_algorithm: str = 'sha256',
+                             chunk_size: int = 1024 * 1024) -> Tuple[str, int]:
+        """
+        Stream the object to file_path and hash the content on the way
+        :return: (hex digest of the content, size of the content)
+        """
+        if file_path is None:
+            raise ValueError("download_object_sync: file_path must be provided")
+
+        hasher = hashlib.new(hash_algorithm)
+        size = 0
+        with open(file_path, 'wb') as f:
+            for chunk in self.iter_object_sync(bucket_name, object_name, chunk_size=chunk_size):
+                hasher.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        return hasher.hexdigest(), size
+
     async def object_exists(self, bucket_name: Optional[str] = None, object_name: str = None) -> bool:
 
         if not bucket_name:
@@ -314,6 +426,21 @@ class MinioStorage(BaseStorage, ABC):
             source=source
         )
 
+    async def compose_object(self, bucket_name: Optional[str] = None, object_name: str = None,
+                             source_objects: List[str] = None) -> None:
+        """ server side concatenation, every source except the last one must be at least 5MB """
+        if bucket_name is None:
+            bucket_name = self.bucket
+        sources = [miniopy_async_commonconfig.ComposeSource(bucket_name, one) for one in source_objects]
+        await self.minio_client.compose_object(bucket_name, object_name, sources)
+
+    def compose_object_sync(self, bucket_name: Optional[str] = None, object_name: str = None,
+                            source_objects: List[str] = None) -> None:
+        if bucket_name is None:
+            bucket_name = self.bucket
+        sources = [minio.commonconfig.ComposeSource(bucket_name, one) for one in source_objects]
+        self.minio_client_sync.compose_object(bucket_name, object_name, sources)
+
     async def remove_object(self, bucket_name: Optional[str] = None, object_name: str = None) -> None:
         if bucket_name is None:
             bucket_name = self.bucket
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import aiofiles
+from loguru import logger
+from pydantic import BaseModel, Field, PrivateAttr
+
+from bisheng.core.storage.minio.minio_storage import MinioStorage
+
+
+class UploadStats(BaseModel):
+    """ result of one batch upload """
+    total: int = Field(default=0, description='number of files in the batch')
+    uploaded: int = Field(default=0, description='files sent to object storage')
+    copied: int = Field(default=0, description='files with duplicate content, copied on the server side')
+    skipped: int = Field(default=0, description='files already stored with the same content')
+    failed: int = Field(default=0, description='files failed after all retries')
+    bytes: int = Field(default=0, description='bytes sent to object storage')
+    seconds: float = Field(default=0, description='wall time of the batch')
+    _error: Optional[Exception] = PrivateAttr(default=None)
+
+    def add_failure(self, error: Exception):
+        self.failed += 1
+        self._error = self._error or error
+
+    def raise_for_failed(self):
+        """ re-raise the first upload error of the batch """
+        if self.failed:
+            raise self._error or RuntimeError(f'{self.failed} of {self.total} files failed to upload')
+
+    @property
+    def throughput(self) -> float:
+        """ uploaded bytes per second """
+        return self.bytes / self.seconds if self.seconds else 0
+
+    def __str__(self):
+        return (f'total={self.total} uploaded={self.uploaded} copied={self.copied} skipped={self.skipped} '
+                f'failed={self.failed} bytes={self.bytes} seconds={self.seconds:.3f} '
+                f'throughput={self.throughput / 1024 / 1024:.2f}MB/s')
+
+
+class ObjectUploadManager:
+    """
+    Upload many local files to object storage concurrently.
+
+    - bounded parallelism: at most `max_workers` uploads in flight
+    - content dedup: an object that already exists with the same md5 etag is skipped, and files of a batch
+      with identical content are uploaded once and copied on the server side for the other names
+    - retry with exponential backoff for every request
+    """
+
+    def __init__(self, minio_client: MinioStorage, max_workers: int = 8, max_retries: int = 3,
+                 backoff: float = 0.5):
+        self.minio_client = minio_client
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    @staticmethod
+    def _file_md5(file_path: str) -> str:
+        md5 = hashlib.md5()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                md5.update(chunk)
+        return md5.hexdigest()
+
+    @staticmethod
+    def _merge_stats(stats: UploadStats, partials: List[UploadStats]):
+        for one in partials:
+            stats.uploaded += one.uploaded
+            stats.copied += one.copied
+            stats.skipped += one.skipped
+            stats.failed += one.failed
+            stats.bytes += one.bytes
+            stats._error = stats._error or one._error
+
+    @staticmethod
+    def _group_by_content(files: List[Tuple[str, str]], digests: List[str]) -> Dict[str, List[Tuple[str, str]]]:
+        groups: Dict[str, List[Tuple[str, str]]] = {}
+        for (local_path, object_name), digest in zip(files, digests):
+            groups.setdefault(digest, []).append((local_path, object_name))
+        return groups
+
+    def _retry(self, func, *args, **kwargs):
+        for i in range(self.max_retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if i >= self.max_retries:
+                    raise e
+                sleep = self.backoff * (2 ** i)
+                logger.warning(f'object upload retry {i + 1}/{self.max_retries} after {sleep}s, error: {e}')
+                time.sleep(sleep)
+
+    async def _aretry(self, func, *args, **kwargs):
+        for i in range(self.max_retries + 1):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if i >= self.max_retries:
+                    raise e
+                sleep = self.backoff * (2 ** i)
+                logger.warning(f'object upload retry {i + 1}/{self.max_retries} after {sleep}s, error: {e}')
+                await asyncio.sleep(sleep)
+
+    def _stored_etag(self, bucket_name: str, object_name: str) -> Optional[str]:
+        try:
+            return self.minio_client.minio_client_sync.stat_object(bucket_name, object_name).etag
+        except Exception as e:
+            if 'NoSuchKey' in str(e) or 'Not Found' in str(e):
+                return None
+            raise e
+
+    async def _astored_etag(self, bucket_name: str, object_name: str) -> Optional[str]:
+        try:
+            return (await self.minio_client.minio_client.stat_object(bucket_name, object_name)).etag
+        except Exception as e:
+            if 'NoSuchKey' in str(e) or 'Not Found' in str(e):
+                return None
+            raise e
+
+    def _upload_group(self, bucket_name: str, digest: str, group: List[Tuple[str, str]]) -> UploadStats:
+        """ upload the first file of one content group, copy it for the rest """
+        stats = UploadStats(total=len(group))
+        source_object = None
+        for local_path, object_name in group:
+            try:
+                if self._retry(self._stored_etag, bucket_name, object_name) == digest:
+                    stats.skipped += 1
+                elif source_object is None:
+                    self._retry(self.minio_client.put_object_sync, bucket_name=bucket_name, object_name=object_name,
+                                file=local_path)
+                    stats.uploaded += 1
+                    stats.bytes += os.path.getsize(local_path)
+                else:
+                    self._retry(self.minio_client.copy_object_sync, source_bucket=bucket_name,
+                                source_object=source_object, dest_bucket=bucket_name, dest_object=object_name)
+                    stats.copied += 1
+                source_object = source_object or object_name
+            except Exception as e:
+                stats.add_failure(e)
+                logger.exception(f'upload object {object_name} failed: {e}')
+        return stats
+
+    async def _aupload_group(self, bucket_name: str, digest: str, group: List[Tuple[str, str]]) -> UploadStats:
+        stats = UploadStats(total=len(group))
+        source_object = None
+        for local_path, object_name in group:
+            try:
+                if await self._aretry(self._astored_etag, bucket_name, object_name) == digest:
+                    stats.skipped += 1
+                elif source_object is None:
+                    await self._aretry(self.minio_client.put_object, bucket_name=bucket_name,
+                                       object_name=object_name, file=local_path)
+                    stats.uploaded += 1
+                    stats.bytes += os.path.getsize(local_path)
+                else:
+                    await self._aretry(self.minio_client.copy_object, source_bucket=bucket_name,
+                                       source_object=source_object, dest_bucket=bucket_name, dest_object=object_name)
+                    stats.copied += 1
+                source_object = source_object or object_name
+            except Exception as e:
+                stats.add_failure(e)
+                logger.exception(f'upload object {object_name} failed: {e}')
+        return stats
+
+    def upload_files(self, files: List[Tuple[str, str]], bucket_name: str = None) -> UploadStats:
+        """
+        :param files: list of (local file path, object name)
+        :param bucket_name: default is the public bucket
+        """
+        bucket_name = bucket_name or self.minio_client.bucket
+        stats = UploadStats(total=len(files))
+        if not files:
+            return stats
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            digests = list(executor.map(lambda one: self._file_md5(one[0]), files))
+            groups = self._group_by_content(files, digests)
+            futures = [executor.submit(self._upload_group, bucket_name, digest, group)
+                       for digest, group in groups.items()]
+            self._merge_stats(stats, [future.result() for future in futures])
+        stats.seconds = time.perf_counter() - start
+        return stats
+
+    async def aupload_files(self, files: List[Tuple[str, str]], bucket_name: str = None) -> UploadStats:
+        """ async version of upload_files """
+        bucket_name = bucket_name or self.minio_client.bucket
+        stats = UploadStats(total=len(files))
+        if not files:
+            return stats
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def _md5(local_path: str) -> str:
+            md5 = hashlib.md5()
+            async with semaphore:
+                async with aiofiles.open(local_path, 'rb') as f:
+                    while chunk := await f.read(1024 * 1024):
+                        md5.update(chunk)
+            return md5.hexdigest()
+
+        async def _upload(digest: str, group: List[Tuple[str, str]]) -> UploadStats:
+            async with semaphore:
+                return await self._aupload_group(bucket_name, digest, group)
+
+        digests = await asyncio.gather(*[_md5(one[0]) for one in files])
+        groups = self._group_by_content(files, digests)
+        self._merge_stats(stats, await asyncio.gather(*[_upload(digest, group) for digest, group in groups.items()]))
+        stats.seconds = time.perf_counter() - start
+        return stats
@@ -88,6 +88,13 @@ class EvaluationDao(EvaluationBase):
             statement = select(Evaluation).where(Evaluation.id == evaluation_id)
             return session.exec(statement).first()
 
+    @classmethod
+    def get_running_evaluations(cls) -> List[Evaluation]:
+        with get_sync_db_session() as session:
+            statement = select(Evaluation).where(and_(Evaluation.is_delete == 0,
+                                                      Evaluation.status == EvaluationTaskStatus.running.value))
+            return session.exec(statement).all()
+
     @classmethod
     def update_evaluation(cls, evaluation: Evaluation) -> Evaluation:
         with get_sync_db_session() as session:
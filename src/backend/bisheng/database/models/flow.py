@@ -163,6 +163,18 @@ class FlowDao(FlowBase):
             session.commit()
             return flow_info
 
+    @classmethod
+    async def adelete_flow(cls, flow_info: Flow) -> Flow:
+        from bisheng.database.models.flow_version import FlowVersion
+        async with get_async_db_session() as session:
+            await session.delete(flow_info)
+            # Delete the corresponding version information
+            update_statement = update(FlowVersion).where(
+                FlowVersion.flow_id == flow_info.id).values(is_delete=1)
+            await session.exec(update_statement)
+            await session.commit()
+            return flow_info
+
     @classmethod
     def get_flow_by_id(cls, flow_id: str) -> Optional[Flow]:
         with get_sync_db_session() as session:
@@ -564,6 +576,32 @@ class FlowDao(FlowBase):
                 })
             return data
 
+    @classmethod
+    def get_all_app_by_update_cursor(cls, cursor: Optional[Tuple[datetime, str]], start_time: datetime = None,
+                                     end_time: datetime = None, limit: int = 1000) -> List[Dict]:
+        """ keyset pagination of flows and assistants ordered by (update_time, id) """
+        sub_query = select(
+            Flow.id, Flow.name, Flow.description, Flow.flow_type, Flow.logo, Flow.user_id,
+            Flow.status, Flow.create_time, Flow.update_time).union_all(
+            select(Assistant.id, Assistant.name, Assistant.desc, FlowType.ASSISTANT.value,
+                   Assistant.logo, Assistant.user_id, Assistant.status, Assistant.create_time,
+                   Assistant.update_time).where(Assistant.is_delete == 0)).subquery()
+
+        statement = select(sub_query.c.id, sub_query.c.name, sub_query.c.description,
+                           sub_query.c.flow_type, sub_query.c.logo, sub_query.c.user_id,
+                           sub_query.c.status, sub_query.c.create_time, sub_query.c.update_time)
+        if cursor:
+            statement = statement.where(or_(sub_query.c.update_time > cursor[0],
+                                            and_(sub_query.c.update_time == cursor[0], sub_query.c.id > cursor[1])))
+        if start_time:
+            statement = statement.where(sub_query.c.update_time >= start_time)
+        if end_time:
+            statement = statement.where(sub_query.c.update_time < end_time)
+        statement = statement.order_by(sub_query.c.update_time, sub_query.c.id).limit(limit)
+        keys = ['id', 'name', 'description', 'flow_type', 'logo', 'user_id', 'status', 'create_time', 'update_time']
+        with get_sync_db_session() as session:
+            return [dict(zip(keys, one)) for one in session.exec(statement).all()]
+
     @classmethod
     def get_first_app(cls):
         sub_query = select(
@@ -5,6 +5,7 @@ from sqlalchemy import Column, DateTime, text, func, delete, and_, UniqueConstra
 from sqlmodel import Field, select
 
 from bisheng.common.models.base import SQLModelSerializable
+from bisheng.core.cache.permission_version import PermissionVersion
 from bisheng.core.database import get_sync_db_session, get_async_db_session
 from bisheng.database.constants import AdminRole
 from bisheng.database.models.role_access import RoleAccess
@@ -97,6 +98,7 @@ class RoleDao(RoleBase):
             session.exec(delete(UserRole).where(UserRole.role_id == role_id))
             session.exec(delete(RoleAccess).where(RoleAccess.role_id == role_id))
             session.commit()
+        PermissionVersion.bump_global()
 
     @classmethod
     def get_role_by_ids(cls, role_ids: List[int]) -> List[Role]:
@@ -129,3 +131,4 @@ class RoleDao(RoleBase):
             session.exec(delete(UserRole).where(UserRole.id.in_([one.UserRole.id for one in all_user])))
             session.exec(delete(Role).where(Role.group_id == group_id))
             session.commit()
+        PermissionVersion.bump_users([one.UserRole.user_id for one in all_user])
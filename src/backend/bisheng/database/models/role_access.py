@@ -7,6 +7,7 @@ from sqlalchemy import Column, DateTime, text
 from sqlmodel import Field, select, delete, col
 
 from bisheng.common.models.base import SQLModelSerializable
+from bisheng.core.cache.permission_version import PermissionVersion
 from bisheng.core.database import get_sync_db_session, get_async_db_session
 
 
@@ -167,3 +168,4 @@ class RoleAccessDao(RoleAccessBase):
                 role_access = RoleAccess(role_id=role_id, third_id=str(access_id), type=access_type.value)
                 session.add(role_access)
             await session.commit()
+        await PermissionVersion.abump_global()
@@ -8,8 +8,8 @@ from datetime import datetime
 from enum import Enum
 from typing import List, Optional
 
-from sqlmodel import Field, select, Column, DateTime, text, Text, func, JSON, desc
-from sqlalchemy import Integer
+from sqlmodel import Field, select, Column, DateTime, text, Text, func, JSON, desc, update
+from sqlalchemy import Integer, Index
 
 from bisheng.common.models.base import SQLModelSerializable
 from bisheng.core.database import get_sync_db_session, get_async_db_session
@@ -59,6 +59,8 @@ class ScheduledTaskBase(SQLModelSerializable):
 
 class ScheduledTask(ScheduledTaskBase, table=True):
     __tablename__ = 'scheduled_task'
+    # due task query: status = enabled and next_run_time <= now order by next_run_time
+    __table_args__ = (Index('scheduled_task_due_idx', 'status', 'next_run_time'),)
     id: Optional[int] = Field(default=None, primary_key=True)
 
 
@@ -115,6 +117,36 @@ class ScheduledTaskDao(ScheduledTaskBase):
                 ScheduledTask.status == TaskStatus.ENABLED.value)
             return session.exec(statement).all()
 
+    @classmethod
+    def get_due_tasks(cls, now: datetime, limit: int = 100) -> List[ScheduledTask]:
+        """ enabled tasks whose next_run_time has passed, earliest first """
+        with get_sync_db_session() as session:
+            statement = select(ScheduledTask).where(
+                ScheduledTask.status == TaskStatus.ENABLED.value,
+                ScheduledTask.next_run_time <= now,
+            ).order_by(ScheduledTask.next_run_time).limit(limit)
+            return session.exec(statement).all()
+
+    @classmethod
+    def claim_task(cls, task_id: int, expected_next_run: datetime, last_run: Optional[datetime],
+                   next_run: Optional[datetime]) -> bool:
+        """
+        move next_run_time forward if it is still expected_next_run,
+        only one scheduler replica wins a due run
+        """
+        values = {'next_run_time': next_run}
+        if last_run is not None:
+            values['last_run_time'] = last_run
+        statement = update(ScheduledTask).where(
+            ScheduledTask.id == task_id,
+            ScheduledTask.status == TaskStatus.ENABLED.value,
+            ScheduledTask.next_run_time == expected_next_run,
+        ).values(**values)
+        with get_sync_db_session() as session:
+            result = session.exec(statement)
+            session.commit()
+            return result.rowcount > 0
+
     @classmethod
     def get_task_by_id(cls, task_id: int) -> Optional[ScheduledTask]:
         with get_sync_db_session() as session:
@@ -156,6 +188,14 @@ class ScheduledTaskDao(ScheduledTaskBase):
                 session.add(task)
                 session.commit()
 
+    @classmethod
+    def update_last_run_time(cls, task_id: int, last_run: datetime):
+        """ a manual run, next_run_time is left to the scheduler """
+        statement = update(ScheduledTask).where(ScheduledTask.id == task_id).values(last_run_time=last_run)
+        with get_sync_db_session() as session:
+            session.exec(statement)
+            session.commit()
+
 
 class TaskExecutionLogDao(TaskExecutionLogBase):
 
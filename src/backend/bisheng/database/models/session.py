@@ -1,7 +1,8 @@
 from datetime import datetime
 from enum import Enum
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
+from sqlalchemy import and_, or_
 from sqlmodel import Field, Column, DateTime, text, select, func, update
 
 from bisheng.common.models.base import SQLModelSerializable
@@ -148,6 +149,26 @@ class MessageSessionDao(MessageSessionBase):
         with get_sync_db_session() as session:
             return session.exec(statement).all()
 
+    @classmethod
+    def filter_session_by_cursor(cls,
+                                 cursor: Optional[Tuple[datetime, str]] = None,
+                                 limit: int = 1000,
+                                 **filters) -> List[MessageSession]:
+        """
+        keyset pagination ordered by (create_time desc, chat_id desc)
+        :param cursor: (create_time, chat_id) of the last row of the previous page, None for the first page
+        :param filters: same filters as filter_session
+        """
+        statement = cls.generate_filter_session_statement(select(MessageSession), **filters)
+        if cursor:
+            create_time, chat_id = cursor
+            statement = statement.where(or_(MessageSession.create_time < create_time,
+                                            and_(MessageSession.create_time == create_time,
+                                                 MessageSession.chat_id < chat_id)))
+        statement = statement.order_by(MessageSession.create_time.desc(), MessageSession.chat_id.desc()).limit(limit)
+        with get_sync_db_session() as session:
+            return session.exec(statement).all()
+
     @classmethod
     def filter_session_count(cls,
                              chat_ids: List[str] = None,
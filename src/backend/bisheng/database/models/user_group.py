@@ -5,6 +5,7 @@ from sqlalchemy import Column, DateTime, delete, text, INT
 from sqlmodel import Field, select
 
 from bisheng.common.models.base import SQLModelSerializable
+from bisheng.core.cache.permission_version import PermissionVersion
 from bisheng.core.database import get_sync_db_session, get_async_db_session
 from bisheng.database.models.group import DefaultGroup
 
@@ -99,7 +100,8 @@ class UserGroupDao(UserGroupBase):
             session.add(user_group)
             session.commit()
             session.refresh(user_group)
-            return user_group
+        PermissionVersion.bump_users([user_group.user_id])
+        return user_group
 
     @classmethod
     def insert_user_group_admin(cls, user_id: int, group_id: int) -> UserGroup:
@@ -111,7 +113,8 @@ class UserGroupDao(UserGroupBase):
             session.add(user_group)
             session.commit()
             session.refresh(user_group)
-            return user_group
+        PermissionVersion.bump_users([user_id])
+        return user_group
 
     @classmethod
     def delete_user_group(cls, user_id: int, group_id: int) -> None:
@@ -121,6 +124,7 @@ class UserGroupDao(UserGroupBase):
             user_group = session.exec(statement).first()
             session.delete(user_group)
             session.commit()
+        PermissionVersion.bump_users([user_id])
 
     @classmethod
     def delete_user_groups(cls, user_id: int, group_ids: List[int]):
@@ -136,6 +140,7 @@ class UserGroupDao(UserGroupBase):
             )
             session.exec(statement)
             session.commit()
+        PermissionVersion.bump_users([user_id])
 
     @classmethod
     def add_user_groups(cls, user_id: int, group_ids: List[int]):
@@ -147,6 +152,7 @@ class UserGroupDao(UserGroupBase):
                 user_group = UserGroup(user_id=user_id, group_id=group_id, is_group_admin=0)
                 session.add(user_group)
             session.commit()
+        PermissionVersion.bump_users([user_id])
 
     @classmethod
     def get_group_user(cls,
@@ -197,7 +203,8 @@ class UserGroupDao(UserGroupBase):
         with get_sync_db_session() as session:
             session.add_all(user_groups)
             session.commit()
-            return user_groups
+        PermissionVersion.bump_users([one.user_id for one in user_groups])
+        return user_groups
 
     @classmethod
     async def add_default_user_group(cls, user_id: int) -> None:
@@ -208,6 +215,7 @@ class UserGroupDao(UserGroupBase):
             user_group = UserGroup(user_id=user_id, group_id=DefaultGroup, is_group_admin=False)
             session.add(user_group)
             await session.commit()
+        await PermissionVersion.abump_users([user_id])
 
     @classmethod
     def delete_group_admins(cls, group_id: int, admin_ids: List[int]) -> None:
@@ -221,6 +229,7 @@ class UserGroupDao(UserGroupBase):
                 UserGroup.is_group_admin == 1)
             session.exec(statement)
             session.commit()
+        PermissionVersion.bump_users(admin_ids)
 
     @classmethod
     def delete_group_all_admin(cls, group_id: int) -> None:
@@ -233,3 +242,5 @@ class UserGroupDao(UserGroupBase):
                 UserGroup.is_group_admin == 1)
             session.exec(statement)
             session.commit()
+        # the affected users are unknown here
+        PermissionVersion.bump_global()
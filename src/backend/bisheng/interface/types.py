@@ -1,44 +1,45 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from functools import lru_cache
+from importlib import metadata
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
-from bisheng.interface.agents.base import agent_creator
-from bisheng.interface.autogenRole.base import autogenrole_creator
-from bisheng.interface.chains.base import chain_creator
-from bisheng.interface.custom.directory_reader.utils import merge_nested_dicts_with_renaming
-from bisheng.interface.custom.utils import build_custom_components
-from bisheng.interface.document_loaders.base import documentloader_creator
-from bisheng.interface.embeddings.base import embedding_creator
-from bisheng.interface.inputoutput.base import input_output_creator
-from bisheng.interface.llms.base import llm_creator
-from bisheng.interface.memories.base import memory_creator
-from bisheng.interface.output_parsers.base import output_parser_creator
-from bisheng.interface.prompts.base import prompt_creator
-from bisheng.interface.retrievers.base import retriever_creator
-from bisheng.interface.text_splitters.base import textsplitter_creator
-from bisheng.interface.toolkits.base import toolkits_creator
-from bisheng.interface.tools.base import tool_creator
-from bisheng.interface.utilities.base import utility_creator
-from bisheng.interface.vector_store.base import vectorstore_creator
-from bisheng.interface.wrappers.base import wrapper_creator
-from cachetools import LRUCache, cached
+from loguru import logger
 
+BASE_COMPONENTS_PATH = str(Path(__file__).parent.parent / 'components')
+# packages whose version changes the langchain types
+TYPES_CACHE_PACKAGES = ['langchain', 'langchain-community', 'langchain-core', 'bisheng-langchain']
+# settings the creators filter their types and docs by, see the type_name of every creator
+TYPES_CACHE_SETTINGS = ['dev', 'chains', 'agents', 'prompts', 'llms', 'tools', 'memories', 'embeddings', 'vectorstores',
+                        'documentloaders', 'wrappers', 'retrievers', 'toolkits', 'textsplitters', 'utilities',
+                        'input_output', 'output_parsers', 'autogen_roles']
+# sources of the creators and of the frontend node templates they build
+TYPES_CACHE_SOURCES = [Path(__file__).parent, Path(__file__).parent.parent / 'template']
 
-def get_type_list():
-    """Get a list of all langchain types"""
-    all_types = build_langchain_types_dict()
 
-    # all_types.pop("tools")
-
-    for key, value in all_types.items():
-        all_types[key] = [item['template']['_type'] for item in value.values()]
-
-    return all_types
-
-
-@cached(LRUCache(maxsize=1))
-def build_langchain_types_dict():  # sourcery skip: dict-assign-update-to-union
-    """Build a dictionary of all langchain types"""
-
-    all_types = {}
+def _build_langchain_types() -> Dict:
+    """Introspect every creator, the creators are imported only here"""
+    from bisheng.interface.agents.base import agent_creator
+    from bisheng.interface.autogenRole.base import autogenrole_creator
+    from bisheng.interface.chains.base import chain_creator
+    from bisheng.interface.document_loaders.base import documentloader_creator
+    from bisheng.interface.embeddings.base import embedding_creator
+    from bisheng.interface.inputoutput.base import input_output_creator
+    from bisheng.interface.llms.base import llm_creator
+    from bisheng.interface.memories.base import memory_creator
+    from bisheng.interface.output_parsers.base import output_parser_creator
+    from bisheng.interface.prompts.base import prompt_creator
+    from bisheng.interface.retrievers.base import retriever_creator
+    from bisheng.interface.text_splitters.base import textsplitter_creator
+    from bisheng.interface.toolkits.base import toolkits_creator
+    from bisheng.interface.tools.base import tool_creator
+    from bisheng.interface.utilities.base import utility_creator
+    from bisheng.interface.vector_store.base import vectorstore_creator
+    from bisheng.interface.wrappers.base import wrapper_creator
 
     creators = [
         chain_creator,
@@ -68,13 +69,180 @@ def build_langchain_types_dict():  # sourcery skip: dict-assign-update-to-union
     return all_types
 
 
-langchain_types_dict = build_langchain_types_dict()
+def _settings_digest() -> str:
+    from bisheng.common.services.config_service import settings
+    sections = {name: getattr(settings, name, None) for name in TYPES_CACHE_SETTINGS}
+    return hashlib.sha256(json.dumps(sections, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _sources_digest() -> str:
+    digest = hashlib.sha256()
+    for source in TYPES_CACHE_SOURCES:
+        for p in sorted(source.rglob('*.py')):
+            digest.update(str(p.relative_to(source)).encode())
+            digest.update(p.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+@lru_cache(maxsize=1)
+def _types_version() -> str:
+    """
+    bisheng version, the versions of the packages the types are introspected from, the settings the
+    creators filter by and the creator sources, the version alone misses code patched into an image
+    """
+    from bisheng import __version__
+    versions = [f'bisheng={__version__}']
+    for package in TYPES_CACHE_PACKAGES:
+        try:
+            versions.append(f'{package}={metadata.version(package)}')
+        except metadata.PackageNotFoundError:
+            continue
+    versions.append(f'settings={_settings_digest()}')
+    versions.append(f'sources={_sources_digest()}')
+    return ';'.join(versions)
+
+
+class ComponentTypeRegistry(object):
+    """
+    Component type dictionaries of the process, built on first use.
+    The langchain types are written to a json file in the cache dir and read back by the other processes
+    of the same versions, see _types_version. Custom component files are parsed again only when
+    their mtime or size changed and then their content hash changed too.
+    Set COMPONENT_TYPES_CACHE=0 to disable the file cache.
+    """
+
+    def __init__(self, components_path: str = BASE_COMPONENTS_PATH, cache_file: Optional[str] = None):
+        self.components_path = components_path
+        self.cache_file = cache_file
+        self._lock = threading.RLock()
+        self._langchain_types: Optional[Dict] = None
+        self._custom_stat: Optional[Tuple] = None
+        self._custom_hash: Optional[str] = None
+        self._custom_types: Optional[Dict] = None
+        self._all_types: Optional[Dict] = None
+
+    def _cache_path(self) -> Optional[Path]:
+        if os.getenv('COMPONENT_TYPES_CACHE', '1') == '0':
+            return None
+        if self.cache_file:
+            return Path(self.cache_file)
+        from bisheng.core.cache.utils import CACHE_DIR
+        return Path(CACHE_DIR) / 'component_types.json'
+
+    def _read_cache(self) -> Dict:
+        path = self._cache_path()
+        if path is None or not path.exists():
+            return {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f'read component types cache {path} error: {e}')
+            return {}
+        return data if data.get('version') == _types_version() else {}
+
+    def _write_cache(self, **values):
+        path = self._cache_path()
+        if path is None:
+            return
+        data = {**self._read_cache(), **values, 'version': _types_version()}
+        tmp_path = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # write then rename, other processes never read a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            tmp_path = None
+        except (TypeError, ValueError) as e:
+            logger.warning(f'component types are not json serializable, not cached: {e}')
+        except OSError as e:
+            logger.warning(f'write component types cache {path} error: {e}')
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def langchain_types(self) -> Dict:
+        with self._lock:
+            if self._langchain_types is None:
+                cached = self._read_cache().get('langchain_types')
+                if cached:
+                    self._langchain_types = cached
+                    logger.debug('langchain types loaded from the file cache')
+                else:
+                    self._langchain_types = _build_langchain_types()
+                    self._write_cache(langchain_types=self._langchain_types)
+            return self._langchain_types
+
+    def _component_files(self) -> List[Path]:
+        return sorted(p for p in Path(self.components_path).rglob('*.py') if '__pycache__' not in p.parts)
+
+    def custom_types(self) -> Dict:
+        from bisheng.interface.custom.utils import build_custom_components
+
+        with self._lock:
+            files = self._component_files()
+            stat = tuple((str(p), p.stat().st_mtime_ns, p.stat().st_size) for p in files)
+            if stat == self._custom_stat and self._custom_types is not None:
+                return self._custom_types
+
+            digest = hashlib.sha256()
+            for p in files:
+                digest.update(str(p.relative_to(self.components_path)).encode())
+                digest.update(p.read_bytes())
+            content_hash = digest.hexdigest()
+            if content_hash != self._custom_hash or self._custom_types is None:
+                cached = self._read_cache().get('custom_types') or {}
+                if cached.get('hash') == content_hash:
+                    self._custom_types = cached['types']
+                else:
+                    self._custom_types = build_custom_components([self.components_path])
+                    self._write_cache(custom_types={'hash': content_hash, 'types': self._custom_types})
+                self._custom_hash = content_hash
+                self._all_types = None
+            self._custom_stat = stat
+            return self._custom_types
+
+    def all_types(self) -> Dict:
+        from bisheng.interface.custom.directory_reader.utils import merge_nested_dicts_with_renaming
+
+        with self._lock:
+            custom_types = self.custom_types()
+            if self._all_types is None:
+                # merge into a copy, the cached langchain types stay as they were built
+                native = {key: dict(value) for key, value in self.langchain_types().items()}
+                self._all_types = merge_nested_dicts_with_renaming(native, custom_types)
+            return self._all_types
+
+
+component_type_registry = ComponentTypeRegistry()
+
+
+def get_type_list():
+    """Get a list of all langchain types"""
+    all_types = dict(build_langchain_types_dict())
+
+    # all_types.pop("tools")
+
+    for key, value in all_types.items():
+        all_types[key] = [item['template']['_type'] for item in value.values()]
+
+    return all_types
+
+
+def build_langchain_types_dict():  # sourcery skip: dict-assign-update-to-union
+    """Build a dictionary of all langchain types"""
+    return component_type_registry.langchain_types()
+
+
+def __getattr__(name):
+    # the module level dict is built on first access instead of at import
+    if name == 'langchain_types_dict':
+        return build_langchain_types_dict()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def get_all_types_dict():
     """Get all types dictionary combining native and custom components."""
-    BASE_COMPONENTS_PATH = str(Path(__file__).parent.parent / 'components')
-    native_components = build_langchain_types_dict()
-    custom_components_from_file = build_custom_components([BASE_COMPONENTS_PATH])
-    return merge_nested_dicts_with_renaming(native_components, custom_components_from_file)
-    # return native_components
+    return component_type_registry.all_types()
@@ -13,6 +13,7 @@ from langchain_core.language_models import BaseLLM
 from langchain_core.prompts import PromptTemplate
 from loguru import logger
 
+from bisheng.knowledge.rag.vectorstore_registry import vectorstore_registry
 from bisheng_langchain.vectorstores.elastic_keywords_search import DEFAULT_PROMPT
 from bisheng_langchain.vectorstores.milvus import DEFAULT_MILVUS_CONNECTION
 
@@ -631,3 +632,4 @@ class ElasticsearchWithPermissionCheck(VectorStore, ABC):
     def delete(self, **kwargs: Any) -> None:
         # TODO: Check if this can be done in bulk
         self.client.indices.delete(index=self.index_name)
+        vectorstore_registry.invalidate(self.index_name)
@@ -29,6 +29,7 @@ from bisheng.core.cache.utils import save_uploaded_file
 from bisheng.core.logger import trace_id_var
 from bisheng.database.models.role_access import AccessType
 from bisheng.knowledge.api.dependencies import get_knowledge_service, get_knowledge_file_service
+from bisheng.knowledge.domain.knowledge_rag import KnowledgeRag
 from bisheng.knowledge.domain.models.knowledge import (KnowledgeCreate, KnowledgeDao, KnowledgeTypeEnum,
                                                        KnowledgeUpdate)
 from bisheng.knowledge.domain.models.knowledge import KnowledgeState
@@ -964,3 +965,10 @@ async def modify_file_user_metadata(*,
     knowledge_file_model = await knowledge_file_service.modify_file_user_metadata(login_user, req_data)
 
     return resp_200(data=knowledge_file_model)
+
+
+@router.get('/vectorstore/metrics', summary='Get vectorstore handle registry metrics',
+            response_model=UnifiedResponseModel)
+async def get_vectorstore_metrics(login_user: UserPayload = Depends(UserPayload.get_login_user)):
+    """ Cached milvus and es handles of this process """
+    return resp_200(data=KnowledgeRag.get_vectorstore_metrics())
@@ -1,3 +1,5 @@
+import asyncio
+import copy
 from typing import Dict
 
 from langchain_core.embeddings import Embeddings
@@ -9,6 +11,7 @@ from bisheng.common.errcode.http_error import NotFoundError
 from bisheng.knowledge.domain.models.knowledge import Knowledge, KnowledgeDao
 from bisheng.knowledge.rag.elasticsearch_factory import ElasticsearchFactory
 from bisheng.knowledge.rag.milvus_factory import MilvusFactory
+from bisheng.knowledge.rag.vectorstore_registry import vectorstore_registry
 from bisheng.llm.domain import LLMService
 
 
@@ -59,6 +62,60 @@ class KnowledgeRag:
         knowledge = cls._get_knowledge_sync(knowledge, knowledge_id)
         return cls.init_es_vectorstore_sync(knowledge.index_name, **kwargs)
 
+    @classmethod
+    def _bind_embedding(cls, vectorstore: Milvus, embedding: Embeddings) -> Milvus:
+        """ share the cached connection and collection, but use the embedding of the current invoke user """
+        vectorstore = copy.copy(vectorstore)
+        vectorstore.embedding_func = embedding
+        return vectorstore
+
+    @classmethod
+    async def get_knowledge_milvus_vectorstore(cls, invoke_user_id: int, knowledge: Knowledge) -> Milvus:
+        """ get milvus vectorstore of knowledge from the handle registry, only used for retrieval """
+        embedding = await LLMService.get_bisheng_knowledge_embedding(model_id=int(knowledge.model),
+                                                                     invoke_user_id=invoke_user_id)
+        vectorstore = await vectorstore_registry.aget_or_create(
+            ('milvus', knowledge.collection_name, knowledge.model), knowledge.update_time,
+            lambda: cls.init_milvus_vectorstore(knowledge.collection_name, embedding))
+        return cls._bind_embedding(vectorstore, embedding)
+
+    @classmethod
+    def get_knowledge_milvus_vectorstore_sync(cls, invoke_user_id: int, knowledge: Knowledge) -> Milvus:
+        """ get milvus vectorstore of knowledge from the handle registry, only used for retrieval """
+        embedding = LLMService.get_bisheng_knowledge_embedding_sync(model_id=int(knowledge.model),
+                                                                    invoke_user_id=invoke_user_id)
+        vectorstore = vectorstore_registry.get_or_create(
+            ('milvus', knowledge.collection_name, knowledge.model), knowledge.update_time,
+            lambda: cls.init_milvus_vectorstore(knowledge.collection_name, embedding))
+        return cls._bind_embedding(vectorstore, embedding)
+
+    @classmethod
+    async def get_knowledge_es_vectorstore(cls, knowledge: Knowledge) -> AsyncElasticsearchStore:
+        """ get es vectorstore of knowledge from the handle registry, async client is bound to the event loop """
+        # the loop id only spreads the handles of live loops, the registry checks the loop itself
+        loop_id = id(asyncio.get_running_loop())
+        return await vectorstore_registry.aget_or_create(
+            ('es_async', knowledge.index_name, loop_id), knowledge.update_time,
+            lambda: cls.init_es_vectorstore(knowledge.index_name),
+            close=lambda vectorstore: vectorstore.client.close(), bind_loop=True)
+
+    @classmethod
+    def get_knowledge_es_vectorstore_sync(cls, knowledge: Knowledge) -> ElasticsearchStore:
+        """ get es vectorstore of knowledge from the handle registry """
+        return vectorstore_registry.get_or_create(
+            ('es', knowledge.index_name, None), knowledge.update_time,
+            lambda: cls.init_es_vectorstore_sync(knowledge.index_name))
+
+    @classmethod
+    def invalidate_vectorstore(cls, name: str):
+        """ drop the cached handles of a milvus collection or es index, call it after the drop or rebuild """
+        if name:
+            vectorstore_registry.invalidate(name)
+
+    @classmethod
+    def get_vectorstore_metrics(cls) -> dict:
+        return vectorstore_registry.metrics()
+
     @classmethod
     def get_multi_knowledge_vectorstore_sync(cls, invoke_user_id: int, knowledge_ids: list[int], user_name: str = None,
                                              check_auth: bool = True, include_es: bool = True,
@@ -90,10 +147,10 @@ class KnowledgeRag:
                 "es": None,
             }
             if include_milvus:
-                vectorstore = cls.init_knowledge_milvus_vectorstore_sync(invoke_user_id, knowledge)
+                vectorstore = cls.get_knowledge_milvus_vectorstore_sync(invoke_user_id, knowledge)
                 ret[knowledge.id]["milvus"] = vectorstore
             if include_es:
-                es_vectorstore = cls.init_knowledge_es_vectorstore_sync(knowledge)
+                es_vectorstore = cls.get_knowledge_es_vectorstore_sync(knowledge)
                 ret[knowledge.id]["es"] = es_vectorstore
         return ret
 
@@ -131,10 +188,10 @@ class KnowledgeRag:
                 "es": None,
             }
             if include_milvus:
-                vectorstore = await cls.init_knowledge_milvus_vectorstore(invoke_user_id, knowledge)
+                vectorstore = await cls.get_knowledge_milvus_vectorstore(invoke_user_id, knowledge)
                 ret[knowledge.id]["milvus"] = vectorstore
             if include_es:
-                es_vectorstore = await cls.init_knowledge_es_vectorstore(knowledge)
+                es_vectorstore = await cls.get_knowledge_es_vectorstore(knowledge)
                 ret[knowledge.id]["es"] = es_vectorstore
         return ret
 
@@ -1,18 +1,17 @@
 from datetime import datetime
 from enum import Enum
-from typing import Any, List, Optional, Union, Dict
+from typing import Any, List, Optional, Union, Dict, Tuple
 
 from pydantic import BaseModel, field_validator
 from sqlalchemy import JSON
-from sqlmodel import Column, DateTime, Field, delete, func, or_, select, text, update
+from sqlmodel import Column, DateTime, Field, and_, delete, func, or_, select, text, update
 from sqlmodel.sql.expression import Select, SelectOfScalar, col
 
 from bisheng.common.models.base import SQLModelSerializable
 from bisheng.core.database import get_sync_db_session, get_async_db_session
-from bisheng.database.models.role_access import AccessType, RoleAccessDao
+from bisheng.database.models.role_access import AccessType
 from bisheng.knowledge.domain.models.knowledge_file import KnowledgeFile, KnowledgeFileDao
-from bisheng.user.domain.models.user import UserDao
-from bisheng.user.domain.models.user_role import UserRoleDao
+from bisheng.user.domain.services.permission_snapshot import PermissionSnapshot, PermissionSnapshotService
 
 
 class KnowledgeTypeEnum(Enum):
@@ -292,6 +291,19 @@ class KnowledgeDao(KnowledgeBase):
         with get_sync_db_session() as session:
             return session.scalar(select(Knowledge.id).where(*filters))
 
+    @classmethod
+    def _filter_permission_knowledge(cls, snapshot: PermissionSnapshot,
+                                     knowledge_list: List[Knowledge]) -> List[Knowledge]:
+        """ keep the knowledge created by the user or granted to the user's roles, same as get_user_knowledge """
+        if snapshot.is_admin():
+            return knowledge_list
+        granted = snapshot.access.get(AccessType.KNOWLEDGE.value, set())
+        res = [one for one in knowledge_list
+               if one.type != KnowledgeTypeEnum.PRIVATE.value and (
+                       one.user_id == snapshot.user_id or str(one.id) in granted)]
+        res.sort(key=lambda x: x.update_time or datetime.min, reverse=True)
+        return res
+
     @classmethod
     def judge_knowledge_permission(cls, user_name: str,
                                    knowledge_ids: List[int]) -> List[Knowledge]:
@@ -301,35 +313,11 @@ class KnowledgeDao(KnowledgeBase):
         :param knowledge_ids: The knowledge base uponIDVertical
         :return: Returns a list of knowledge bases that the user has permissions
         """
-        # get user info
-        user_info = UserDao.get_user_by_username(user_name)
-        if not user_info:
-            return []
-
-        # Query the role the user belongs to
-        role_list = UserRoleDao.get_user_roles(user_info.user_id)
-        if not role_list:
+        # roles and grants come from the cached permission snapshot
+        snapshot = PermissionSnapshotService.get_snapshot_by_name(user_name)
+        if not snapshot or not snapshot.role_ids:
             return []
-
-        role_id_list = []
-        is_admin = False
-        for role in role_list:
-            role_id_list.append(role.role_id)
-            if role.role_id == 1:
-                is_admin = True
-        # admin User has all knowledge base permissions
-        if is_admin:
-            return KnowledgeDao.get_list_by_ids(knowledge_ids)
-
-        # query role List of knowledge bases with permissions
-        role_access_list = RoleAccessDao.find_role_access(role_id_list, [str(one) for one in knowledge_ids],
-                                                          AccessType.KNOWLEDGE)
-
-        user_knowledge_list = cls.get_user_knowledge(user_info.user_id,
-                                                     knowledge_id_extra=[int(access.third_id) for access in
-                                                                         role_access_list],
-                                                     filter_knowledge=knowledge_ids)
-        return user_knowledge_list
+        return cls._filter_permission_knowledge(snapshot, cls.get_list_by_ids(knowledge_ids))
 
     @classmethod
     async def ajudge_knowledge_permission(cls, user_name: str,
@@ -343,32 +331,11 @@ class KnowledgeDao(KnowledgeBase):
         Returns:
 
         """
-        # get user info
-        user_info = await UserDao.aget_user_by_username(user_name)
-        if not user_info:
+        # roles and grants come from the cached permission snapshot
+        snapshot = await PermissionSnapshotService.aget_snapshot_by_name(user_name)
+        if not snapshot or not snapshot.role_ids:
             return []
-        # Query the role the user belongs to
-        role_list = await UserRoleDao.aget_user_roles(user_info.user_id)
-        if not role_list:
-            return []
-        role_id_list = []
-        is_admin = False
-        for role in role_list:
-            role_id_list.append(role.role_id)
-            if role.role_id == 1:
-                is_admin = True
-        # admin User has all knowledge base permissions
-        if is_admin:
-            return await cls.aget_list_by_ids(knowledge_ids)
-        # query role List of knowledge bases with permissions
-        role_access_list = await RoleAccessDao.afind_role_access(role_id_list, [str(one) for one in knowledge_ids],
-                                                                 AccessType.KNOWLEDGE)
-        # Query whether the knowledge base created by the user is included
-        user_knowledge_list = await cls.aget_user_knowledge(user_info.user_id,
-                                                            knowledge_id_extra=[int(access.third_id) for access in
-                                                                                role_access_list],
-                                                            filter_knowledge=knowledge_ids)
-        return user_knowledge_list
+        return cls._filter_permission_knowledge(snapshot, await cls.aget_list_by_ids(knowledge_ids))
 
     @classmethod
     def filter_knowledge_by_ids(cls,
@@ -523,6 +490,22 @@ class KnowledgeDao(KnowledgeBase):
         with get_sync_db_session() as session:
             return session.exec(statement).all()
 
+    @classmethod
+    def get_knowledge_by_update_cursor(cls, cursor: Optional[Tuple[datetime, int]], start_time: datetime = None,
+                                       end_time: datetime = None, limit: int = 1000) -> List[Knowledge]:
+        """ keyset pagination ordered by (update_time, id), cursor is the last row of the previous page """
+        statement = select(Knowledge)
+        if cursor:
+            statement = statement.where(or_(Knowledge.update_time > cursor[0],
+                                            and_(Knowledge.update_time == cursor[0], Knowledge.id > cursor[1])))
+        if start_time:
+            statement = statement.where(Knowledge.update_time >= start_time)
+        if end_time:
+            statement = statement.where(Knowledge.update_time < end_time)
+        statement = statement.order_by(Knowledge.update_time, Knowledge.id).limit(limit)
+        with get_sync_db_session() as session:
+            return session.exec(statement).all()
+
     @classmethod
     def get_first_knowledge(cls) -> Optional[Knowledge]:
         """ Get the first knowledge base """
@@ -0,0 +1,188 @@
+import asyncio
+import inspect
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from loguru import logger
+
+
+class VectorStoreRegistry:
+    """
+    Process level registry of vectorstore handles.
+
+    Building a Milvus store connects to the server, describes and loads the collection, and building an
+    ES store creates a new client with its own connection pool. The registry keeps the built handles keyed by
+    (kind, collection/index name, embedding model) so retrieval requests can reuse them.
+
+    Every entry carries a version (the knowledge update_time); a lookup with another version rebuilds the handle.
+    Entries not used for `idle_seconds` are evicted, and the least recently used entry is evicted once
+    `max_size` is reached.
+
+    Handles of async clients are bound to the event loop that built them, a lookup from another loop or after
+    that loop closed rebuilds the handle. A dropped handle is closed with its `close` callback, a coroutine is
+    run on the loop of the handle while it is still open.
+    """
+
+    def __init__(self, max_size: int = 256, idle_seconds: int = 30 * 60):
+        self._entries: OrderedDict[Tuple, Dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+
+        self._hits = 0
+        self._misses = 0
+        self._refreshes = 0
+        self._evictions = 0
+        self._build_count = 0
+        self._build_seconds_total = 0.0
+        self._build_seconds_max = 0.0
+
+    @staticmethod
+    def _loop_alive(entry: Dict[str, Any], loop: Optional[asyncio.AbstractEventLoop] = None) -> bool:
+        """ the loop of a loop bound entry is open, and is the given loop if any """
+        if entry['loop'] is None:
+            return True
+        entry_loop = entry['loop']()
+        return entry_loop is not None and not entry_loop.is_closed() and (loop is None or entry_loop is loop)
+
+    def _lookup(self, key: Tuple, version: Hashable, loop: Optional[asyncio.AbstractEventLoop] = None) \
+            -> Optional[Any]:
+        """ return the cached handle, None if missing, stale, bound to another loop or idle for too long """
+        now = time.monotonic()
+        with self._lock:
+            dropped = self._evict_idle(now)
+            entry = self._entries.get(key)
+            value = None
+            if entry is None:
+                self._misses += 1
+            elif entry['version'] != version or not self._loop_alive(entry, loop):
+                self._refreshes += 1
+                dropped.append(self._entries.pop(key))
+            else:
+                self._hits += 1
+                entry['last_used'] = now
+                self._entries.move_to_end(key)
+                value = entry['value']
+        self._close(dropped)
+        return value
+
+    def _store(self, key: Tuple, version: Hashable, value: Any, build_cost: float,
+               loop: Optional[asyncio.AbstractEventLoop] = None, close: Optional[Callable[[Any], Any]] = None):
+        now = time.monotonic()
+        with self._lock:
+            self._build_count += 1
+            self._build_seconds_total += build_cost
+            self._build_seconds_max = max(self._build_seconds_max, build_cost)
+            dropped = [entry for entry in [self._entries.pop(key, None)] if entry is not None]
+            # handles of closed loops are never hit again
+            for one in [k for k, entry in self._entries.items() if not self._loop_alive(entry)]:
+                dropped.append(self._entries.pop(one))
+                self._evictions += 1
+            while self.max_size and len(self._entries) >= self.max_size:
+                dropped.append(self._entries.popitem(last=False)[1])
+                self._evictions += 1
+            self._entries[key] = {'value': value, 'version': version, 'created': now, 'last_used': now,
+                                  'build_cost': build_cost, 'loop': weakref.ref(loop) if loop else None,
+                                  'close': close}
+        self._close(dropped)
+
+    def _evict_idle(self, now: float) -> List[Dict[str, Any]]:
+        dropped = []
+        if not self.idle_seconds:
+            return dropped
+        # entries are ordered by last use, so stop at the first one that is still fresh
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry['last_used'] < self.idle_seconds:
+                break
+            dropped.append(self._entries.popitem(last=False)[1])
+            self._evictions += 1
+        return dropped
+
+    @classmethod
+    def _close(cls, entries: List[Dict[str, Any]]):
+        """ close dropped handles, outside of the lock """
+        for entry in entries:
+            if entry['close'] is None:
+                continue
+            try:
+                result = entry['close'](entry['value'])
+                if not inspect.isawaitable(result):
+                    continue
+                loop = entry['loop']() if entry['loop'] else None
+                if loop is not None and not loop.is_closed():
+                    asyncio.run_coroutine_threadsafe(result, loop)
+                else:
+                    # the connections went away with their loop
+                    result.close()
+            except Exception as e:
+                logger.warning(f'vectorstore_registry close handle error: {e}')
+
+    def get_or_create(self, key: Tuple, version: Hashable, builder: Callable[[], Any],
+                      close: Optional[Callable[[Any], Any]] = None) -> Any:
+        """ get the handle of key, build it with builder when missing or version changed """
+        value = self._lookup(key, version)
+        if value is not None:
+            return value
+        start = time.perf_counter()
+        value = builder()
+        build_cost = time.perf_counter() - start
+        logger.debug(f'vectorstore_registry build key={key} cost={build_cost:.3f}s')
+        self._store(key, version, value, build_cost, close=close)
+        return value
+
+    async def aget_or_create(self, key: Tuple, version: Hashable, builder: Callable[[], Any],
+                             close: Optional[Callable[[Any], Any]] = None, bind_loop: bool = False) -> Any:
+        """
+        async version of get_or_create, the blocking builder is run in a worker thread
+        :param bind_loop: the handle is an async client, it is only returned to the running loop
+        """
+        loop = asyncio.get_running_loop() if bind_loop else None
+        value = self._lookup(key, version, loop)
+        if value is not None:
+            return value
+        start = time.perf_counter()
+        value = await asyncio.to_thread(builder)
+        build_cost = time.perf_counter() - start
+        logger.debug(f'vectorstore_registry build key={key} cost={build_cost:.3f}s')
+        self._store(key, version, value, build_cost, loop=loop, close=close)
+        return value
+
+    def invalidate(self, name: str):
+        """ drop all handles of the collection or index name """
+        with self._lock:
+            dropped = [self._entries.pop(key) for key in [one for one in self._entries.keys() if one[1] == name]]
+        self._close(dropped)
+
+    def clear(self):
+        with self._lock:
+            dropped = list(self._entries.values())
+            self._entries.clear()
+        self._close(dropped)
+
+    def metrics(self) -> Dict[str, Any]:
+        """ registry size, hit ratio and handle construction time """
+        with self._lock:
+            lookups = self._hits + self._misses + self._refreshes
+            return {
+                'size': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'refreshes': self._refreshes,
+                'evictions': self._evictions,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0,
+                'build_count': self._build_count,
+                'build_seconds_total': round(self._build_seconds_total, 4),
+                'build_seconds_avg': round(self._build_seconds_total / self._build_count, 4)
+                if self._build_count else 0,
+                'build_seconds_max': round(self._build_seconds_max, 4),
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+vectorstore_registry = VectorStoreRegistry()
@@ -2,11 +2,9 @@
 
 import json
 import logging
-import time
-import uuid
 from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, WebSocket
 from fastapi.responses import StreamingResponse
 from sqlmodel import select
 
@@ -23,8 +21,9 @@ from bisheng.langgraph.api.schemas import (
     NodeTypeInfo,
     StreamEventResponse,
 )
-from bisheng.langgraph.engine.graph_builder import LangGraphBuilder
-from bisheng.langgraph.engine.state_schema import DEFAULT_STATE, LangGraphState
+from bisheng.langgraph.engine.checkpointer import CheckpointerManager
+from bisheng.langgraph.engine.executor import langgraph_execution_service
+from bisheng.langgraph.engine.state_schema import LangGraphState
 from bisheng.langgraph.engine.stream_manager import StreamEvent, StreamManager
 from bisheng.langgraph.nodes import NODE_TYPE_MAP
 
@@ -345,6 +344,50 @@ async def get_templates():
     return resp_200(data=PRESET_TEMPLATES)
 
 
+@router.get('/execution-metrics')
+async def get_execution_metrics():
+    """Concurrency and compiled graph cache metrics of the execution service."""
+    return resp_200(data=langgraph_execution_service.metrics())
+
+
+@router.get('/stream-metrics')
+async def get_stream_metrics():
+    """Ring buffer metrics of the recent streamed runs of this process."""
+    return resp_200(data=langgraph_execution_service.stream_metrics())
+
+
+@router.get('/streams/{stream_id}/events')
+async def replay_stream_events(stream_id: str, cursor: int = Query(default=0), limit: int = Query(default=500)):
+    """Events of a run after the cursor seq, from the buffer of this process or spilled to redis by any pod."""
+    stream_manager = langgraph_execution_service.get_stream(stream_id)
+    if stream_manager is not None:
+        events, _ = await stream_manager.aread(cursor, limit=limit)
+    else:
+        events = await StreamManager.areplay(stream_id, cursor=cursor, limit=limit)
+    return resp_200(data={
+        'events': [e.model_dump() for e in events],
+        'cursor': events[-1].seq if events else cursor,
+    })
+
+
+@router.get('/streams/{stream_id}/live')
+async def follow_stream_events(stream_id: str, cursor: int = Query(default=0),
+                               last_event_id: Optional[str] = Header(default=None)):
+    """Follow a streamed run with SSE from the cursor seq, the Last-Event-ID of a reconnecting client wins."""
+    if last_event_id and last_event_id.isdigit():
+        cursor = int(last_event_id)
+    stream_manager = langgraph_execution_service.get_stream(stream_id)
+    if stream_manager is None:
+        raise HTTPException(status_code=404, detail='Stream not found in this process, replay it from /events')
+    subscription = stream_manager.subscribe(cursor)
+
+    async def event_generator():
+        async for event in langgraph_execution_service.follow(subscription):
+            yield StreamManager.to_sse_format(event)
+
+    return StreamingResponse(event_generator(), media_type='text/event-stream')
+
+
 @router.post('/create-from-template/{template_id}')
 async def create_from_template(template_id: str, name: str = '', space_id: Optional[int] = None):
     """Create a new LangGraph workflow from a preset template."""
@@ -374,7 +417,7 @@ async def create_from_template(template_id: str, name: str = '', space_id: Optio
 @router.get('/{workflow_id}')
 async def get_langgraph_workflow(workflow_id: str):
     """Get a LangGraph workflow by ID."""
-    flow = FlowDao.get_flow_by_id(workflow_id)
+    flow = await FlowDao.aget_flow_by_id(workflow_id)
     if not flow or flow.flow_type != FlowType.LANGGRAPH.value:
         raise HTTPException(status_code=404, detail='LangGraph workflow not found')
     return resp_200(data={
@@ -391,7 +434,7 @@ async def get_langgraph_workflow(workflow_id: str):
 @router.put('/{workflow_id}')
 async def update_langgraph_workflow(workflow_id: str, req: LangGraphUpdateRequest):
     """Update a LangGraph workflow."""
-    flow = FlowDao.get_flow_by_id(workflow_id)
+    flow = await FlowDao.aget_flow_by_id(workflow_id)
     if not flow or flow.flow_type != FlowType.LANGGRAPH.value:
         raise HTTPException(status_code=404, detail='LangGraph workflow not found')
 
@@ -402,17 +445,20 @@ async def update_langgraph_workflow(workflow_id: str, req: LangGraphUpdateReques
     if req.data is not None:
         flow.data = req.data
 
-    FlowDao.update_flow(flow)
+    await FlowDao.aupdate_flow(flow)
+    langgraph_execution_service.invalidate(workflow_id)
     return resp_200(data={'id': str(flow.id)})
 
 
 @router.delete('/{workflow_id}')
 async def delete_langgraph_workflow(workflow_id: str):
     """Delete a LangGraph workflow."""
-    flow = FlowDao.get_flow_by_id(workflow_id)
+    flow = await FlowDao.aget_flow_by_id(workflow_id)
     if not flow or flow.flow_type != FlowType.LANGGRAPH.value:
         raise HTTPException(status_code=404, detail='LangGraph workflow not found')
-    FlowDao.delete_flow(flow)
+    await FlowDao.adelete_flow(flow)
+    langgraph_execution_service.invalidate(workflow_id)
+    CheckpointerManager.remove(workflow_id)
     return resp_200(data={'deleted': True})
 
 
@@ -421,106 +467,20 @@ async def delete_langgraph_workflow(workflow_id: str):
 @router.post('/{workflow_id}/run')
 async def run_langgraph_workflow(workflow_id: str, req: LangGraphRunRequest):
     """Execute a LangGraph workflow (blocking)."""
-    flow = FlowDao.get_flow_by_id(workflow_id)
-    if not flow or not flow.data:
-        raise HTTPException(status_code=404, detail='Workflow not found')
-
-    workflow_data = flow.data
-    if isinstance(workflow_data, str):
-        workflow_data = json.loads(workflow_data)
-
-    stream_manager = StreamManager()
-    builder = LangGraphBuilder(
-        workflow_id=workflow_id,
-        workflow_data=workflow_data,
-        user_id=0,
-        checkpointer_mode='memory',
-        stream_manager=stream_manager,
-    )
-
-    compiled, config, nodes_map = builder.build()
-
-    # Override thread_id if provided
-    if req.thread_id:
-        config['configurable']['thread_id'] = req.thread_id
-
-    # Build initial state
-    initial_state = dict(DEFAULT_STATE)
-    if req.inputs:
-        from langchain_core.messages import HumanMessage
-        if 'message' in req.inputs:
-            initial_state['messages'] = [HumanMessage(content=req.inputs['message'])]
-        initial_state['variables'] = {'input': req.inputs}
-
-    # Execute
-    try:
-        result = None
-        for event in compiled.stream(initial_state, config=config):
-            result = event
-
-        # Get final state
-        final_state = compiled.get_state(config)
-        final_output = ''
-        if final_state and final_state.values:
-            final_output = final_state.values.get('final_output', '')
-            if not final_output and final_state.values.get('messages'):
-                last_msg = final_state.values['messages'][-1]
-                final_output = last_msg.content if hasattr(last_msg, 'content') else str(last_msg)
-
-        return resp_200(data={
-            'status': 'success',
-            'output': final_output,
-            'thread_id': config['configurable']['thread_id'],
-            'events': [e.model_dump() for e in stream_manager.get_events()],
-        })
-    except Exception as e:
-        logger.exception(f'Workflow execution error: {e}')
-        return resp_200(data={'status': 'error', 'error': str(e)})
+    result = await langgraph_execution_service.run(workflow_id, req.inputs, req.thread_id)
+    return resp_200(data=result)
 
 
 @router.post('/{workflow_id}/stream')
 async def stream_langgraph_workflow(workflow_id: str, req: LangGraphRunRequest):
     """Execute a LangGraph workflow with SSE streaming."""
-    flow = FlowDao.get_flow_by_id(workflow_id)
-    if not flow or not flow.data:
-        raise HTTPException(status_code=404, detail='Workflow not found')
-
-    workflow_data = flow.data
-    if isinstance(workflow_data, str):
-        workflow_data = json.loads(workflow_data)
-
-    stream_manager = StreamManager()
+    # load the flow before the response starts, so a missing workflow is still a 404
+    await langgraph_execution_service.get_flow(workflow_id)
 
     async def event_generator():
-        builder = LangGraphBuilder(
-            workflow_id=workflow_id,
-            workflow_data=workflow_data,
-            user_id=0,
-            checkpointer_mode='memory',
-            stream_manager=stream_manager,
-        )
-        compiled, config, _ = builder.build()
-
-        if req.thread_id:
-            config['configurable']['thread_id'] = req.thread_id
-
-        initial_state = dict(DEFAULT_STATE)
-        if req.inputs:
-            from langchain_core.messages import HumanMessage
-            if 'message' in req.inputs:
-                initial_state['messages'] = [HumanMessage(content=req.inputs['message'])]
-            initial_state['variables'] = {'input': req.inputs}
-
-        yield f'data: {json.dumps({"event_type": "workflow_start", "timestamp": time.time()})}\n\n'
-
-        try:
-            for event in compiled.stream(initial_state, config=config):
-                for node_id, node_output in event.items():
-                    yield f'data: {json.dumps({"event_type": "node_end", "node_id": node_id, "data": str(node_output)[:500], "timestamp": time.time()})}\n\n'
-        except Exception as e:
-            yield f'data: {json.dumps({"event_type": "error", "data": {"error": str(e)}, "timestamp": time.time()})}\n\n'
-
-        yield f'data: {json.dumps({"event_type": "workflow_end", "timestamp": time.time()})}\n\n'
+        # the first event carries the stream_id, /streams/{stream_id}/live resumes from the last id received
+        async for event in langgraph_execution_service.stream(workflow_id, req.inputs, req.thread_id):
+            yield StreamManager.to_sse_format(event)
 
     return StreamingResponse(event_generator(), media_type='text/event-stream')
 
@@ -528,46 +488,8 @@ async def stream_langgraph_workflow(workflow_id: str, req: LangGraphRunRequest):
 @router.post('/{workflow_id}/resume')
 async def resume_langgraph_workflow(workflow_id: str, req: LangGraphResumeRequest):
     """Resume a paused LangGraph workflow after human input."""
-    flow = FlowDao.get_flow_by_id(workflow_id)
-    if not flow or not flow.data:
-        raise HTTPException(status_code=404, detail='Workflow not found')
-
-    workflow_data = flow.data
-    if isinstance(workflow_data, str):
-        workflow_data = json.loads(workflow_data)
-
-    stream_manager = StreamManager()
-    builder = LangGraphBuilder(
-        workflow_id=workflow_id,
-        workflow_data=workflow_data,
-        user_id=0,
-        checkpointer_mode='memory',
-        stream_manager=stream_manager,
-    )
-    compiled, config, _ = builder.build()
-    config['configurable']['thread_id'] = req.thread_id
-
-    # Update state with human feedback
-    compiled.update_state(
-        config,
-        {'human_feedback': req.human_feedback},
-    )
-
-    # Resume execution
-    try:
-        result = None
-        for event in compiled.stream(None, config=config):
-            result = event
-
-        final_state = compiled.get_state(config)
-        final_output = final_state.values.get('final_output', '') if final_state else ''
-
-        return resp_200(data={
-            'status': 'success',
-            'output': final_output,
-        })
-    except Exception as e:
-        return resp_200(data={'status': 'error', 'error': str(e)})
+    result = await langgraph_execution_service.resume(workflow_id, req.thread_id, req.human_feedback)
+    return resp_200(data=result)
 
 
 @router.post('/{workflow_id}/invoke')
@@ -581,25 +503,7 @@ async def invoke_langgraph_workflow(workflow_id: str, req: LangGraphRunRequest):
 @router.get('/{workflow_id}/state')
 async def get_workflow_state(workflow_id: str, thread_id: str = Query(default=None)):
     """Get current workflow state."""
-    flow = FlowDao.get_flow_by_id(workflow_id)
-    if not flow or not flow.data:
-        raise HTTPException(status_code=404, detail='Workflow not found')
-
-    workflow_data = flow.data
-    if isinstance(workflow_data, str):
-        workflow_data = json.loads(workflow_data)
-
-    builder = LangGraphBuilder(
-        workflow_id=workflow_id,
-        workflow_data=workflow_data,
-        checkpointer_mode='memory',
-    )
-    compiled, config, _ = builder.build()
-
-    if thread_id:
-        config['configurable']['thread_id'] = thread_id
-
-    state = compiled.get_state(config)
+    state = await langgraph_execution_service.get_state(workflow_id, thread_id)
     if state:
         values = state.values or {}
         serialized = {}
@@ -626,26 +530,8 @@ async def get_workflow_state(workflow_id: str, thread_id: str = Query(default=No
 @router.get('/{workflow_id}/history')
 async def get_workflow_history(workflow_id: str, thread_id: str = Query(default=None)):
     """Get checkpoint history for time travel debugging."""
-    flow = FlowDao.get_flow_by_id(workflow_id)
-    if not flow or not flow.data:
-        raise HTTPException(status_code=404, detail='Workflow not found')
-
-    workflow_data = flow.data
-    if isinstance(workflow_data, str):
-        workflow_data = json.loads(workflow_data)
-
-    builder = LangGraphBuilder(
-        workflow_id=workflow_id,
-        workflow_data=workflow_data,
-        checkpointer_mode='memory',
-    )
-    compiled, config, _ = builder.build()
-
-    if thread_id:
-        config['configurable']['thread_id'] = thread_id
-
     history = []
-    for state in compiled.get_state_history(config):
+    for state in await langgraph_execution_service.get_state_history(workflow_id, thread_id):
         checkpoint = {
             'checkpoint_id': state.config.get('configurable', {}).get('checkpoint_id', ''),
             'thread_id': state.config.get('configurable', {}).get('thread_id', ''),
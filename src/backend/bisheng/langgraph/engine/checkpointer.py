@@ -3,16 +3,32 @@
 Supports SQLite (default) and PostgreSQL for production use.
 Bisheng uses MySQL, so we default to SQLite file-based checkpointing
 which is portable and doesn't require additional infrastructure.
+
+Memory use is bounded:
+- every thread keeps only its last LANGGRAPH_CHECKPOINT_KEEP_LAST checkpoints
+- a memory checkpointer keeps at most LANGGRAPH_MEMORY_MAX_THREADS threads, the least recently used are dropped
+- CheckpointerManager keeps at most LANGGRAPH_CHECKPOINTER_MAX_INSTANCES memory checkpointers and
+  drops the ones idle for LANGGRAPH_CHECKPOINTER_TTL seconds
+- SQLite and PostgreSQL checkpointers are created once per database and share one connection (pool)
 """
 
 import logging
 import os
-from typing import Optional
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
 
 from langgraph.checkpoint.memory import MemorySaver
 
 logger = logging.getLogger(__name__)
 
+CHECKPOINT_KEEP_LAST = int(os.environ.get('LANGGRAPH_CHECKPOINT_KEEP_LAST', 20))
+MEMORY_MAX_THREADS = int(os.environ.get('LANGGRAPH_MEMORY_MAX_THREADS', 1000))
+CHECKPOINTER_MAX_INSTANCES = int(os.environ.get('LANGGRAPH_CHECKPOINTER_MAX_INSTANCES', 256))
+CHECKPOINTER_TTL = int(os.environ.get('LANGGRAPH_CHECKPOINTER_TTL', 3600))
+
 # Track the SQLite saver availability
 _sqlite_available = False
 try:
@@ -25,11 +41,193 @@ except ImportError:
 _postgres_available = False
 try:
     from langgraph.checkpoint.postgres import PostgresSaver
+    from psycopg.rows import dict_row
+    from psycopg_pool import ConnectionPool
     _postgres_available = True
 except ImportError:
     logger.info('langgraph-checkpoint-postgres not available')
 
 
+def _thread_key(config) -> tuple:
+    configurable = config.get('configurable', {})
+    return configurable.get('thread_id'), configurable.get('checkpoint_ns', '')
+
+
+def _payload_size(value) -> int:
+    """approximate size of the serialized checkpoint data"""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_payload_size(v) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(_payload_size(v) for v in value)
+    return 0
+
+
+class BoundedMemorySaver(MemorySaver):
+    """MemorySaver that keeps the last `keep_last` checkpoints of a thread and at most `max_threads` threads."""
+
+    def __init__(self, keep_last: int = CHECKPOINT_KEEP_LAST, max_threads: int = MEMORY_MAX_THREADS, **kwargs):
+        super().__init__(**kwargs)
+        self.keep_last = keep_last
+        self.max_threads = max_threads
+        self.last_used = time.time()
+        self.pruned = 0
+        self.evicted_threads = 0
+        self._threads: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            thread_id, checkpoint_ns = _thread_key(next_config)
+            self.last_used = time.time()
+            self._threads[thread_id] = self.last_used
+            self._threads.move_to_end(thread_id)
+            self._prune(thread_id, checkpoint_ns)
+            while len(self._threads) > self.max_threads:
+                oldest, _ = self._threads.popitem(last=False)
+                self._drop_thread(oldest)
+        return next_config
+
+    def put_writes(self, config, writes, task_id, *args, **kwargs):
+        with self._lock:
+            return super().put_writes(config, writes, task_id, *args, **kwargs)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        checkpoints = self.storage.get(thread_id, {}).get(checkpoint_ns)
+        if not checkpoints or len(checkpoints) <= self.keep_last:
+            return
+        # checkpoint ids are uuid6, sorting them orders by creation time
+        for checkpoint_id in sorted(checkpoints)[:-self.keep_last]:
+            checkpoints.pop(checkpoint_id, None)
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self.pruned += 1
+        self._prune_blobs(thread_id, checkpoint_ns, checkpoints)
+
+    def _prune_blobs(self, thread_id: str, checkpoint_ns: str, checkpoints: Dict):
+        """drop channel values no longer referenced by the kept checkpoints"""
+        blobs = getattr(self, 'blobs', None)
+        if not blobs:
+            return
+        referenced = set()
+        for saved in checkpoints.values():
+            checkpoint = self.serde.loads_typed(saved[0])
+            referenced.update(checkpoint.get('channel_versions', {}).items())
+        for key in [k for k in list(blobs) if k[0] == thread_id and k[1] == checkpoint_ns]:
+            if (key[2], key[3]) not in referenced:
+                blobs.pop(key, None)
+
+    def _drop_thread(self, thread_id: str):
+        self.storage.pop(thread_id, None)
+        for key in [k for k in list(self.writes) if k[0] == thread_id]:
+            self.writes.pop(key, None)
+        blobs = getattr(self, 'blobs', None)
+        if blobs:
+            for key in [k for k in list(blobs) if k[0] == thread_id]:
+                blobs.pop(key, None)
+        self.evicted_threads += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            checkpoints = sum(len(ns) for thread in self.storage.values() for ns in thread.values())
+            size = (_payload_size(self.storage) + _payload_size(self.writes)
+                    + _payload_size(getattr(self, 'blobs', {})))
+        return {
+            'threads': len(self.storage),
+            'checkpoints': checkpoints,
+            'approx_bytes': size,
+            'pruned': self.pruned,
+            'evicted_threads': self.evicted_threads,
+        }
+
+
+if _sqlite_available:
+    class BoundedSqliteSaver(SqliteSaver):
+        """SqliteSaver that deletes all but the last `keep_last` checkpoints of a thread."""
+
+        def __init__(self, conn, keep_last: int = CHECKPOINT_KEEP_LAST, **kwargs):
+            super().__init__(conn, **kwargs)
+            self.keep_last = keep_last
+            self.last_used = time.time()
+
+        def put(self, config, checkpoint, metadata, new_versions):
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            self.last_used = time.time()
+            thread_id, checkpoint_ns = _thread_key(next_config)
+            keep = ('SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? '
+                    'ORDER BY checkpoint_id DESC LIMIT ?')
+            params = (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep_last)
+            with self.cursor() as cur:
+                cur.execute(f'DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? '
+                            f'AND checkpoint_id NOT IN ({keep})', params)
+                cur.execute(f'DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? '
+                            f'AND checkpoint_id NOT IN ({keep})', params)
+            return next_config
+
+
+if _postgres_available:
+    class BoundedPostgresSaver(PostgresSaver):
+        """PostgresSaver that deletes all but the last `keep_last` checkpoints of a thread and their blobs."""
+
+        def __init__(self, conn, keep_last: int = CHECKPOINT_KEEP_LAST, **kwargs):
+            super().__init__(conn, **kwargs)
+            self.keep_last = keep_last
+            self.last_used = time.time()
+
+        def put(self, config, checkpoint, metadata, new_versions):
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            self.last_used = time.time()
+            thread_id, checkpoint_ns = _thread_key(next_config)
+            keep = ('SELECT checkpoint_id FROM checkpoints WHERE thread_id = %s AND checkpoint_ns = %s '
+                    'ORDER BY checkpoint_id DESC LIMIT %s')
+            params = (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep_last)
+            with self._cursor() as cur:
+                cur.execute(f'DELETE FROM checkpoint_writes WHERE thread_id = %s AND checkpoint_ns = %s '
+                            f'AND checkpoint_id NOT IN ({keep})', params)
+                cur.execute(f'DELETE FROM checkpoints WHERE thread_id = %s AND checkpoint_ns = %s '
+                            f'AND checkpoint_id NOT IN ({keep})', params)
+                cur.execute('DELETE FROM checkpoint_blobs b WHERE b.thread_id = %s AND b.checkpoint_ns = %s '
+                            'AND NOT EXISTS (SELECT 1 FROM checkpoints c WHERE c.thread_id = b.thread_id '
+                            'AND c.checkpoint_ns = b.checkpoint_ns '
+                            "AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version)",
+                            (thread_id, checkpoint_ns))
+            return next_config
+
+
+# shared savers of the durable backends, keyed by db path or connection string
+_shared_savers: Dict[str, Any] = {}
+_shared_lock = threading.Lock()
+
+
+def _shared_sqlite_saver(db_path: str):
+    key = f'sqlite:{db_path}'
+    with _shared_lock:
+        if key not in _shared_savers:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            logger.info(f'Using SQLite checkpointer at {db_path}')
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            _shared_savers[key] = BoundedSqliteSaver(conn)
+        return _shared_savers[key]
+
+
+def _shared_postgres_saver(connection_string: str):
+    key = f'postgres:{connection_string}'
+    with _shared_lock:
+        if key not in _shared_savers:
+            logger.info('Using PostgreSQL checkpointer')
+            pool = ConnectionPool(
+                connection_string,
+                min_size=1,
+                max_size=int(os.environ.get('LANGGRAPH_POSTGRES_POOL_SIZE', 10)),
+                kwargs={'autocommit': True, 'prepare_threshold': 0, 'row_factory': dict_row},
+            )
+            saver = BoundedPostgresSaver(pool)
+            saver.setup()
+            _shared_savers[key] = saver
+        return _shared_savers[key]
+
+
 def get_checkpointer(
     mode: str = 'memory',
     db_path: Optional[str] = None,
@@ -44,44 +242,90 @@ def get_checkpointer(
         connection_string: PostgreSQL connection string
 
     Returns:
-        A LangGraph checkpointer instance
+        A LangGraph checkpointer instance, sqlite and postgres checkpointers are shared per database
     """
     if mode == 'sqlite' and _sqlite_available:
         if db_path is None:
             data_dir = os.environ.get('BISHENG_DATA_DIR', '/app/data')
             db_path = os.path.join(data_dir, 'langgraph_checkpoints.db')
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        logger.info(f'Using SQLite checkpointer at {db_path}')
-        return SqliteSaver.from_conn_string(db_path)
+        return _shared_sqlite_saver(db_path)
 
     if mode == 'postgres' and _postgres_available:
         if connection_string is None:
             connection_string = os.environ.get('LANGGRAPH_POSTGRES_URL', '')
         if connection_string:
-            logger.info('Using PostgreSQL checkpointer')
-            return PostgresSaver.from_conn_string(connection_string)
+            return _shared_postgres_saver(connection_string)
         logger.warning('PostgreSQL connection string not provided, falling back to memory')
 
     # Default: in-memory
-    logger.info('Using MemorySaver checkpointer')
-    return MemorySaver()
+    logger.debug('Using MemorySaver checkpointer')
+    return BoundedMemorySaver()
 
 
 class CheckpointerManager:
-    """Manages checkpointer lifecycle for LangGraph workflows."""
+    """Manages checkpointer lifecycle for LangGraph workflows.
+
+    Instances are kept in LRU order, at most `max_instances` are cached and an instance
+    idle for `ttl` seconds is dropped on the next access.
+    """
+
+    _instances: OrderedDict = OrderedDict()
+    _lock = threading.Lock()
+    max_instances = CHECKPOINTER_MAX_INSTANCES
+    ttl = CHECKPOINTER_TTL
+    evicted = 0
+
+    @classmethod
+    def _last_used(cls, entry: Dict) -> float:
+        return max(entry['access_time'], getattr(entry['saver'], 'last_used', 0))
 
-    _instances: dict = {}
+    @classmethod
+    def _evict(cls):
+        now = time.time()
+        for key in [k for k, entry in cls._instances.items() if now - cls._last_used(entry) > cls.ttl]:
+            cls._instances.pop(key, None)
+            cls.evicted += 1
+        while len(cls._instances) > cls.max_instances:
+            cls._instances.popitem(last=False)
+            cls.evicted += 1
 
     @classmethod
     def get_or_create(cls, workflow_id: str, mode: str = 'memory', **kwargs):
         """Get or create a checkpointer for a workflow."""
         key = f'{workflow_id}_{mode}'
-        if key not in cls._instances:
-            cls._instances[key] = get_checkpointer(mode=mode, **kwargs)
-        return cls._instances[key]
+        with cls._lock:
+            entry = cls._instances.get(key)
+            if entry is None:
+                entry = {'saver': get_checkpointer(mode=mode, **kwargs), 'mode': mode}
+                cls._instances[key] = entry
+            entry['access_time'] = time.time()
+            cls._instances.move_to_end(key)
+            cls._evict()
+            return entry['saver']
 
     @classmethod
-    def remove(cls, workflow_id: str, mode: str = 'memory'):
-        """Remove a checkpointer instance."""
-        key = f'{workflow_id}_{mode}'
-        cls._instances.pop(key, None)
+    def remove(cls, workflow_id: str, mode: Optional[str] = None):
+        """Remove the checkpointer instance of one mode, or of all modes when mode is None."""
+        with cls._lock:
+            for key in [k for k in cls._instances if k.rsplit('_', 1)[0] == workflow_id]:
+                if mode is None or cls._instances[key]['mode'] == mode:
+                    cls._instances.pop(key, None)
+
+    @classmethod
+    def metrics(cls) -> Dict[str, Any]:
+        with cls._lock:
+            entries = list(cls._instances.values())
+        res = {
+            'instances': len(entries),
+            'max_instances': cls.max_instances,
+            'evicted': cls.evicted,
+            'by_mode': {},
+            'memory': {'threads': 0, 'checkpoints': 0, 'approx_bytes': 0, 'pruned': 0, 'evicted_threads': 0},
+            'shared_savers': len(_shared_savers),
+        }
+        for entry in entries:
+            res['by_mode'][entry['mode']] = res['by_mode'].get(entry['mode'], 0) + 1
+            if isinstance(entry['saver'], BoundedMemorySaver):
+                for k, v in entry['saver'].metrics().items():
+                    res['memory'][k] += v
+        return res
@@ -0,0 +1,146 @@
+"""Adaptive concurrency for LLM fan-out inside LangGraph nodes.
+
+The limiter follows AIMD: the limit grows by about one per round of successful calls,
+shrinks a little when the latency rises above the observed baseline, and is halved on a
+rate limit error (HTTP 429). Calls wait for a free slot on the event loop instead of holding a thread.
+"""
+
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """429 from the provider, raised as an openai / httpx / requests error or wrapped in a plain exception"""
+    status = getattr(e, 'status_code', None) or getattr(getattr(e, 'response', None), 'status_code', None)
+    if status == 429:
+        return True
+    text = str(e).lower()
+    return '429' in text or 'rate limit' in text or 'too many requests' in text
+
+
+def retry_after_seconds(e: Exception) -> Optional[float]:
+    headers = getattr(getattr(e, 'response', None), 'headers', None) or {}
+    try:
+        value = headers.get('retry-after')
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveConcurrencyLimiter:
+    """Concurrency limit between `min_limit` and `max_limit`, adjusted by latency and rate limit errors."""
+
+    def __init__(self, max_limit: int, initial_limit: Optional[int] = None, min_limit: int = 1,
+                 latency_tolerance: float = 2.0, decrease_factor: float = 0.9):
+        self.max_limit = max(max_limit, min_limit)
+        self.min_limit = min_limit
+        self.limit = float(min(initial_limit or max(self.max_limit // 2, min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.baseline_latency: Optional[float] = None
+        self._cond = asyncio.Condition()
+
+        # metrics
+        self.calls = 0
+        self.rate_limited = 0
+        self.max_in_flight = 0
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    async def release(self, latency: Optional[float] = None, rate_limited: bool = False):
+        async with self._cond:
+            self.in_flight -= 1
+            self.calls += 1
+            if rate_limited:
+                self.rate_limited += 1
+                self.limit = max(self.min_limit, self.limit / 2)
+            elif latency is not None:
+                if self.baseline_latency is None or latency < self.baseline_latency:
+                    self.baseline_latency = latency
+                else:
+                    # the baseline drifts up slowly, so one fast outlier does not pin it
+                    self.baseline_latency += (latency - self.baseline_latency) * 0.05
+                if latency > self.baseline_latency * self.latency_tolerance:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    async def run(self, func: Callable[[], Awaitable[T]]) -> T:
+        """run one call within the limit, the latency of a successful call adjusts the limit"""
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            res = await func()
+        except Exception as e:
+            await self.release(rate_limited=is_rate_limit_error(e))
+            raise
+        await self.release(latency=time.perf_counter() - start)
+        return res
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'limit': round(self.limit, 2),
+            'max_limit': self.max_limit,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'calls': self.calls,
+            'rate_limited': self.rate_limited,
+            'baseline_latency': round(self.baseline_latency, 3) if self.baseline_latency else None,
+        }
+
+
+async def call_with_retry(limiter: AdaptiveConcurrencyLimiter, func: Callable[[], Awaitable[T]],
+                          max_retries: int = 3, backoff: float = 1.0) -> T:
+    """retry with exponential backoff and jitter, a rate limit error waits for retry-after when given"""
+    for i in range(max_retries + 1):
+        try:
+            return await limiter.run(func)
+        except Exception as e:
+            if i >= max_retries:
+                raise e
+            sleep = backoff * (2 ** i)
+            if is_rate_limit_error(e):
+                sleep = max(sleep, retry_after_seconds(e) or 0)
+            sleep *= 1 + random.random() * 0.25
+            logger.warning(f'llm call retry {i + 1}/{max_retries} after {sleep:.2f}s, error: {e}')
+            await asyncio.sleep(sleep)
+
+
+def run_coroutine_sync(coro: Awaitable[T]) -> T:
+    """run a coroutine from sync node code, nodes run in worker threads without an event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    # called from a thread that already runs a loop, run the coroutine on its own loop in another thread
+    result: Dict[str, Any] = {}
+    context = contextvars.copy_context()
+
+    def _target():
+        try:
+            result['value'] = context.run(asyncio.run, coro)
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=_target, daemon=True)
+    thread.start()
+    thread.join()
+    if 'error' in result:
+        raise result['error']
+    return result['value']
@@ -0,0 +1,281 @@
+"""Execution service for LangGraph workflows.
+
+Keeps the API event loop free while workflows run:
+- flows are loaded with the async DAO
+- compiled graphs are cached per flow version, so a run does not rebuild the graph
+- the sync graph execution runs in a bounded thread pool, extra runs wait for a free slot
+- streamed runs are read from their StreamManager by seq, a client reconnects with the last seq it got
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from bisheng.core.cache.flow import InMemoryCache
+from bisheng.database.models.flow import Flow, FlowDao
+from bisheng.langgraph.engine.checkpointer import CheckpointerManager
+from bisheng.langgraph.engine.graph_builder import LangGraphBuilder
+from bisheng.langgraph.engine.state_schema import DEFAULT_STATE
+from bisheng.langgraph.engine.stream_manager import (StreamEvent, StreamEventType, StreamManager,
+                                                     StreamSubscription, current_stream_manager)
+
+logger = logging.getLogger(__name__)
+
+# seconds a stream reader waits for new events before it checks again
+STREAM_POLL_SECONDS = 5
+
+
+class CompiledGraphCache:
+    """LRU cache of compiled graphs keyed by (workflow_id, checkpointer_mode).
+
+    An entry is only reused while the flow update_time is unchanged.
+    The checkpointer is compiled into the graph, so the cached graph also keeps
+    the thread state used by resume, state and history.
+    """
+
+    def __init__(self, max_size: int = 64, expiration_time: int = 60 * 60):
+        self._cache = InMemoryCache(max_size=max_size, expiration_time=expiration_time)
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, flow: Flow, checkpointer_mode: str = 'memory') -> Tuple[Any, Dict]:
+        key = (str(flow.id), checkpointer_mode)
+        version = str(flow.update_time)
+        entry = self._cache.get(key)
+        if entry and entry['version'] == version:
+            self.hits += 1
+            return entry['compiled'], entry['config']
+
+        self.misses += 1
+        workflow_data = flow.data
+        if isinstance(workflow_data, str):
+            workflow_data = json.loads(workflow_data)
+        start = time.perf_counter()
+        builder = LangGraphBuilder(
+            workflow_id=str(flow.id),
+            workflow_data=workflow_data,
+            user_id=0,
+            checkpointer_mode=checkpointer_mode,
+        )
+        compiled, config, _ = builder.build()
+        logger.debug(f'compiled langgraph workflow {flow.id} cost={time.perf_counter() - start:.3f}s')
+        self._cache.set(key, {'version': version, 'compiled': compiled, 'config': config})
+        return compiled, config
+
+    def invalidate(self, workflow_id: str):
+        for mode in ('memory', 'sqlite', 'postgres'):
+            self._cache.delete((workflow_id, mode))
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._cache._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0,
+        }
+
+
+class LangGraphExecutionService:
+    """Run LangGraph workflows without blocking the event loop.
+
+    At most `max_concurrency` workflows execute at the same time in the worker threads,
+    other requests wait on the semaphore without holding a thread.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.max_concurrency = max_concurrency or int(os.environ.get('LANGGRAPH_MAX_CONCURRENCY', 16))
+        self.graph_cache = CompiledGraphCache()
+        # stream managers of recent streamed runs by stream id, kept after the run for reconnecting readers
+        self.streams = InMemoryCache(max_size=int(os.environ.get('LANGGRAPH_STREAM_KEEP', 256)),
+                                     expiration_time=60 * 60)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='langgraph')
+        self._semaphores: Dict[int, asyncio.Semaphore] = {}
+        self.running = 0
+        self.waiting = 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # a semaphore is bound to the loop it is first used in
+        loop_id = id(asyncio.get_running_loop())
+        if loop_id not in self._semaphores:
+            self._semaphores[loop_id] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop_id]
+
+    async def get_flow(self, workflow_id: str) -> Flow:
+        flow = await FlowDao.aget_flow_by_id(workflow_id)
+        if not flow or not flow.data:
+            raise HTTPException(status_code=404, detail='Workflow not found')
+        return flow
+
+    async def get_compiled(self, workflow_id: str, thread_id: Optional[str] = None,
+                           checkpointer_mode: str = 'memory') -> Tuple[Any, Dict]:
+        """compiled graph and a per-request config, the graph is built in a worker thread on a cache miss"""
+        flow = await self.get_flow(workflow_id)
+        compiled, config = await self._run_in_executor(self.graph_cache.get_or_build, flow, checkpointer_mode)
+        config = {**config, 'configurable': {**config['configurable']}}
+        if thread_id:
+            config['configurable']['thread_id'] = thread_id
+        return compiled, config
+
+    def invalidate(self, workflow_id: str):
+        self.graph_cache.invalidate(workflow_id)
+
+    async def _run_in_executor(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    def build_initial_state(inputs: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        initial_state = dict(DEFAULT_STATE)
+        if inputs:
+            from langchain_core.messages import HumanMessage
+            if 'message' in inputs:
+                initial_state['messages'] = [HumanMessage(content=inputs['message'])]
+            initial_state['variables'] = {'input': inputs}
+        return initial_state
+
+    @staticmethod
+    def _final_output(compiled, config: Dict) -> str:
+        final_state = compiled.get_state(config)
+        final_output = ''
+        if final_state and final_state.values:
+            final_output = final_state.values.get('final_output', '')
+            if not final_output and final_state.values.get('messages'):
+                last_msg = final_state.values['messages'][-1]
+                final_output = last_msg.content if hasattr(last_msg, 'content') else str(last_msg)
+        return final_output
+
+    @staticmethod
+    def _execute(compiled, graph_input, config: Dict, stream_manager: StreamManager):
+        """sync graph execution, runs in a worker thread, the nodes emit their events to stream_manager"""
+        token = current_stream_manager.set(stream_manager)
+        try:
+            for _ in compiled.stream(graph_input, config=config):
+                pass
+        finally:
+            current_stream_manager.reset(token)
+            stream_manager.close()
+
+    async def _bounded(self, func, *args):
+        self.waiting += 1
+        async with self._semaphore():
+            self.waiting -= 1
+            self.running += 1
+            try:
+                return await self._run_in_executor(func, *args)
+            finally:
+                self.running -= 1
+
+    async def run(self, workflow_id: str, inputs: Optional[Dict[str, Any]] = None,
+                  thread_id: Optional[str] = None) -> Dict[str, Any]:
+        # every run gets its own thread unless the caller continues an existing one,
+        # runs share the cached graph and its checkpointer
+        compiled, config = await self.get_compiled(workflow_id, thread_id or uuid.uuid4().hex)
+        # events of the run can be replayed by thread id when LANGGRAPH_STREAM_SPILL is on
+        stream_manager = StreamManager(stream_id=config['configurable']['thread_id'])
+        try:
+            await self._bounded(self._execute, compiled, self.build_initial_state(inputs), config, stream_manager)
+            final_output = await self._run_in_executor(self._final_output, compiled, config)
+            return {
+                'status': 'success',
+                'output': final_output,
+                'thread_id': config['configurable']['thread_id'],
+                'events': [e.model_dump() for e in stream_manager.get_events()],
+            }
+        except Exception as e:
+            logger.exception(f'Workflow execution error: {e}')
+            return {'status': 'error', 'error': str(e)}
+
+    async def stream(self, workflow_id: str, inputs: Optional[Dict[str, Any]] = None,
+                     thread_id: Optional[str] = None) -> AsyncIterator[StreamEvent]:
+        """run the graph in a worker thread and yield the events of its stream manager in seq order"""
+        compiled, config = await self.get_compiled(workflow_id, thread_id or uuid.uuid4().hex)
+        # a thread can be run again, every streamed run gets its own stream
+        stream_manager = StreamManager(stream_id=uuid.uuid4().hex)
+        self.streams.set(stream_manager.stream_id, stream_manager)
+        stream_manager.emit(StreamEvent(event_type=StreamEventType.WORKFLOW_START, data={
+            'stream_id': stream_manager.stream_id, 'thread_id': config['configurable']['thread_id']}))
+        subscription = stream_manager.subscribe()
+
+        def _end():
+            stream_manager.emit(StreamEvent(event_type=StreamEventType.WORKFLOW_END))
+            stream_manager.flush()
+
+        async def produce():
+            try:
+                await self._bounded(self._execute, compiled, self.build_initial_state(inputs), config,
+                                    stream_manager)
+            except Exception as e:
+                stream_manager.emit_error(error=str(e))
+            finally:
+                # emit may wait on a full buffer and flush writes to redis
+                await asyncio.to_thread(_end)
+
+        task = asyncio.create_task(produce())
+        try:
+            async for event in self.follow(subscription):
+                yield event
+        finally:
+            if not task.done():
+                # the client went away, the worker thread finishes the run in the background
+                task.add_done_callback(lambda t: t.exception())
+
+    def get_stream(self, stream_id: str) -> Optional[StreamManager]:
+        """stream manager of a recent streamed run of this process"""
+        return self.streams.get(stream_id)
+
+    @staticmethod
+    async def follow(subscription: StreamSubscription) -> AsyncIterator[StreamEvent]:
+        """events of a subscription up to the workflow_end event"""
+        try:
+            while True:
+                for event in await subscription.aread(timeout=STREAM_POLL_SECONDS):
+                    yield event
+                    if event.event_type == StreamEventType.WORKFLOW_END:
+                        return
+        finally:
+            subscription.close()
+
+    async def resume(self, workflow_id: str, thread_id: str, human_feedback: Any) -> Dict[str, Any]:
+        compiled, config = await self.get_compiled(workflow_id, thread_id)
+
+        def _resume():
+            compiled.update_state(config, {'human_feedback': human_feedback})
+            self._execute(compiled, None, config, StreamManager())
+            final_state = compiled.get_state(config)
+            return final_state.values.get('final_output', '') if final_state else ''
+
+        try:
+            return {'status': 'success', 'output': await self._bounded(_resume)}
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+
+    async def get_state(self, workflow_id: str, thread_id: Optional[str] = None):
+        compiled, config = await self.get_compiled(workflow_id, thread_id)
+        return await self._run_in_executor(compiled.get_state, config)
+
+    async def get_state_history(self, workflow_id: str, thread_id: Optional[str] = None):
+        compiled, config = await self.get_compiled(workflow_id, thread_id)
+        return await self._run_in_executor(lambda: list(compiled.get_state_history(config)))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'max_concurrency': self.max_concurrency,
+            'running': self.running,
+            'waiting': self.waiting,
+            'graph_cache': self.graph_cache.metrics(),
+            'checkpointers': CheckpointerManager.metrics(),
+        }
+
+    def stream_metrics(self) -> List[Dict[str, Any]]:
+        return [item['value'].metrics() for item in list(self.streams._cache.values())]
+
+
+langgraph_execution_service = LangGraphExecutionService()
@@ -12,7 +12,7 @@ from langgraph.constants import END, START
 from langgraph.graph import StateGraph
 from loguru import logger
 
-from bisheng.langgraph.engine.checkpointer import get_checkpointer
+from bisheng.langgraph.engine.checkpointer import CheckpointerManager
 from bisheng.langgraph.engine.state_schema import DEFAULT_STATE, LangGraphState
 from bisheng.langgraph.engine.stream_manager import StreamManager
 from bisheng.langgraph.nodes.base import BaseLGNode
@@ -73,7 +73,7 @@ class LangGraphBuilder:
         self._add_edges(graph_builder)
 
         # Compile with checkpointer
-        checkpointer = get_checkpointer(mode=self.checkpointer_mode)
+        checkpointer = CheckpointerManager.get_or_create(self.workflow_id, mode=self.checkpointer_mode)
         compiled = graph_builder.compile(
             checkpointer=checkpointer,
             interrupt_before=self.interrupt_node_ids if self.interrupt_node_ids else None,
@@ -4,11 +4,16 @@ Provides structured event types for real-time UI updates including
 node execution, token streaming, tool calls, and state changes.
 """
 
+import asyncio
 import json
 import logging
+import os
+import threading
 import time
+from collections import deque
+from contextvars import ContextVar
 from enum import Enum
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 
 from pydantic import BaseModel
 
@@ -25,6 +30,7 @@ class StreamEventType(str, Enum):
     STATE_UPDATE = 'state_update'
     HUMAN_INPUT = 'human_input'
     CHECKPOINT = 'checkpoint'
+    PARTIAL_RESULT = 'partial_result'
     ERROR = 'error'
     WORKFLOW_START = 'workflow_start'
     WORKFLOW_END = 'workflow_end'
@@ -37,18 +43,89 @@ class StreamEvent(BaseModel):
     node_name: Optional[str] = None
     data: Any = None
     timestamp: float = 0.0
+    # sequence id in the stream, starts at 1 and increases by one per event
+    seq: int = 0
 
     def model_post_init(self, __context):
         if self.timestamp == 0.0:
             self.timestamp = time.time()
 
 
+class BackpressurePolicy(str, Enum):
+    """What emit does when the ring buffer is full."""
+    DROP_OLDEST = 'drop_oldest'
+    # wait until every subscriber has read the oldest event, drop it after block_timeout
+    BLOCK = 'block'
+
+
+class StreamSubscription:
+    """A reader of one stream, keeps the seq of the last event it has read."""
+
+    def __init__(self, manager: 'StreamManager', cursor: int = 0):
+        self.manager = manager
+        self.cursor = cursor
+        self.missed = 0
+
+    def read(self, limit: Optional[int] = None, timeout: Optional[float] = None) -> List[StreamEvent]:
+        """events after the cursor, waits up to timeout seconds when there is none"""
+        events, missed = self.manager.read(self.cursor, limit=limit, timeout=timeout)
+        self._advance(events, missed)
+        return events
+
+    async def aread(self, limit: Optional[int] = None, timeout: Optional[float] = None) -> List[StreamEvent]:
+        events, missed = await self.manager.aread(self.cursor, limit=limit, timeout=timeout)
+        self._advance(events, missed)
+        return events
+
+    def _advance(self, events: List[StreamEvent], missed: int):
+        self.missed += missed
+        self.cursor += missed
+        if events:
+            self.cursor = events[-1].seq
+            self.manager.notify_progress()
+
+    def close(self):
+        self.manager.unsubscribe(self)
+
+
 class StreamManager:
-    """Manages streaming events during LangGraph workflow execution."""
+    """Manages streaming events during LangGraph workflow execution.
+
+    Events are kept in a fixed size ring buffer and numbered with a monotonic seq,
+    subscribers read from their own cursor and can resume from any seq still in the buffer.
+    With a stream_id and spill enabled, events are also written to a redis sorted set in batches,
+    so a reader on another pod can replay the stream with `StreamManager.replay`.
+    """
+
+    spill_key_prefix = 'langgraph:stream:'
+
+    def __init__(self, capacity: Optional[int] = None, policy: BackpressurePolicy = BackpressurePolicy.DROP_OLDEST,
+                 block_timeout: float = 5.0, stream_id: Optional[str] = None, spill: Optional[bool] = None,
+                 spill_batch: int = 64, spill_max_events: int = 10000, spill_expire: int = 3600):
+        self.capacity = capacity or int(os.environ.get('LANGGRAPH_STREAM_BUFFER_SIZE', 1024))
+        self.policy = BackpressurePolicy(policy)
+        self.block_timeout = block_timeout
+        self.stream_id = stream_id
+        if spill is None:
+            spill = os.environ.get('LANGGRAPH_STREAM_SPILL', '').lower() in ('1', 'true')
+        self.spill = bool(spill and stream_id)
+        self.spill_batch = spill_batch
+        self.spill_max_events = spill_max_events
+        self.spill_expire = spill_expire
 
-    def __init__(self):
         self._listeners: List[Callable[[StreamEvent], None]] = []
-        self._events: List[StreamEvent] = []
+        self._events: Deque[StreamEvent] = deque()
+        self._sizes: Deque[int] = deque()
+        self._subscriptions: List[StreamSubscription] = []
+        self._pending_spill: List[StreamEvent] = []
+        self._cond = threading.Condition()
+        self._seq = 0
+
+        # metrics
+        self.bytes = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.blocked_seconds = 0.0
 
     def add_listener(self, callback: Callable[[StreamEvent], None]):
         """Register a callback for stream events."""
@@ -58,9 +135,71 @@ class StreamManager:
         """Remove a callback."""
         self._listeners = [l for l in self._listeners if l != callback]
 
+    def subscribe(self, cursor: int = 0) -> StreamSubscription:
+        """Attach a reader starting after `cursor`, 0 reads from the oldest buffered event."""
+        subscription = StreamSubscription(self, cursor)
+        with self._cond:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: StreamSubscription):
+        with self._cond:
+            self._subscriptions = [one for one in self._subscriptions if one is not subscription]
+            self._cond.notify_all()
+
+    def notify_progress(self):
+        """wake a producer blocked on a full buffer"""
+        if self.policy == BackpressurePolicy.BLOCK:
+            with self._cond:
+                self._cond.notify_all()
+
+    @property
+    def first_seq(self) -> int:
+        return self._events[0].seq if self._events else self._seq + 1
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def _oldest_is_unread(self) -> bool:
+        oldest = self._events[0].seq
+        return any(one.cursor < oldest for one in self._subscriptions)
+
+    def _make_room(self):
+        """called with the condition held and a full buffer"""
+        if self.policy == BackpressurePolicy.BLOCK and self._subscriptions:
+            start = time.perf_counter()
+            deadline = time.monotonic() + self.block_timeout
+            while self._oldest_is_unread():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            self.blocked_seconds += time.perf_counter() - start
+        evicted = self._events.popleft()
+        self.bytes -= self._sizes.popleft()
+        if any(one.cursor < evicted.seq for one in self._subscriptions):
+            self.dropped += 1
+
     def emit(self, event: StreamEvent):
         """Emit a stream event to all listeners."""
-        self._events.append(event)
+        spill_batch = None
+        with self._cond:
+            while len(self._events) >= self.capacity:
+                self._make_room()
+            self._seq += 1
+            event.seq = self._seq
+            size = len(str(event.data)) if event.data is not None else 0
+            self._events.append(event)
+            self._sizes.append(size)
+            self.bytes += size
+            if self.spill:
+                self._pending_spill.append(event)
+                if len(self._pending_spill) >= self.spill_batch:
+                    spill_batch, self._pending_spill = self._pending_spill, []
+            self._cond.notify_all()
+        if spill_batch:
+            self._spill(spill_batch)
         for listener in self._listeners:
             try:
                 listener(event)
@@ -116,6 +255,13 @@ class StreamManager:
             data={'input_schema': input_schema},
         ))
 
+    def emit_partial_result(self, node_id: str, stage: str, data: Any):
+        self.emit(StreamEvent(
+            event_type=StreamEventType.PARTIAL_RESULT,
+            node_id=node_id,
+            data={'stage': stage, **data},
+        ))
+
     def emit_error(self, node_id: str = None, error: str = ''):
         self.emit(StreamEvent(
             event_type=StreamEventType.ERROR,
@@ -123,11 +269,146 @@ class StreamManager:
             data={'error': error},
         ))
 
+    def _read_buffer(self, cursor: int, limit: Optional[int]) -> Tuple[List[StreamEvent], int]:
+        """called with the condition held"""
+        missed = 0
+        first_seq = self.first_seq
+        if cursor + 1 < first_seq:
+            missed = first_seq - cursor - 1
+            cursor = first_seq - 1
+        start = cursor + 1 - first_seq
+        end = len(self._events) if limit is None else min(len(self._events), start + limit)
+        return [self._events[i] for i in range(start, end)], missed
+
+    def read(self, cursor: int = 0, limit: Optional[int] = None,
+             timeout: Optional[float] = None) -> Tuple[List[StreamEvent], int]:
+        """
+        events with seq > cursor and the number of events already evicted from the buffer.
+        evicted events are read from redis when spill is enabled.
+        """
+        with self._cond:
+            if timeout and cursor >= self._seq:
+                self._cond.wait_for(lambda: cursor < self._seq, timeout)
+            events, missed = self._read_buffer(cursor, limit)
+        if missed and self.spill:
+            self.flush()
+            spilled = self.replay(self.stream_id, cursor, max_seq=cursor + missed)
+            return self._merge_spilled(spilled, events, missed, limit)
+        return events, missed
+
+    @staticmethod
+    def _merge_spilled(spilled: List[StreamEvent], events: List[StreamEvent], missed: int,
+                       limit: Optional[int]) -> Tuple[List[StreamEvent], int]:
+        events = spilled + events
+        if limit is not None:
+            events = events[:limit]
+        return events, missed - len(spilled)
+
+    async def aread(self, cursor: int = 0, limit: Optional[int] = None,
+                    timeout: Optional[float] = None) -> Tuple[List[StreamEvent], int]:
+        """async version of read, waits for new events without holding a thread"""
+        if timeout and cursor >= self._seq:
+            loop = asyncio.get_running_loop()
+            arrived = asyncio.Event()
+
+            def _on_event(_):
+                loop.call_soon_threadsafe(arrived.set)
+
+            self.add_listener(_on_event)
+            try:
+                if cursor >= self._seq:
+                    await asyncio.wait_for(arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.remove_listener(_on_event)
+        # the condition is only held to copy from the buffer, never waited on here
+        with self._cond:
+            events, missed = self._read_buffer(cursor, limit)
+        if missed and self.spill:
+            await asyncio.to_thread(self.flush)
+            spilled = await self.areplay(self.stream_id, cursor, max_seq=cursor + missed)
+            return self._merge_spilled(spilled, events, missed, limit)
+        return events, missed
+
     def get_events(self) -> List[StreamEvent]:
-        """Get all recorded events."""
-        return self._events.copy()
+        """Get the events still in the buffer."""
+        with self._cond:
+            return list(self._events)
+
+    def _spill(self, events: List[StreamEvent]):
+        try:
+            from bisheng.core.cache.redis_manager import get_redis_client_sync
+            key = f'{self.spill_key_prefix}{self.stream_id}'
+            pipe = get_redis_client_sync().pipeline(transaction=False)
+            pipe.zadd(key, {event.model_dump_json(): event.seq for event in events})
+            pipe.zremrangebyrank(key, 0, -self.spill_max_events - 1)
+            pipe.expire(key, self.spill_expire)
+            pipe.execute()
+            self.spilled += len(events)
+        except Exception as e:
+            logger.warning(f'spill stream {self.stream_id} events to redis error: {e}')
+
+    def flush(self):
+        """write the pending events to redis"""
+        with self._cond:
+            events, self._pending_spill = self._pending_spill, []
+        if events:
+            self._spill(events)
+
+    def close(self):
+        self.flush()
+
+    @classmethod
+    def replay(cls, stream_id: str, cursor: int = 0, limit: Optional[int] = None,
+               max_seq: Optional[int] = None) -> List[StreamEvent]:
+        """events with cursor < seq <= max_seq spilled to redis by any pod"""
+        from bisheng.core.cache.redis_manager import get_redis_client_sync
+        key = f'{cls.spill_key_prefix}{stream_id}'
+        max_score = max_seq if max_seq is not None else '+inf'
+        if limit is None:
+            values = get_redis_client_sync().connection.zrangebyscore(key, f'({cursor}', max_score)
+        else:
+            values = get_redis_client_sync().connection.zrangebyscore(key, f'({cursor}', max_score, start=0, num=limit)
+        return [StreamEvent.model_validate_json(one) for one in values]
 
-    def to_sse_format(self, event: StreamEvent) -> str:
-        """Convert event to Server-Sent Events format."""
+    @classmethod
+    async def areplay(cls, stream_id: str, cursor: int = 0, limit: Optional[int] = None,
+                      max_seq: Optional[int] = None) -> List[StreamEvent]:
+        """async version of replay"""
+        from bisheng.core.cache.redis_manager import get_redis_client
+        key = f'{cls.spill_key_prefix}{stream_id}'
+        max_score = max_seq if max_seq is not None else '+inf'
+        redis_client = await get_redis_client()
+        if limit is None:
+            values = await redis_client.async_connection.zrangebyscore(key, f'({cursor}', max_score)
+        else:
+            values = await redis_client.async_connection.zrangebyscore(key, f'({cursor}', max_score, start=0, num=limit)
+        return [StreamEvent.model_validate_json(one) for one in values]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'stream_id': self.stream_id,
+                'capacity': self.capacity,
+                'policy': self.policy.value,
+                'buffered': len(self._events),
+                'first_seq': self.first_seq,
+                'last_seq': self.last_seq,
+                'approx_bytes': self.bytes,
+                'dropped': self.dropped,
+                'blocked_seconds': round(self.blocked_seconds, 3),
+                'subscribers': len(self._subscriptions),
+                'spilled': self.spilled,
+            }
+
+    @staticmethod
+    def to_sse_format(event: StreamEvent) -> str:
+        """Convert event to Server-Sent Events format, the id is the seq a client resumes from."""
         data = event.model_dump()
-        return f'data: {json.dumps(data, ensure_ascii=False)}\n\n'
+        return f'id: {event.seq}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n'
+
+
+# Stream manager of the current run. Compiled graphs are shared between runs,
+# so nodes resolve the manager of the run from this context var first.
+current_stream_manager: ContextVar[Optional[StreamManager]] = ContextVar('langgraph_stream_manager', default=None)
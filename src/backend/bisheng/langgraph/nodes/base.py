@@ -12,7 +12,7 @@ from typing import Any, Dict, List, Optional
 
 from langchain_core.runnables import RunnableConfig
 
-from bisheng.langgraph.engine.stream_manager import StreamManager
+from bisheng.langgraph.engine.stream_manager import StreamManager, current_stream_manager
 
 logger = logging.getLogger(__name__)
 
@@ -41,13 +41,18 @@ class BaseLGNode(ABC):
         self.node_data = node_data
         self.workflow_id = workflow_id
         self.user_id = user_id
-        self.stream_manager = stream_manager or StreamManager()
+        self._stream_manager = stream_manager or StreamManager()
         self.target_nodes = target_nodes or []
 
         # Parse node configuration from group_params
         self.config: Dict[str, Any] = {}
         self._parse_config()
 
+    @property
+    def stream_manager(self) -> StreamManager:
+        """Stream manager of the running execution, falls back to the one given at build time."""
+        return current_stream_manager.get() or self._stream_manager
+
     def _parse_config(self):
         """Parse configuration from node_data group_params."""
         group_params = self.node_data.get('group_params', [])
@@ -1,12 +1,13 @@
 """Map-Reduce node - parallel execution with aggregation."""
 
+import asyncio
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Any, Dict, List, Optional
 
 from langchain_core.messages import AIMessage
 from langchain_core.runnables import RunnableConfig
 
+from bisheng.langgraph.engine.concurrency import AdaptiveConcurrencyLimiter, call_with_retry, run_coroutine_sync
 from bisheng.langgraph.nodes.base import BaseLGNode
 
 logger = logging.getLogger(__name__)
@@ -15,24 +16,28 @@ logger = logging.getLogger(__name__)
 class MapReduceNode(BaseLGNode):
     """Executes a function over multiple items in parallel, then aggregates.
 
+    Map calls use `ainvoke` under an adaptive concurrency limit: the limit starts at half of
+    max_concurrency, grows while the provider latency is stable and is halved on rate limit errors.
+    Failed calls are retried with backoff. When the map results do not fit in one reduce prompt,
+    they are reduced in groups and the partial results are reduced again until one is left.
+    Map results and partial reduce results are streamed as partial_result events.
+
     Config:
     - input_variable: Reference to the list variable to map over
     - map_prompt: Prompt template for each item (use {{item}} placeholder)
     - reduce_prompt: Prompt to aggregate results
     - model_id: LLM model for map/reduce
     - max_concurrency: Maximum parallel executions
+    - max_retries: Retries of a failed LLM call
+    - reduce_batch_size: Maximum map results in one reduce call
+    - reduce_max_chars: Maximum characters of the results in one reduce call
     - output_key: Output variable key
     """
 
     def execute(self, state: Dict[str, Any], config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
         from bisheng.llm.domain.services.llm import LLMService
-        from langchain_core.messages import HumanMessage, SystemMessage
 
         input_var = self.config.get('input_variable', '')
-        map_prompt = self.config.get('map_prompt', 'Process this item: {{item}}')
-        reduce_prompt = self.config.get('reduce_prompt', 'Summarize these results:\n{{results}}')
-        model_id = self.config.get('model_id', '')
-        max_concurrency = self.config.get('max_concurrency', 5)
         output_key = self.config.get('output_key', 'output')
 
         # Get input list
@@ -51,43 +56,85 @@ class MapReduceNode(BaseLGNode):
 
         # Get LLM
         llm = LLMService.get_bisheng_llm_sync(
-            model_id=model_id,
+            model_id=self.config.get('model_id', ''),
             temperature=self.config.get('temperature', 0.7),
             app_id=self.workflow_id,
         )
 
-        # Map phase - parallel execution
-        map_results = []
+        map_results, final_result = run_coroutine_sync(self.amap_reduce(llm, items, state))
+
+        return {
+            'messages': [AIMessage(content=final_result)],
+            'variables': {self.node_id: {output_key: final_result, 'map_results': map_results}},
+            'intermediate_results': map_results,
+        }
+
+    async def amap_reduce(self, llm, items: List[Any], state: Dict[str, Any]):
+        """map every item and reduce the results, returns (map_results, final_result)"""
+        map_prompt = self.config.get('map_prompt', 'Process this item: {{item}}')
+        max_concurrency = int(self.config.get('max_concurrency', 5) or 5)
+        max_retries = int(self.config.get('max_retries', 3))
+        limiter = AdaptiveConcurrencyLimiter(max_limit=min(max_concurrency, len(items)))
+
+        async def _ainvoke(prompt: str) -> str:
+            from langchain_core.messages import HumanMessage
+            response = await llm.ainvoke([HumanMessage(content=prompt)])
+            return response.content if hasattr(response, 'content') else str(response)
 
-        def process_item(item):
-            prompt = map_prompt.replace('{{item}}', str(item))
-            prompt = self.resolve_template(prompt, state)
+        async def process_item(index: int, item: Any) -> str:
+            prompt = self.resolve_template(map_prompt.replace('{{item}}', str(item)), state)
             try:
-                response = llm.invoke([HumanMessage(content=prompt)])
-                return response.content if hasattr(response, 'content') else str(response)
+                result = await call_with_retry(limiter, lambda: _ainvoke(prompt), max_retries=max_retries)
             except Exception as e:
-                return f'Error: {str(e)}'
+                result = f'Error: {str(e)}'
+            self.stream_manager.emit_partial_result(self.node_id, 'map', {'index': index, 'result': result})
+            return result
 
-        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(items))) as executor:
-            futures = {executor.submit(process_item, item): i for i, item in enumerate(items)}
-            map_results = [None] * len(items)
-            for future in as_completed(futures):
-                idx = futures[future]
-                map_results[idx] = future.result()
+        # Map phase - concurrency is bounded by the limiter, not by the number of tasks
+        map_results = list(await asyncio.gather(*[process_item(i, item) for i, item in enumerate(items)]))
 
         # Reduce phase
-        results_text = '\n---\n'.join([f'[{i+1}] {r}' for i, r in enumerate(map_results) if r])
-        final_prompt = reduce_prompt.replace('{{results}}', results_text)
-        final_prompt = self.resolve_template(final_prompt, state)
-
         try:
-            response = llm.invoke([HumanMessage(content=final_prompt)])
-            final_result = response.content if hasattr(response, 'content') else str(response)
+            final_result = await self._areduce(limiter, _ainvoke, map_results, state, max_retries)
         except Exception as e:
             final_result = f'Reduce error: {str(e)}'
-
-        return {
-            'messages': [AIMessage(content=final_result)],
-            'variables': {self.node_id: {output_key: final_result, 'map_results': map_results}},
-            'intermediate_results': map_results,
-        }
+        logger.info(f'map reduce node {self.node_id} items={len(items)} limiter={limiter.metrics()}')
+        return map_results, final_result
+
+    def _reduce_groups(self, results: List[str]) -> List[List[str]]:
+        """split results into groups that fit one reduce prompt"""
+        batch_size = max(int(self.config.get('reduce_batch_size', 20) or 20), 2)
+        max_chars = int(self.config.get('reduce_max_chars', 12000) or 12000)
+        groups, group, group_chars = [], [], 0
+        for one in results:
+            # a group holds at least two results, so every reduce level shrinks the list
+            if group and (len(group) >= batch_size or (len(group) >= 2 and group_chars + len(one) > max_chars)):
+                groups.append(group)
+                group, group_chars = [], 0
+            group.append(one)
+            group_chars += len(one)
+        if group or not groups:
+            groups.append(group)
+        return groups
+
+    async def _areduce(self, limiter: AdaptiveConcurrencyLimiter, ainvoke, results: List[str],
+                       state: Dict[str, Any], max_retries: int) -> str:
+        reduce_prompt = self.config.get('reduce_prompt', 'Summarize these results:\n{{results}}')
+        results = [r for r in results if r]
+        level = 0
+        while True:
+            groups = self._reduce_groups(results)
+
+            async def reduce_group(index: int, group: List[str]) -> str:
+                results_text = '\n---\n'.join([f'[{i + 1}] {r}' for i, r in enumerate(group)])
+                prompt = self.resolve_template(reduce_prompt.replace('{{results}}', results_text), state)
+                result = await call_with_retry(limiter, lambda: ainvoke(prompt), max_retries=max_retries)
+                if len(groups) > 1:
+                    self.stream_manager.emit_partial_result(self.node_id, 'reduce',
+                                                            {'level': level, 'index': index, 'result': result})
+                return result
+
+            results = list(await asyncio.gather(*[reduce_group(i, group) for i, group in enumerate(groups)]))
+            if len(groups) == 1:
+                return results[0]
+            level += 1
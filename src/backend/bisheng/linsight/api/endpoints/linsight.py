@@ -40,7 +40,8 @@ from bisheng.linsight.domain.models.linsight_session_version import LinsightSess
     LinsightSessionVersion
 from bisheng.linsight.domain.models.linsight_sop import LinsightSOPDao, LinsightSOPRecord
 from bisheng.knowledge.domain.models.knowledge import KnowledgeTypeEnum, KnowledgeDao
-from bisheng.linsight.domain.services.state_message_manager import LinsightStateMessageManager, MessageData, MessageEventType
+from bisheng.linsight.domain.services.state_message_manager import LinsightStateMessageManager, MessageData, \
+    MessageEventType, SignalType
 from bisheng.share_link.api.dependencies import header_share_token_parser
 from bisheng.share_link.domain.models.share_link import ShareLink
 from bisheng.utils import util
@@ -544,6 +545,8 @@ async def terminate_execute(
     state_message_manager = LinsightStateMessageManager(session_version_id=linsight_session_version_id)
 
     await state_message_manager.set_session_version_info(session_version_model)
+    # Wake up the worker running the task
+    await state_message_manager.publish_signal(SignalType.TERMINATE)
 
     state_message_manager = LinsightStateMessageManager(session_version_id=session_version_model.id)
     # Push termination message
@@ -781,6 +784,14 @@ async def download_md_to_pdf_or_docx(
         return ResourceDownloadError.return_resp(data=str(e))
 
 
+@router.get("/workbench/pdf-render/metrics", summary="Get markdown to pdf render pool metrics",
+            response_model=UnifiedResponseModel)
+async def get_pdf_render_metrics(login_user: UserPayload = Depends(UserPayload.get_login_user)):
+    """ Warm browser pool metrics of this process """
+    from bisheng.common.utils.markdown_cmpnt.pdf_render_service import get_pdf_render_metrics as _metrics
+    return resp_200(data=_metrics())
+
+
 @router.post("/sop/add", summary="Add InspirationSOP", response_model=UnifiedResponseModel)
 async def add_sop(
         sop_obj: SOPManagementSchema = Body(..., description="SOPObjects"),
@@ -2,7 +2,7 @@ from datetime import datetime
 from enum import Enum
 from typing import Optional, Dict, List
 
-from sqlalchemy import Enum as SQLEnum, Column, JSON, DateTime, text, CHAR, ForeignKey, update
+from sqlalchemy import Enum as SQLEnum, Column, JSON, DateTime, text, CHAR, ForeignKey, update, delete
 from sqlmodel import Field, select, col
 
 from bisheng.core.database import get_async_db_session
@@ -182,3 +182,108 @@ class LinsightExecuteTaskDao(object):
 
             await session.exec(statement)
             await session.commit()
+
+
+class LinsightExecuteTaskStep(SQLModelSerializable, table=True):
+    """
+    Execution step log of a task, appended while the task runs and merged into task.history when it ends
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    task_id: str = Field(..., description='TaskID', sa_column=Column(CHAR(36), nullable=False, index=True))
+    session_version_id: str = Field(..., description='Session VersionID',
+                                    sa_column=Column(CHAR(36), nullable=False, index=True))
+    step: Dict = Field(..., description='Execution Step', sa_type=JSON, nullable=False)
+    create_time: datetime = Field(default_factory=datetime.now, description='Creation Time',
+                                  sa_column=Column(DateTime, nullable=False, server_default=text('CURRENT_TIMESTAMP')))
+
+    __tablename__ = "linsight_execute_task_step"
+
+
+class LinsightExecuteTaskStepDao(object):
+    """
+    Execution step log data access objects
+    """
+
+    @classmethod
+    async def batch_create_steps(cls, steps: List[LinsightExecuteTaskStep]) -> None:
+        """
+        Batch append steps
+        :param steps: Step list
+        """
+        if not steps:
+            return
+        async with get_async_db_session() as session:
+            session.add_all(steps)
+            await session.commit()
+
+    @classmethod
+    async def get_by_task_ids(cls, task_ids: List[str]) -> Dict[str, List[Dict]]:
+        """
+        Get the steps of tasks in append order
+        :param task_ids: TaskIDList
+        :return: TaskID -> step list
+        """
+        res = {}
+        if not task_ids:
+            return res
+        async with get_async_db_session() as session:
+            statement = select(LinsightExecuteTaskStep).where(
+                col(LinsightExecuteTaskStep.task_id).in_(task_ids)).order_by(col(LinsightExecuteTaskStep.id))
+            steps = await session.exec(statement)
+            for one in steps.all():
+                res.setdefault(one.task_id, []).append(one.step)
+        return res
+
+    @classmethod
+    async def update_last_step(cls, task_id: str, step: Dict) -> bool:
+        """
+        Replace the latest step of a task, used when the user answers a call_user_input step
+        :param task_id: TaskID
+        :param step: New step data
+        :return: Whether a step was updated
+        """
+        async with get_async_db_session() as session:
+            statement = select(LinsightExecuteTaskStep).where(
+                LinsightExecuteTaskStep.task_id == task_id).order_by(col(LinsightExecuteTaskStep.id).desc()).limit(1)
+            last_step = (await session.exec(statement)).first()
+            if not last_step:
+                return False
+            last_step.step = step
+            session.add(last_step)
+            await session.commit()
+            return True
+
+    @classmethod
+    async def compact_task(cls, task_id: str, history: List[Dict], **kwargs) -> Optional[LinsightExecuteTask]:
+        """
+        Write the full history into the task and delete its step log in one transaction
+        :param task_id: TaskID
+        :param history: Full step history
+        :param kwargs: Other update fields
+        :return: Updated task object
+        """
+        async with get_async_db_session() as session:
+            task = (await session.exec(select(LinsightExecuteTask).where(LinsightExecuteTask.id == task_id))).first()
+            if not task:
+                return None
+            task.history = history
+            for key, value in kwargs.items():
+                setattr(task, key, value)
+            session.add(task)
+            await session.exec(delete(LinsightExecuteTaskStep).where(LinsightExecuteTaskStep.task_id == task_id))
+            await session.commit()
+            await session.refresh(task)
+            return task
+
+    @classmethod
+    async def merge_history(cls, tasks: List[LinsightExecuteTask]) -> List[LinsightExecuteTask]:
+        """
+        Append the not yet compacted steps to task.history
+        :param tasks: Task list
+        :return: Task list with full history
+        """
+        steps = await cls.get_by_task_ids([task.id for task in tasks])
+        for task in tasks:
+            if steps.get(task.id):
+                task.history = (task.history or []) + steps[task.id]
+        return tasks
@@ -29,6 +29,7 @@ from bisheng.common.services.config_service import settings
 from bisheng.core.prompts.manager import get_prompt_manager
 from bisheng.linsight.domain.models.linsight_sop import LinsightSOP, LinsightSOPDao, LinsightSOPRecord
 from bisheng.interface.embeddings.custom import FakeEmbedding
+from bisheng.knowledge.domain.knowledge_rag import KnowledgeRag
 from bisheng.llm.domain.const import LLMModelType
 from bisheng.llm.domain.models import LLMDao
 from bisheng.llm.domain.services import LLMService
@@ -607,6 +608,7 @@ class SOPManageService:
                 if vector_client.col is not None:
                     logger.info("Delete existingSOPVector Storagecollection")
                     vector_client.col.drop()
+                    KnowledgeRag.invalidate_vectorstore(SOPManageService.collection_name)
                     vector_client.col = None
                     vector_client.fields = []
 
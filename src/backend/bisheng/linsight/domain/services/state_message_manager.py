@@ -1,5 +1,7 @@
 import asyncio
+import json
 import pickle
+import time
 from enum import Enum
 from typing import List, Dict, Any, Optional
 
@@ -10,7 +12,7 @@ from bisheng.linsight.domain.schemas.linsight_schema import UserInputEventSchema
 from bisheng.common.errcode.http_error import ServerError
 from bisheng.core.cache.redis_manager import get_redis_client_sync, get_redis_client
 from bisheng.linsight.domain.models.linsight_execute_task import ExecuteTaskStatusEnum, LinsightExecuteTaskDao, \
-    LinsightExecuteTask
+    LinsightExecuteTask, LinsightExecuteTaskStep, LinsightExecuteTaskStepDao
 from bisheng.linsight.domain.models.linsight_session_version import LinsightSessionVersion, LinsightSessionVersionDao
 from bisheng.utils.util import retry_async
 from bisheng_langchain.linsight.event import BaseEvent
@@ -42,6 +44,16 @@ class MessageEventType(str, Enum):
     TASK_TERMINATED = "task_terminated"
 
 
+class SignalType(str, Enum):
+    """
+    Signals published to the running task of a session
+    """
+    # User terminated the task
+    TERMINATE = "terminate"
+    # User input of a task is completed
+    USER_INPUT = "user_input"
+
+
 class MessageData(BaseModel):
     """Message Data Model"""
     event_type: MessageEventType
@@ -57,6 +69,10 @@ class LinsightStateMessageManager:
     DEFAULT_RETRY_ATTEMPTS = 3
     DEFAULT_RETRY_DELAY = 1
     KEY_PREFIX = "linsight_tasks:"
+    # Buffered steps are written to the database when either limit is reached
+    STEP_FLUSH_SIZE = 20
+    STEP_FLUSH_INTERVAL = 2
+    FINISHED_STATUS = (ExecuteTaskStatusEnum.SUCCESS, ExecuteTaskStatusEnum.FAILED, ExecuteTaskStatusEnum.TERMINATED)
 
     def __init__(self, session_version_id: str):
         """
@@ -74,9 +90,23 @@ class LinsightStateMessageManager:
         self._keys = {
             'session_version_info': f"{self._key_prefix}session_version_info",
             'messages': f"{self._key_prefix}messages",
-            'execution_tasks': f"{self._key_prefix}execution_tasks:"
+            'execution_tasks': f"{self._key_prefix}execution_tasks:",
+            'execution_task_steps': f"{self._key_prefix}execution_task_steps:",
+            'execution_task_ids': f"{self._key_prefix}execution_task_ids",
+            'signal': f"{self._key_prefix}signal"
         }
 
+        # Steps appended to Redis but not yet written to the database
+        self._pending_steps: Dict[str, List[Dict]] = {}
+        self._pending_step_num = 0
+        self._last_flush_time = time.monotonic()
+
+    def _task_key(self, task_id: str) -> str:
+        return f"{self._keys['execution_tasks']}{task_id}"
+
+    def _steps_key(self, task_id: str) -> str:
+        return f"{self._keys['execution_task_steps']}{task_id}"
+
     async def _handle_redis_operation(self, operation, *args, **kwargs):
         """
         ImpuestoRedisOperation error handling
@@ -135,6 +165,44 @@ class LinsightStateMessageManager:
             self._logger.error(f"Failed to pop message: {e}")
             raise e
 
+    async def publish_signal(self, signal: SignalType, **data) -> None:
+        """
+        Publish a signal to the worker running the session
+
+        Args:
+            signal: Signal type
+            **data: Signal data
+        """
+        try:
+            await self._redis_client.apublish(self._keys['signal'], json.dumps({"signal": signal.value, **data}))
+        except Exception as e:
+            # The worker also checks the state periodically, a lost signal only delays it
+            self._logger.error(f"Failed to publish signal {signal}: {e}")
+
+    async def subscribe_signals(self):
+        """
+        Subscribe the signal channel of the session
+
+        Returns:
+            Redis PubSub object, read it with get_signal
+        """
+        pubsub = self._redis_client.async_connection.pubsub()
+        await pubsub.subscribe(self._keys['signal'])
+        return pubsub
+
+    @staticmethod
+    async def get_signal(pubsub, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Wait for the next signal
+
+        Returns:
+            Signal data or None when no signal arrives within timeout
+        """
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message and message.get('type') == 'message':
+            return json.loads(message['data'])
+        return None
+
     @retry_async(num_retries=DEFAULT_RETRY_ATTEMPTS, delay=DEFAULT_RETRY_DELAY)
     async def set_session_version_info(self, session_version_model) -> None:
         """
@@ -202,14 +270,14 @@ class LinsightStateMessageManager:
             return
 
         try:
-            # Batch WriteRedis
-            tasks_mapping = {
-                f"{self._keys['execution_tasks']}{task.id}": task.model_dump()
-                for task in tasks
-            }
-
-            await self._redis_client.amset(tasks_mapping, expiration=self.DEFAULT_EXPIRATION)
-
+            # Batch WriteRedis, the task ids are kept in a set so that no KEYS scan is needed
+            async with self._redis_client.async_pipeline() as pipe:
+                for task in tasks:
+                    await pipe.set(self._task_key(task.id), pickle.dumps(task.model_dump()),
+                                   ex=self.DEFAULT_EXPIRATION)
+                await pipe.sadd(self._keys['execution_task_ids'], *[task.id for task in tasks])
+                await pipe.expire(self._keys['execution_task_ids'], self.DEFAULT_EXPIRATION)
+                await pipe.execute()
 
         except Exception as e:
             self._logger.error(f"Failed to set execution tasks: {e}")
@@ -221,9 +289,9 @@ class LinsightStateMessageManager:
             task_id: str,
             status: ExecuteTaskStatusEnum,
             **kwargs
-    ) -> Dict[str, Any]:
+    ) -> Optional[Dict[str, Any]]:
         """
-        Update Execution Status
+        Update Execution Status, the step log is compacted into history when the task ends
 
         Args:
             task_id: TaskID
@@ -231,33 +299,64 @@ class LinsightStateMessageManager:
             **kwargs: Other update fields
 
         Returns:
-            Updated task data
+            Updated task data, None if the task was deleted
         """
         try:
+            # Steps must be in the database before the status changes, the user input reads them
+            await self.flush_steps()
+            steps = await self._get_task_steps(task_id)
+
+            if status in self.FINISHED_STATUS:
+                task_model = await self._compact_task(task_id, steps, status=status, **kwargs)
+                return task_model.model_dump() if task_model else None
+
             # Update database first
             task_model = await LinsightExecuteTaskDao.update_by_id(
                 task_id,
                 status=status,
                 **kwargs
             )
+            if not task_model:
+                self._logger.warning(f"Task {task_id} not found, skip updating status to {status}")
+                return None
 
             # Update againRedis
-            task_key = f"{self._keys['execution_tasks']}{task_id}"
-            task_data = task_model.model_dump()
-
             await self._redis_client.aset(
-                task_key,
-                task_data,
+                self._task_key(task_id),
+                task_model.model_dump(),
                 expiration=self.DEFAULT_EXPIRATION
             )
 
             self._logger.info(f"Updated task {task_id} status to {status}")
+            task_data = task_model.model_dump()
+            task_data['history'] = (task_data.get('history') or []) + steps
             return task_data
 
         except Exception as e:
             self._logger.error(f"Failed to update task {task_id} status: {e}")
             raise
 
+    async def _compact_task(self, task_id: str, steps: List[Dict], **kwargs) -> Optional[LinsightExecuteTask]:
+        """Merge the step log into task.history and drop the log, None if the task was deleted"""
+        task_model = await LinsightExecuteTaskDao.get_by_id(task_id)
+        if task_model:
+            history = (task_model.history or []) + steps
+            task_model = await LinsightExecuteTaskStepDao.compact_task(task_id, history=history, **kwargs)
+        if not task_model:
+            self._logger.warning(f"Task {task_id} not found, skip compacting {len(steps)} steps")
+            await self._redis_client.adelete(self._steps_key(task_id))
+            return None
+
+        # Task and step list are replaced together, readers never see the steps twice
+        async with self._redis_client.async_pipeline() as pipe:
+            await pipe.set(self._task_key(task_id), pickle.dumps(task_model.model_dump()),
+                           ex=self.DEFAULT_EXPIRATION)
+            await pipe.delete(self._steps_key(task_id))
+            await pipe.execute()
+
+        self._logger.info(f"Compacted {len(steps)} steps of task {task_id}, status {task_model.status}")
+        return task_model
+
     @retry_async(num_retries=DEFAULT_RETRY_ATTEMPTS, delay=DEFAULT_RETRY_DELAY)
     async def set_user_input(self, task_id: str, user_input: str, files: List[Dict[str, str]] = None) -> None:
         """
@@ -268,16 +367,19 @@ class LinsightStateMessageManager:
             user_input: User input
             files: Related Documents List
         """
-        task_key = f"{self._keys['execution_tasks']}{task_id}"
+        task_key = self._task_key(task_id)
 
         try:
 
-            task_model = await self.get_execution_task(task_id)
+            task_model = await self._get_task_model(task_id)
 
             if not task_model:
                 raise ValueError(f"Task with ID {task_id} not found in Redis or database.")
 
-            user_input_event = task_model.history[-1] if task_model.history else None
+            steps = await self._get_task_steps(task_id)
+            history = (task_model.history or []) + steps
+
+            user_input_event = history[-1] if history else None
             if user_input_event is None or user_input_event.get("step_type") != "call_user_input":
                 raise ValueError(f"Task with ID {task_id} does not support user input.")
 
@@ -286,21 +388,30 @@ class LinsightStateMessageManager:
             user_input_event.user_input = user_input
             user_input_event.files = files
             user_input_event.is_completed = True
-            task_model.history[-1] = user_input_event.model_dump()
+            user_input_event = user_input_event.model_dump()
 
             task_model.status = ExecuteTaskStatusEnum.USER_INPUT_COMPLETED
 
+            if steps:
+                # The step is still in the step log, only the last entry is replaced
+                await LinsightExecuteTaskStepDao.update_last_step(task_id, user_input_event)
+                await LinsightExecuteTaskDao.update_by_id(task_id, status=ExecuteTaskStatusEnum.USER_INPUT_COMPLETED)
+            else:
+                task_model.history[-1] = user_input_event
+                await LinsightExecuteTaskDao.update_by_id(
+                    task_id,
+                    status=ExecuteTaskStatusEnum.USER_INPUT_COMPLETED,
+                    history=task_model.history
+                )
+
             # Using Transactions to Ensure Data Consistency
             async with self._redis_client.async_pipeline() as pipe:
                 await pipe.set(task_key, pickle.dumps(task_model.model_dump()), ex=self.DEFAULT_EXPIRATION)
+                if steps and await self._redis_client.aexists(self._steps_key(task_id)):
+                    await pipe.lset(self._steps_key(task_id), -1, pickle.dumps(user_input_event))
                 await pipe.execute()
 
-            # Database updating
-            await LinsightExecuteTaskDao.update_by_id(
-                task_id,
-                status=ExecuteTaskStatusEnum.USER_INPUT_COMPLETED,
-                history=task_model.history
-            )
+            await self.publish_signal(SignalType.USER_INPUT, task_id=task_id)
 
             self._logger.info(f"Set user input for task {task_id}")
 
@@ -308,6 +419,29 @@ class LinsightStateMessageManager:
             self._logger.error(f"Failed to set user input for task {task_id}: {e}")
             raise ServerError.http_exception()
 
+    async def _get_task_model(self, task_id: str) -> Optional[LinsightExecuteTask]:
+        """Task without the step log, history only holds the compacted steps"""
+        task_data = await self._redis_client.aget(self._task_key(task_id))
+        if task_data:
+            return LinsightExecuteTask.model_validate(task_data)
+
+        # Automatically close purchase order afterRedisNo data in, fetching from database
+        task_model = await LinsightExecuteTaskDao.get_by_id(task_id)
+        if task_model:
+            await self.set_execution_tasks([task_model])
+        return task_model
+
+    async def _get_task_steps(self, task_id: str) -> List[Dict]:
+        """Steps not compacted yet, the Redis list holds all of them while it exists"""
+        steps = await self._redis_client.alrange(self._steps_key(task_id))
+        if steps:
+            return steps
+        return await self._get_db_steps(task_id)
+
+    async def _get_db_steps(self, task_id: str) -> List[Dict]:
+        db_steps = await LinsightExecuteTaskStepDao.get_by_task_ids([task_id])
+        return db_steps.get(task_id, []) + self._pending_steps.get(task_id, [])
+
     @retry_async(num_retries=DEFAULT_RETRY_ATTEMPTS, delay=DEFAULT_RETRY_DELAY)
     async def get_execution_task(self, task_id: str) -> Optional[LinsightExecuteTask]:
         """
@@ -319,17 +453,14 @@ class LinsightStateMessageManager:
         Returns:
             Execute Task Model orNone
         """
-        task_key = f"{self._keys['execution_tasks']}{task_id}"
-
         try:
-            task_data = await self._redis_client.aget(task_key)
+            task_model = await self._get_task_model(task_id)
+            if task_model is None:
+                return None
 
-            if task_data:
-                return LinsightExecuteTask.model_validate(task_data)
-
-            # Automatically close purchase order afterRedisNo data in, fetching from database
-            task_model = await LinsightExecuteTaskDao.get_by_id(task_id)
-            await self.set_execution_tasks([task_model])
+            steps = await self._get_task_steps(task_id)
+            if steps:
+                task_model.history = (task_model.history or []) + steps
             return task_model
 
         except Exception as e:
@@ -339,40 +470,37 @@ class LinsightStateMessageManager:
     @retry_async(num_retries=DEFAULT_RETRY_ATTEMPTS, delay=DEFAULT_RETRY_DELAY)
     async def add_execution_task_step(self, task_id: str, step: BaseEvent) -> None:
         """
-        Add Execute Task Step
+        Add Execute Task Step, the step is appended to the task step log instead of rewriting the task
 
         Args:
             task_id: TaskID
             step: Execution Steps
         """
-        task_key = f"{self._keys['execution_tasks']}{task_id}"
+        steps_key = self._steps_key(task_id)
+        step_data = step.model_dump()
 
         try:
-            task_data = await self.get_execution_task(task_id)
-
-            if not task_data:
-                raise ValueError(f"Task with ID {task_id} not found in Redis.")
-
-            task_model = LinsightExecuteTask.model_validate(task_data)
-
-            # Initialization History
-            if task_model.history is None:
-                task_model.history = []
-
-            # Adding new Steps
-            task_model.history.append(step.model_dump())
-
-            # Update Redis and database
-            await self._redis_client.aset(
-                task_key,
-                task_model.model_dump(),
-                expiration=self.DEFAULT_EXPIRATION
-            )
-
-            await LinsightExecuteTaskDao.update_by_id(
-                task_id,
-                history=task_model.history
-            )
+            async with self._redis_client.async_pipeline() as pipe:
+                await pipe.rpush(steps_key, pickle.dumps(step_data))
+                await pipe.expire(steps_key, self.DEFAULT_EXPIRATION)
+                await pipe.expire(self._task_key(task_id), self.DEFAULT_EXPIRATION)
+                length, _, _ = await pipe.execute()
+
+            if length == 1:
+                # A new list, restore the earlier steps if the list has expired while the task ran
+                earlier_steps = await self._get_db_steps(task_id)
+                if earlier_steps:
+                    async with self._redis_client.async_pipeline() as pipe:
+                        await pipe.delete(steps_key)
+                        await pipe.rpush(steps_key, *[pickle.dumps(one) for one in earlier_steps + [step_data]])
+                        await pipe.expire(steps_key, self.DEFAULT_EXPIRATION)
+                        await pipe.execute()
+
+            self._pending_steps.setdefault(task_id, []).append(step_data)
+            self._pending_step_num += 1
+            if (self._pending_step_num >= self.STEP_FLUSH_SIZE
+                    or time.monotonic() - self._last_flush_time >= self.STEP_FLUSH_INTERVAL):
+                await self.flush_steps()
 
             self._logger.info(f"Added step to task {task_id}")
 
@@ -380,6 +508,29 @@ class LinsightStateMessageManager:
             self._logger.error(f"Failed to add step to task {task_id}: {e}")
             raise
 
+    async def flush_steps(self) -> None:
+        """
+        Write the buffered steps into the database in one batch
+        """
+        self._last_flush_time = time.monotonic()
+        if not self._pending_step_num:
+            return
+
+        pending_steps, self._pending_steps, self._pending_step_num = self._pending_steps, {}, 0
+        step_models = [
+            LinsightExecuteTaskStep(task_id=task_id, session_version_id=self._session_version_id, step=step)
+            for task_id, steps in pending_steps.items() for step in steps
+        ]
+        try:
+            await LinsightExecuteTaskStepDao.batch_create_steps(step_models)
+        except Exception as e:
+            # Keep the steps buffered, they are written by the next flush
+            for task_id, steps in pending_steps.items():
+                self._pending_steps[task_id] = steps + self._pending_steps.get(task_id, [])
+            self._pending_step_num += len(step_models)
+            self._logger.error(f"Failed to flush {len(step_models)} steps: {e}")
+            raise
+
     async def get_execution_tasks(self):
         """
         Get All Execute Tasks
@@ -388,18 +539,35 @@ class LinsightStateMessageManager:
             Execute Task List
         """
         try:
-            pattern = f"{self._keys['execution_tasks']}*"
-            task_keys = await self._redis_client.akeys(pattern)
-
-            if not task_keys:
-                return []
+            task_ids = await self._redis_client.async_connection.smembers(self._keys['execution_task_ids'])
+            task_ids = [one.decode() if isinstance(one, bytes) else one for one in task_ids]
 
-            tasks_data = await self._redis_client.amget(task_keys)
-            tasks = [LinsightExecuteTask.model_validate(task) for task in tasks_data if task]
+            tasks = []
+            if task_ids:
+                tasks_data = await self._redis_client.amget([self._task_key(one) for one in task_ids])
+                tasks = [LinsightExecuteTask.model_validate(task) for task in tasks_data if task]
 
             if not tasks:
                 tasks = await LinsightExecuteTaskDao.get_by_session_version_id(
                     session_version_id=self._session_version_id)
+                if not tasks:
+                    return []
+
+            # Read all step lists in one round trip
+            async with self._redis_client.async_pipeline(transaction=False) as pipe:
+                for task in tasks:
+                    await pipe.lrange(self._steps_key(task.id), 0, -1)
+                steps_list = await pipe.execute()
+
+            missing_ids = [task.id for task, steps in zip(tasks, steps_list) if not steps]
+            db_steps = await LinsightExecuteTaskStepDao.get_by_task_ids(missing_ids)
+            for task, steps in zip(tasks, steps_list):
+                if steps:
+                    steps = [pickle.loads(one) for one in steps]
+                else:
+                    steps = db_steps.get(task.id, []) + self._pending_steps.get(task.id, [])
+                if steps:
+                    task.history = (task.history or []) + steps
             return tasks
 
         except Exception as e:
@@ -411,12 +579,15 @@ class LinsightStateMessageManager:
         Cleanup Session RelatedRedisDATA
         """
         try:
-            pattern = f"{self._key_prefix}*"
-            keys = await self._redis_client.akeys(pattern)
+            task_ids = await self._redis_client.async_connection.smembers(self._keys['execution_task_ids'])
+            task_ids = [one.decode() if isinstance(one, bytes) else one for one in task_ids]
 
-            if keys:
-                await self._redis_client.adelete(*keys)
-                self._logger.info(f"Cleaned up {len(keys)} keys for session {self._session_version_id}")
+            keys = [self._keys['session_version_info'], self._keys['messages'], self._keys['execution_task_ids']]
+            for task_id in task_ids:
+                keys.extend([self._task_key(task_id), self._steps_key(task_id)])
+
+            deleted = await self._redis_client.async_connection.delete(*keys)
+            self._logger.info(f"Cleaned up {deleted} keys for session {self._session_version_id}")
 
         except Exception as e:
             self._logger.error(f"Failed to cleanup session data: {e}")
@@ -433,15 +604,11 @@ class LinsightStateMessageManager:
             stats = {
                 'session_version_id': self._session_version_id,
                 'message_count': await self._redis_client.allen(self._keys['messages']),
-                'has_session_info': await self._redis_client.exists(self._keys['session_version_info']),
-                'task_count': 0
+                'has_session_info': await self._redis_client.aexists(self._keys['session_version_info']),
+                'task_count': await self._redis_client.async_connection.scard(self._keys['execution_task_ids']),
+                'pending_step_count': self._pending_step_num,
             }
 
-            # Calculate number of tasks
-            pattern = f"{self._keys['execution_tasks']}*"
-            task_keys = await self._redis_client.akeys(pattern)
-            stats['task_count'] = len(task_keys)
-
             return stats
 
         except Exception as e:
@@ -457,11 +624,20 @@ class LinsightStateMessageManager:
         try:
             redis_client = await get_redis_client()
             pattern = f"{cls.KEY_PREFIX}*"
-            keys = await redis_client.async_connection.keys(pattern)
 
-            if keys:
-                await redis_client.async_connection.delete(*keys)
-                logger.info(f"Cleaned up {len(keys)} keys for all sessions")
+            # SCAN in batches, KEYS blocks redis while it walks the whole keyspace
+            deleted = 0
+            batch = []
+            async for key in redis_client.async_connection.scan_iter(match=pattern, count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    deleted += await redis_client.async_connection.delete(*batch)
+                    batch = []
+            if batch:
+                deleted += await redis_client.async_connection.delete(*batch)
+
+            if deleted:
+                logger.info(f"Cleaned up {deleted} keys for all sessions")
         except Exception as e:
             logger.error(f"Failed to cleanup all session data: {e}")
             return
@@ -31,7 +31,7 @@ from bisheng.core.logger import trace_id_var
 from bisheng.core.prompts.manager import get_prompt_manager
 from bisheng.core.storage.minio.minio_manager import get_minio_storage
 from bisheng.database.models.flow import FlowType
-from bisheng.linsight.domain.models.linsight_execute_task import LinsightExecuteTaskDao
+from bisheng.linsight.domain.models.linsight_execute_task import LinsightExecuteTaskDao, LinsightExecuteTaskStepDao
 from bisheng.linsight.domain.models.linsight_session_version import LinsightSessionVersionDao, SessionVersionStatusEnum, \
     LinsightSessionVersion
 from bisheng.linsight.domain.models.linsight_sop import LinsightSOPRecord
@@ -603,6 +603,9 @@ class LinsightWorkbenchImpl:
         if not execute_tasks:
             return []
 
+        # Running tasks keep their steps in the step log until they end
+        execute_tasks = await LinsightExecuteTaskStepDao.merge_history(execute_tasks)
+
         # 1. Get Level 1 Tasks parent_task_id Yes  None Task
         root_tasks = [task for task in execute_tasks if task.parent_task_id is None]
 
@@ -22,7 +22,8 @@ from bisheng.linsight.domain.models.linsight_execute_task import LinsightExecute
 from bisheng.linsight.domain.models.linsight_session_version import LinsightSessionVersionDao, SessionVersionStatusEnum, \
     LinsightSessionVersion
 from bisheng.linsight.domain import utils as linsight_execute_utils
-from bisheng.linsight.domain.services.state_message_manager import LinsightStateMessageManager, MessageData, MessageEventType
+from bisheng.linsight.domain.services.state_message_manager import LinsightStateMessageManager, MessageData, \
+    MessageEventType, SignalType
 from bisheng.llm.domain.services import LLMService
 from bisheng.tool.domain.services.tool import ToolServices
 from bisheng_langchain.linsight.agent import LinsightAgent
@@ -49,13 +50,20 @@ class TaskAlreadyInProgressError(Exception):
 class LinsightWorkflowTask:
     """Workflow Task Executor - Responsible for managing the entire mission lifecycle"""
 
-    USER_TERMINATION_CHECK_INTERVAL = 2
+    # Termination and user input arrive as pub/sub signals, the state is also checked at this interval
+    # in case a signal was published while nobody was subscribed
+    USER_TERMINATION_CHECK_INTERVAL = 30
 
     def __init__(self):
         self._state_manager: Optional[LinsightStateMessageManager] = None
         self._is_terminated = False
+        self._terminated_event = asyncio.Event()
+        self._user_input_events: Dict[str, asyncio.Event] = {}
         self._termination_task: Optional[asyncio.Task] = None
-        self._final_result: Optional[TaskEnd] = None
+        # TaskEnd of every task by task id, first-level tasks run in parallel and end in any order
+        self._task_results: Dict[str, TaskEnd] = {}
+        # first-level task ids in plan order
+        self._plan_task_ids: List[str] = []
         self.file_dir: Optional[str] = None
         self.session_version_id: Optional[str] = None
         self.step_event_extra_files: List[Dict] = []  # File information for storing additional processing of step events
@@ -93,6 +101,10 @@ class LinsightWorkflowTask:
             # Stop Terminating Monitoring
             await self._stop_termination_monitor()
 
+            # Write the steps still buffered in memory
+            if self._state_manager:
+                await self._state_manager.flush_steps()
+
             # Clean File Directory
             if self.file_dir and os.path.exists(self.file_dir):
                 shutil.rmtree(self.file_dir, ignore_errors=True)
@@ -145,6 +157,7 @@ class LinsightWorkflowTask:
 
             # Generate and save tasks
             task_info = await agent.generate_task(session_model.sop)
+            self._plan_task_ids = [one["id"] for one in task_info if not one.get("parent_id")]
             await self._save_task_info(session_model, task_info)
 
             # Do Task
@@ -321,9 +334,8 @@ class LinsightWorkflowTask:
 
         async def termination_monitor():
             """End monitoring task"""
-            while True:
-                await asyncio.sleep(0.5)  # <g id="Bold">Qn,</g>0.5Seconds checked once
-                self._check_termination()
+            await self._terminated_event.wait()
+            self._check_termination()
 
         try:
             # Create two concurrent tasks
@@ -401,9 +413,10 @@ class LinsightWorkflowTask:
             status=ExecuteTaskStatusEnum.IN_PROGRESS
         )
 
-        await self._state_manager.push_message(
-            MessageData(event_type=MessageEventType.TASK_START, data=task_data)
-        )
+        if task_data:
+            await self._state_manager.push_message(
+                MessageData(event_type=MessageEventType.TASK_START, data=task_data)
+            )
 
     async def _handle_task_end(self, agent: LinsightAgent, event: TaskEnd, session_model: LinsightSessionVersion):
         """Handle task end events"""
@@ -416,12 +429,12 @@ class LinsightWorkflowTask:
             task_data=event.data
         )
 
-        await self._state_manager.push_message(
-            MessageData(event_type=MessageEventType.TASK_END, data=task_data)
-        )
+        if task_data:
+            await self._state_manager.push_message(
+                MessageData(event_type=MessageEventType.TASK_END, data=task_data)
+            )
 
-        # Save Final Result
-        self._final_result = event
+        self._task_results[event.task_id] = event
 
     async def _handle_need_user_input(self, agent: LinsightAgent, event: NeedUserInput,
                                       session_model: LinsightSessionVersion):
@@ -498,17 +511,26 @@ class LinsightWorkflowTask:
 
     async def _wait_for_input_completion(self, task_id: str) -> Optional[LinsightExecuteTask]:
         """Wait for user input to complete"""
-        while True:
-            self._check_termination()
+        input_event = self._user_input_events.setdefault(task_id, asyncio.Event())
+        try:
+            while True:
+                # Cleared before reading the state, a signal published after the read wakes the wait below
+                input_event.clear()
+                self._check_termination()
 
-            task_model = await self._state_manager.get_execution_task(task_id)
-            if task_model is None:
-                raise ValueError(f"Task {task_id} Does not exist")
+                task_model = await self._state_manager.get_execution_task(task_id)
+                if task_model is None:
+                    raise ValueError(f"Task {task_id} Does not exist")
 
-            if task_model.status == ExecuteTaskStatusEnum.USER_INPUT_COMPLETED:
-                return task_model
+                if task_model.status == ExecuteTaskStatusEnum.USER_INPUT_COMPLETED:
+                    return task_model
 
-            await asyncio.sleep(1)
+                try:
+                    await asyncio.wait_for(input_event.wait(), timeout=self.USER_TERMINATION_CHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._user_input_events.pop(task_id, None)
 
     # ==================== Terminate Inspection ====================
 
@@ -518,22 +540,63 @@ class LinsightWorkflowTask:
             logger.info("Termination signal detected, ready to terminate agent task")
             raise UserTerminationError("Task terminated by user")
 
+    def _set_terminated(self):
+        """Mark terminated and wake up everything waiting on the task"""
+        self._is_terminated = True
+        self._terminated_event.set()
+        for event in self._user_input_events.values():
+            event.set()
+
+    def _handle_signal(self, signal: Dict) -> None:
+        if signal.get("signal") == SignalType.TERMINATE.value:
+            self._set_terminated()
+        elif signal.get("signal") == SignalType.USER_INPUT.value:
+            event = self._user_input_events.get(signal.get("task_id"))
+            if event:
+                event.set()
+
     async def _start_termination_monitor(self, session_model: LinsightSessionVersion):
         """Start Termination Monitoring"""
 
         async def monitor():
-            while not self._is_terminated:
-                try:
-                    if await self._check_user_termination():
-                        self._is_terminated = True
-                        break
-                    await asyncio.sleep(self.USER_TERMINATION_CHECK_INTERVAL)
-                except Exception as e:
-                    logger.error(f"Terminate Monitoring Exception: {e}")
-                    await asyncio.sleep(self.USER_TERMINATION_CHECK_INTERVAL)
+            pubsub = None
+            try:
+                while not self._is_terminated:
+                    try:
+                        if pubsub is None:
+                            # Subscribe before checking the state so that no signal falls in between
+                            pubsub = await self._state_manager.subscribe_signals()
+                            if await self._check_user_termination():
+                                self._set_terminated()
+                                break
+
+                        signal = await self._state_manager.get_signal(pubsub,
+                                                                      timeout=self.USER_TERMINATION_CHECK_INTERVAL)
+                        if signal:
+                            self._handle_signal(signal)
+                        elif await self._check_user_termination():
+                            self._set_terminated()
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        logger.error(f"Terminate Monitoring Exception: {e}")
+                        if pubsub is not None:
+                            await self._close_pubsub(pubsub)
+                            pubsub = None
+                        await asyncio.sleep(self.USER_TERMINATION_CHECK_INTERVAL)
+            finally:
+                if pubsub is not None:
+                    await self._close_pubsub(pubsub)
 
         self._termination_task = asyncio.create_task(monitor())
 
+    @staticmethod
+    async def _close_pubsub(pubsub):
+        try:
+            await pubsub.aclose()
+        except Exception as e:
+            logger.warning(f"Failed to close signal subscription: {e}")
+
     async def _stop_termination_monitor(self):
         """Stop Terminating Monitoring"""
         if self._termination_task and not self._termination_task.done():
@@ -582,18 +645,25 @@ class LinsightWorkflowTask:
 
     # ==================== Task Completion Processing ====================
 
+    def _get_final_result(self) -> Optional[TaskEnd]:
+        """Result of the last task in the plan, not of the task that ended last"""
+        if not self._plan_task_ids:
+            return None
+        return self._task_results.get(self._plan_task_ids[-1])
+
     async def _handle_task_completion(self, session_model: LinsightSessionVersion):
         """Processing Task Completion"""
-        if not self._final_result:
+        final_result = self._get_final_result()
+        if not final_result:
             logger.error("No final task results found")
             return
 
-        if self._final_result.status == TaskStatus.SUCCESS.value:
-            await self._handle_task_success(session_model)
+        if final_result.status == TaskStatus.SUCCESS.value:
+            await self._handle_task_success(session_model, final_result)
         else:
             await self._handle_task_failure(session_model, "Task execution failed:<g id='1'></g> ")
 
-    async def _handle_task_success(self, session_model: LinsightSessionVersion):
+    async def _handle_task_success(self, session_model: LinsightSessionVersion, final_result: TaskEnd):
         """Processing task successful"""
         try:
             # Read File Directory File Details
@@ -603,7 +673,7 @@ class LinsightWorkflowTask:
             final_result_files = await linsight_execute_utils.get_final_result_file(
                 session_model=session_model,
                 file_details=file_details,
-                answer=self._final_result.answer
+                answer=final_result.answer
             )
             execution_tasks = await self._state_manager.get_execution_tasks()
             all_from_session_files = await linsight_execute_utils.get_all_files_from_session(
@@ -612,7 +682,7 @@ class LinsightWorkflowTask:
             # Update session status
             session_model.status = SessionVersionStatusEnum.COMPLETED
             session_model.output_result = {
-                "answer": self._final_result.answer,
+                "answer": final_result.answer,
                 "final_files": final_result_files,
                 "all_from_session_files": all_from_session_files
             }
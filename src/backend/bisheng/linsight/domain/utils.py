@@ -258,6 +258,50 @@ async def handle_step_event_extra(event: ExecStep, task_exec_obj) -> ExecStep:
     return event
 
 
+async def _terminate_crashed_session_versions(session_versions: List[LinsightSessionVersion]) -> None:
+    """
+    Mark the session versions of a crashed worker node as failed and rollback the invite codes
+    """
+    if not session_versions:
+        return
+
+    session_version_ids = [one.id for one in session_versions]
+    await LinsightSessionVersionDao.batch_update_session_versions_status(
+        session_version_ids=session_version_ids,
+        status=SessionVersionStatusEnum.FAILED,
+        output_result={"error_message": "Worker node crash detected"}
+    )
+
+    # 更新 execution task 状态
+    await LinsightExecuteTaskDao.batch_update_status_by_session_version_id(
+        session_version_ids=session_version_ids,
+        status=ExecuteTaskStatusEnum.FAILED,
+        where=(
+            LinsightExecuteTask.status != ExecuteTaskStatusEnum.SUCCESS,
+            LinsightExecuteTask.status != ExecuteTaskStatusEnum.FAILED
+        )
+    )
+
+    logger.warning(f"Terminated {len(session_version_ids)} incomplete tasks due to worker node crash.")
+
+    system_config = await settings.aget_all_config()
+    # DapatkanLinsight_invitation_code
+    linsight_invitation_code = system_config.get("linsight_invitation_code", False)
+
+    # Rollback invite code
+    if linsight_invitation_code:
+        for user_id in {one.user_id for one in session_versions}:
+            try:
+                await InviteCodeService.revoke_invite_code(user_id=user_id)
+                logger.info(f"User Rolled Back {user_id} Invitation code for")
+            except Exception as e:
+                logger.error(f"Rollback user {user_id} Invitation code failed for: {e}")
+
+    else:
+        logger.warning(
+            "Not enabled in system configuration Linsight Invitation code function, skip rollback operation")
+
+
 # Initiateworkerwhen checking for incomplete tasks and terminating
 async def check_and_terminate_incomplete_tasks(node_id: str) -> None:
     """
@@ -279,14 +323,12 @@ async def check_and_terminate_incomplete_tasks(node_id: str) -> None:
             return
 
         tasks_to_terminate = []
-        user_ids_to_rollback = set()
 
         for session in incomplete_tasks:
             session_id = session.id
 
             # Check task ownership in Redis
-            owner_key = f"linsight:task:owner:{session_id}"
-            owner_node_id = await redis_client.get(owner_key)
+            owner_node_id = await node_manager.get_task_owner(session_id)
 
             should_terminate = False
 
@@ -306,47 +348,25 @@ async def check_and_terminate_incomplete_tasks(node_id: str) -> None:
                     logger.info(f"Task {session_id} is running on active node {owner_node_id}. Skipping.")
 
             if should_terminate:
-                tasks_to_terminate.append(session_id)
-                user_ids_to_rollback.add(session.user_id)
+                tasks_to_terminate.append(session)
 
         # 3. 批量执行终止操作（只针对筛选出的任务）
-        if tasks_to_terminate:
-            await LinsightSessionVersionDao.batch_update_session_versions_status(
-                session_version_ids=tasks_to_terminate,
-                status=SessionVersionStatusEnum.FAILED,
-                output_result={"error_message": "Worker node crash detected"}
-            )
-
-            # 更新 execution task 状态
-            await LinsightExecuteTaskDao.batch_update_status_by_session_version_id(
-                session_version_ids=tasks_to_terminate,
-                status=ExecuteTaskStatusEnum.FAILED,
-                where=(
-                    LinsightExecuteTask.status != ExecuteTaskStatusEnum.SUCCESS,
-                    LinsightExecuteTask.status != ExecuteTaskStatusEnum.FAILED
-                )
-            )
-
-        logger.warning(f"Terminated {len(tasks_to_terminate)} incomplete tasks due to worker node crash.")
-
-        system_config = await settings.aget_all_config()
-        # DapatkanLinsight_invitation_code
-        linsight_invitation_code = system_config.get("linsight_invitation_code", False)
-
-        # Rollback invite code
-        if linsight_invitation_code:
-            for user_id in user_ids_to_rollback:
-                try:
-                    await InviteCodeService.revoke_invite_code(user_id=user_id)
-                    logger.info(f"User Rolled Back {user_id} Invitation code for")
-                except Exception as e:
-                    logger.error(f"Rollback user {user_id} Invitation code failed for: {e}")
-
-        else:
-            logger.warning(
-                "Not enabled in system configuration Linsight Invitation code function, skip rollback operation")
+        await _terminate_crashed_session_versions(tasks_to_terminate)
 
         logger.info("Check and terminate incomplete task action completed")
     except Exception as e:
         logger.error(f"Exception occurred while checking and terminating incomplete tasks: {e}")
         return
+
+
+async def terminate_dead_node_tasks(session_version_ids: List[str]) -> None:
+    """
+    Terminate the running tasks owned by a worker node whose heartbeat has expired
+    """
+    if not session_version_ids:
+        return
+    session_version_ids = set(session_version_ids)
+    incomplete_tasks = await LinsightSessionVersionDao.get_session_versions_by_status(
+        status=SessionVersionStatusEnum.IN_PROGRESS
+    )
+    await _terminate_crashed_session_versions([one for one in incomplete_tasks if one.id in session_version_ids])
@@ -1,7 +1,11 @@
 import argparse
 import asyncio
+import functools
 import logging
+import pickle
 import socket
+import threading
+import time
 import uuid
 
 from multiprocessing import Process, Manager, set_start_method
@@ -20,15 +24,22 @@ logger = logging.getLogger(__name__)
 class NodeManager:
     _instance = None
 
+    NODES_KEY = "linsight:nodes"
+
     def __init__(self, redis_client, node_id):
         # generate unique node ID
         self.node_id = node_id
-        self.redis = redis_client
-        self.heartbeat_key = f"linsight:node:heartbeat:{self.node_id}"
+        self.redis: RedisClient = redis_client
+        self.heartbeat_key = self.get_heartbeat_key(self.node_id)
         # Heartbeat interval (seconds)
         self.interval = 5
         # Redis key expiration time (seconds)
-        self.ttl = 15
+        self.ttl = 30
+        # Check dead nodes every failover_interval seconds
+        self.failover_interval = 30
+        # expired nodes seen by the last failover check, a node is dead when it is seen on two checks
+        self._suspected_nodes = set()
+        self._heartbeat_thread: Optional[threading.Thread] = None
 
     @classmethod
     def get_instance(cls, node_id):
@@ -37,58 +48,144 @@ class NodeManager:
             cls._instance = cls(redis_client, node_id)
         return cls._instance
 
+    @staticmethod
+    def get_heartbeat_key(node_id) -> str:
+        return f"linsight:node:heartbeat:{node_id}"
+
+    @staticmethod
+    def get_node_tasks_key(node_id) -> str:
+        return f"linsight:node:tasks:{node_id}"
+
+    @staticmethod
+    def get_task_owner_key(session_version_id) -> str:
+        return f"linsight:task:owner:{session_version_id}"
+
+    def _refresh_heartbeat(self):
+        """Refresh the heartbeat key, runs in a thread so a blocked event loop does not expire the node"""
+        while True:
+            try:
+                self.redis.set(self.heartbeat_key, "1", expiration=self.ttl)
+            except Exception as e:
+                logger.error(f"Heartbeat failed: {e}")
+            time.sleep(self.interval)
+
     async def start_heartbeat(self):
-        """Start the heartbeat task to indicate node liveness"""
+        """Start the heartbeat thread to indicate node liveness and check dead nodes"""
         logger.info(f"Starting heartbeat for node: {self.node_id}")
+        await self.redis.async_connection.sadd(self.NODES_KEY, self.node_id)
+        if self._heartbeat_thread is None:
+            self._heartbeat_thread = threading.Thread(target=self._refresh_heartbeat, daemon=True,
+                                                      name="linsight-heartbeat")
+            self._heartbeat_thread.start()
         while True:
+            await asyncio.sleep(self.failover_interval)
             try:
-                # set heartbeat key with expiration
-                await self.redis.aset(self.heartbeat_key, "1", expiration=self.ttl)
+                await self.failover_dead_nodes()
             except Exception as e:
-                logger.error(f"Heartbeat failed: {e}")
-            await asyncio.sleep(self.interval)
+                logger.error(f"Failover dead nodes failed: {e}")
 
     async def register_task_ownership(self, session_version_id):
         """Register task ownership to this node"""
-        key = f"linsight:task:owner:{session_version_id}"
         # Set the node ID as the owner of the task with a TTL
-        await self.redis.aset(key, self.node_id, expiration=86400)  # 1 day expiration
+        await self.redis.aset(self.get_task_owner_key(session_version_id), self.node_id,
+                              expiration=86400)  # 1 day expiration
+        await self.redis.async_connection.sadd(self.get_node_tasks_key(self.node_id), session_version_id)
 
     async def release_task_ownership(self, session_version_id):
         """Release task ownership"""
-        key = f"linsight:task:owner:{session_version_id}"
-        await self.redis.delete(key)
+        await self.redis.adelete(self.get_task_owner_key(session_version_id))
+        await self.redis.async_connection.srem(self.get_node_tasks_key(self.node_id), session_version_id)
+
+    async def get_task_owner(self, session_version_id) -> Optional[str]:
+        return await self.redis.aget(self.get_task_owner_key(session_version_id))
 
     async def is_node_alive(self, target_node_id):
         """Check if a target node is alive based on its heartbeat"""
         if not target_node_id:
             return False
-        key = f"linsight:node:heartbeat:{target_node_id}"
-        exists = await self.redis.exists(key)
+        exists = await self.redis.aexists(self.get_heartbeat_key(target_node_id))
         return exists > 0
 
+    async def failover_dead_nodes(self):
+        """Terminate the tasks of registered nodes whose heartbeat has expired"""
+        from bisheng.linsight.domain.utils import terminate_dead_node_tasks
+
+        node_ids = await self.redis.async_connection.smembers(self.NODES_KEY)
+        suspected_nodes = set()
+        for node_id in node_ids:
+            node_id = node_id.decode() if isinstance(node_id, bytes) else node_id
+            if node_id == self.node_id or await self.is_node_alive(node_id):
+                continue
+            suspected_nodes.add(node_id)
+            # The heartbeat must stay expired for a whole failover interval before the node is dead
+            if node_id not in self._suspected_nodes:
+                continue
+
+            # Only one live node handles a dead node
+            lock_key = f"linsight:node:failover:{node_id}"
+            if not await self.redis.async_connection.set(lock_key, self.node_id, nx=True, ex=self.failover_interval):
+                continue
+
+            tasks_key = self.get_node_tasks_key(node_id)
+            session_version_ids = await self.redis.async_connection.smembers(tasks_key)
+            session_version_ids = [one.decode() if isinstance(one, bytes) else one for one in session_version_ids]
+            logger.warning(f"Node {node_id} heartbeat expired, terminate its tasks: {session_version_ids}")
+            await terminate_dead_node_tasks(session_version_ids)
+
+            await self.redis.async_connection.delete(tasks_key)
+            await self.redis.async_connection.srem(self.NODES_KEY, node_id)
+        self._suspected_nodes = suspected_nodes
+
 
 # LinsightQueue queue
 class LinsightQueue(object):
+    """
+    FIFO queue on a sorted set, the score is an increasing sequence number.
+    Consumers block on BZPOPMIN and the position of an item is its ZRANK.
+    """
+
     def __init__(self, name, namespace, redis):
         self.__db: RedisClient = redis
-        self.key = '%s:%s' % (namespace, name)
+        self.key = '%s:%s:zset' % (namespace, name)
+        self.seq_key = '%s:%s:seq' % (namespace, name)
+        # Items of the former list based queue, moved into the sorted set by the consumers
+        self.legacy_key = '%s:%s' % (namespace, name)
+        self._legacy_migrated = False
+
+    @staticmethod
+    def _decode(data):
+        return data.decode() if isinstance(data, bytes) else data
+
+    async def _migrate_legacy(self):
+        if self._legacy_migrated:
+            return
+        self._legacy_migrated = True
+        while True:
+            item = await self.__db.alpop(self.legacy_key)
+            if item is None:
+                break
+            await self.put(pickle.loads(item))
 
     async def qsize(self):
-        return await self.__db.allen(self.key)  # Back to queuelistNumber of inner elements
+        return await self.__db.async_connection.zcard(self.key)  # Number of queued items
 
     async def put(self, data, timeout=None):
-        await self.__db.arpush(self.key, data, expiration=timeout)  # Add a new element to the far right of the queue
+        # Add a new element to the tail of the queue, an item already queued keeps its position
+        seq = await self.__db.async_connection.incr(self.seq_key)
+        await self.__db.async_connection.zadd(self.key, {data: seq}, nx=True)
+        if timeout:
+            await self.__db.aexpire_key(self.key, timeout)
 
     async def get_wait(self, timeout=None):
         # Returns the first element of the queue, if empty, wait until an element is queued (the timeout threshold istimeout, if isNonehas been waiting)
-        item = await self.__db.ablpop(self.key, timeout=timeout)
-        return item
+        await self._migrate_legacy()
+        item = await self.__db.async_connection.bzpopmin(self.key, timeout=timeout or 0)
+        return self._decode(item[1]) if item else None
 
     async def get_nowait(self):
         # Returns the first element of the queue directly, if the queue is emptyNone
-        item = await self.__db.alpop(self.key)
-        return item
+        item = await self.__db.async_connection.zpopmin(self.key)
+        return self._decode(item[0][0]) if item else None
 
     # Get the position of a task's data in the queue
     async def index(self, data):
@@ -97,12 +194,8 @@ class LinsightQueue(object):
         :param data: Task Data
         :return: Position in queue, starting from 1; if not found, return 0
         """
-        items = await self.__db.alrange(self.key)
-        try:
-            index = items.index(data)
-            return index + 1  # Return index from1Getting Started
-        except ValueError:
-            return 0
+        rank = await self.__db.async_connection.zrank(self.key, data)
+        return rank + 1 if rank is not None else 0
 
     # Delete a task data
     async def remove(self, data):
@@ -111,7 +204,7 @@ class LinsightQueue(object):
         :param data: Task Data
         :return:
         """
-        await self.__db.alrem(self.key, data)  # Remove the specified data from the queue
+        await self.__db.async_connection.zrem(self.key, data)  # Remove the specified data from the queue
 
 
 class ScheduleCenterProcess(Process):
@@ -129,7 +222,7 @@ class ScheduleCenterProcess(Process):
         self.max_concurrency: Optional[Union[int, ValueProxy]] = max_concurrency
         self.node_id: Optional[ValueProxy] = node_id
 
-    def handle_task_result(self, task: asyncio.Task):
+    def handle_task_result(self, task: asyncio.Task, session_version_id: str = None):
         try:
             result = task.result()  # If there is an exception, it will be thrown here
         except Exception as e:
@@ -139,6 +232,8 @@ class ScheduleCenterProcess(Process):
             if self.semaphore:
                 logger.info("Releasing semaphore after task completion.")
                 self.semaphore.release()
+            if session_version_id and self.node_manager:
+                asyncio.create_task(self.node_manager.release_task_ownership(session_version_id))
 
     async def async_run(self):
         """
@@ -168,7 +263,9 @@ class ScheduleCenterProcess(Process):
                 task = asyncio.create_task(
                     exec_task.async_run(session_version_id)
                 )
-                task.add_done_callback(self.handle_task_result)  # Add callback to handle task completion
+                # Add callback to handle task completion
+                task.add_done_callback(functools.partial(self.handle_task_result,
+                                                         session_version_id=session_version_id))
 
             except Exception as e:
                 logger.error(f"Error in ScheduleCenterProcess: {e}")
@@ -1,12 +1,15 @@
+import asyncio
+import hmac
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 from loguru import logger
 
 from bisheng.api import router, router_rpc
+from bisheng.api.services.evaluation import resume_evaluation_tasks
 from bisheng.common.errcode import BaseErrorCode
 from bisheng.common.exceptions.auth import AuthJWTException
 from bisheng.common.init_data import init_default_data
@@ -14,7 +17,8 @@ from bisheng.common.services.config_service import settings
 from bisheng.core.context import initialize_app_context, close_app_context
 from bisheng.core.logger import set_logger_config
 from bisheng.services.utils import initialize_services, teardown_services
-from bisheng.utils.http_middleware import CustomMiddleware, WebSocketLoggingMiddleware
+from bisheng.utils.http_metrics import request_metrics
+from bisheng.utils.http_middleware import RequestMiddleware
 from bisheng.utils.threadpool import thread_pool
 
 
@@ -55,7 +59,9 @@ async def lifespan(app: FastAPI):
     initialize_services()
     await init_default_data()
     # LangfuseInstance.update()
+    resume_evaluation = asyncio.create_task(resume_evaluation_tasks())
     yield
+    resume_evaluation.cancel()
     teardown_services()
     thread_pool.tear_down()
     await close_app_context()
@@ -78,6 +84,17 @@ def create_app():
     def get_health():
         return {'status': 'OK'}
 
+    @app.get('/metrics', include_in_schema=False)
+    def get_metrics(request: Request):
+        # Prometheus text format, off unless metrics_conf.enabled
+        metrics_conf = settings.metrics_conf
+        if not metrics_conf.enabled:
+            return PlainTextResponse('Not Found', status_code=status.HTTP_404_NOT_FOUND)
+        if metrics_conf.token and not hmac.compare_digest(request.headers.get('authorization', ''),
+                                                          f'Bearer {metrics_conf.token}'):
+            return PlainTextResponse('Unauthorized', status_code=status.HTTP_401_UNAUTHORIZED)
+        return PlainTextResponse(request_metrics.render(), media_type='text/plain; version=0.0.4')
+
     app.add_middleware(
         CORSMiddleware,
         allow_origins=origins,
@@ -86,8 +103,7 @@ def create_app():
         allow_headers=['*'],
     )
 
-    app.add_middleware(CustomMiddleware)
-    app.add_middleware(WebSocketLoggingMiddleware)
+    app.add_middleware(RequestMiddleware)
 
     @app.exception_handler(AuthJWTException)
     def authjwt_exception_handler(request: Request, exc: AuthJWTException):
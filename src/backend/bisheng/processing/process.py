@@ -179,6 +179,8 @@ async def process_graph_cached(
     # memery input
     if hasattr(built_object, 'memory') and built_object.memory is not None:
         fix_memory_inputs(built_object)
+        # the graph is kept alive between calls, the history is loaded again below
+        built_object.memory.clear()
         with get_sync_db_session() as session:
             history = session.exec(
                 select(ChatMessage).where(
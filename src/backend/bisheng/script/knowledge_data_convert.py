@@ -133,8 +133,10 @@ def convert_one_knowledge_data(knowledge: Knowledge):
             KnowledgeDao.update_one(knowledge)
             # clear old data
             milvus_vector.client.drop_collection(old_collection_name)
+            KnowledgeRag.invalidate_vectorstore(old_collection_name)
             if es_vector.client.indices.exists(index=old_index_name):
                 es_vector.client.indices.delete(index=old_index_name)
+                KnowledgeRag.invalidate_vectorstore(old_index_name)
         else:
             print(f"The knowledge base upon ID:{knowledge.id} Data does not need to be updated.")
     except Exception as e:
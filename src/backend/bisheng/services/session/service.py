@@ -1,33 +1,77 @@
+from loguru import logger
+
 from bisheng.api.utils import build_flow_no_yield
 from bisheng.core.cache.redis_manager import get_redis_client_sync
 from bisheng.services.base import Service
+from bisheng.services.cache.service import InMemoryCache
 from bisheng.services.session.utils import compute_dict_hash, session_id_generator
+from bisheng.utils import generate_uuid
 
-# if TYPE_CHECKING:
-#     from bisheng.services.cache.base import BaseCacheService
+# live graphs kept by one process
+SESSION_CACHE_SIZE = 64
+SESSION_EXPIRATION = 3600
+DESCRIPTOR_PREFIX = 'session_descriptor:'
 
 
 class SessionService(Service):
+    """
+    Two tier session store.
+    Built graphs stay in a per-process LRU keyed by (session id, graph hash), they are never pickled.
+    Redis only keeps a small descriptor of the session: the graph hash and the build arguments,
+    so any process rebuilds the same graph on a local miss.
+    A live graph is used only while the descriptor it was built for is still in redis,
+    clearing a session in one process makes every process rebuild it.
+    """
     name = 'session_service'
 
-    def __init__(self):
+    def __init__(self, max_size: int = SESSION_CACHE_SIZE, expiration: int = SESSION_EXPIRATION):
         self.cache_service = get_redis_client_sync()
+        self.graph_cache = InMemoryCache(max_size=max_size, expiration_time=expiration)
+        self.expiration = expiration
 
-    async def load_session(self, key, data_graph, **kwargs):
-        # Check if the data is cached
-        if key in self.cache_service:
-            return await self.cache_service.aget(key)
+    @staticmethod
+    def _descriptor_key(session_id: str) -> str:
+        return f'{DESCRIPTOR_PREFIX}{session_id}'
 
+    @staticmethod
+    def _build_kwargs(kwargs: dict) -> dict:
+        # only plain values go into the descriptor, a live object can not be stored without pickling it
+        return {k: v for k, v in kwargs.items() if isinstance(v, (str, int, float, bool, dict, list, type(None)))}
+
+    async def load_session(self, key, data_graph, **kwargs):
         if key is None:
             key = self.generate_key(session_id=None, data_graph=data_graph)
+        graph_hash = compute_dict_hash(data_graph)
 
-        # If not cached, build the graph and cache it
-        # graph, artifacts = await build_sorted_vertices(data_graph)
-        # Complete with custom initialization methodsapiAlignment with Chat
-        artifacts = {}
-        graph = await build_flow_no_yield(graph_data=data_graph, **kwargs)
+        descriptor = await self.cache_service.aget(self._descriptor_key(key))
+        if descriptor and descriptor.get('graph_hash') != graph_hash:
+            descriptor = None
+        local = self.graph_cache.get((key, graph_hash))
+        if local and descriptor and local[0] == descriptor['build_id']:
+            await self.cache_service.aexpire_key(self._descriptor_key(key), self.expiration)
+            return local[1], local[2]
+
+        if descriptor:
+            # rebuilt in this process with the arguments of the first build
+            build_kwargs = {**descriptor['build_kwargs'], **{k: v for k, v in kwargs.items()
+                                                              if k not in descriptor['build_kwargs']}}
+            artifacts = descriptor.get('artifacts') or {}
+        else:
+            build_kwargs = kwargs
+            artifacts = {}
+            descriptor = {
+                'session_id': key,
+                'build_id': generate_uuid(),
+                'graph_hash': graph_hash,
+                'build_kwargs': self._build_kwargs(kwargs),
+                'artifacts': artifacts,
+            }
 
-        await self.cache_service.aset(key, (graph, artifacts))
+        # Complete with custom initialization methodsapiAlignment with Chat
+        graph = await build_flow_no_yield(graph_data=data_graph, **build_kwargs)
+        self.graph_cache.set((key, graph_hash), (descriptor['build_id'], graph, artifacts))
+        await self.cache_service.aset(self._descriptor_key(key), descriptor, expiration=self.expiration)
+        logger.debug(f'session graph built session_id={key} graph_hash={graph_hash}')
 
         return graph, artifacts
 
@@ -42,8 +86,17 @@ class SessionService(Service):
             session_id = session_id_generator()
         return self.build_key(session_id, data_graph=data_graph).lower()
 
-    def update_session(self, session_id, value):
-        self.cache_service.set(session_id, value)
+    def update_session(self, session_id, value, data_graph=None):
+        """ replace the live graph of a session, value is (graph, artifacts) """
+        descriptor = self.cache_service.get(self._descriptor_key(session_id))
+        if not descriptor:
+            return
+        if data_graph and compute_dict_hash(data_graph) != descriptor['graph_hash']:
+            return
+        self.graph_cache.set((session_id, descriptor['graph_hash']), (descriptor['build_id'], *value))
 
     def clear_session(self, session_id):
-        self.cache_service.delete(session_id)
+        descriptor = self.cache_service.get(self._descriptor_key(session_id))
+        if descriptor:
+            self.graph_cache.delete((session_id, descriptor.get('graph_hash')))
+        self.cache_service.delete(self._descriptor_key(session_id))
@@ -0,0 +1,135 @@
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from bisheng.core.cache.redis_manager import get_redis_client_sync
+from bisheng.telemetry.domain.mid_table.base import BaseMidTable, BaseRecord
+
+
+class MidTableSyncState(BaseModel):
+    """ progress of one sync, saved after every batch """
+    cursor: Optional[List[Any]] = Field(default=None, description='keyset of the last synced source row')
+    rows: int = 0
+    finished: bool = False
+    update_time: datetime = Field(default_factory=datetime.now)
+
+
+class MidTableSyncResult(BaseModel):
+    name: str
+    rows: int = 0
+    batches: int = 0
+    finished: bool = True
+    seconds: float = 0
+
+
+class MidTableSyncer(ABC):
+    """
+    Incremental sync of one mid table.
+
+    Source rows are read by keyset pagination on a monotonic column (update_time or timestamp) plus the row id,
+    so every run only reads the rows changed after the high-water mark. Each batch is written with one bulk
+    request, records keep a stable es_id so a row synced twice is overwritten instead of duplicated.
+    The cursor is saved in redis after every batch: an interrupted run or backfill continues from the last batch.
+    """
+    name: str = ''
+    state_key_prefix = 'telemetry:mid_sync:'
+    batch_size = 1000
+    # rows changed within this lag are left to the next run, their transactions may not be visible yet
+    safety_lag = timedelta(minutes=5)
+
+    def __init__(self, mid_table: BaseMidTable):
+        self.mid_table = mid_table
+
+    @abstractmethod
+    def fetch(self, cursor: Optional[List[Any]], start_time: Optional[datetime], end_time: Optional[datetime],
+              limit: int) -> List[Any]:
+        """ source rows after cursor in keyset order, within [start_time, end_time) """
+        pass
+
+    @abstractmethod
+    def cursor_of(self, row: Any) -> List[Any]:
+        """ keyset of a source row """
+        pass
+
+    @abstractmethod
+    def to_records(self, rows: List[Any]) -> List[BaseRecord]:
+        """ mid table records of a batch of source rows """
+        pass
+
+    def initial_cursor(self) -> Optional[List[Any]]:
+        """ cursor for the first incremental run, continue from the newest record already in the mid table """
+        return None
+
+    def _state_key(self, job: str) -> str:
+        return f'{self.state_key_prefix}{self.name}:{job}'
+
+    def load_state(self, job: str) -> Optional[MidTableSyncState]:
+        return get_redis_client_sync().get(self._state_key(job))
+
+    def save_state(self, job: str, state: MidTableSyncState):
+        state.update_time = datetime.now()
+        get_redis_client_sync().set(self._state_key(job), state, expiration=None)
+
+    def clear_state(self, job: str):
+        get_redis_client_sync().delete(self._state_key(job))
+
+    def _run(self, job: str, cursor: Optional[List[Any]], start_time: Optional[datetime],
+             end_time: Optional[datetime], max_batches: Optional[int]) -> MidTableSyncResult:
+        start = time.perf_counter()
+        state = self.load_state(job) or MidTableSyncState(cursor=cursor)
+        result = MidTableSyncResult(name=self.name, finished=False)
+        while max_batches is None or result.batches < max_batches:
+            rows = self.fetch(state.cursor, start_time, end_time, self.batch_size)
+            if rows:
+                self.mid_table.insert_records_sync(self.to_records(rows))
+                state.cursor = self.cursor_of(rows[-1])
+                state.rows += len(rows)
+                result.rows += len(rows)
+                result.batches += 1
+            if len(rows) < self.batch_size:
+                result.finished = True
+                state.finished = True
+            self.save_state(job, state)
+            if result.finished:
+                break
+        result.seconds = round(time.perf_counter() - start, 3)
+        logger.info(f'mid table sync {self.name}:{job} rows={result.rows} batches={result.batches} '
+                    f'finished={result.finished} cursor={state.cursor} cost={result.seconds}s')
+        return result
+
+    def sync_increment(self, max_batches: Optional[int] = None) -> MidTableSyncResult:
+        """ sync the rows changed since the last run """
+        job = 'increment'
+        # the saved cursor of the last run is the high-water mark, it is only initialized once
+        cursor = None if self.load_state(job) else self.initial_cursor()
+        return self._run(job, cursor, None, datetime.now() - self.safety_lag, max_batches)
+
+    def backfill(self, start_time: datetime, end_time: datetime,
+                 max_batches: Optional[int] = None) -> MidTableSyncResult:
+        """
+        resync the rows changed within [start_time, end_time).
+        with max_batches the backfill stops after that many batches, call again with the same range to continue.
+        """
+        job = f'backfill:{start_time.isoformat()}:{end_time.isoformat()}'
+        result = self._run(job, None, start_time, end_time, max_batches)
+        if result.finished:
+            self.clear_state(job)
+        return result
+
+
+def sync_mid_tables_parallel(syncers: List[MidTableSyncer], max_workers: int = 4) -> Dict[str, MidTableSyncResult]:
+    """ run the incremental sync of several mid tables at the same time, one table per thread """
+    res = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {one.name: executor.submit(one.sync_increment) for one in syncers}
+        for name, future in futures.items():
+            try:
+                res[name] = future.result()
+            except Exception as e:
+                logger.exception(f'mid table sync {name} failed: {e}')
+    return res
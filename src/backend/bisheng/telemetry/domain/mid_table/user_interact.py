@@ -1,3 +1,5 @@
+from typing import Dict, List, Optional
+
 from bisheng.common.constants.enums.telemetry import BaseTelemetryTypeEnum
 from bisheng.telemetry.domain.mid_table.base import BaseMidTable, BaseRecord
 
@@ -31,3 +33,23 @@ class UserInteract(BaseMidTable):
         }
 
         return self.search_from_base_sync(body={"query": query, "from": (page - 1) * page_size, "size": page_size})
+
+    def get_records_after_sync(self, search_after: Optional[List] = None, start_time: int = None,
+                               end_time: int = None, size: int = 1000) -> List[Dict]:
+        """ page the feedback events ordered by (timestamp, event_id) with search_after """
+        time_range = {}
+        if start_time:
+            time_range["gte"] = start_time * 1000
+        if end_time:
+            time_range["lt"] = end_time * 1000
+        query = {
+            "bool": {
+                "filter": [
+                    {"term": {"event_type": {"value": BaseTelemetryTypeEnum.MESSAGE_FEEDBACK.value}}},
+                ] + ([{"range": {"timestamp": time_range}}] if time_range else [])
+            }
+        }
+        body = {"query": query, "size": size, "sort": [{"timestamp": "asc"}, {"event_id": "asc"}]}
+        if search_after:
+            body["search_after"] = search_after
+        return self.search_from_base_sync(body=body)
@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import BigInteger, Column, DateTime, Index, UniqueConstraint
+from sqlalchemy.dialects.mysql import insert
+from sqlmodel import Field, col, func, select, text
+
+from bisheng.common.models.base import SQLModelSerializable
+from bisheng.core.database import get_async_db_session, get_sync_db_session
+
+
+class TokenUsageGranularity(str, Enum):
+    HOUR = 'hour'
+    DAY = 'day'
+
+
+class TokenUsageRollupBase(SQLModelSerializable):
+    """ token usage of model_invoke events, summed per time bucket, user, app and model """
+    granularity: str = Field(max_length=8, description='hour or day')
+    bucket_time: datetime = Field(sa_column=Column(DateTime, nullable=False), description='bucket start, UTC')
+    user_id: int = Field(default=0, description='User ID')
+    user_name: str = Field(default='', max_length=255, description='Username')
+    app_id: str = Field(default='', max_length=64, description='App ID')
+    app_name: str = Field(default='', max_length=255, description='App name')
+    app_type: str = Field(default='', max_length=32, description='App type')
+    model_id: int = Field(default=0, description='Model ID')
+    model_name: str = Field(default='', max_length=255, description='Model name')
+    input_tokens: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default=text('0')))
+    output_tokens: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default=text('0')))
+    cache_tokens: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default=text('0')))
+    total_tokens: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default=text('0')))
+    invoke_count: int = Field(default=0, description='Number of model invocations')
+    create_time: Optional[datetime] = Field(default=None, sa_column=Column(
+        DateTime, nullable=False, server_default=text('CURRENT_TIMESTAMP')))
+    update_time: Optional[datetime] = Field(default=None, sa_column=Column(
+        DateTime, nullable=False, server_default=text('CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP')))
+
+
+class TokenUsageRollup(TokenUsageRollupBase, table=True):
+    __table_args__ = (
+        UniqueConstraint('granularity', 'bucket_time', 'user_id', 'app_id', 'model_id', name='token_usage_bucket_uniq'),
+        Index('token_usage_app_idx', 'granularity', 'app_name', 'bucket_time'),
+        Index('token_usage_user_idx', 'granularity', 'user_name', 'bucket_time'),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+
+class TokenUsageRollupDao(TokenUsageRollup):
+    sum_columns = ['input_tokens', 'output_tokens', 'cache_tokens', 'total_tokens', 'invoke_count']
+    name_columns = ['user_name', 'app_name', 'app_type', 'model_name']
+
+    @classmethod
+    def upsert_rows(cls, rows: List[Dict], batch_size: int = 500):
+        """ insert rollup rows, replace the sums of existing buckets """
+        if not rows:
+            return
+        with get_sync_db_session() as session:
+            for i in range(0, len(rows), batch_size):
+                statement = insert(TokenUsageRollup).values(rows[i:i + batch_size])
+                statement = statement.on_duplicate_key_update(
+                    **{one: statement.inserted[one] for one in cls.sum_columns + cls.name_columns})
+                session.exec(statement)
+            session.commit()
+
+    @classmethod
+    def sum_hours_of_day(cls, day: datetime) -> List[Dict]:
+        """ sum the hourly buckets of one UTC day into daily rows """
+        statement = select(TokenUsageRollup.user_id, TokenUsageRollup.app_id, TokenUsageRollup.model_id,
+                           func.max(TokenUsageRollup.user_name), func.max(TokenUsageRollup.app_name),
+                           func.max(TokenUsageRollup.app_type), func.max(TokenUsageRollup.model_name),
+                           *[func.sum(getattr(TokenUsageRollup, one)) for one in cls.sum_columns]).where(
+            TokenUsageRollup.granularity == TokenUsageGranularity.HOUR.value,
+            TokenUsageRollup.bucket_time >= day,
+            TokenUsageRollup.bucket_time < day + timedelta(days=1),
+        ).group_by(TokenUsageRollup.user_id, TokenUsageRollup.app_id, TokenUsageRollup.model_id)
+        with get_sync_db_session() as session:
+            result = session.exec(statement).all()
+        keys = ['user_id', 'app_id', 'model_id'] + cls.name_columns + cls.sum_columns
+        return [dict(zip(keys, one), granularity=TokenUsageGranularity.DAY.value, bucket_time=day)
+                for one in result]
+
+    @classmethod
+    def _day_filters(cls, statement, start_date: Optional[datetime], end_date: Optional[datetime]):
+        statement = statement.where(TokenUsageRollup.granularity == TokenUsageGranularity.DAY.value)
+        if start_date:
+            statement = statement.where(TokenUsageRollup.bucket_time >= start_date)
+        if end_date:
+            statement = statement.where(TokenUsageRollup.bucket_time <= end_date)
+        return statement
+
+    @classmethod
+    def _sum_select(cls, *columns):
+        return select(*columns,
+                      func.sum(TokenUsageRollup.total_tokens).label('total_tokens'),
+                      func.sum(TokenUsageRollup.input_tokens).label('input_tokens'),
+                      func.sum(TokenUsageRollup.output_tokens).label('output_tokens'),
+                      func.sum(TokenUsageRollup.invoke_count).label('invoke_count'))
+
+    @classmethod
+    async def _aexec_page(cls, statement, count_column, page: int, page_size: int) -> Tuple[List, int]:
+        count_statement = statement.with_only_columns(func.count(func.distinct(count_column))) \
+            .group_by(None).order_by(None)
+        statement = statement.order_by(text('total_tokens desc')).offset((page - 1) * page_size).limit(page_size)
+        async with get_async_db_session() as session:
+            result = (await session.exec(statement)).all()
+            total = (await session.exec(count_statement)).first()
+        return [one._asdict() for one in result], total or 0
+
+    @classmethod
+    async def aget_stats_by_user(cls, start_date: Optional[datetime], end_date: Optional[datetime],
+                                 user_name: Optional[str], page: int, page_size: int) -> Tuple[List[Dict], int]:
+        statement = cls._sum_select(TokenUsageRollup.user_id,
+                                    func.max(TokenUsageRollup.user_name).label('user_name'))
+        statement = cls._day_filters(statement, start_date, end_date)
+        if user_name:
+            statement = statement.where(col(TokenUsageRollup.user_name).like(f'%{user_name}%'))
+        statement = statement.group_by(TokenUsageRollup.user_id)
+        return await cls._aexec_page(statement, TokenUsageRollup.user_id, page, page_size)
+
+    @classmethod
+    async def aget_stats_by_app(cls, start_date: Optional[datetime], end_date: Optional[datetime],
+                                app_name: Optional[str], user_name: Optional[str], page: int,
+                                page_size: int) -> Tuple[List[Dict], int]:
+        """ app_name is a fuzzy filter, user_name is an exact filter """
+        statement = cls._sum_select(TokenUsageRollup.app_id,
+                                    func.max(TokenUsageRollup.app_name).label('app_name'),
+                                    func.max(TokenUsageRollup.app_type).label('app_type'))
+        statement = cls._day_filters(statement, start_date, end_date)
+        if app_name:
+            statement = statement.where(col(TokenUsageRollup.app_name).like(f'%{app_name}%'))
+        if user_name:
+            statement = statement.where(TokenUsageRollup.user_name == user_name)
+        statement = statement.group_by(TokenUsageRollup.app_id)
+        return await cls._aexec_page(statement, TokenUsageRollup.app_id, page, page_size)
+
+    @classmethod
+    async def aget_app_daily(cls, app_name: str, start_date: Optional[datetime],
+                             end_date: Optional[datetime]) -> List[Dict]:
+        statement = cls._sum_select(TokenUsageRollup.bucket_time)
+        statement = cls._day_filters(statement, start_date, end_date)
+        statement = statement.where(TokenUsageRollup.app_name == app_name) \
+            .group_by(TokenUsageRollup.bucket_time).order_by(TokenUsageRollup.bucket_time)
+        async with get_async_db_session() as session:
+            return [one._asdict() for one in (await session.exec(statement)).all()]
+
+    @classmethod
+    async def aget_app_top_users(cls, app_name: str, start_date: Optional[datetime], end_date: Optional[datetime],
+                                 limit: int = 100) -> List[Dict]:
+        statement = cls._sum_select(TokenUsageRollup.user_id,
+                                    func.max(TokenUsageRollup.user_name).label('user_name'))
+        statement = cls._day_filters(statement, start_date, end_date)
+        statement = statement.where(TokenUsageRollup.app_name == app_name) \
+            .group_by(TokenUsageRollup.user_id).order_by(text('total_tokens desc')).limit(limit)
+        async with get_async_db_session() as session:
+            return [one._asdict() for one in (await session.exec(statement)).all()]
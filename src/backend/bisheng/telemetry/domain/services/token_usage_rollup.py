@@ -0,0 +1,167 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Set
+
+from loguru import logger
+
+from bisheng.common.constants.enums.telemetry import BaseTelemetryTypeEnum
+from bisheng.common.services import telemetry_service
+from bisheng.core.cache.redis_manager import get_redis_client_sync
+from bisheng.core.search.elasticsearch.manager import get_statistics_es_connection_sync
+from bisheng.telemetry.domain.models.token_usage import TokenUsageGranularity, TokenUsageRollupDao
+
+
+def _floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _floor_day(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def utc_now() -> datetime:
+    return datetime.now(tz=timezone.utc).replace(tzinfo=None)
+
+
+class TokenUsageRollupService:
+    """
+    Incrementally roll up the model_invoke telemetry events into hourly and daily token usage buckets.
+
+    Hourly buckets are computed from the raw events with an ES composite aggregation, paged by after_key,
+    and upserted into the rollup table. The daily buckets of the touched days are then summed from the hourly
+    buckets. The end of the last rolled up hour is kept as the high-water mark; every run starts `lookback`
+    before it so late events are picked up. All times are UTC, bucket rows are recomputed, never incremented,
+    so running a range twice is safe.
+    """
+    hwm_key = 'telemetry:token_usage_rollup:hwm'
+    lookback = timedelta(hours=2)
+    # range of events aggregated by one round, the high-water mark is saved after each round
+    chunk = timedelta(days=1)
+    composite_size = 1000
+    # first run without a high-water mark starts this many days ago
+    initial_days = 90
+
+    @classmethod
+    def get_high_water_mark(cls) -> Optional[datetime]:
+        value = get_redis_client_sync().get(cls.hwm_key)
+        return datetime.fromisoformat(value) if value else None
+
+    @classmethod
+    def set_high_water_mark(cls, value: datetime):
+        get_redis_client_sync().set(cls.hwm_key, value.isoformat(), expiration=None)
+
+    @classmethod
+    def _composite_query(cls, start: datetime, end: datetime, after_key: Optional[Dict]) -> Dict:
+        prefix = f'event_data.{BaseTelemetryTypeEnum.MODEL_INVOKE.value}'
+        composite = {
+            'size': cls.composite_size,
+            'sources': [
+                {'hour': {'date_histogram': {'field': 'timestamp', 'fixed_interval': '1h'}}},
+                {'user_id': {'terms': {'field': 'user_context.user_id'}}},
+                {'app_id': {'terms': {'field': f'{prefix}_app_id', 'missing_bucket': True}}},
+                {'model_id': {'terms': {'field': f'{prefix}_model_id', 'missing_bucket': True}}},
+            ],
+        }
+        if after_key:
+            composite['after'] = after_key
+        return {
+            'size': 0,
+            'query': {'bool': {'filter': [
+                {'term': {'event_type': BaseTelemetryTypeEnum.MODEL_INVOKE.value}},
+                {'range': {'timestamp': {'gte': start.strftime('%Y-%m-%dT%H:%M:%S'),
+                                         'lt': end.strftime('%Y-%m-%dT%H:%M:%S'),
+                                         'format': 'strict_date_optional_time'}}},
+            ]}},
+            'aggs': {'rollup': {
+                'composite': composite,
+                'aggs': {
+                    'total_tokens': {'sum': {'field': f'{prefix}_total_token'}},
+                    'input_tokens': {'sum': {'field': f'{prefix}_input_token'}},
+                    'output_tokens': {'sum': {'field': f'{prefix}_output_token'}},
+                    'cache_tokens': {'sum': {'field': f'{prefix}_cache_token'}},
+                    'user_name': {'terms': {'field': 'user_context.user_name', 'size': 1}},
+                    'app_name': {'terms': {'field': f'{prefix}_app_name', 'size': 1}},
+                    'app_type': {'terms': {'field': f'{prefix}_app_type', 'size': 1}},
+                    'model_name': {'terms': {'field': f'{prefix}_model_name', 'size': 1}},
+                }
+            }}
+        }
+
+    @staticmethod
+    def _first_key(bucket: Dict, name: str, default=''):
+        buckets = bucket.get(name, {}).get('buckets', [])
+        return buckets[0]['key'] if buckets else default
+
+    @classmethod
+    def iter_hour_rows(cls, start: datetime, end: datetime) -> Iterator[List[Dict]]:
+        """ hourly rows of [start, end), one list per composite page """
+        es = get_statistics_es_connection_sync()
+        after_key = None
+        while True:
+            result = es.search(index=telemetry_service.index_name, body=cls._composite_query(start, end, after_key))
+            rollup = result.get('aggregations', {}).get('rollup', {})
+            buckets = rollup.get('buckets', [])
+            if not buckets:
+                break
+            rows = []
+            for b in buckets:
+                key = b['key']
+                rows.append({
+                    'granularity': TokenUsageGranularity.HOUR.value,
+                    'bucket_time': datetime.fromtimestamp(key['hour'] / 1000, tz=timezone.utc).replace(tzinfo=None),
+                    'user_id': key['user_id'] or 0,
+                    'user_name': str(cls._first_key(b, 'user_name')),
+                    'app_id': str(key['app_id'] or ''),
+                    'app_name': str(cls._first_key(b, 'app_name')),
+                    'app_type': str(cls._first_key(b, 'app_type')),
+                    'model_id': int(key['model_id'] or 0),
+                    'model_name': str(cls._first_key(b, 'model_name')),
+                    'input_tokens': int(b['input_tokens']['value']),
+                    'output_tokens': int(b['output_tokens']['value']),
+                    'cache_tokens': int(b['cache_tokens']['value']),
+                    'total_tokens': int(b['total_tokens']['value']),
+                    'invoke_count': b['doc_count'],
+                })
+            yield rows
+            after_key = rollup.get('after_key')
+            if not after_key:
+                break
+
+    @classmethod
+    def rollup_days(cls, days: Set[datetime]):
+        for day in sorted(days):
+            TokenUsageRollupDao.upsert_rows(TokenUsageRollupDao.sum_hours_of_day(day))
+
+    @classmethod
+    def rollup(cls, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Optional[datetime]:
+        """
+        roll up the events of [start, end) in chunks, the high-water mark moves after each chunk
+        so a failed or interrupted run resumes from the last finished chunk.
+        :param start: default is the high-water mark minus lookback
+        :param end: default is the start of the current hour
+        :return: the new high-water mark
+        """
+        end = _floor_hour(end or utc_now())
+        if start is None:
+            hwm = cls.get_high_water_mark()
+            start = hwm - cls.lookback if hwm else _floor_day(end - timedelta(days=cls.initial_days))
+        start = _floor_hour(start)
+        if start >= end:
+            return cls.get_high_water_mark()
+
+        logger.info(f'token usage rollup from {start} to {end}')
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + cls.chunk, end)
+            days, rows_count = set(), 0
+            for rows in cls.iter_hour_rows(chunk_start, chunk_end):
+                TokenUsageRollupDao.upsert_rows(rows)
+                days.update(_floor_day(one['bucket_time']) for one in rows)
+                rows_count += len(rows)
+            cls.rollup_days(days)
+            hwm = cls.get_high_water_mark()
+            if not hwm or chunk_end > hwm:
+                cls.set_high_water_mark(chunk_end)
+            logger.info(f'token usage rollup chunk {chunk_start} - {chunk_end} hour_rows={rows_count} '
+                        f'days={len(days)}')
+            chunk_start = chunk_end
+        return cls.get_high_water_mark()
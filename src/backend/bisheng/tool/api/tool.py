@@ -12,6 +12,7 @@ from bisheng.tool.domain.schemas import TestToolReq
 from bisheng.tool.domain.services.openapi import OpenApiSchema
 from bisheng.tool.domain.services.tool import ToolServices
 from bisheng_langchain.gpts.tools.api_tools.openapi import OpenApiTools
+from bisheng_langchain.gpts.tools.code_interpreter.worker_pool import get_interpreter_pool_metrics
 
 router = APIRouter(prefix='/tool', tags=['Tool'])
 
@@ -129,3 +130,10 @@ async def get_linsight_tools():
     """
     tools = await ToolServices.get_linsight_tools()
     return resp_200(data=tools)
+
+
+@router.get('/code-interpreter/metrics', summary='Get local code interpreter pool metrics',
+            response_model=UnifiedResponseModel)
+async def get_code_interpreter_metrics(login_user: UserPayload = Depends(UserPayload.get_login_user)):
+    """ Warm interpreter pool metrics of this process """
+    return resp_200(data=get_interpreter_pool_metrics())
@@ -1,8 +1,8 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from pydantic import field_validator
-from sqlalchemy import Column, DateTime, func, text
+from sqlalchemy import Column, DateTime, func, text, and_, or_
 from sqlalchemy.orm import selectinload
 from sqlmodel import Field, select, Relationship, col
 
@@ -273,6 +273,26 @@ class UserDao(UserBase):
         with get_sync_db_session() as session:
             return session.exec(statement).all()
 
+    @classmethod
+    def get_user_with_group_role_by_cursor(cls, cursor: Optional[Tuple[datetime, int]], start_time: datetime = None,
+                                           end_time: datetime = None, limit: int = 1000) -> List[User]:
+        """ keyset pagination ordered by (update_time, user_id), cursor is the last row of the previous page """
+        statement = select(User)
+        if cursor:
+            statement = statement.where(or_(User.update_time > cursor[0],
+                                            and_(User.update_time == cursor[0], User.user_id > cursor[1])))
+        if start_time:
+            statement = statement.where(User.update_time >= start_time)
+        if end_time:
+            statement = statement.where(User.update_time < end_time)
+        statement = statement.order_by(User.update_time, User.user_id).limit(limit)
+        statement = statement.options(
+            selectinload(User.groups),  # type: ignore
+            selectinload(User.roles)  # type: ignore
+        )
+        with get_sync_db_session() as session:
+            return session.exec(statement).all()
+
     @classmethod
     def get_first_user(cls) -> User | None:
         statement = select(User).order_by(col(User.user_id).asc()).limit(1)
@@ -6,6 +6,7 @@ from sqlalchemy import Column, DateTime, text, delete, INT
 from sqlmodel import Field, select
 
 from bisheng.common.models.base import SQLModelSerializable
+from bisheng.core.cache.permission_version import PermissionVersion
 from bisheng.core.database import get_sync_db_session, get_async_db_session
 from bisheng.database.constants import AdminRole
 
@@ -85,7 +86,8 @@ class UserRoleDao(UserRoleBase):
             session.add(user_role)
             await session.commit()
             await session.refresh(user_role)
-            return user_role
+        await PermissionVersion.abump_users([user_id])
+        return user_role
 
     @classmethod
     def add_user_roles(cls, user_id: int, role_ids: List[int]) -> List[UserRole]:
@@ -96,7 +98,8 @@ class UserRoleDao(UserRoleBase):
             user_roles = [UserRole(user_id=user_id, role_id=role_id) for role_id in role_ids]
             session.add_all(user_roles)
             session.commit()
-            return user_roles
+        PermissionVersion.bump_users([user_id])
+        return user_roles
 
     @classmethod
     def delete_user_roles(cls, user_id: int, role_ids: List[int]) -> None:
@@ -107,3 +110,4 @@ class UserRoleDao(UserRoleBase):
             statement = delete(UserRole).where(UserRole.user_id == user_id).where(UserRole.role_id.in_(role_ids))
             session.exec(statement)
             session.commit()
+        PermissionVersion.bump_users([user_id])
@@ -15,10 +15,10 @@ from bisheng.common.exceptions.auth import JWTDecodeError
 from bisheng.common.services.config_service import settings
 from bisheng.database.constants import AdminRole
 from bisheng.database.models.group import GroupDao
-from bisheng.database.models.role_access import AccessType, RoleAccessDao, WebMenuResource
+from bisheng.database.models.role_access import AccessType, WebMenuResource
 from bisheng.database.models.user_group import UserGroupDao
 from ..models.user import User
-from ..models.user_role import UserRoleDao
+from .permission_snapshot import PermissionSnapshotService
 
 
 class AuthJwt:
@@ -106,9 +106,7 @@ class LoginUser(BaseModel):
         self.group_cache = kwargs.get('group_cache', {})
 
         if not self.user_role:
-            self.user_role = []
-            user_role = UserRoleDao.get_user_roles(self.user_id)
-            self.user_role = [user_role.role_id for user_role in user_role]
+            self.user_role = PermissionSnapshotService.get_snapshot(self.user_id).role_ids
 
     @cached_property
     def _check_admin(self):
@@ -160,16 +158,14 @@ class LoginUser(BaseModel):
         if self.user_id == owner_user_id:
             return True
         # Judgment Authorization
-        if RoleAccessDao.judge_role_access(self.user_role, target_id, access_type):
-            return True
-        return False
+        return PermissionSnapshotService.get_snapshot(self.user_id).has_access(target_id, access_type)
 
     @async_wrapper_access_check
     async def async_access_check(self, owner_user_id: int, target_id: str, access_type: AccessType) -> bool:
         if self.user_id == owner_user_id:
             return True
-        flag = await RoleAccessDao.ajudge_role_access(self.user_role, target_id, access_type)
-        return True if flag else False
+        snapshot = await PermissionSnapshotService.aget_snapshot(self.user_id)
+        return snapshot.has_access(target_id, access_type)
 
     @wrapper_access_check
     def copiable_check(self, owner_user_id: int) -> bool:
@@ -187,13 +183,7 @@ class LoginUser(BaseModel):
             Check if the user is an administrator of a group
         """
         # Determine if you are an administrator of a user group
-        user_group = UserGroupDao.get_user_admin_group(self.user_id)
-        if not user_group:
-            return False
-        for one in user_group:
-            if one.group_id == group_id:
-                return True
-        return False
+        return group_id in PermissionSnapshotService.get_snapshot(self.user_id).admin_group_ids
 
     @async_wrapper_access_check
     async def async_check_group_admin(self, group_id: int) -> bool:
@@ -201,22 +191,17 @@ class LoginUser(BaseModel):
             Asynchronously check if the user is an administrator of a group
         """
         # Determine if you are an administrator of a user group
-        user_group = await UserGroupDao.aget_user_admin_group(self.user_id, group_id)
-        if not user_group:
-            return False
-        for one in user_group:
-            if one.group_id == group_id:
-                return True
-        return False
+        snapshot = await PermissionSnapshotService.aget_snapshot(self.user_id)
+        return group_id in snapshot.admin_group_ids
 
     @wrapper_access_check
     def check_groups_admin(self, group_ids: List[int]) -> bool:
         """
         Check if the user is an administrator in the user group list, one of which istrue
         """
-        user_groups = UserGroupDao.get_user_admin_group(self.user_id)
-        for one in user_groups:
-            if one.is_group_admin and one.group_id in group_ids:
+        admin_group_ids = PermissionSnapshotService.get_snapshot(self.user_id).admin_group_ids
+        for one in admin_group_ids:
+            if one in group_ids:
                 return True
         return False
 
@@ -240,18 +225,17 @@ class LoginUser(BaseModel):
     async def get_user_group_ids(self, user_id: int = None):
         if user_id is None:
             user_id = self.user_id
-        user_groups = await UserGroupDao.aget_user_group(user_id)
-        return [one_group.group_id for one_group in user_groups]
+        snapshot = await PermissionSnapshotService.aget_snapshot(user_id)
+        return list(snapshot.group_ids)
 
     def get_user_access_resource_ids(self, access_types: List[AccessType]) -> List[str]:
         """ Query resources for which the user has the corresponding permissionsIDVertical """
-        role_access = RoleAccessDao.get_role_access_batch(self.user_role, access_types)
-        return list(set([one.third_id for one in role_access]))
+        return PermissionSnapshotService.get_snapshot(self.user_id).get_access_ids(access_types)
 
     async def aget_user_access_resource_ids(self, access_types: List[AccessType]) -> List[str]:
         """ Resources with corresponding permissions for asynchronous query usersIDVertical """
-        role_access = await RoleAccessDao.aget_role_access_batch(self.user_role, access_types)
-        return list(set([one.third_id for one in role_access]))
+        snapshot = await PermissionSnapshotService.aget_snapshot(self.user_id)
+        return snapshot.get_access_ids(access_types)
 
     # some methods related to AuthJwt
     @classmethod
@@ -275,15 +259,15 @@ class LoginUser(BaseModel):
 
     @classmethod
     async def init_login_user(cls, user_id: int, user_name: str) -> Self:
-        user_roles = await UserRoleDao.aget_user_roles(user_id)
-        role_ids = [user_role.role_id for user_role in user_roles]
+        snapshot = await PermissionSnapshotService.aget_snapshot(user_id)
+        role_ids = list(snapshot.role_ids)
         login_user = cls(user_id=user_id, user_name=user_name, user_role=role_ids)
         return login_user
 
     @classmethod
     def init_login_user_sync(cls, user_id: int, user_name: str) -> Self:
-        user_roles = UserRoleDao.get_user_roles(user_id)
-        role_ids = [user_role.role_id for user_role in user_roles]
+        snapshot = PermissionSnapshotService.get_snapshot(user_id)
+        role_ids = list(snapshot.role_ids)
         login_user = cls(user_id=user_id, user_name=user_name, user_role=role_ids)
         return login_user
 
@@ -314,24 +298,22 @@ class LoginUser(BaseModel):
     @classmethod
     async def get_roles_web_menu(cls, user: User) -> (List[int] | str, List[str]):
         """ get user roles and web menu """
-        db_user_role = await UserRoleDao.aget_user_roles(user.user_id)
+        snapshot = await PermissionSnapshotService.aget_snapshot(user.user_id)
         role = ''
         role_ids = []
-        for user_role in db_user_role:
-            if user_role.role_id == AdminRole:
+        for role_id in snapshot.role_ids:
+            if role_id == AdminRole:
                 role = 'admin'
             else:
-                role_ids.append(user_role.role_id)
+                role_ids.append(role_id)
         if role != 'admin':
             # is user group admin ?
-            db_user_groups = await UserGroupDao.aget_user_admin_group(user.user_id)
-            if len(db_user_groups) > 0:
+            if snapshot.is_group_admin():
                 role = 'group_admin'
             else:
                 role = role_ids
             # Get a list of a user's menu bar permissions
-            web_menu = await RoleAccessDao.aget_role_access(role_ids, AccessType.WEB_MENU)
-            web_menu = list(set([one.third_id for one in web_menu]))
+            web_menu = snapshot.get_access_ids([AccessType.WEB_MENU])
         else:
             web_menu = [one.value for one in WebMenuResource]
         return role, web_menu
@@ -0,0 +1,165 @@
+from typing import Dict, List, Optional, Set, Tuple, Iterable
+
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from bisheng.core.cache.flow import InMemoryCache
+from bisheng.core.cache.permission_version import PermissionVersion
+from bisheng.core.cache.redis_manager import get_redis_client, get_redis_client_sync
+from bisheng.database.constants import AdminRole
+from bisheng.database.models.role_access import AccessType, RoleAccessDao, RoleAccess
+from bisheng.database.models.user_group import UserGroupDao, UserGroup
+from bisheng.user.domain.models.user import UserDao
+from bisheng.user.domain.models.user_role import UserRoleDao
+
+
+class PermissionSnapshot(BaseModel):
+    """ roles, groups and resource grants of one user at a permission version """
+    user_id: int
+    role_ids: List[int] = Field(default_factory=list)
+    group_ids: List[int] = Field(default_factory=list)
+    admin_group_ids: List[int] = Field(default_factory=list)
+    access: Dict[int, Set[str]] = Field(default_factory=dict, description='access type value -> resource ids')
+    version: Tuple[int, int] = Field(default=(0, 0), description='(global_version, user_version)')
+
+    def is_admin(self) -> bool:
+        return AdminRole in self.role_ids
+
+    def is_group_admin(self) -> bool:
+        return len(self.admin_group_ids) > 0
+
+    def has_access(self, third_id: str | int, access_type: AccessType) -> bool:
+        if self.is_admin():
+            return True
+        return str(third_id) in self.access.get(access_type.value, set())
+
+    def filter_access(self, third_ids: Iterable[str | int], access_type: AccessType) -> List[str | int]:
+        """ bulk check, return the ids the user has been granted, keep the input order """
+        if self.is_admin():
+            return list(third_ids)
+        granted = self.access.get(access_type.value, set())
+        return [one for one in third_ids if str(one) in granted]
+
+    def get_access_ids(self, access_types: List[AccessType]) -> List[str]:
+        res = set()
+        for one in access_types:
+            res.update(self.access.get(one.value, set()))
+        return list(res)
+
+
+class PermissionSnapshotService:
+    """
+    Compute permission snapshots once and cache them in redis and in process memory.
+    A cached snapshot is valid as long as its version equals the current PermissionVersion.
+    """
+    snapshot_key_prefix = 'permission:snapshot:'
+    user_name_key_prefix = 'permission:user_name:'
+    snapshot_expire = 86400
+    user_name_expire = 3600
+
+    _local_cache = InMemoryCache(max_size=4096, expiration_time=300)
+
+    @classmethod
+    def _snapshot_key(cls, user_id: int) -> str:
+        return f'{cls.snapshot_key_prefix}{user_id}'
+
+    @classmethod
+    def _build_snapshot(cls, user_id: int, version: Tuple[int, int], user_roles: list, user_groups: List[UserGroup],
+                        admin_groups: List[UserGroup], role_access: List[RoleAccess]) -> PermissionSnapshot:
+        access: Dict[int, Set[str]] = {}
+        for one in role_access:
+            access.setdefault(one.type, set()).add(one.third_id)
+        return PermissionSnapshot(
+            user_id=user_id,
+            role_ids=[one.role_id for one in user_roles],
+            group_ids=[one.group_id for one in user_groups],
+            admin_group_ids=[one.group_id for one in admin_groups],
+            access=access,
+            version=version,
+        )
+
+    @classmethod
+    def get_snapshot(cls, user_id: int) -> PermissionSnapshot:
+        version = PermissionVersion.get(user_id)
+        local_key = (user_id, version)
+        if snapshot := cls._local_cache.get(local_key):
+            return snapshot
+
+        redis_client = get_redis_client_sync()
+        snapshot: Optional[PermissionSnapshot] = None
+        try:
+            snapshot = redis_client.get(cls._snapshot_key(user_id))
+        except Exception as e:
+            logger.warning(f'get permission snapshot from redis error: {e}')
+        if not snapshot or tuple(snapshot.version) != version:
+            user_roles = UserRoleDao.get_user_roles(user_id)
+            user_groups = UserGroupDao.get_user_group(user_id)
+            admin_groups = UserGroupDao.get_user_admin_group(user_id)
+            role_ids = [one.role_id for one in user_roles]
+            role_access = RoleAccessDao.get_role_access(role_ids, None) if role_ids else []
+            snapshot = cls._build_snapshot(user_id, version, user_roles, user_groups, admin_groups, role_access)
+            redis_client.set(cls._snapshot_key(user_id), snapshot, expiration=cls.snapshot_expire)
+        cls._local_cache.set(local_key, snapshot)
+        return snapshot
+
+    @classmethod
+    async def aget_snapshot(cls, user_id: int) -> PermissionSnapshot:
+        version = await PermissionVersion.aget(user_id)
+        local_key = (user_id, version)
+        if snapshot := cls._local_cache.get(local_key):
+            return snapshot
+
+        redis_client = await get_redis_client()
+        snapshot: Optional[PermissionSnapshot] = None
+        try:
+            snapshot = await redis_client.aget(cls._snapshot_key(user_id))
+        except Exception as e:
+            logger.warning(f'get permission snapshot from redis error: {e}')
+        if not snapshot or tuple(snapshot.version) != version:
+            user_roles = await UserRoleDao.aget_user_roles(user_id)
+            user_groups = await UserGroupDao.aget_user_group(user_id)
+            admin_groups = await UserGroupDao.aget_user_admin_group(user_id)
+            role_ids = [one.role_id for one in user_roles]
+            role_access = await RoleAccessDao.aget_role_access(role_ids) if role_ids else []
+            snapshot = cls._build_snapshot(user_id, version, user_roles, user_groups, admin_groups, role_access)
+            await redis_client.aset(cls._snapshot_key(user_id), snapshot, expiration=cls.snapshot_expire)
+        cls._local_cache.set(local_key, snapshot)
+        return snapshot
+
+    @classmethod
+    def get_user_id_by_name(cls, user_name: str) -> Optional[int]:
+        key = f'{cls.user_name_key_prefix}{user_name}'
+        redis_client = get_redis_client_sync()
+        if user_id := redis_client.get(key):
+            return user_id
+        user_info = UserDao.get_user_by_username(user_name)
+        if not user_info:
+            return None
+        redis_client.set(key, user_info.user_id, expiration=cls.user_name_expire)
+        return user_info.user_id
+
+    @classmethod
+    async def aget_user_id_by_name(cls, user_name: str) -> Optional[int]:
+        key = f'{cls.user_name_key_prefix}{user_name}'
+        redis_client = await get_redis_client()
+        if user_id := await redis_client.aget(key):
+            return user_id
+        user_info = await UserDao.aget_user_by_username(user_name)
+        if not user_info:
+            return None
+        await redis_client.aset(key, user_info.user_id, expiration=cls.user_name_expire)
+        return user_info.user_id
+
+    @classmethod
+    def get_snapshot_by_name(cls, user_name: str) -> Optional[PermissionSnapshot]:
+        user_id = cls.get_user_id_by_name(user_name)
+        if not user_id:
+            return None
+        return cls.get_snapshot(user_id)
+
+    @classmethod
+    async def aget_snapshot_by_name(cls, user_name: str) -> Optional[PermissionSnapshot]:
+        user_id = await cls.aget_user_id_by_name(user_name)
+        if not user_id:
+            return None
+        return await cls.aget_snapshot(user_id)
@@ -1,7 +1,9 @@
 import os
+import re
 import tempfile
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import IO, Dict, List, Any, Tuple
+from typing import IO, Dict, List, Any, Tuple, Optional
 from urllib.parse import unquote, urlparse
 
 import pandas as pd
@@ -14,21 +16,58 @@ from bisheng.core.storage.minio.minio_manager import get_minio_storage_sync
 from bisheng.utils.util import _is_valid_url
 
 
-def find_lcs(str1, str2):
-    lstr1 = len(str1)
-    lstr2 = len(str2)
-    record = [[0 for i in range(lstr2 + 1)] for j in range(lstr1 + 1)]  # One more person
-    maxNum = 0
-    p = 0
-    for i in range(lstr1):
-        for j in range(lstr2):
-            if str1[i] == str2[j]:
-                record[i + 1][j + 1] = record[i][j] + 1
-                if record[i + 1][j + 1] > maxNum:
-                    maxNum = record[i + 1][j + 1]
-                    p = i + 1
+@dataclass
+class IndexedParagraph:
+    """A paragraph holding placeholders, hits are (start, end, placeholder) in text"""
+    paragraph: Any
+    text: str
+    hits: List[Tuple[int, int, str]]
+    cell: Any = None  # Table cell of the paragraph, None for body paragraphs
+    run_offsets: List[int] = field(default_factory=list)
+
+
+class PlaceholderIndex(object):
+    """
+    Placeholder occurrences of a document, collected in one pass over the body paragraphs and the table cells.
+    Body paragraphs are matched on the joined text of their runs, so a placeholder split across runs is found
+    with the runs it spans. Only the indexed paragraphs are touched when rendering.
+    """
+
+    def __init__(self, doc, placeholders: List[str]):
+        placeholders = sorted({one for one in placeholders if one}, key=len, reverse=True)
+        self.pattern = re.compile("|".join(re.escape(one) for one in placeholders)) if placeholders else None
+        self.paragraphs: List[IndexedParagraph] = []
+        self.cell_paragraphs: List[IndexedParagraph] = []
+        if self.pattern is None:
+            return
+
+        for p in doc.paragraphs:
+            run_texts = [r.text for r in p.runs]
+            text = "".join(run_texts)
+            if hits := self.find(text):
+                offsets, offset = [], 0
+                for run_text in run_texts:
+                    offsets.append(offset)
+                    offset += len(run_text)
+                self.paragraphs.append(IndexedParagraph(p, text, hits, run_offsets=offsets))
+
+        seen_cells = set()
+        for table in doc.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    # merged cells are returned once per grid column, the elements are kept so they stay the same proxies
+                    if cell._tc in seen_cells:
+                        continue
+                    seen_cells.add(cell._tc)
+                    for p in cell.paragraphs:
+                        text = p.text
+                        if hits := self.find(text):
+                            self.cell_paragraphs.append(IndexedParagraph(p, text, hits, cell=cell))
 
-    return str1[p - maxNum: p], maxNum
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        if not text or self.pattern is None:
+            return []
+        return [(m.start(), m.end(), m.group(0)) for m in self.pattern.finditer(text)]
 
 
 class DocxTemplateRender(object):
@@ -281,16 +320,24 @@ class DocxTemplateRender(object):
             for i in range(end_run_index - 1, start_run_index, -1):
                 paragraph.runs[i].text = ""
 
-    def _process_resource_placeholders(self, doc, placeholder_map):
+    def _process_resource_placeholders(self, doc, placeholder_map, index: Optional[PlaceholderIndex] = None):
         """
         Work with hybrid placeholders in paragraphs in positional order
 
         Args:
             doc: WordDocument object  
             placeholder_map: Placeholder Mapping Dictionary
+            index: Paragraphs that held placeholders before the variable replacement, only they are checked
         """
+        if not placeholder_map:
+            return
+        if index is None:
+            index = PlaceholderIndex(doc, list(placeholder_map.keys()))
+        resource_pattern = re.compile("|".join(re.escape(one) for one in placeholder_map))
+        map_order = {placeholder: i for i, placeholder in enumerate(placeholder_map)}
+
         # Work with placeholders in all paragraphs
-        paragraphs_to_process = list(doc.paragraphs)  # Create a copy as we may modify the paragraph structure
+        paragraphs_to_process = [item.paragraph for item in index.paragraphs]
 
         for i, p in enumerate(paragraphs_to_process):
             paragraph_text = p.text
@@ -299,15 +346,13 @@ class DocxTemplateRender(object):
 
             # Find all placeholders and their positions in the paragraph
             placeholders_with_positions = []
-            for placeholder, resource_info in placeholder_map.items():
-                pos = paragraph_text.find(placeholder)
-                if pos != -1:
-                    placeholders_with_positions.append({
-                        'placeholder': placeholder,
-                        'resource_info': resource_info,
-                        'position': pos,
-                        'end_position': pos + len(placeholder)
-                    })
+            for match in resource_pattern.finditer(paragraph_text):
+                placeholders_with_positions.append({
+                    'placeholder': match.group(0),
+                    'resource_info': placeholder_map[match.group(0)],
+                    'position': match.start(),
+                    'end_position': match.end()
+                })
 
             if not placeholders_with_positions:
                 continue
@@ -319,51 +364,51 @@ class DocxTemplateRender(object):
             self._process_mixed_content_paragraph(doc, p, placeholders_with_positions, paragraph_text)
 
         # Working with Placeholders in Table Cells
-        for table in doc.tables:
-            for i, row in enumerate(table.rows):
-                for j, cell in enumerate(row.cells):
-                    for one in cell.paragraphs:
-                        cell_text = one.text
-                        if not cell_text:
-                            continue
-
-                        # Check for placeholders in cells
-                        for placeholder, resource_info in placeholder_map.items():
-                            if placeholder in cell_text:
-                                if resource_info["type"] == "image":
-                                    # Insert Actual Picture in Table Cell
-                                    image_path = resource_info.get("local_path") or resource_info.get("path", "")
-                                    if image_path and os.path.exists(image_path):
-                                        try:
-                                            # Insert a picture in a cell (this will empty the cell and insert the picture)
-                                            self._insert_image_in_table_cell(cell, image_path)
-                                            logger.info(f"✅ Picture successfully inserted in table cell: {image_path}")
-                                            # Marker placeholder processed, no need to update text
-                                            cell_text = ""
-                                        except Exception as e:
-                                            logger.error(f"❌ Table Cell Insert Picture Failed: {str(e)}")
-                                            # Show file name on failure
-                                            cell_text = cell_text.replace(placeholder, os.path.basename(image_path))
-                                    else:
-                                        # Image file does not exist, display path
-                                        cell_text = cell_text.replace(placeholder,
-                                                                      resource_info.get("path", placeholder))
-                                elif resource_info["type"] == "excel":
-                                    cell_text = cell_text.replace(placeholder, "[ExcelTable Filter]")
-                                elif resource_info["type"] == "csv":
-                                    cell_text = cell_text.replace(placeholder, "[CSVTable Filter]")
-                                elif resource_info["type"] == "markdown_table":
-                                    cell_text = cell_text.replace(placeholder, "[MarkdownTable Filter]")
-                                logger.info(f"Process table cell placeholders: {placeholder}")
-
-                        # Update cell text
-                        if cell_text != one.text:
-                            if one.runs:
-                                one.runs[0].text = cell_text
-                                for r_index in range(1, len(one.runs)):
-                                    one.runs[r_index].text = ""
-                            else:
-                                one.add_run(cell_text)
+        for item in index.cell_paragraphs:
+            cell, one = item.cell, item.paragraph
+            cell_text = one.text
+            if not cell_text:
+                continue
+
+            # Check for placeholders in cells, in the order of the placeholder map
+            present = sorted({m.group(0) for m in resource_pattern.finditer(cell_text)}, key=map_order.get)
+            for placeholder in present:
+                resource_info = placeholder_map[placeholder]
+                if placeholder in cell_text:
+                    if resource_info["type"] == "image":
+                        # Insert Actual Picture in Table Cell
+                        image_path = resource_info.get("local_path") or resource_info.get("path", "")
+                        if image_path and os.path.exists(image_path):
+                            try:
+                                # Insert a picture in a cell (this will empty the cell and insert the picture)
+                                self._insert_image_in_table_cell(cell, image_path)
+                                logger.info(f"✅ Picture successfully inserted in table cell: {image_path}")
+                                # Marker placeholder processed, no need to update text
+                                cell_text = ""
+                            except Exception as e:
+                                logger.error(f"❌ Table Cell Insert Picture Failed: {str(e)}")
+                                # Show file name on failure
+                                cell_text = cell_text.replace(placeholder, os.path.basename(image_path))
+                        else:
+                            # Image file does not exist, display path
+                            cell_text = cell_text.replace(placeholder,
+                                                          resource_info.get("path", placeholder))
+                    elif resource_info["type"] == "excel":
+                        cell_text = cell_text.replace(placeholder, "[ExcelTable Filter]")
+                    elif resource_info["type"] == "csv":
+                        cell_text = cell_text.replace(placeholder, "[CSVTable Filter]")
+                    elif resource_info["type"] == "markdown_table":
+                        cell_text = cell_text.replace(placeholder, "[MarkdownTable Filter]")
+                    logger.info(f"Process table cell placeholders: {placeholder}")
+
+            # Update cell text
+            if cell_text != one.text:
+                if one.runs:
+                    one.runs[0].text = cell_text
+                    for r_index in range(1, len(one.runs)):
+                        one.runs[r_index].text = ""
+                else:
+                    one.add_run(cell_text)
 
     def _process_mixed_content_paragraph(self, doc, paragraph, placeholders_with_positions, original_text):
         """
@@ -1419,132 +1464,78 @@ class DocxTemplateRender(object):
         for table_info in resources.get("markdown_tables", []):
             placeholder_map[table_info["placeholder"]] = {"type": "markdown_table", "content": table_info["content"]}
 
-        # Original Text Replacement Logic
-        for replace_info in template_def:
-            k1 = replace_info[0]
-            v1 = replace_info[1]
-
-            # Work with placeholders in tables
-            for table in doc.tables:
-                for i, row in enumerate(table.rows):
-                    for j, cell in enumerate(row.cells):
-                        if k1 in cell.text:
-                            for one in cell.paragraphs:
-                                if k1 in one.text:
-                                    # Checks for placeholders requiring special handling
-                                    cell_text = one.text.replace(k1, v1)
-
-                                    # Processing Placeholders
-                                    for placeholder, resource_info in placeholder_map.items():
-                                        if placeholder in cell_text:
-                                            if resource_info["type"] == "image":
-                                                # Insert Actual Picture in Table Cell
-                                                image_path = resource_info.get("local_path") or resource_info.get(
-                                                    "path", "")
-                                                if image_path and os.path.exists(image_path):
-                                                    try:
-                                                        # Clear cell text
-                                                        cell_text = cell_text.replace(placeholder, "")
-                                                        # Insert Picture in Cell
-                                                        self._insert_image_in_table_cell(cell, image_path)
-                                                        logger.info(f"✅ Picture successfully inserted in table cell: {image_path}")
-                                                    except Exception as e:
-                                                        logger.error(f"❌ Table Cell Insert Picture Failed: {str(e)}")
-                                                        # Show file name on failure
-                                                        cell_text = cell_text.replace(placeholder,
-                                                                                      os.path.basename(image_path))
-                                                else:
-                                                    # Image file does not exist, display path
-                                                    cell_text = cell_text.replace(placeholder, resource_info.get("path",
-                                                                                                                 placeholder))
-                                            elif resource_info["type"] == "excel":
-                                                cell_text = cell_text.replace(placeholder, "[ExcelTable Filter]")
-                                            elif resource_info["type"] == "csv":
-                                                cell_text = cell_text.replace(placeholder, "[CSVTable Filter]")
-                                            elif resource_info["type"] == "markdown_table":
-                                                cell_text = cell_text.replace(placeholder, "[MarkdownTable Filter]")
-
-                                    one.runs[0].text = cell_text
-                                    for r_index, r in enumerate(one.runs):
-                                        if r_index == 0:
-                                            continue
-                                        r.text = ""
-
-            # Processing Placeholders in Paragraphs
-            for p in doc.paragraphs:
-                if k1 not in p.text:
-                    continue
+        # Variable values, a value holding a later variable gets it replaced like the sequential replacement did
+        keys, values = [], {}
+        for k1, v1 in template_def:
+            if k1 and k1 not in values:
+                keys.append(k1)
+                values[k1] = "" if v1 is None else str(v1)
+        for i, k1 in enumerate(keys):
+            for k2 in keys[i + 1:]:
+                if k2 in values[k1]:
+                    values[k1] = values[k1].replace(k2, values[k2])
+
+        # One pass over the document for variables and resource placeholders
+        index = PlaceholderIndex(doc, keys + list(placeholder_map.keys()))
+
+        # Work with placeholders in tables
+        for item in index.cell_paragraphs:
+            if not any(hit[2] in values for hit in item.hits) or not item.paragraph.runs:
+                continue
+            item.paragraph.runs[0].text = self._substitute(item.text, item.hits, values)
+            for r in item.paragraph.runs[1:]:
+                r.text = ""
 
-                runs_cnt = len(p.runs)
-                s_e = []
-                i = 0
-                while i < runs_cnt:
-                    new_i = i + 1
-                    for j in range(i + 1, runs_cnt + 1):
-                        part_text = "".join([r.text for r in p.runs[i:j]])
-                        if k1 in part_text:
-                            # Find the smallest range containingk1right of privacyruns
-                            tmp_i, tmp_j = i, j
-                            while tmp_i <= tmp_j:
-                                tmp_part_text = "".join([r.text for r in p.runs[tmp_i:tmp_j]])
-                                if k1 in tmp_part_text:
-                                    tmp_i += 1
-                                    continue
-                                else:
-                                    tmp_i -= 1
-                                    break
-                            s_e.append((tmp_i, j))
-                            new_i = j
-                            break
-                    i = new_i
-
-                for one in s_e:
-                    s, e = one
-                    assert e > 0, [r.text for r in p.runs]
-
-                    if e - s == 1:
-                        replace_mapping = [(k1, v1)]
-                    elif e - s == 2:
-                        s_tgt_text = p.runs[s].text
-                        comm_str, max_num = find_lcs(k1, s_tgt_text)
-                        assert k1.startswith(comm_str)
-                        p1 = comm_str
-                        p2 = k1[max_num:]
-                        n = len(v1)
-                        sub_n1 = int(1.0 * len(p1) / (len(p1) + len(p2)) * n)
-                        replace_mapping = [(p1, v1[:sub_n1]), (p2, v1[sub_n1:])]
-                    elif e - s == 3:
-                        m_text = p.runs[s + 1].text
-                        head_tail = k1.split(m_text, 1)
-                        assert len(head_tail) == 2
-                        h_text = head_tail[0]
-                        t_text = head_tail[1]
-                        replace_mapping = [(h_text, ""), (m_text, v1), (t_text, "")]
-                    else:
-                        m_texts = [p.runs[i].text for i in range(s + 1, e - 1)]
-                        m_text = "".join(m_texts)
-                        head_tail = k1.split(m_text, 1)
-                        assert len(head_tail) == 2
-                        h_text = head_tail[0]
-                        t_text = head_tail[1]
-                        replace_mapping = [(h_text, "")]
-                        replace_mapping.append((m_texts[0], v1))
-                        for text in m_texts[1:]:
-                            replace_mapping.append((text, ""))
-                        replace_mapping.append((t_text, ""))
-
-                    for i in range(s, e):
-                        _k, _v = replace_mapping[i - s]
-                        p.runs[i].text = p.runs[i].text.replace(_k, _v)
+        # Processing Placeholders in Paragraphs
+        for item in index.paragraphs:
+            self._substitute_runs(item, values)
 
         # Unify resource placeholders after all variable replacements are complete
-        self._process_resource_placeholders(doc, placeholder_map)
+        self._process_resource_placeholders(doc, placeholder_map, index)
 
         # Add Final Document Content Check
         self._log_final_document_content(doc)
 
         return doc
 
+    @staticmethod
+    def _substitute(text: str, hits: List[Tuple[int, int, str]], values: Dict[str, str]) -> str:
+        """Replace the variable hits of a text, other hits are kept"""
+        parts, last = [], 0
+        for start, end, key in hits:
+            if key in values:
+                parts.append(text[last:start])
+                parts.append(values[key])
+                last = end
+        parts.append(text[last:])
+        return "".join(parts)
+
+    @staticmethod
+    def _substitute_runs(item: IndexedParagraph, values: Dict[str, str]):
+        """
+        Replace the variable hits of a body paragraph run by run, the run formatting is kept.
+        A placeholder split across runs is removed from every run it spans and its value goes to the
+        run holding most of the placeholder, usually the variable name between the braces.
+        """
+        runs = item.paragraph.runs
+        offsets = item.run_offsets
+        texts = [r.text for r in runs]
+        new_texts = list(texts)
+        for start, end, key in reversed(item.hits):
+            if key not in values:
+                continue
+            spans = []
+            for k, run_start in enumerate(offsets):
+                a, b = max(start, run_start), min(end, run_start + len(texts[k]))
+                if a < b:
+                    spans.append((k, a - run_start, b - run_start))
+            target = max(spans, key=lambda one: (one[2] - one[1], -one[0]))[0]
+            for k, a, b in reversed(spans):
+                new_texts[k] = new_texts[k][:a] + (values[key] if k == target else "") + new_texts[k][b:]
+        for r, old, new in zip(runs, texts, new_texts):
+            if old != new:
+                r.text = new
+
     def _log_final_document_content(self, doc):
         """Review final document content"""
         try:
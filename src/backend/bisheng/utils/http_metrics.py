@@ -0,0 +1,210 @@
+"""
+Request metrics of the process, exported in the Prometheus text format.
+
+Requests are labelled with the method, the route template (never the raw path) and the status code,
+so the series stay bounded by the number of routes. Label sets beyond MAX_SERIES share the route "<other>".
+
+With several uvicorn workers set BISHENG_METRICS_DIR to a directory shared by them and emptied before they
+start: every worker writes its snapshot to <pid>.json there and render() merges the snapshots of the live
+workers, whichever worker serves the scrape.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+# upper bounds of the latency buckets (s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MAX_SERIES = 2000
+# seconds between two snapshot writes of a worker
+SNAPSHOT_INTERVAL = 1.0
+UNMATCHED_ROUTE = '<unmatched>'
+OTHER_ROUTE = '<other>'
+
+
+class _Histogram(object):
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RequestMetrics(object):
+    """ latency histograms per (method, route, status) plus in flight request and websocket gauges """
+
+    def __init__(self, max_series: int = MAX_SERIES, snapshot_dir: Optional[str] = None,
+                 snapshot_interval: float = SNAPSHOT_INTERVAL):
+        self.max_series = max_series
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str, str], _Histogram] = {}
+        self.in_flight = 0
+        self.websockets = 0
+        self._dirty = False
+        # pid of the process the snapshot writer runs in, the thread does not survive a fork
+        self._writer_pid = None
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+            self._changed()
+
+    def request_finished(self, method: str, route: str, status: int, duration: float):
+        with self._lock:
+            self.in_flight -= 1
+            key = (method, route, str(status))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                if len(self._histograms) >= self.max_series:
+                    key = (method, OTHER_ROUTE, str(status))
+                    histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = _Histogram()
+            histogram.observe(duration)
+            self._changed()
+
+    def websocket_opened(self):
+        with self._lock:
+            self.websockets += 1
+            self._changed()
+
+    def websocket_closed(self):
+        with self._lock:
+            self.websockets -= 1
+            self._changed()
+
+    def _changed(self):
+        """ called with the lock held, starts the snapshot writer of this process on first use """
+        self._dirty = True
+        if self.snapshot_dir and self._writer_pid != os.getpid():
+            self._writer_pid = os.getpid()
+            threading.Thread(target=self._write_loop, name='http-metrics-snapshot', daemon=True).start()
+
+    def _snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._dirty = False
+            return {
+                'histograms': [[*key, list(h.counts), h.total, h.count] for key, h in self._histograms.items()],
+                'in_flight': self.in_flight,
+                'websockets': self.websockets,
+            }
+
+    def _snapshot_path(self, pid: int) -> str:
+        return os.path.join(self.snapshot_dir, f'{pid}.json')
+
+    def write_snapshot(self):
+        """ write the snapshot of this process, replaced atomically so a reader never sees half of it """
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = self._snapshot_path(os.getpid())
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.snapshot_interval)
+            if not self._dirty:
+                continue
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                logger.warning(f'write http metrics snapshot error: {e}')
+
+    def _read_snapshots(self) -> List[Dict[str, Any]]:
+        """ snapshots of the live workers, the files of exited workers are removed """
+        self.write_snapshot()
+        snapshots = []
+        for name in os.listdir(self.snapshot_dir):
+            pid, ext = os.path.splitext(name)
+            if ext != '.json' or not pid.isdigit():
+                continue
+            path = os.path.join(self.snapshot_dir, name)
+            if not _pid_alive(int(pid)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f'read http metrics snapshot {name} error: {e}')
+        return snapshots
+
+    def render(self) -> str:
+        """ Prometheus text exposition format 0.0.4 """
+        snapshots = self._read_snapshots() if self.snapshot_dir else [self._snapshot()]
+        merged: Dict[Tuple[str, str, str], List] = {}
+        in_flight = websockets = 0
+        for snapshot in snapshots:
+            in_flight += snapshot['in_flight']
+            websockets += snapshot['websockets']
+            for method, route, status, counts, total, count in snapshot['histograms']:
+                one = merged.get((method, route, status))
+                if one is None:
+                    merged[(method, route, status)] = [list(counts), total, count]
+                else:
+                    one[0] = [a + b for a, b in zip(one[0], counts)]
+                    one[1] += total
+                    one[2] += count
+        histograms = [(key, counts, total, count) for key, (counts, total, count) in merged.items()]
+
+        lines: List[str] = [
+            '# HELP http_request_duration_seconds HTTP request duration by route template',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        totals: List[str] = [
+            '# HELP http_requests_total HTTP requests by route template and status',
+            '# TYPE http_requests_total counter',
+        ]
+        for (method, route, status), counts, total, count in sorted(histograms):
+            labels = f'method="{method}",route="{_escape(route)}",status="{status}"'
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {total}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {count}')
+            totals.append(f'http_requests_total{{{labels}}} {count}')
+        lines.extend(totals)
+        lines.extend([
+            '# HELP http_requests_in_flight HTTP requests being served',
+            '# TYPE http_requests_in_flight gauge',
+            f'http_requests_in_flight {in_flight}',
+            '# HELP websocket_connections Open websocket connections',
+            '# TYPE websocket_connections gauge',
+            f'websocket_connections {websockets}',
+        ])
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics(snapshot_dir=os.getenv('BISHENG_METRICS_DIR') or None)
@@ -1,46 +1,71 @@
 # Define a custom middleware class
-from time import time
+from time import perf_counter
 
-from fastapi import Request
 from loguru import logger
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
 
 from bisheng.core.logger import trace_id_generator, trace_id_var
 from bisheng.utils import get_request_ip
+from bisheng.utils.http_metrics import UNMATCHED_ROUTE, RequestMetrics, request_metrics
 
 
-class CustomMiddleware(BaseHTTPMiddleware):
-    """Cutting Procedure"""
+def _route_template(scope) -> str:
+    """ path template of the matched route, the raw path would make a label value per url """
+    route = scope.get('route')
+    path = getattr(route, 'path', None)
+    if not path:
+        return UNMATCHED_ROUTE
+    return scope.get('root_path', '') + path
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint):
-        # You can modify the request before passing it to the next middleware or endpoint
-        if request.headers.get('x-trace-id'):
-            trace_id = request.headers.get('x-trace-id')
-        else:
-            trace_id = trace_id_generator()
-        # WithNginx  choose one of two Gotta see.NGINX Configuration of
-        ip = get_request_ip(request)
-        path = request.url
-        trace_id_var.set(trace_id)
-
-        logger.info(f"| {ip} | {request.method} {path}")
-        start_time = time()
-        response = await call_next(request)
-        process_time = round(time() - start_time, 4)
-        response.headers["X-Process-Time"] = str(process_time)
-        response.headers["X-Trace-ID"] = trace_id
-        logger.info(f"| {ip} | {request.method} {path} | process_time={process_time}s")
-        return response
 
+class RequestMiddleware:
+    """
+    Pure ASGI middleware: trace id, process time headers, one access log line and request metrics.
+    The response body is passed through untouched, streaming responses are not buffered.
+    """
 
-class WebSocketLoggingMiddleware:
-    """WebSocket Log middleware"""
-
-    def __init__(self, app):
+    def __init__(self, app, metrics: RequestMetrics = request_metrics):
         self.app = app
+        self.metrics = metrics
 
     async def __call__(self, scope, receive, send):
-        if scope["type"] == "websocket":
-            trace_id = trace_id_generator()
-            trace_id_var.set(trace_id)
-        await self.app(scope, receive, send)
+        if scope['type'] == 'websocket':
+            await self._websocket(scope, receive, send)
+            return
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        trace_id = connection.headers.get('x-trace-id') or trace_id_generator()
+        trace_id_var.set(trace_id)
+        start_time = perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                headers = MutableHeaders(scope=message)
+                headers.append('X-Process-Time', str(round(perf_counter() - start_time, 4)))
+                headers.append('X-Trace-ID', trace_id)
+            await send(message)
+
+        self.metrics.request_started()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            process_time = perf_counter() - start_time
+            self.metrics.request_finished(scope['method'], _route_template(scope), status_code, process_time)
+            # WithNginx  choose one of two Gotta see.NGINX Configuration of
+            logger.info(f"| {get_request_ip(connection)} | {scope['method']} {connection.url} | {status_code} "
+                        f"| process_time={round(process_time, 4)}s")
+
+    async def _websocket(self, scope, receive, send):
+        trace_id_var.set(HTTPConnection(scope).headers.get('x-trace-id') or trace_id_generator())
+        self.metrics.websocket_opened()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.metrics.websocket_closed()
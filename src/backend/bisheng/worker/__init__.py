@@ -1,9 +1,11 @@
 # register tasks
+from bisheng.worker.audit.session_export import export_session_messages_celery
 from bisheng.worker.knowledge.file_worker import file_copy_celery, parse_knowledge_file_celery, \
     retry_knowledge_file_celery
 from bisheng.worker.knowledge.rebuild_knowledge_worker import rebuild_knowledge_celery
 from bisheng.worker.telemetry.mid_table import sync_mid_user_increment, sync_mid_knowledge_increment, \
-    sync_mid_app_increment, sync_mid_user_interact_dtl
+    sync_mid_app_increment, sync_mid_user_interact_dtl, sync_mid_tables, backfill_mid_table
+from bisheng.worker.telemetry.token_usage import sync_token_usage_rollup
 from bisheng.worker.test.test import add
 from bisheng.worker.workflow.tasks import execute_workflow, continue_workflow, stop_workflow
-from bisheng.worker.scheduled.tasks import check_tasks
\ No newline at end of file
+from bisheng.worker.scheduled.tasks import check_tasks, run_scheduled_task
\ No newline at end of file
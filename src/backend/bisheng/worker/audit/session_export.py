@@ -0,0 +1,15 @@
+from loguru import logger
+
+from bisheng.api.services.session_export import SessionMessageExporter
+from bisheng.core.logger import trace_id_var
+from bisheng.worker.main import bisheng_celery
+
+
+@bisheng_celery.task(acks_late=True)
+def export_session_messages_celery(job_id: str):
+    """ run or resume a session message export job """
+    trace_id_var.set(f'session_export_{job_id}')
+    job = SessionMessageExporter.run_job(job_id)
+    if job:
+        logger.info(f'session export job={job_id} status={job.status.value} sessions={job.sessions} '
+                    f'rows={job.rows} parts={len(job.parts)}')
@@ -0,0 +1,152 @@
+"""
+定时任务调度引擎
+
+每次 tick:
+1. 只查询到期的任务 (status = enabled and next_run_time <= now, 走 scheduled_task_due_idx 索引)
+2. 用 next_run_time 做条件更新来抢占任务, 多个 beat / worker 副本同时调度时只有一个能抢到
+3. 抢到后先把 next_run_time 推进到下一次, 再派发执行, 长时间运行的工作流不会被重复触发
+4. 派发到 celery 默认队列执行, 同时运行的数量受 max_running 限制, 超出的任务保持到期状态等下一次 tick
+
+错过执行时间超过 misfire_grace_time 的按 misfire_policy 处理, 上一次执行还没结束的按 concurrency_policy 处理。
+时钟、派发函数和运行租约都可以注入, 方便用假时钟测试。
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from croniter import croniter
+from loguru import logger
+
+from bisheng.common.services.config_service import settings
+from bisheng.core.config.settings import ScheduledTaskConf
+from bisheng.database.models.scheduled_task import ScheduledTask, ScheduledTaskDao
+from bisheng.utils import generate_uuid
+
+MISFIRE_RUN_ONCE = 'run_once'
+MISFIRE_SKIP = 'skip'
+CONCURRENCY_SKIP = 'skip'
+CONCURRENCY_ALLOW = 'allow'
+
+ACTION_RUN = 'run'
+ACTION_SKIP_MISFIRE = 'skip_misfire'
+ACTION_SKIP_RUNNING = 'skip_running'
+ACTION_LOST = 'lost'
+ACTION_INVALID_CRON = 'invalid_cron'
+
+
+def get_next_run_time(cron_expression: str, base: datetime) -> datetime:
+    return croniter(cron_expression, base).get_next(datetime)
+
+
+class RunLease:
+    """
+    正在执行的定时任务, redis 有序集合 member 为 task_id:run_id, score 为租约到期时间
+    worker 异常退出没有释放的租约到期后自动失效
+    """
+    KEY = 'scheduled_task:running'
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+
+    @property
+    def _redis(self):
+        from bisheng.core.cache.redis_manager import get_redis_client_sync
+        return get_redis_client_sync().connection
+
+    def _running(self) -> List[str]:
+        redis = self._redis
+        redis.zremrangebyscore(self.KEY, '-inf', self.clock())
+        return [one.decode() if isinstance(one, bytes) else one for one in redis.zrange(self.KEY, 0, -1)]
+
+    def count(self) -> int:
+        return len(self._running())
+
+    def is_running(self, task_id: int) -> bool:
+        prefix = f'{task_id}:'
+        return any(one.startswith(prefix) for one in self._running())
+
+    def acquire(self, task_id: int, run_id: str, ttl: int):
+        self._redis.zadd(self.KEY, {f'{task_id}:{run_id}': self.clock() + ttl})
+
+    def release(self, task_id: int, run_id: str):
+        self._redis.zrem(self.KEY, f'{task_id}:{run_id}')
+
+
+def dispatch_to_celery(task_id: int, run_id: str):
+    from bisheng.worker.scheduled.tasks import run_scheduled_task
+    run_scheduled_task.delay(task_id, run_id)
+
+
+class ScheduledTaskScheduler:
+
+    def __init__(self, conf: Optional[ScheduledTaskConf] = None,
+                 clock: Callable[[], datetime] = datetime.now,
+                 dispatch: Callable[[int, str], None] = dispatch_to_celery,
+                 lease: Optional[RunLease] = None,
+                 dao=ScheduledTaskDao):
+        self.conf = conf or settings.scheduled_task_conf
+        self.clock = clock
+        self.dispatch = dispatch
+        self.lease = lease or RunLease(clock=lambda: self.clock().timestamp())
+        self.dao = dao
+
+    def decide(self, task: ScheduledTask, now: datetime) -> str:
+        """ 到期任务这次是执行还是跳过 """
+        late = now - task.next_run_time
+        if late > timedelta(seconds=self.conf.misfire_grace_time) and self.conf.misfire_policy == MISFIRE_SKIP:
+            return ACTION_SKIP_MISFIRE
+        if self.conf.concurrency_policy != CONCURRENCY_ALLOW and self.lease.is_running(task.id):
+            return ACTION_SKIP_RUNNING
+        return ACTION_RUN
+
+    def tick(self) -> Dict[int, str]:
+        """ 调度一次到期任务, 返回每个处理过的任务的动作 """
+        now = self.clock()
+        slots = self.conf.max_running - self.lease.count()
+        if slots <= 0:
+            logger.info(f'scheduled task slots are full, max_running={self.conf.max_running}')
+            return {}
+
+        actions = {}
+        for task in self.dao.get_due_tasks(now, limit=self.conf.due_batch_size):
+            if slots <= 0:
+                # 剩余的到期任务不推进 next_run_time, 下一次 tick 再调度
+                break
+            actions[task.id] = self._schedule_one(task, now)
+            if actions[task.id] == ACTION_RUN:
+                slots -= 1
+        return actions
+
+    def _schedule_one(self, task: ScheduledTask, now: datetime) -> str:
+        try:
+            # 错过的多次执行合并为一次, 下一次执行时间从现在开始算
+            next_run = get_next_run_time(task.cron_expression, now)
+        except (ValueError, KeyError) as e:
+            logger.error(f'scheduled task {task.id} has invalid cron {task.cron_expression}: {e}')
+            self.dao.claim_task(task.id, task.next_run_time, None, None)
+            return ACTION_INVALID_CRON
+
+        action = self.decide(task, now)
+        last_run = now if action == ACTION_RUN else None
+        if not self.dao.claim_task(task.id, task.next_run_time, last_run, next_run):
+            # 被其他调度副本抢先, 或者任务刚被修改
+            return ACTION_LOST
+        if action != ACTION_RUN:
+            logger.info(f'scheduled task {task.id} ({task.name}) {action}, '
+                        f'due={task.next_run_time}, next={next_run}')
+            return action
+
+        logger.info(f'scheduled task {task.id} ({task.name}) is due at {task.next_run_time}, next={next_run}')
+        self.start(task.id)
+        return action
+
+    def start(self, task_id: int) -> str:
+        """ 派发一次执行, 手动触发也走这里, 不受 max_running 和策略限制 """
+        run_id = generate_uuid()
+        self.lease.acquire(task_id, run_id, self.conf.lease_ttl)
+        try:
+            self.dispatch(task_id, run_id)
+        except Exception:
+            self.lease.release(task_id, run_id)
+            raise
+        return run_id
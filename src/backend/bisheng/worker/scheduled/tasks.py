@@ -1,8 +1,11 @@
 """
 定时任务调度 Celery 任务
 
-check_tasks: 每分钟执行一次，检查数据库中到期的定时任务并触发执行
+check_tasks: 每分钟执行一次，抢占数据库中到期的定时任务并派发执行
+run_scheduled_task: 执行一次定时任务
 """
+from typing import Optional
+
 from loguru import logger
 
 from bisheng.worker.main import bisheng_celery
@@ -10,9 +13,29 @@ from bisheng.worker.main import bisheng_celery
 
 @bisheng_celery.task(name='bisheng.worker.scheduled.check_tasks')
 def check_tasks():
-    """每分钟检查并执行到期的定时任务"""
+    """每分钟检查并派发到期的定时任务"""
     try:
         from bisheng.api.v1.scheduled_task import check_and_run_due_tasks
         check_and_run_due_tasks()
     except Exception as e:
         logger.error(f'Error in check_tasks: {e}')
+
+
+@bisheng_celery.task(name='bisheng.worker.scheduled.run_task')
+def run_scheduled_task(task_id: int, run_id: Optional[str] = None):
+    """执行一次定时任务, 结束后释放运行租约"""
+    from bisheng.api.v1.scheduled_task import execute_scheduled_task
+    from bisheng.database.models.scheduled_task import ScheduledTaskDao
+    from bisheng.worker.scheduled.scheduler import RunLease
+
+    try:
+        task = ScheduledTaskDao.get_task_by_id(task_id)
+        if not task:
+            logger.warning(f'scheduled task {task_id} not found, run_id={run_id}')
+            return
+        execute_scheduled_task(task)
+    except Exception as e:
+        logger.error(f'Error in run_scheduled_task {task_id}: {e}')
+    finally:
+        if run_id:
+            RunLease().release(task_id, run_id)
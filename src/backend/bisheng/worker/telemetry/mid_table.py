@@ -1,44 +1,24 @@
-from datetime import datetime, timedelta
-from typing import List
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
 from loguru import logger
 
-from bisheng.api.services.workflow import WorkFlowService
 from bisheng.common.constants.enums.telemetry import ApplicationTypeEnum
 from bisheng.common.schemas.telemetry.base_telemetry_schema import UserGroupInfo, UserRoleInfo
 from bisheng.core.logger import trace_id_var
-from bisheng.database.models.flow import FlowType
-from bisheng.knowledge.domain.services.knowledge_service import KnowledgeService
+from bisheng.database.models.flow import FlowDao, FlowType
+from bisheng.knowledge.domain.models.knowledge import KnowledgeDao
 from bisheng.telemetry.domain.mid_table.app_increment import AppIncrement, AppIncrementRecord
-from bisheng.telemetry.domain.mid_table.base import BaseMidTable
 from bisheng.telemetry.domain.mid_table.knowledge_increment import KnowledgeIncrement, KnowledgeIncrementRecord
+from bisheng.telemetry.domain.mid_table.sync import MidTableSyncer, sync_mid_tables_parallel
 from bisheng.telemetry.domain.mid_table.user_increment import UserIncrement, UserIncrementRecord
 from bisheng.telemetry.domain.mid_table.user_interact import UserInteract, UserInteractRecord
+from bisheng.user.domain.models.user import UserDao
 from bisheng.user.domain.services.user import UserService
 from bisheng.utils import generate_uuid
 from bisheng.worker.main import bisheng_celery
 
 
-def get_yesterday_date_range(mid_table: BaseMidTable, start_date: str = None, end_date: str = None) -> (datetime,
-                                                                                                        datetime):
-    if start_date is None or end_date is None:
-        # default to yesterday's date
-        now = datetime.now()
-        start_date = (now - timedelta(days=1)).strftime("%Y-%m-%d 00:00:00")
-        end_date = datetime(year=now.year, month=now.month, day=now.day, hour=0, minute=0, second=0)
-    else:
-        start_date = datetime.fromisoformat(start_date)
-        end_date = datetime.fromisoformat(end_date)
-
-    lastest_time = mid_table.get_latest_record_time_sync()
-    if lastest_time:
-        start_date = datetime.fromtimestamp(lastest_time) + timedelta(seconds=1)
-    if end_date < start_date:
-        logger.error(f"end_date {end_date} is before start_date {start_date}")
-        return None, None
-    return start_date, end_date
-
-
 def convert_flow_type(flow_type: int) -> ApplicationTypeEnum:
     flow_type_mapping = {
         FlowType.FLOW.value: ApplicationTypeEnum.SKILL,
@@ -48,165 +28,134 @@ def convert_flow_type(flow_type: int) -> ApplicationTypeEnum:
     return flow_type_mapping.get(flow_type, ApplicationTypeEnum.UNKNOWN)
 
 
-@bisheng_celery.task()
-def sync_mid_user_increment(start_date: str = None, end_date: str = None):
-    trace_id_var.set(f"sync_mid_user_increment_task_{generate_uuid()}")
-    mid_table = UserIncrement()
-    start_date, end_date = get_yesterday_date_range(mid_table, start_date, end_date)
-    if start_date is None or end_date is None:
-        return
-
-    logger.info(f"Syncing mid_user_increment from {start_date} to {end_date}")
-    # Here would be the logic to fetch data from the source and insert into mid_user_increment
-    page, page_size = 1, 1000
-
-    while True:
-        user_list = UserService.get_user_all_info(start_time=start_date, end_time=end_date,
-                                                  page=page, page_size=page_size)
-        page += 1
-        if not user_list:
-            break
-        records = []
-        for user in user_list:
-            records.append(UserIncrementRecord(
-                es_id=f"user_{user.user_id}",
-                user_id=user.user_id,
-                user_name=user.user_name,
-                user_group_infos=[UserGroupInfo(user_group_id=group.id, user_group_name=group.group_name)
-                                  for group in user.groups],
-                user_role_infos=[UserRoleInfo(role_id=role.id, role_name=role.role_name, group_id=role.group_id)
-                                 for role in user.roles],
-                timestamp=int(user.create_time.timestamp())
-            ))
-        mid_table.insert_records_sync(records)
-
-    # This is a placeholder for the actual data synchronization logic
-    logger.info(f"Successfully synced mid_user_increment from {start_date} to {end_date}")
-
-
 def get_user_from_ids_with_cache(user_ids: List[int], user_map: dict):
+    user_ids = [one for one in set(user_ids) if one not in user_map]
     if user_ids:
         user_list = UserService.get_user_all_info(user_ids=user_ids, page=0, page_size=0)
         user_map.update({user.user_id: user for user in user_list})
     return user_map
 
 
-@bisheng_celery.task()
-def sync_mid_app_increment(start_date: str = None, end_date: str = None):
-    # Placeholder for syncing mid_app_increment table
-    trace_id_var.set(f"sync_mid_app_increment_task_{generate_uuid()}")
-    logger.info("Syncing mid_app_increment table...")
-
-    mid_table = AppIncrement()
-    start_date, end_date = get_yesterday_date_range(mid_table, start_date, end_date)
-    if start_date is None or end_date is None:
-        return
-
-    logger.info(f"Syncing mid_app_increment from {start_date} to {end_date}")
-
-    page, page_size = 1, 1000
-    user_map = {}
-    while True:
-        app_list = WorkFlowService.get_all_apps_by_time_range_sync(start_time=start_date, end_time=end_date, page=page,
-                                                                   page_size=page_size)
-        page += 1
-        if not app_list:
-            break
-        records = []
-        user_ids = set()
-        for app in app_list:
-            if app['user_id'] not in user_map:
-                user_ids.add(app['user_id'])
-        user_map = get_user_from_ids_with_cache(list(user_ids), user_map)
-
-        for app in app_list:
-            user = user_map.get(app['user_id'], None)
-            records.append(AppIncrementRecord(
-                es_id=f"app_{app['id']}",
-                user_id=app['user_id'],
-                user_name=user.user_name if user else "",
-                user_group_infos=[UserGroupInfo(user_group_id=group.id, user_group_name=group.group_name)
-                                  for group in user.groups] if user else [],
-                user_role_infos=[UserRoleInfo(role_id=role.id, role_name=role.role_name, group_id=role.group_id)
-                                 for role in user.roles] if user else [],
-                app_id=app['id'],
-                app_name=app['name'],
-                app_type=convert_flow_type(app['flow_type']),
-                timestamp=int(app['create_time'].timestamp())
-            ))
-        mid_table.insert_records_sync(records)
+def user_context(user) -> Dict:
+    return {
+        'user_name': user.user_name if user else "",
+        'user_group_infos': [UserGroupInfo(user_group_id=group.id, user_group_name=group.group_name)
+                             for group in user.groups] if user else [],
+        'user_role_infos': [UserRoleInfo(role_id=role.id, role_name=role.role_name, group_id=role.group_id)
+                            for role in user.roles] if user else [],
+    }
 
-    # Implement the actual logic here
-    logger.info("Successfully synced mid_app_increment table.")
 
+def _latest_cursor(mid_table, empty_id: Any) -> Optional[List[Any]]:
+    """ continue from the newest record synced by the old full-range jobs """
+    latest_time = mid_table.get_latest_record_time_sync()
+    if not latest_time:
+        return None
+    return [datetime.fromtimestamp(latest_time), empty_id]
 
-@bisheng_celery.task()
-def sync_mid_knowledge_increment(start_date: str = None, end_date: str = None):
-    # Placeholder for syncing mid_knowledge_increment table
-    trace_id_var.set(f"sync_mid_knowledge_increment_task_{generate_uuid()}")
-    logger.info("Syncing mid_knowledge_increment table...")
-    mid_table = KnowledgeIncrement()
-    start_date, end_date = get_yesterday_date_range(mid_table, start_date, end_date)
-    if start_date is None or end_date is None:
-        return
-    logger.info(f"Syncing mid_knowledge_increment from {start_date} to {end_date}")
-
-    page, page_size = 1, 1000
-    user_map = {}
-    while True:
-        knowledge_list = KnowledgeService.get_all_knowledge_by_time_range(start_date, end_date, page=page,
-                                                                          page_size=page_size)
-        page += 1
-        if not knowledge_list:
-            break
-        user_ids = set()
-        for knowledge in knowledge_list:
-            if knowledge.user_id not in user_map:
-                user_ids.add(knowledge.user_id)
-        user_map = get_user_from_ids_with_cache(list(user_ids), user_map)
 
-        records = []
-        for knowledge in knowledge_list:
-            user = user_map.get(knowledge.user_id, None)
-            records.append(KnowledgeIncrementRecord(
-                es_id=f"knowledge_{knowledge.id}",
-                user_id=knowledge.user_id,
-                user_name=user.user_name if user else "",
-                user_group_infos=[UserGroupInfo(user_group_id=group.id, user_group_name=group.group_name)
-                                  for group in user.groups] if user else [],
-                user_role_infos=[UserRoleInfo(role_id=role.id, role_name=role.role_name, group_id=role.group_id)
-                                 for role in user.roles] if user else [],
-                knowledge_id=knowledge.id,
-                knowledge_name=knowledge.name,
-                knowledge_type=knowledge.type,
-                timestamp=int(knowledge.create_time.timestamp())
-            ))
-        mid_table.insert_records_sync(records)
-    # Implement the actual logic here
-    logger.info("Successfully synced mid_knowledge_increment table.")
+class UserIncrementSyncer(MidTableSyncer):
+    name = 'mid_user_increment'
 
+    def initial_cursor(self):
+        return _latest_cursor(self.mid_table, 0)
 
-@bisheng_celery.task()
-def sync_mid_user_interact_dtl(start_date: str = None, end_date: str = None):
-    # Placeholder for syncing mid_user_interact_dtl table
-    trace_id_var.set(f"sync_mid_user_interact_dtl_task_{generate_uuid()}")
-    logger.info("Syncing mid_user_interact_dtl table...")
-    mid_table = UserInteract()
-    start_date, end_date = get_yesterday_date_range(mid_table, start_date, end_date)
-    if start_date is None or end_date is None:
-        return
-
-    page, page_size = 1, 1000
-    while True:
-        result = mid_table.get_records_by_time_range_sync(start_time=int(start_date.timestamp()),
-                                                          end_time=int(end_date.timestamp()),
-                                                          page=page,
-                                                          page_size=page_size)
-        page += 1
-        if not result:
-            break
+    def fetch(self, cursor, start_time, end_time, limit):
+        return UserDao.get_user_with_group_role_by_cursor(tuple(cursor) if cursor else None, start_time, end_time,
+                                                          limit)
+
+    def cursor_of(self, row):
+        return [row.update_time, row.user_id]
+
+    def to_records(self, rows):
+        return [UserIncrementRecord(
+            es_id=f"user_{user.user_id}",
+            user_id=user.user_id,
+            **user_context(user),
+            timestamp=int(user.create_time.timestamp())
+        ) for user in rows]
+
+
+class AppIncrementSyncer(MidTableSyncer):
+    name = 'mid_app_increment'
+
+    def __init__(self, mid_table):
+        super().__init__(mid_table)
+        self.user_map = {}
+
+    def initial_cursor(self):
+        return _latest_cursor(self.mid_table, '')
+
+    def fetch(self, cursor, start_time, end_time, limit):
+        return FlowDao.get_all_app_by_update_cursor(tuple(cursor) if cursor else None, start_time, end_time, limit)
+
+    def cursor_of(self, row):
+        return [row['update_time'], row['id']]
+
+    def to_records(self, rows):
+        user_map = get_user_from_ids_with_cache([app['user_id'] for app in rows], self.user_map)
+        return [AppIncrementRecord(
+            es_id=f"app_{app['id']}",
+            user_id=app['user_id'],
+            **user_context(user_map.get(app['user_id'])),
+            app_id=app['id'],
+            app_name=app['name'],
+            app_type=convert_flow_type(app['flow_type']),
+            timestamp=int(app['create_time'].timestamp())
+        ) for app in rows]
+
+
+class KnowledgeIncrementSyncer(MidTableSyncer):
+    name = 'mid_knowledge_increment'
+
+    def __init__(self, mid_table):
+        super().__init__(mid_table)
+        self.user_map = {}
+
+    def initial_cursor(self):
+        return _latest_cursor(self.mid_table, 0)
+
+    def fetch(self, cursor, start_time, end_time, limit):
+        return KnowledgeDao.get_knowledge_by_update_cursor(tuple(cursor) if cursor else None, start_time, end_time,
+                                                           limit)
+
+    def cursor_of(self, row):
+        return [row.update_time, row.id]
+
+    def to_records(self, rows):
+        user_map = get_user_from_ids_with_cache([knowledge.user_id for knowledge in rows], self.user_map)
+        return [KnowledgeIncrementRecord(
+            es_id=f"knowledge_{knowledge.id}",
+            user_id=knowledge.user_id,
+            **user_context(user_map.get(knowledge.user_id)),
+            knowledge_id=knowledge.id,
+            knowledge_name=knowledge.name,
+            knowledge_type=knowledge.type,
+            timestamp=int(knowledge.create_time.timestamp())
+        ) for knowledge in rows]
+
+
+class UserInteractSyncer(MidTableSyncer):
+    name = 'mid_user_interact_dtl'
+
+    def initial_cursor(self):
+        latest_time = self.mid_table.get_latest_record_time_sync()
+        # search_after on (timestamp, event_id), the sort value of a date field is epoch milliseconds
+        return [latest_time * 1000, ''] if latest_time else None
+
+    def fetch(self, cursor, start_time, end_time, limit):
+        return self.mid_table.get_records_after_sync(
+            search_after=cursor,
+            start_time=int(start_time.timestamp()) if start_time else None,
+            end_time=int(end_time.timestamp()) if end_time else None,
+            size=limit)
+
+    def cursor_of(self, row):
+        return row['sort']
+
+    def to_records(self, rows):
         records = []
-        for record in result:
+        for record in rows:
             es_id = record['_id']
             record = record['_source']
             records.append(UserInteractRecord(
@@ -228,6 +177,70 @@ def sync_mid_user_interact_dtl(start_date: str = None, end_date: str = None):
                 app_id=record['event_data']['message_feedback_app_id'],
                 app_name=record['event_data']['message_feedback_app_name'],
             ))
-        mid_table.insert_records_sync(records)
-    # Implement the actual logic here
-    logger.info("Successfully synced mid_user_interact_dtl table.")
+        return records
+
+
+MID_TABLE_SYNCERS = {
+    UserIncrementSyncer.name: (UserIncrementSyncer, UserIncrement),
+    AppIncrementSyncer.name: (AppIncrementSyncer, AppIncrement),
+    KnowledgeIncrementSyncer.name: (KnowledgeIncrementSyncer, KnowledgeIncrement),
+    UserInteractSyncer.name: (UserInteractSyncer, UserInteract),
+}
+
+
+def get_mid_table_syncer(name: str) -> MidTableSyncer:
+    syncer_cls, mid_table_cls = MID_TABLE_SYNCERS[name]
+    return syncer_cls(mid_table_cls())
+
+
+def run_mid_table_sync(name: str, start_date: str = None, end_date: str = None):
+    """ incremental sync by default, a backfill of the update time range when start_date and end_date are set """
+    trace_id_var.set(f"sync_{name}_task_{generate_uuid()}")
+    syncer = get_mid_table_syncer(name)
+    if start_date and end_date:
+        logger.info(f"Backfilling {name} from {start_date} to {end_date}")
+        syncer.backfill(datetime.fromisoformat(start_date), datetime.fromisoformat(end_date))
+    else:
+        syncer.sync_increment()
+    logger.info(f"Successfully synced {name} table.")
+
+
+@bisheng_celery.task()
+def sync_mid_user_increment(start_date: str = None, end_date: str = None):
+    run_mid_table_sync(UserIncrementSyncer.name, start_date, end_date)
+
+
+@bisheng_celery.task()
+def sync_mid_app_increment(start_date: str = None, end_date: str = None):
+    run_mid_table_sync(AppIncrementSyncer.name, start_date, end_date)
+
+
+@bisheng_celery.task()
+def sync_mid_knowledge_increment(start_date: str = None, end_date: str = None):
+    run_mid_table_sync(KnowledgeIncrementSyncer.name, start_date, end_date)
+
+
+@bisheng_celery.task()
+def sync_mid_user_interact_dtl(start_date: str = None, end_date: str = None):
+    run_mid_table_sync(UserInteractSyncer.name, start_date, end_date)
+
+
+@bisheng_celery.task()
+def sync_mid_tables():
+    """ incremental sync of all mid tables, one thread per table """
+    trace_id_var.set(f"sync_mid_tables_task_{generate_uuid()}")
+    res = sync_mid_tables_parallel([get_mid_table_syncer(name) for name in MID_TABLE_SYNCERS])
+    logger.info(f"Successfully synced mid tables: {res}")
+
+
+@bisheng_celery.task()
+def backfill_mid_table(name: str, start_date: str, end_date: str, max_batches: int = 50):
+    """
+    backfill one mid table in chunks of max_batches batches, the task queues itself again until
+    the range is done. A lost chunk can be continued by calling the task with the same arguments.
+    """
+    trace_id_var.set(f"backfill_{name}_task_{generate_uuid()}")
+    syncer = get_mid_table_syncer(name)
+    result = syncer.backfill(datetime.fromisoformat(start_date), datetime.fromisoformat(end_date), max_batches)
+    if not result.finished:
+        backfill_mid_table.delay(name, start_date, end_date, max_batches)
@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from loguru import logger
+
+from bisheng.core.logger import trace_id_var
+from bisheng.telemetry.domain.services.token_usage_rollup import TokenUsageRollupService
+from bisheng.utils import generate_uuid
+from bisheng.worker.main import bisheng_celery
+
+
+@bisheng_celery.task()
+def sync_token_usage_rollup(start_date: str = None, end_date: str = None):
+    """ roll up token usage since the last run, start_date/end_date (UTC, iso format) are used for backfills """
+    trace_id_var.set(f"sync_token_usage_rollup_task_{generate_uuid()}")
+    start = datetime.fromisoformat(start_date) if start_date else None
+    end = datetime.fromisoformat(end_date) if end_date else None
+    hwm = TokenUsageRollupService.rollup(start, end)
+    logger.info(f"Successfully synced token usage rollup, high water mark {hwm}")
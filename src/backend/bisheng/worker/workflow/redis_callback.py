@@ -1,12 +1,14 @@
 import asyncio
 import json
 import os
+import threading
 import time
 import uuid
 from typing import AsyncIterator, Iterator, Dict, List
 
 from langchain_core.documents import Document
 from loguru import logger
+from sqlalchemy.exc import IntegrityError
 
 from bisheng.api.v1.schema.workflow import WorkflowEventType
 from bisheng.api.v1.schemas import ChatResponse
@@ -40,6 +42,7 @@ class RedisCallback(BaseCallback):
         self.user_id = user_id
         self.workflow = None
         self.create_session = False
+        self._session_lock = threading.Lock()
         self.source = kwargs.get('source', 'platform')  # only platform or api
 
         self.redis_client = get_redis_client_sync()
@@ -419,34 +422,43 @@ class RedisCallback(BaseCallback):
 
         # Determine if a new session is needed
         if not self.create_session and chat_response.category != WorkflowEventType.UserInput.value:
-            # Insert a new session without session data
-            if not MessageSessionDao.get_one(self.chat_id):
-                db_workflow = FlowDao.get_flow_by_id(self.workflow_id)
-                MessageSessionDao.insert_one(MessageSession(
-                    chat_id=self.chat_id,
-                    flow_id=self.workflow_id,
-                    flow_name=db_workflow.name,
-                    flow_type=FlowType.WORKFLOW.value,
-                    user_id=self.user_id,
-                ))
-
-                # RecordTelemetryJournal
-                telemetry_service.log_event_sync(user_id=self.user_id,
-                                                 event_type=BaseTelemetryTypeEnum.NEW_MESSAGE_SESSION,
-                                                 trace_id=trace_id_var.get(),
-                                                 event_data=NewMessageSessionEventData(
-                                                     session_id=self.chat_id,
-                                                     app_id=self.workflow_id,
-                                                     source=self.source,
-                                                     app_name=db_workflow.name,
-                                                     app_type=ApplicationTypeEnum.WORKFLOW
-                                                 )
-                                                 )
-
-            self.create_session = True
+            with self._session_lock:
+                if not self.create_session:
+                    self._create_message_session()
+                    self.create_session = True
 
         return message.id
 
+    def _create_message_session(self):
+        """ insert the session of the chat once, another process may have inserted it already """
+        if MessageSessionDao.get_one(self.chat_id):
+            return
+        db_workflow = FlowDao.get_flow_by_id(self.workflow_id)
+        try:
+            MessageSessionDao.insert_one(MessageSession(
+                chat_id=self.chat_id,
+                flow_id=self.workflow_id,
+                flow_name=db_workflow.name,
+                flow_type=FlowType.WORKFLOW.value,
+                user_id=self.user_id,
+            ))
+        except IntegrityError:
+            logger.info(f'message session {self.chat_id} already created')
+            return
+
+        # RecordTelemetryJournal
+        telemetry_service.log_event_sync(user_id=self.user_id,
+                                         event_type=BaseTelemetryTypeEnum.NEW_MESSAGE_SESSION,
+                                         trace_id=trace_id_var.get(),
+                                         event_data=NewMessageSessionEventData(
+                                             session_id=self.chat_id,
+                                             app_id=self.workflow_id,
+                                             source=self.source,
+                                             app_name=db_workflow.name,
+                                             app_type=ApplicationTypeEnum.WORKFLOW
+                                         )
+                                         )
+
     def on_node_start(self, data: NodeStartData):
         """ node start event """
         logger.debug(f'node start: {data}')
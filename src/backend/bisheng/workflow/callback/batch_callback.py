@@ -0,0 +1,72 @@
+import contextvars
+import threading
+from typing import Any, Callable, List
+
+from bisheng.workflow.callback.base_callback import BaseCallback
+
+# index of the batch item the current thread runs
+_batch_item_index: contextvars.ContextVar = contextvars.ContextVar('batch_item_index', default=None)
+
+
+class BatchCallback(object):
+    """
+    Callback of the batch items of a node running in threads.
+    Every call is serialized with a lock. Stream chunks are sent at once, the other events of an item
+    are held back until the items before it are finished, so messages are saved in item order.
+    """
+
+    # events sent as they come, the frontend tells the items apart by output_key
+    LIVE_EVENTS = {'on_stream_msg'}
+
+    def __init__(self, callback: BaseCallback, num: int):
+        self._callback = callback
+        self._lock = threading.RLock()
+        self._pending: List[List[tuple]] = [[] for _ in range(num)]
+        self._finished = [False] * num
+        # the first item not finished yet, its events need not wait
+        self._head = 0
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._callback, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            index = _batch_item_index.get()
+            with self._lock:
+                if (index is None or index == self._head or not name.startswith('on_')
+                        or name in self.LIVE_EVENTS):
+                    return attr(*args, **kwargs)
+                self._pending[index].append((attr, args, kwargs))
+
+        return call
+
+    def run_item(self, index: int, func: Callable, *args) -> Any:
+        """ run one item, its held back events are released when it ends """
+        token = _batch_item_index.set(index)
+        try:
+            return func(*args)
+        finally:
+            _batch_item_index.reset(token)
+            self.finish(index)
+
+    def finish(self, index: int):
+        with self._lock:
+            self._finished[index] = True
+            while self._head < len(self._finished):
+                self._release(self._head)
+                if not self._finished[self._head]:
+                    break
+                self._head += 1
+
+    def flush(self):
+        """ release the events of all items, of the finished ones and of the ones that never ended """
+        with self._lock:
+            for index in range(self._head, len(self._pending)):
+                self._release(index)
+            self._head = len(self._pending)
+
+    def _release(self, index: int):
+        events, self._pending[index] = self._pending[index], []
+        for attr, args, kwargs in events:
+            attr(*args, **kwargs)
@@ -1,5 +1,5 @@
 import typing
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from langchain_core.messages import HumanMessage
 from langchain_core.retrievers import BaseRetriever
@@ -257,31 +257,21 @@ class AgentNode(BaseNode):
         self._init_agent(system_prompt)
 
         if self._tab == 'single':
-            self._tool_invoke_list.append([])
-            ret['output'], reasoning_content = self._run_once(None, unique_id, 'output', self._tool_invoke_list[0])
-            self._log_reasoning_content.append(reasoning_content)
-            if self._output_user:
-                self.callback_manager.on_stream_over(StreamMsgOverData(node_id=self.id,
-                                                                       name=self.name,
-                                                                       msg=ret['output'],
-                                                                       reasoning_content=reasoning_content,
-                                                                       unique_id=unique_id,
-                                                                       output_key='output'))
+            self._init_log_list(1)
+            ret['output'], reasoning_content = self._run_item(0, None, unique_id, 'output')
         else:
-            for index, one in enumerate(self.node_params['batch_variable']):
+            batch_variable = self.node_params['batch_variable']
+            self._init_log_list(len(batch_variable))
+            for one in batch_variable:
                 self._batch_variable_list.append(self.get_other_node_variable(one))
-                output_key = self.node_params['output'][index]['key']
-                self._tool_invoke_list.append([])
-                ret[output_key], reasoning_content = self._run_once(one, unique_id, output_key,
-                                                                    self._tool_invoke_list[index])
-                self._log_reasoning_content.append(reasoning_content)
-                if self._output_user:
-                    self.callback_manager.on_stream_over(StreamMsgOverData(node_id=self.id,
-                                                                           name=self.name,
-                                                                           msg=ret[output_key],
-                                                                           reasoning_content=reasoning_content,
-                                                                           unique_id=unique_id,
-                                                                           output_key=output_key))
+
+            # items run concurrently, stream events are told apart by their output_key
+            outputs = self.run_batch(
+                batch_variable,
+                lambda index, one: self._run_item(index, one, unique_id, self.node_params['output'][index]['key']),
+                on_error=lambda index, e: (f'Error: {e}', ''))
+            for index, (output, _) in enumerate(outputs):
+                ret[self.node_params['output'][index]['key']] = output
 
         logger.debug('agent_over result={}', ret)
         if self._output_user:
@@ -292,6 +282,25 @@ class AgentNode(BaseNode):
 
         return ret
 
+    def _init_log_list(self, num: int):
+        """ log lists are filled by item index, batch items finish in any order """
+        self._user_prompt_list = [''] * num
+        self._tool_invoke_list = [[] for _ in range(num)]
+        self._log_reasoning_content = [''] * num
+
+    def _run_item(self, index: int, input_variable: Optional[str], unique_id: str, output_key: str) -> (str, str):
+        output, reasoning_content = self._run_once(input_variable, unique_id, output_key,
+                                                   self._tool_invoke_list[index], index)
+        self._log_reasoning_content[index] = reasoning_content
+        if self._output_user:
+            self.callback_manager.on_stream_over(StreamMsgOverData(node_id=self.id,
+                                                                   name=self.name,
+                                                                   msg=output,
+                                                                   reasoning_content=reasoning_content,
+                                                                   unique_id=unique_id,
+                                                                   output_key=output_key))
+        return output, reasoning_content
+
     def parse_log(self, unique_id: str, result: dict) -> Any:
         ret = []
         index = 0
@@ -346,13 +355,14 @@ class AgentNode(BaseNode):
         return ret
 
     def _run_once(self, input_variable: str = None, unique_id: str = None, output_key: str = None,
-                  tool_invoke_list: list = None) -> (str, str):
+                  tool_invoke_list: list = None, index: int = 0) -> (str, str):
         """
         params:
             input_variable: Input variables, if yesbatchthen you need to pass in a variablekey, otherwiseNone
             unique_id: Node Execute Uniqueid
             output_key: Output Variableskey
             tool_invoke_list: Tool Call Log
+            index: Index of the batch item
         return:
             0: Output results to user
             1: Process of model thinking
@@ -366,7 +376,7 @@ class AgentNode(BaseNode):
                 continue
             variable_map[one] = self.get_other_node_variable(one)
         user = self._user_prompt.format(variable_map)
-        self._user_prompt_list.append(user)
+        self._user_prompt_list[index] = user
 
         chat_history = []
         if self._chat_history_flag:
@@ -1,14 +1,19 @@
 import base64
+import contextvars
 import copy
 import uuid
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from typing import Any, Callable, Dict, List, Optional
 
 from langchain_core.messages import HumanMessage
+from loguru import logger
 
+from bisheng.common.services.config_service import settings
 from bisheng.user.domain.models.user import UserDao
 from bisheng.utils.exceptions import IgnoreException
 from bisheng.workflow.callback.base_callback import BaseCallback
+from bisheng.workflow.callback.batch_callback import BatchCallback
 from bisheng.workflow.callback.event import NodeEndData, NodeStartData
 from bisheng.workflow.common.node import BaseNodeData, NodeType
 from bisheng.workflow.edges.edges import EdgeBase
@@ -181,6 +186,63 @@ class BaseNode(ABC):
                 })
         return human_message
 
+    def get_batch_concurrency(self) -> int:
+        concurrency = self.node_params.get('batch_concurrency')
+        if not concurrency:
+            concurrency = settings.get_workflow_conf().batch_concurrency
+        return max(int(concurrency), 1)
+
+    def run_batch(self, items: List[Any], func: Callable[[int, Any], Any],
+                  on_error: Optional[Callable[[int, Exception], Any]] = None) -> List[Any]:
+        """
+        Run func(index, item) for every batch item with bounded concurrency, results keep the item order.
+        A failed item fails the node, unless the node param batch_error_policy is 'continue',
+        then on_error(index, error) gives the result of the item.
+        """
+        if not items:
+            return []
+        concurrency = min(self.get_batch_concurrency(), len(items))
+        continue_on_error = self.node_params.get('batch_error_policy') == 'continue' and on_error is not None
+
+        def _run_one(index: int, item: Any) -> Any:
+            if self.stop_flag:
+                raise IgnoreException('stop by user')
+            try:
+                return func(index, item)
+            except IgnoreException:
+                raise
+            except Exception as e:
+                if not continue_on_error:
+                    raise
+                logger.warning(f'{self.name} batch item {index} failed: {e}')
+                return on_error(index, e)
+
+        if concurrency == 1:
+            return [_run_one(index, item) for index, item in enumerate(items)]
+
+        # the callbacks are not thread safe, the items share a serialized one that keeps their event order
+        callback = self.callback_manager
+        batch_callback = BatchCallback(callback, len(items))
+        self.callback_manager = batch_callback
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'batch_{self.id}') as executor:
+                # every item runs in a copy of the caller context, so the trace id and similar vars follow it
+                futures = [executor.submit(contextvars.copy_context().run, batch_callback.run_item, index,
+                                           _run_one, index, item)
+                           for index, item in enumerate(items)]
+                done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+                if not_done:
+                    # one item failed, the items not started yet are dropped
+                    for future in not_done:
+                        future.cancel()
+        finally:
+            self.callback_manager = callback
+            batch_callback.flush()
+        for future in futures:
+            if future.done() and not future.cancelled() and future.exception():
+                raise future.exception()
+        return [future.result() for future in futures]
+
     def run(self, state: dict) -> Any:
         """
         Run node entry
@@ -51,20 +51,35 @@ class LLMNode(BaseNode):
 
         result = {}
         if self._tab == 'single':
+            self._init_log_list(1)
             result['output'], reasoning_content = self._run_once(None, unique_id, 'output')
-            self._log_reasoning_content.append(reasoning_content)
+            self._log_reasoning_content[0] = reasoning_content
         else:
-            for index, one in enumerate(self.node_params['batch_variable']):
+            batch_variable = self.node_params['batch_variable']
+            self._init_log_list(len(batch_variable))
+            for one in batch_variable:
                 self._batch_variable_list.append(self.get_other_node_variable(one))
-                output_key = self.node_params['output'][index]['key']
-                result[output_key], reasoning_content = self._run_once(one, unique_id, output_key)
-                self._log_reasoning_content.append(reasoning_content)
+
+            def _run_item(index: int, one: str) -> (str, str):
+                return self._run_once(one, unique_id, self.node_params['output'][index]['key'], index)
+
+            # items run concurrently, stream events are told apart by their output_key
+            outputs = self.run_batch(batch_variable, _run_item, on_error=lambda index, e: (f'Error: {e}', ''))
+            for index, (output, reasoning_content) in enumerate(outputs):
+                result[self.node_params['output'][index]['key']] = output
+                self._log_reasoning_content[index] = reasoning_content
 
         if self._output_user:
             for k, v in result.items():
                 self.graph_state.save_context(content=v, msg_sender='AI')
         return result
 
+    def _init_log_list(self, num: int):
+        """ log lists are filled by item index, batch items finish in any order """
+        self._system_prompt_list = [''] * num
+        self._user_prompt_list = [''] * num
+        self._log_reasoning_content = [''] * num
+
     def parse_log(self, unique_id: str, result: dict) -> Any:
         ret = []
         index = 0
@@ -86,7 +101,8 @@ class LLMNode(BaseNode):
     def _run_once(self,
                   input_variable: str = None,
                   unique_id: str = None,
-                  output_key: str = None) -> (str, str):
+                  output_key: str = None,
+                  index: int = 0) -> (str, str):
         # Description is a variable that references a batch, The value of the variable needs to be replaced with the variable selected by the user
         special_variable = f'{self.id}.batch_variable'
         variable_map = {}
@@ -96,7 +112,7 @@ class LLMNode(BaseNode):
                 continue
             variable_map[one] = self.get_other_node_variable(one)
         system = self._system_prompt.format(variable_map)
-        self._system_prompt_list.append(system)
+        self._system_prompt_list[index] = system
 
         variable_map = {}
         for one in self._user_variables:
@@ -105,7 +121,7 @@ class LLMNode(BaseNode):
                 continue
             variable_map[one] = self.get_other_node_variable(one)
         user = self._user_prompt.format(variable_map)
-        self._user_prompt_list.append(user)
+        self._user_prompt_list[index] = user
 
         logger.debug(
             f'outputkey={output_key} workflow llm node prompt: system: {system}\nuser: {user}')
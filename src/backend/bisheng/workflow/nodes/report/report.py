@@ -1,7 +1,9 @@
+import contextvars
 import io
 import os
 import re
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
 from typing import Dict, Tuple, Any, List, Optional
@@ -14,11 +16,22 @@ from charset_normalizer import detect
 from loguru import logger
 from openpyxl import load_workbook
 
+from bisheng.common.services.config_service import settings
 from bisheng.core.storage.minio.minio_manager import get_minio_storage_sync
+from bisheng.services.cache.service import InMemoryCache
 from bisheng.utils.docx_temp import DocxTemplateRender
 from bisheng.workflow.callback.event import OutputMsgData
 from bisheng.workflow.nodes.base import BaseNode
 
+# Templates kept by one process, keyed by (version key, etag), value is (content, template variables)
+_template_cache = InMemoryCache(max_size=32, expiration_time=24 * 3600)
+# Chunk size of streamed resource downloads
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class ResourceTooLargeError(Exception):
+    """Resource is larger than the download size cap"""
+
 
 class ResourceType(Enum):
     """Resource Type Enumeration"""
@@ -200,8 +213,17 @@ class OverlapResolver:
 class PatternMatcher:
     """Pattern matchers, which are responsible for identifying various resources in the content"""
 
+    # (pattern, compiled regex), built once per process
+    _compiled: Optional[List[Tuple[MatchPattern, re.Pattern]]] = None
+
     def __init__(self):
-        self.patterns = [
+        if PatternMatcher._compiled is None:
+            PatternMatcher._compiled = [(one, re.compile(one.pattern, one.flags)) for one in self._build_patterns()]
+        self.patterns = [one for one, _ in PatternMatcher._compiled]
+
+    @staticmethod
+    def _build_patterns() -> List[MatchPattern]:
+        return [
             # Priority1: MarkdownImages (The clearest format)
             MatchPattern(
                 name="markdown_image",
@@ -280,8 +302,12 @@ class PatternMatcher:
         """Find all matches in content"""
         all_matches = []
 
-        for pattern in self.patterns:
-            for match in re.finditer(pattern.pattern, content, pattern.flags):
+        # Every pattern needs a file extension or a table cell separator
+        if "." not in content and "|" not in content:
+            return all_matches
+
+        for pattern, regex in PatternMatcher._compiled:
+            for match in regex.finditer(content):
                 match_info = {
                     "pattern_name": pattern.name,
                     "resource_type": pattern.resource_type,
@@ -758,12 +784,19 @@ class ContentParser:
 
 
 class ResourceDownloadManager:
-    """Resource Download Manager"""
+    """
+    Resource Download Manager
+    Resources are fetched by a thread pool, a path used by several resources is fetched once.
+    HTTP and MinIO downloads are streamed to temporary files and stop at max_size bytes.
+    """
 
-    def __init__(self, minio_client):
+    def __init__(self, minio_client, max_workers: int = 1, timeout: int = 30, max_size: int = 0):
         self.minio_client = minio_client
         self.temp_files: List[str] = []  # Manage all temporary files
         self.logger = logger
+        self.max_workers = max(max_workers, 1)
+        self.timeout = timeout
+        self.max_size = max_size  # 0 means no limit
 
     def download_all_resources(self, resources: List[ResourceData]) -> Dict[str, Any]:
         """
@@ -779,29 +812,40 @@ class ResourceDownloadManager:
 
         self.logger.info(f"Start downloading resources: Images {len(image_resources)} Pcs, Table Filter {len(table_resources)} Pcs")
 
+        # Group the resources by path, MarkdownThe form has been processed in the parsing phase
+        groups: Dict[Tuple[ResourceType, str], List[ResourceData]] = {}
+        for resource in image_resources + table_resources:
+            if resource.resource_type == ResourceType.TABLE and resource.table_source not in [
+                    TableSource.CSV_CONTENT, TableSource.EXCEL_CONTENT]:
+                continue
+            groups.setdefault((resource.resource_type, resource.original_path), []).append(resource)
+
+        fetched = self._fetch_concurrently([group[0] for group in groups.values()])
+        errors = {}
+        for group, error in zip(groups.values(), fetched):
+            for duplicate in group[1:]:
+                self._copy_download_result(group[0], duplicate)
+            for resource in group:
+                errors[id(resource)] = error
+
+        self.logger.info(f"Distinct resource paths downloaded: {len(groups)}, workers: {self.max_workers}")
+
         # Download image resources
         for resource in image_resources:
-            try:
-                self._download_image_resource(resource)
-                if resource.download_success:
-                    stats["images_success"] += 1
-                else:
-                    stats["images_failed"] += 1
-            except Exception as e:
+            if error := errors.get(id(resource)):
+                stats["images_failed"] += 1
+                stats["errors"].append(f"This image failed to load {resource.original_path}: {error}")
+            elif resource.download_success:
+                stats["images_success"] += 1
+            else:
                 stats["images_failed"] += 1
-                stats["errors"].append(f"This image failed to load {resource.original_path}: {str(e)}")
-                self.logger.error(f"Abnormal image download: {str(e)}")
 
         # Processing Table Resources
         for resource in table_resources:
             try:
-                if resource.table_source == TableSource.MARKDOWN_TABLE:
-                    # MarkdownThe form has been processed in the parsing phase, just verify
-                    self._validate_table_resource(resource)
-                elif resource.table_source in [TableSource.CSV_CONTENT, TableSource.EXCEL_CONTENT]:
-                    # Excel/CSVFile needs to be downloaded and parsed
-                    self._download_and_parse_table_file(resource)
-                    self._validate_table_resource(resource)
+                if error := errors.get(id(resource)):
+                    raise Exception(error)
+                self._validate_table_resource(resource)
                 stats["tables_processed"] += 1
             except Exception as e:
                 stats["errors"].append(f"Form processing failed {resource.file_name}: {str(e)}")
@@ -813,6 +857,40 @@ class ResourceDownloadManager:
 
         return stats
 
+    def _fetch_concurrently(self, resources: List[ResourceData]) -> List[Optional[str]]:
+        """Download every resource, returns the error message of each resource"""
+
+        def _fetch(resource: ResourceData) -> Optional[str]:
+            try:
+                if resource.resource_type == ResourceType.IMAGE:
+                    self._download_image_resource(resource)
+                else:
+                    # Excel/CSVFile needs to be downloaded and parsed
+                    self._download_and_parse_table_file(resource)
+                return None
+            except Exception as e:
+                self.logger.error(f"Abnormal resource download: {resource.original_path}, {str(e)}")
+                return str(e)
+
+        if self.max_workers == 1 or len(resources) <= 1:
+            return [_fetch(resource) for resource in resources]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(resources)),
+                                thread_name_prefix="report_fetch") as executor:
+            futures = [executor.submit(contextvars.copy_context().run, _fetch, resource) for resource in resources]
+            return [future.result() for future in futures]
+
+    @staticmethod
+    def _copy_download_result(source: ResourceData, target: ResourceData):
+        """Give a resource the download result of another resource with the same path"""
+        target.image_source = source.image_source
+        target.local_path = source.local_path
+        target.download_success = source.download_success
+        target.error_message = source.error_message
+        if source.table_data is not None:
+            target.table_data = [list(row) for row in source.table_data]
+        if source.alignments is not None:
+            target.alignments = list(source.alignments)
+
     def _download_image_resource(self, resource: ResourceData):
         """Download individual image assets"""
         if resource.image_source == ImageSource.LOCAL_FILE:
@@ -914,23 +992,11 @@ class ResourceDownloadManager:
         """
         try:
             # Checks to see if file exists.
-            if not self.minio_client.object_exists_sync(bucket_name, object_name):
+            temp_file = self._save_minio_object(bucket_name, object_name)
+            if not temp_file:
                 self.logger.debug(f"MinIOFile don\'t exists: {bucket_name}/{object_name}")
                 return False
 
-            # Download File Contents
-            file_content = self.minio_client.get_object_sync(bucket_name, object_name)
-
-            # Generate temporary filename
-            file_ext = os.path.splitext(object_name)[1] or ".dat"
-            filename = f"{uuid4().hex}{file_ext}"
-            temp_dir = tempfile.gettempdir()
-            temp_file = os.path.join(temp_dir, filename)
-
-            # Save to Temporary File
-            with open(temp_file, "wb") as f:
-                f.write(file_content)
-
             # Update resource information
             resource.local_path = temp_file
             resource.download_success = True
@@ -1025,18 +1091,8 @@ class ResourceDownloadManager:
         bucket_name, object_name = self._parse_path_for_minio(file_path)
         if bucket_name and object_name:
             try:
-                if self.minio_client.object_exists_sync(bucket_name, object_name):
-                    file_content = self.minio_client.get_object_sync(bucket_name, object_name)
-
-                    # Generate Temporary Files
-                    file_ext = os.path.splitext(object_name)[1] or ".dat"
-                    filename = f"{uuid4().hex}{file_ext}"
-                    temp_dir = tempfile.gettempdir()
-                    temp_file = os.path.join(temp_dir, filename)
-
-                    with open(temp_file, "wb") as f:
-                        f.write(file_content)
-
+                temp_file = self._save_minio_object(bucket_name, object_name)
+                if temp_file:
                     self.temp_files.append(temp_file)
                     self.logger.info(f"MinIOForm file downloaded successfully: {bucket_name}/{object_name} -> {temp_file}")
                     return temp_file
@@ -1149,7 +1205,7 @@ class ResourceDownloadManager:
                               "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
             }
 
-            response = requests.get(url, headers=headers, timeout=30, verify=False)
+            response = requests.get(url, headers=headers, timeout=self.timeout, verify=False, stream=True)
             response.raise_for_status()
 
             # Get filename
@@ -1169,8 +1225,9 @@ class ResourceDownloadManager:
             temp_dir = tempfile.gettempdir()
             temp_file = os.path.join(temp_dir, filename)
 
-            with open(temp_file, "wb") as f:
-                f.write(response.content)
+            with response:
+                self._check_size(int(response.headers.get("Content-Length") or 0), url)
+                self._write_chunks(temp_file, response.iter_content(DOWNLOAD_CHUNK_SIZE), url)
 
             return temp_file, True
 
@@ -1178,6 +1235,42 @@ class ResourceDownloadManager:
             self.logger.error(f"Download failed: {url}, Error-free: {str(e)}")
             return "", False
 
+    def _save_minio_object(self, bucket_name: str, object_name: str) -> Optional[str]:
+        """Stream a MinIO object to a temporary file, None when the object does not exist"""
+        try:
+            stat = self.minio_client.minio_client_sync.stat_object(bucket_name, object_name)
+        except Exception as e:
+            if 'code: NoSuchKey' in str(e):
+                return None
+            raise e
+        self._check_size(stat.size or 0, f"{bucket_name}/{object_name}")
+
+        # Generate temporary filename
+        file_ext = os.path.splitext(object_name)[1] or ".dat"
+        temp_file = os.path.join(tempfile.gettempdir(), f"{uuid4().hex}{file_ext}")
+        self._write_chunks(temp_file, self.minio_client.iter_object_sync(bucket_name, object_name,
+                                                                         chunk_size=DOWNLOAD_CHUNK_SIZE),
+                           f"{bucket_name}/{object_name}")
+        return temp_file
+
+    def _check_size(self, size: int, source: str):
+        if self.max_size and size > self.max_size:
+            raise ResourceTooLargeError(f"{source} is {size} bytes, larger than {self.max_size} bytes")
+
+    def _write_chunks(self, temp_file: str, chunks, source: str):
+        """Write the chunks to the file, the partial file is removed when the size cap is passed"""
+        size = 0
+        try:
+            with open(temp_file, "wb") as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    self._check_size(size, source)
+                    f.write(chunk)
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
     def _download_file_from_minio(self, minio_path: str) -> Tuple[str, bool]:
         """FROMMinIODownload file"""
         try:
@@ -1396,13 +1489,9 @@ class ReportNode(BaseNode):
         download_manager = None
 
         try:
-            # 1. Download sample
-            logger.info("=== Walking Tongs1: Download report template ===")
-            template_content = self._download_template()
-
-            # 2. Resolve Template Variables
-            logger.info("=== Walking Tongs2: Resolve Template Variables ===")
-            template_variables = self._extract_template_variables(template_content)
+            # 1. Download sample and 2. Resolve Template Variables, cached per template version
+            logger.info("=== Walking Tongs1-2: Load report template and its variables ===")
+            template_content, template_variables = self._load_template()
 
             # 3. Get workflow variables
             logger.info("=== Walking Tongs3: Get workflow variables ===")
@@ -1445,7 +1534,11 @@ class ReportNode(BaseNode):
 
             # 5. Download all resources
             logger.info("=== Walking Tongs5: Download Resource File ===")
-            download_manager = ResourceDownloadManager(self._minio_client)
+            workflow_conf = settings.get_workflow_conf()
+            download_manager = ResourceDownloadManager(self._minio_client,
+                                                       max_workers=workflow_conf.report_fetch_concurrency,
+                                                       timeout=workflow_conf.report_fetch_timeout,
+                                                       max_size=workflow_conf.report_max_resource_size)
             download_stats = download_manager.download_all_resources(all_resources)
 
             self._log_download_stats(download_stats)
@@ -1475,15 +1568,27 @@ class ReportNode(BaseNode):
             #     download_manager.cleanup()
             pass
 
-    def _download_template(self) -> bytes:
-        """Download sample"""
-        if not self._minio_client.object_exists_sync(self._minio_client.bucket, self._object_name):
-            raise Exception(f"Template file does not exists!: {self._object_name}")
+    def _load_template(self) -> Tuple[bytes, set]:
+        """Template content and its variables, cached by version key and etag"""
+        try:
+            stat = self._minio_client.minio_client_sync.stat_object(self._minio_client.bucket, self._object_name)
+        except Exception as e:
+            if 'code: NoSuchKey' in str(e):
+                raise Exception(f"Template file does not exists!: {self._object_name}")
+            raise e
+
+        cache_key = (self._version_key, stat.etag)
+        if cached := _template_cache.get(cache_key):
+            logger.info(f"Template cache hit: {self._object_name}, etag: {stat.etag}")
+            return cached
 
         template_content = self._minio_client.get_object_sync(self._minio_client.bucket, self._object_name)
         logger.info(f"Template downloaded successfully, size: {len(template_content)} byte")
-
-        return template_content
+        template_variables = self._extract_template_variables(template_content)
+        if template_variables:
+            # a template that failed to parse is downloaded again next time
+            _template_cache.set(cache_key, (template_content, template_variables))
+        return template_content, template_variables
 
     def _get_filtered_workflow_variables(self, template_variables: set) -> Dict[str, Any]:
         """Get filtered workflow variables"""
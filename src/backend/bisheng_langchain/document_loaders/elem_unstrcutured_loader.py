@@ -9,6 +9,8 @@ import requests
 from langchain_community.docstore.document import Document
 from langchain_community.document_loaders.pdf import BasePDFLoader
 
+from bisheng_langchain.document_loaders.parsers.partition_client import PartitionClient
+
 logger = logging.getLogger(__name__)
 
 
@@ -71,10 +73,19 @@ class ElemUnstructuredLoader(BasePDFLoader):
                  start: int = 0,
                  n: int = None,
                  verbose: bool = False,
+                 timeout: int = 600,
+                 shard_pages: int = 50,
+                 max_concurrency: int = 4,
+                 max_retries: int = 2,
                  kwargs: dict = {}) -> None:
         """Initialize with a file path."""
         self.unstructured_api_url = unstructured_api_url
         self.unstructured_api_key = unstructured_api_key
+        self.partition_client = PartitionClient(unstructured_api_url,
+                                                timeout=timeout,
+                                                shard_pages=shard_pages,
+                                                max_workers=max_concurrency,
+                                                max_retries=max_retries)
         self.force_ocr = force_ocr
         self.enable_formular = enable_formular
         self.filter_page_header_footer = filter_page_header_footer
@@ -89,27 +100,14 @@ class ElemUnstructuredLoader(BasePDFLoader):
 
     def load(self) -> List[Document]:
         """Load given path as pages."""
-        b64_data = base64.b64encode(open(self.file_path, 'rb').read()).decode()
-        parameters = {'start': self.start, 'n': self.n}
-        parameters.update(self.extra_kwargs)
         # TODO: add filter_page_header_footer into payload when elt4llm is ready.
-        payload = dict(filename=os.path.basename(self.file_name),
-                       b64_data=[b64_data],
-                       mode='partition',
-                       force_ocr=self.force_ocr,
-                       enable_formula=self.enable_formular,
-                       ocr_sdk_url=self.ocr_sdk_url,
-                       parameters=parameters)
-
-        resp = requests.post(self.unstructured_api_url, headers=self.headers, json=payload)
-        if resp.status_code != 200:
-            raise Exception(
-                f'file partition {os.path.basename(self.file_name)} failed resp={resp.text}')
-
-        resp = resp.json()
-        if 200 != resp.get('status_code'):
-            logger.info(f'file partition {os.path.basename(self.file_name)} error resp={resp}')
-            raise Exception(f'file partition error {os.path.basename(self.file_name)} error resp={resp}')
+        fields = dict(mode='partition',
+                      force_ocr=self.force_ocr,
+                      enable_formula=self.enable_formular,
+                      ocr_sdk_url=self.ocr_sdk_url,
+                      parameters=dict(self.extra_kwargs))
+        # large pdfs are partitioned in page shards, the body is streamed from the file
+        resp = self.partition_client.partition(self.file_path, self.file_name, fields, start=self.start, n=self.n)
         partitions = resp['partitions']
         if partitions:
             logger.info(f'content_from_partitions')
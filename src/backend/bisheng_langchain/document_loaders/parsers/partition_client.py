@@ -0,0 +1,188 @@
+# flake8: noqa
+"""Client of the etl4lm partition service.
+
+Large PDFs are split into page ranges, the shards are partitioned concurrently and the
+partitions are merged back with the page numbers of the whole file. Every request body is
+streamed from the file, the base64 payload is never built in memory as one string.
+"""
+import base64
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# bytes read per chunk of the streamed body, a multiple of 3 so the base64 chunks join without padding
+STREAM_CHUNK_SIZE = 3 * 256 * 1024
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class PartitionTimeoutError(Exception):
+    """The partition service did not answer in time"""
+
+
+def iter_json_payload(fields: Dict[str, Any], file_path: str, file_key: str = 'b64_data',
+                      chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """json body of `fields` plus `file_key: [<base64 of the file>]`, produced chunk by chunk"""
+    head = json.dumps(fields, ensure_ascii=False)
+    prefix = head[:-1] + (', ' if fields else '') + json.dumps(file_key) + ': ["'
+    yield prefix.encode('utf-8')
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            yield base64.b64encode(chunk)
+    yield b'"]}'
+
+
+def offset_partitions(partitions: List[Dict], page_offset: int) -> List[Dict]:
+    """move the page numbers of a shard to the page numbers of the whole file"""
+    if not page_offset:
+        return partitions
+    for part in partitions:
+        metadata = part.get('metadata') or {}
+        extra_data = metadata.get('extra_data') or {}
+        if extra_data.get('pages'):
+            extra_data['pages'] = [page + page_offset for page in extra_data['pages']]
+        if isinstance(metadata.get('page_number'), int):
+            metadata['page_number'] += page_offset
+    return partitions
+
+
+class PartitionClient(object):
+    """
+    params:
+        url: partition service address
+        timeout: seconds of one request
+        shard_pages: pages of one shard, PDFs with more pages are sharded, 0 disables sharding
+        max_workers: shards partitioned at the same time
+        max_retries: retries of a shard on connection errors, timeouts and 429 / 5xx answers
+    """
+
+    def __init__(self,
+                 url: str,
+                 timeout: int = 600,
+                 shard_pages: int = 50,
+                 max_workers: int = 4,
+                 max_retries: int = 2,
+                 backoff: float = 1.0,
+                 headers: Optional[Dict] = None):
+        self.url = url
+        self.timeout = timeout
+        self.shard_pages = shard_pages
+        self.max_workers = max(max_workers, 1)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.headers = headers or {'Content-Type': 'application/json'}
+
+    def partition(self, file_path: str, file_name: str, fields: Dict[str, Any],
+                  start: int = 0, n: Optional[int] = None) -> Dict[str, Any]:
+        """
+        partition a file, the answer has the format of the partition service:
+        status_code, partitions, text and b64_pdf when the service converted the file
+        """
+        parameters = dict(fields.get('parameters') or {})
+        shards = self._page_shards(file_path, file_name, start, n)
+        if len(shards) <= 1:
+            parameters.update({'start': start, 'n': n})
+            return self._post(file_path, file_name, {**fields, 'parameters': parameters})
+
+        parameters.update({'start': 0, 'n': None})
+        logger.info(f'partition {file_name} in {len(shards)} shards of {self.shard_pages} pages')
+        tmp_dir = tempfile.mkdtemp(prefix='partition_')
+        try:
+            shard_files = self._split_pdf(file_path, shards, tmp_dir)
+
+            def _run(index: int) -> Dict[str, Any]:
+                shard_start, _ = shards[index]
+                name = f'{os.path.splitext(os.path.basename(file_name))[0]}_{shard_start}.pdf'
+                return self._post(shard_files[index], name, {**fields, 'parameters': parameters})
+
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(shards)),
+                                    thread_name_prefix='partition') as executor:
+                results = list(executor.map(_run, range(len(shards))))
+            return self._merge_results(results, shards, shard_files)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _page_shards(self, file_path: str, file_name: str, start: int, n: Optional[int]) -> List[Tuple[int, int]]:
+        """[(first page, page count)] of every shard, one shard when the file is not sharded"""
+        if not self.shard_pages or not file_name.lower().endswith('.pdf'):
+            return []
+        try:
+            import fitz
+            with fitz.open(file_path) as doc:
+                page_count = doc.page_count
+        except Exception as e:
+            logger.warning(f'count pages of {file_name} failed, partition it in one request: {e}')
+            return []
+        end = page_count if n is None else min(page_count, start + n)
+        return [(one, min(self.shard_pages, end - one)) for one in range(start, end, self.shard_pages)]
+
+    @staticmethod
+    def _split_pdf(file_path: str, shards: List[Tuple[int, int]], tmp_dir: str) -> List[str]:
+        import fitz
+        shard_files = []
+        with fitz.open(file_path) as doc:
+            for shard_start, count in shards:
+                shard_file = os.path.join(tmp_dir, f'{shard_start}.pdf')
+                with fitz.open() as shard:
+                    shard.insert_pdf(doc, from_page=shard_start, to_page=shard_start + count - 1)
+                    shard.save(shard_file)
+                shard_files.append(shard_file)
+        return shard_files
+
+    def _post(self, file_path: str, file_name: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        fields = {**fields, 'filename': os.path.basename(file_name)}
+        for i in range(self.max_retries + 1):
+            retry = i < self.max_retries
+            try:
+                resp = requests.post(self.url, headers=self.headers, data=iter_json_payload(fields, file_path),
+                                     timeout=self.timeout)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                if not retry:
+                    if isinstance(e, requests.Timeout) or 'Timeout' in str(e):
+                        logger.error(f'Request to etl4lm API timed out: {e}')
+                        raise PartitionTimeoutError('etl4lm server timeout')
+                    raise e
+                logger.warning(f'file partition {file_name} request error, retry {i + 1}: {e}')
+            else:
+                if resp.status_code == 200:
+                    res = resp.json()
+                    if 200 != res.get('status_code'):
+                        logger.info(f'file partition {file_name} error resp={res}')
+                        raise Exception(f'file partition error {file_name} error resp={res}')
+                    return res
+                if resp.status_code not in RETRY_STATUS or not retry:
+                    raise Exception(f'file partition {file_name} failed resp={resp.text}')
+                logger.warning(f'file partition {file_name} status={resp.status_code}, retry {i + 1}')
+            time.sleep(self.backoff * (2 ** i) * (1 + random.random() * 0.25))
+
+    @staticmethod
+    def _merge_results(results: List[Dict], shards: List[Tuple[int, int]], shard_files: List[str]) -> Dict:
+        partitions, texts = [], []
+        for res, (shard_start, _) in zip(results, shards):
+            partitions.extend(offset_partitions(res.get('partitions') or [], shard_start))
+            if res.get('text'):
+                texts.append(res['text'])
+        merged = {'status_code': 200, 'partitions': partitions, 'text': '\n'.join(texts)}
+
+        if any(res.get('b64_pdf') for res in results):
+            # the service changed the pdf, join the changed shards in page order
+            import fitz
+            with fitz.open() as doc:
+                for res, shard_file in zip(results, shard_files):
+                    if res.get('b64_pdf'):
+                        with fitz.open(stream=base64.b64decode(res['b64_pdf']), filetype='pdf') as one:
+                            doc.insert_pdf(one)
+                    else:
+                        with fitz.open(shard_file) as one:
+                            doc.insert_pdf(one)
+                merged['b64_pdf'] = base64.b64encode(doc.tobytes()).decode()
+        return merged
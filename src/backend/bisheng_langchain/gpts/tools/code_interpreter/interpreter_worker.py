@@ -0,0 +1,202 @@
+"""Warm interpreter worker of the code interpreter pool.
+
+The worker imports the common data analysis libraries once and then serves execution requests
+read as json lines from stdin. Every request runs in a child forked from the warm worker, so the
+imports are shared but no state leaks from one execution to the next. The child gets its own
+process group, working directory and resource limits, the result is written as one json line.
+
+Only the standard library is used here, the script is started by file path.
+"""
+import json
+import os
+import resource
+import runpy
+import signal
+import sys
+import time
+import traceback
+
+VIOLATION_TIMEOUT = 'timeout'
+VIOLATION_CPU = 'cpu'
+VIOLATION_MEMORY = 'memory'
+VIOLATION_FILE_SIZE = 'file_size'
+VIOLATION_OUTPUT = 'output'
+VIOLATION_KILLED = 'killed'
+
+
+def _preload(modules):
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    for name in modules:
+        try:
+            __import__(name)
+        except Exception as e:
+            print(f'code interpreter worker preload {name} failed: {e}', file=sys.stderr)
+
+
+def _set_limit(kind, value):
+    if not value:
+        return
+    _, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(kind, (value, hard))
+
+
+def _run_child(req):
+    """runs in the forked child, never returns"""
+    code = 1
+    try:
+        os.setpgrp()
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGXCPU, signal.SIGXFSZ):
+            signal.signal(sig, signal.SIG_DFL)
+
+        out_fd = os.open(req['stdout'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        err_fd = os.open(req['stderr'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        os.close(out_fd)
+        os.close(err_fd)
+        in_fd = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(in_fd, 0)
+        os.close(in_fd)
+
+        os.chdir(req['cwd'])
+        _set_limit(resource.RLIMIT_CPU, req.get('cpu_limit'))
+        _set_limit(resource.RLIMIT_AS, req.get('memory_limit'))
+        _set_limit(resource.RLIMIT_FSIZE, req.get('file_size_limit'))
+
+        sys.argv = [req['script']]
+        sys.path[0] = req['cwd']
+        try:
+            runpy.run_path(req['script'], run_name='__main__')
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except MemoryError as e:
+            _print_exception(e, req['script'])
+            code = 137
+        except BaseException as e:
+            _print_exception(e, req['script'])
+            code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _print_exception(e, script):
+    """traceback starting at the script, as if it was run by `python script`"""
+    tb = e.__traceback__
+    while tb is not None and tb.tb_frame.f_code.co_filename != script:
+        tb = tb.tb_next
+    traceback.print_exception(type(e), e, tb or e.__traceback__)
+
+
+def _read_limited(path, limit):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(limit + 1 if limit else -1)
+    except OSError:
+        return '', False
+    truncated = bool(limit) and len(data) > limit
+    if truncated:
+        data = data[:limit]
+    return data.decode('utf-8', errors='replace'), truncated
+
+
+def _execute(req):
+    start = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        _run_child(req)
+
+    deadline = start + req['timeout']
+    status, rusage, timeout = None, None, False
+    sleep = 0.001
+    while True:
+        wpid, wstatus, wrusage = os.wait4(pid, os.WNOHANG)
+        if wpid:
+            status, rusage = wstatus, wrusage
+            break
+        if time.monotonic() >= deadline:
+            timeout = True
+            _kill_group(pid)
+            _, status, rusage = os.wait4(pid, 0)
+            break
+        time.sleep(sleep)
+        sleep = min(sleep * 2, 0.02)
+    # processes started in the background by the code do not outlive the execution
+    _kill_group(pid)
+
+    returncode = os.waitstatus_to_exitcode(status)
+    stdout, stdout_truncated = _read_limited(req['stdout'], req.get('output_limit'))
+    stderr, stderr_truncated = _read_limited(req['stderr'], req.get('output_limit'))
+
+    violation = None
+    if timeout:
+        violation = VIOLATION_TIMEOUT
+    elif returncode == -signal.SIGXCPU:
+        violation = VIOLATION_CPU
+    elif returncode == -signal.SIGXFSZ:
+        violation = VIOLATION_FILE_SIZE
+    elif returncode == 137 and 'MemoryError' in stderr:
+        violation = VIOLATION_MEMORY
+    elif returncode == -signal.SIGKILL:
+        violation = VIOLATION_KILLED
+    elif stdout_truncated or stderr_truncated:
+        violation = VIOLATION_OUTPUT
+
+    if violation and violation != VIOLATION_OUTPUT:
+        stderr += f'\nExecution stopped: {violation} limit exceeded'
+        returncode = returncode or 1
+    if stdout_truncated or stderr_truncated:
+        stderr += f'\nOutput truncated to {req.get("output_limit")} bytes'
+
+    return {
+        'returncode': returncode,
+        'stdout': stdout,
+        'stderr': stderr,
+        'violation': violation,
+        'timeout': timeout,
+        'elapsed': time.monotonic() - start,
+        'cpu_time': rusage.ru_utime + rusage.ru_stime if rusage else 0,
+        'max_rss': rusage.ru_maxrss * 1024 if rusage else 0,
+    }
+
+
+def _kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def main():
+    # stdout is the protocol channel, anything printed by the worker itself goes to stderr
+    channel = os.fdopen(os.dup(1), 'w', buffering=1)
+    os.dup2(2, 1)
+
+    _preload([one for one in (sys.argv[1] if len(sys.argv) > 1 else '').split(',') if one])
+    channel.write(json.dumps({'ready': True, 'pid': os.getpid()}) + '\n')
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            res = _execute(json.loads(line))
+        except Exception as e:
+            res = {'returncode': 1, 'stdout': '', 'stderr': f'code interpreter worker error: {e}',
+                   'violation': None, 'timeout': False, 'error': True}
+        channel.write(json.dumps(res) + '\n')
+
+
+if __name__ == '__main__':
+    main()
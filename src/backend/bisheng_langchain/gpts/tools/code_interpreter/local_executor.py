@@ -5,6 +5,7 @@ import shutil
 import subprocess
 import sys
 import tempfile
+import time
 import uuid
 from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from hashlib import md5
@@ -16,6 +17,7 @@ import matplotlib
 from loguru import logger
 
 from bisheng_langchain.gpts.tools.code_interpreter.base_executor import BaseExecutor
+from bisheng_langchain.gpts.tools.code_interpreter.worker_pool import get_interpreter_pool, InterpreterWorkerError
 
 CODE_BLOCK_PATTERN = r"```(\w*)\n(.*?)\n```"
 DEFAULT_TIMEOUT = 600
@@ -38,6 +40,9 @@ print() any output and results so you can capture the output."""  # noqa: T201
 
 
 class LocalExecutor(BaseExecutor):
+    # the font cache is rebuilt once per process instead of on every execution
+    _font_cache_cleared = False
+
     def __init__(self, minio: dict = None, **kwargs):
         super().__init__(minio, **kwargs)
         self.minio = minio
@@ -67,11 +72,11 @@ class LocalExecutor(BaseExecutor):
         """判断python代码中是否导入了matplotlib库，如果有则插入设置字体的代码"""
 
         split_code = code.split('\n')
-        cache_file = matplotlib.get_cachedir()
-        font_cache = glob.glob(f'{cache_file}/fontlist*')
-
-        for cache in font_cache:
-            os.remove(cache)
+        if not LocalExecutor._font_cache_cleared:
+            LocalExecutor._font_cache_cleared = True
+            cache_file = matplotlib.get_cachedir()
+            for cache in glob.glob(f'{cache_file}/fontlist*'):
+                os.remove(cache)
 
         # todo: 如果生成的代码中已经有了设置字体的代码，可能会导致该段代码失效
         if 'matplotlib' in code:
@@ -138,6 +143,23 @@ class LocalExecutor(BaseExecutor):
                       work_dir: Optional[str] = None,
                       lang: Optional[str] = 'python',
                       file_path: Optional[str] = None):
+        if lang.startswith('python') and file_path is not None:
+            pool = get_interpreter_pool()
+            if pool is not None:
+                start = time.monotonic()
+                try:
+                    res = pool.execute(script=str(Path(file_path).absolute()), cwd=work_dir, timeout=timeout)
+                except InterpreterWorkerError as e:
+                    logger.error(f'code interpreter pool error: {e}')
+                    return 1, str(e), ""
+                if res is not None:
+                    if res.get('timeout'):
+                        return 1, TIMEOUT_MSG, ""
+                    return cls._format_result(res['returncode'], res['stdout'], res['stderr'], filename, work_dir,
+                                              file_path)
+                # every warm worker is busy, run in a cold subprocess with what is left of the timeout
+                timeout = max(timeout - (time.monotonic() - start), 0.1)
+
         cmd = [
             sys.executable if lang.startswith('python') else cls._cmd(lang),
             f'.\\{filename}' if WIN32 else filename,
@@ -163,8 +185,13 @@ class LocalExecutor(BaseExecutor):
                     result = future.result(timeout=timeout)
                 except TimeoutError:
                     return 1, TIMEOUT_MSG, ""
-        if result.returncode:
-            logs = result.stderr
+        return cls._format_result(result.returncode, result.stdout, result.stderr, filename, work_dir, file_path)
+
+    @staticmethod
+    def _format_result(returncode: int, stdout: str, stderr: str, filename: str, work_dir: str,
+                       file_path: Optional[str]) -> Tuple[int, str, str]:
+        if returncode:
+            logs = stderr
             if file_path is not None:
                 abs_path = str(Path(file_path).absolute())
                 logs = logs.replace(str(abs_path), '').replace(filename, '')
@@ -172,8 +199,8 @@ class LocalExecutor(BaseExecutor):
                 abs_path = str(Path(work_dir).absolute()) + PATH_SEPARATOR
                 logs = logs.replace(str(abs_path), '')
         else:
-            logs = result.stdout
-        return result.returncode, logs, ""
+            logs = stdout
+        return returncode, logs, ""
 
     @classmethod
     def execute_code(
@@ -0,0 +1,294 @@
+"""Pool of warm python interpreters for the local code interpreter.
+
+Every worker preloads the common libraries once and forks a fresh child per execution, see
+interpreter_worker.py. A worker is replaced after `max_runs` executions or after an execution
+broke a limit, the replacement is started in the background so the next call finds a warm one.
+
+Configured by environment variables:
+- CODE_INTERPRETER_POOL_SIZE: number of workers, 0 disables the pool (default 2)
+- CODE_INTERPRETER_MAX_RUNS: executions served by one worker (default 50)
+- CODE_INTERPRETER_SLOT_WAIT: seconds an execution waits for a free worker before it runs in a cold
+  subprocess instead, the wait counts against its timeout (default 1)
+- CODE_INTERPRETER_PRELOAD: comma separated modules imported by the workers
+- CODE_INTERPRETER_CPU_LIMIT: cpu seconds of one execution, 0 means the execution timeout (default 0)
+- CODE_INTERPRETER_MEMORY_LIMIT: address space of one execution in MB, 0 is unlimited (default 4096)
+- CODE_INTERPRETER_FILE_SIZE_LIMIT: size of one written file in MB, 0 is unlimited (default 512)
+- CODE_INTERPRETER_OUTPUT_LIMIT: stdout/stderr kept of one execution in KB (default 1024)
+"""
+import atexit
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'interpreter_worker.py')
+DEFAULT_PRELOAD = 'numpy,pandas,matplotlib,matplotlib.pyplot'
+# extra seconds the pool waits for a worker answer after the execution timeout
+WORKER_GRACE_SECONDS = 30
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class InterpreterWorkerError(Exception):
+    """The worker process died or answered garbage"""
+
+
+class InterpreterWorker:
+    """One warm interpreter process, serves one execution at a time"""
+
+    def __init__(self, preload: List[str]):
+        self.runs = 0
+        self.started_at = time.monotonic()
+        self.proc = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, ','.join(preload)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+        ready = self.proc.stdout.readline()
+        if not ready:
+            self.close()
+            raise InterpreterWorkerError('code interpreter worker exited during startup')
+        self.pid = json.loads(ready).get('pid')
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def execute(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        # the worker enforces the timeout itself, the watchdog only catches a stuck worker
+        watchdog = threading.Timer(req['timeout'] + WORKER_GRACE_SECONDS, self.proc.kill)
+        watchdog.start()
+        try:
+            self.proc.stdin.write(json.dumps(req) + '\n')
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+        except (BrokenPipeError, OSError) as e:
+            raise InterpreterWorkerError(f'code interpreter worker is gone: {e}')
+        finally:
+            watchdog.cancel()
+        if not line:
+            raise InterpreterWorkerError('code interpreter worker exited during execution')
+        self.runs += 1
+        return json.loads(line)
+
+    def close(self):
+        if self.alive():
+            self.proc.kill()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+
+
+class InterpreterPool:
+    """Bounded pool of warm interpreter workers"""
+
+    def __init__(self, size: int, max_runs: int = 50, preload: Optional[List[str]] = None,
+                 cpu_limit: int = 0, memory_limit: int = 0, file_size_limit: int = 0, output_limit: int = 0,
+                 slot_wait: float = 1):
+        self.size = size
+        self.max_runs = max_runs
+        self.slot_wait = slot_wait
+        self.preload = preload or []
+        self.cpu_limit = cpu_limit
+        self.memory_limit = memory_limit
+        self.file_size_limit = file_size_limit
+        self.output_limit = output_limit
+
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle: List[InterpreterWorker] = []
+        self._busy = 0
+        self._closed = False
+
+        # metrics
+        self._runs = 0
+        self._cold_starts = 0
+        self._overflows = 0
+        self._workers_started = 0
+        self._recycled = 0
+        self._violations = Counter()
+        self._wait_time = 0.0
+        self._exec_time = 0.0
+
+        self._warm_up(size)
+
+    def _start_worker(self) -> InterpreterWorker:
+        worker = InterpreterWorker(self.preload)
+        with self._lock:
+            self._workers_started += 1
+        return worker
+
+    def _warm_up(self, num: int):
+        """start workers in the background until the pool is full"""
+
+        def _target():
+            for _ in range(num):
+                with self._lock:
+                    if self._closed or len(self._idle) + self._busy >= self.size:
+                        return
+                try:
+                    worker = self._start_worker()
+                except Exception as e:
+                    logger.error(f'start code interpreter worker error: {e}')
+                    return
+                with self._lock:
+                    if self._closed or len(self._idle) + self._busy >= self.size:
+                        worker.close()
+                        return
+                    self._idle.append(worker)
+
+        threading.Thread(target=_target, daemon=True, name='code-interpreter-warmup').start()
+
+    def execute(self, script: str, cwd: str, timeout: int) -> Optional[Dict[str, Any]]:
+        """
+        run a python script in a warm worker, returns returncode/stdout/stderr/violation.
+        returns None when every worker stayed busy for slot_wait seconds, the caller runs the script itself
+        """
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=min(self.slot_wait, timeout)):
+            with self._lock:
+                self._overflows += 1
+            return None
+        wait_time = time.monotonic() - start
+
+        worker = None
+        res = None
+        log_dir = tempfile.mkdtemp(prefix='code_interpreter_')
+        try:
+            with self._lock:
+                self._busy += 1
+                while self._idle and worker is None:
+                    worker = self._idle.pop()
+                    if not worker.alive():
+                        worker.close()
+                        worker = None
+            if worker is None:
+                with self._lock:
+                    self._cold_starts += 1
+                worker = self._start_worker()
+
+            res = worker.execute({
+                'script': script,
+                'cwd': cwd,
+                # the wait for the slot is part of the timeout
+                'timeout': max(timeout - wait_time, 0.1),
+                'stdout': os.path.join(log_dir, 'stdout'),
+                'stderr': os.path.join(log_dir, 'stderr'),
+                'cpu_limit': self.cpu_limit or timeout,
+                'memory_limit': self.memory_limit,
+                'file_size_limit': self.file_size_limit,
+                'output_limit': self.output_limit,
+            })
+            return res
+        except InterpreterWorkerError:
+            if worker:
+                worker.close()
+                worker = None
+            self._warm_up(1)
+            raise
+        finally:
+            shutil.rmtree(log_dir, ignore_errors=True)
+            self._release(worker, res, wait_time, time.monotonic() - start - wait_time)
+
+    def _release(self, worker: Optional[InterpreterWorker], res: Optional[Dict], wait_time: float,
+                 exec_time: float):
+        violation = res.get('violation') if res else None
+        # truncated output does not affect the worker, every other violation replaces it
+        broken = bool(violation) and violation != 'output'
+        recycle = worker is not None and (broken or worker.runs >= self.max_runs or not worker.alive())
+        with self._lock:
+            self._busy -= 1
+            self._runs += 1
+            self._wait_time += wait_time
+            self._exec_time += exec_time
+            if violation:
+                self._violations[violation] += 1
+            if recycle:
+                self._recycled += 1
+            elif worker is not None:
+                if self._closed:
+                    recycle = True
+                else:
+                    self._idle.append(worker)
+        if recycle:
+            worker.close()
+            self._warm_up(1)
+        self._slots.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            runs = self._runs or 1
+            return {
+                'size': self.size,
+                'idle': len(self._idle),
+                'busy': self._busy,
+                'runs': self._runs,
+                'cold_starts': self._cold_starts,
+                'overflows': self._overflows,
+                'workers_started': self._workers_started,
+                'recycled': self._recycled,
+                'violations': dict(self._violations),
+                'avg_wait_time': round(self._wait_time / runs, 4),
+                'avg_exec_time': round(self._exec_time / runs, 4),
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+
+_pool: Optional[InterpreterPool] = None
+_pool_lock = threading.Lock()
+
+
+def pool_supported() -> bool:
+    return hasattr(os, 'fork') and sys.platform != 'win32'
+
+
+def get_interpreter_pool() -> Optional[InterpreterPool]:
+    """process wide pool, None when it is disabled or not supported on this platform"""
+    global _pool
+    if _pool is not None:
+        return _pool
+    size = _env_int('CODE_INTERPRETER_POOL_SIZE', 2)
+    if size <= 0 or not pool_supported():
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = InterpreterPool(
+                size=size,
+                max_runs=_env_int('CODE_INTERPRETER_MAX_RUNS', 50),
+                preload=[one.strip() for one in os.getenv('CODE_INTERPRETER_PRELOAD', DEFAULT_PRELOAD).split(',')
+                         if one.strip()],
+                cpu_limit=_env_int('CODE_INTERPRETER_CPU_LIMIT', 0),
+                memory_limit=_env_int('CODE_INTERPRETER_MEMORY_LIMIT', 4096) * 1024 * 1024,
+                file_size_limit=_env_int('CODE_INTERPRETER_FILE_SIZE_LIMIT', 512) * 1024 * 1024,
+                output_limit=_env_int('CODE_INTERPRETER_OUTPUT_LIMIT', 1024) * 1024,
+                slot_wait=_env_int('CODE_INTERPRETER_SLOT_WAIT', 1),
+            )
+            atexit.register(_pool.close)
+    return _pool
+
+
+def get_interpreter_pool_metrics() -> Dict[str, Any]:
+    if _pool is None:
+        return {'enabled': False}
+    return {'enabled': True, **_pool.metrics()}
@@ -15,6 +15,7 @@ class ExecConfig(BaseModel):
     retry_temperature: float = Field(default=1, description='重试时的模型温度')
     file_content_length: int = Field(default=5000, description='拆分子任务时读取文件内容的字符数，超过后会截断')
     max_file_content_num: int = Field(default=3, description='拆分子任务时读取的中间过程文件数量，按时间倒序')
+    max_parallel_tasks: int = Field(default=4, description='同时执行的一级任务数量上限，没有依赖关系的任务会并行执行，1为串行')
 
 
 CallUserInputToolName = "call_user_input"
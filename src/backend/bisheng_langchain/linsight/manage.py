@@ -1,5 +1,6 @@
 import asyncio
 import json
+import logging
 import traceback
 from asyncio.queues import Queue
 from functools import cached_property
@@ -16,6 +17,8 @@ from bisheng_langchain.linsight.react_task import ReactTask
 from bisheng_langchain.linsight.task import Task
 from bisheng_langchain.linsight.utils import generate_uuid_str
 
+logger = logging.getLogger(__name__)
+
 
 class TaskManage(BaseModel):
     """
@@ -34,10 +37,12 @@ class TaskManage(BaseModel):
     aqueue: Optional[Queue] = Field(default=None, description='Asynchronous queue for task processing')
     task_mode: str = Field(default=TaskMode.FUNCTION.value,
                            description='Mode of the task execution, can be FUNCTION or REACT')
+    max_parallel_tasks: int = Field(default=1, description='Maximum first-level tasks executed at the same time')
 
     @model_validator(mode="after")
     def validate_tasks(self) -> "TaskManage":
-        self.aqueue = Queue(maxsize=50)
+        # unbounded: parallel tasks put events without waiting, the consumer drains them as they arrive
+        self.aqueue = Queue()
         self.tool_map = {tool.name: tool for tool in self.tools}
         return self
 
@@ -82,6 +87,7 @@ class TaskManage(BaseModel):
                 one.children = child_map[one.id]
 
         self.tasks = res
+        self.max_parallel_tasks = max(exec_config.max_parallel_tasks, 1)
         self.task_map = {}
         self.task_step_map = {}
         for task in self.tasks:
@@ -183,8 +189,8 @@ class TaskManage(BaseModel):
     @classmethod
     def completion_task_tree_info(cls, original_task: list[dict]) -> list[dict]:
         """
-        目前只支持一级任务串行！！！
         将模型生成的任务列表转换为完整的任务树信息，补全下游节点的信息
+        一级任务按input里的依赖关系调度，没有依赖关系的任务会并行执行
         """
         task_map = {}
         task_step_map = {}
@@ -277,21 +283,91 @@ class TaskManage(BaseModel):
             task.answer.append(str(e)[:-100])
             raise e
 
-    async def ainvoke_task(self) -> AsyncIterator[BaseEvent]:
+    def get_task_dependencies(self) -> dict[str, list[str]]:
+        """ task id: ids of the first-level tasks whose output it needs """
+        res = {}
         for task in self.tasks:
-            async_task = asyncio.create_task(self.catch_task_exception(task))
-            while not async_task.done():
-                while not self.aqueue.empty():
-                    res = await self.aqueue.get()
-                    yield res
-                await asyncio.sleep(0.1)
-            while not self.aqueue.empty():
-                res = await self.aqueue.get()
-                yield res
-            if task_exception := async_task.exception():
-                raise task_exception
-            if task.status == TaskStatus.FAILED.value:
-                raise Exception(f"Task {task.step_id} failed with error: {task.get_finally_answer()}")
+            depends = []
+            for key in task.input or []:
+                if key == "query" or key not in self.task_step_map:
+                    continue
+                depend_task = self.task_step_map[key]
+                if depend_task.id != task.id and depend_task.id not in depends:
+                    depends.append(depend_task.id)
+            res[task.id] = depends
+        return res
+
+    @staticmethod
+    def _ready_tasks(pending: list[Task], finished: set[str], dependencies: dict[str, list[str]],
+                     running_num: int, limit: int) -> list[Task]:
+        """ tasks whose dependencies are finished, in plan order """
+        res = [one for one in pending if all(d in finished for d in dependencies[one.id])][:limit]
+        if not res and limit > 0 and pending and not running_num:
+            # the plan has a dependency cycle, run the first pending task to keep going
+            logger.warning(f"task dependency cycle found, run task {pending[0].step_id} in plan order")
+            res = pending[:1]
+        return res
+
+    async def ainvoke_task(self) -> AsyncIterator[BaseEvent]:
+        """
+        Run the first-level tasks by their dependency DAG.
+        A task starts when all the steps in its input are finished, at most max_parallel_tasks run at the same time.
+        Events of one task keep their order. When a task fails, the running tasks are cancelled and the error is raised.
+        """
+        dependencies = self.get_task_dependencies()
+        pending = list(self.tasks)
+        finished = set()
+        running: dict[asyncio.Task, Task] = {}
+        getter: Optional[asyncio.Task] = None
+        try:
+            while True:
+                if getter is not None and getter.done():
+                    yield getter.result()
+                    getter = None
+                ready = self._ready_tasks(pending, finished, dependencies, len(running),
+                                          self.max_parallel_tasks - len(running))
+                for task in ready:
+                    pending.remove(task)
+                    running[asyncio.create_task(self.catch_task_exception(task))] = task
+                if not running and self.aqueue.empty():
+                    break
+
+                if getter is None:
+                    getter = asyncio.create_task(self.aqueue.get())
+                done, _ = await asyncio.wait([getter, *running], return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield getter.result()
+                    getter = None
+
+                for async_task in done:
+                    if async_task is getter or async_task not in running:
+                        continue
+                    task = running.pop(async_task)
+                    task_exception = async_task.exception()
+                    if task_exception is None and task.status == TaskStatus.FAILED.value:
+                        task_exception = Exception(f"Task {task.step_id} failed with error: {task.get_finally_answer()}")
+                    if task_exception:
+                        # events already sent by the failed task and the others are delivered before the error
+                        await self._cancel_running(running)
+                        running = {}
+                        if getter is not None and getter.done():
+                            yield getter.result()
+                            getter = None
+                        while not self.aqueue.empty():
+                            yield self.aqueue.get_nowait()
+                        raise task_exception
+                    finished.add(task.id)
+        finally:
+            if getter is not None:
+                getter.cancel()
+            await self._cancel_running(running)
+
+    @staticmethod
+    async def _cancel_running(running: dict) -> None:
+        for async_task in running:
+            async_task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
 
     async def continue_task(self, task_id: str, user_input: str) -> None:
         """
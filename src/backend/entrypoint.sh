@@ -31,6 +31,9 @@ start_default(){
 
 if [ "$start_mode" = "api" ]; then
     echo "Starting API server..."
+    # 各worker的请求指标快照目录，/metrics 汇总所有worker，启动前清空上次运行的快照
+    export BISHENG_METRICS_DIR=${BISHENG_METRICS_DIR:-/tmp/bisheng_metrics}
+    rm -rf "$BISHENG_METRICS_DIR"
     uvicorn bisheng.main:app --host 0.0.0.0 --port 7860 --no-access-log --workers 8
 elif [ "$start_mode" = "knowledge" ]; then
     echo "Starting Knowledge Celery worker..."
@@ -0,0 +1,52 @@
+"""Startup benchmark of the component type registry.
+
+Every measure runs in a fresh interpreter, like a new API or celery worker process:
+import of bisheng.interface.types, first get_all_types_dict() without the file cache (cold) and with
+the file cache written by the cold run (warm), then a second call in the same process.
+
+    python test/component_types_benchmark.py --rounds 3
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+MEASURE = '''
+import json, time
+start = time.perf_counter()
+from bisheng.interface import types
+imported = time.perf_counter()
+all_types = types.get_all_types_dict()
+first = time.perf_counter()
+types.get_all_types_dict()
+second = time.perf_counter()
+print(json.dumps({"import": imported - start, "first": first - imported, "second": second - first,
+                  "categories": len(all_types)}))
+'''
+
+
+def measure() -> dict:
+    out = subprocess.run([sys.executable, '-c', MEASURE], capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def clear_cache():
+    subprocess.run([sys.executable, '-c', 'from bisheng.interface.types import component_type_registry as r;'
+                                          'p = r._cache_path(); p and p.unlink(missing_ok=True)'], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    for _ in range(args.rounds):
+        clear_cache()
+        cold = measure()
+        warm = measure()
+        print(f'categories={cold["categories"]} import={cold["import"]:.2f}s '
+              f'cold_first={cold["first"]:.2f}s warm_first={warm["first"]:.2f}s second_call={warm["second"]:.4f}s')
+
+
+if __name__ == '__main__':
+    main()
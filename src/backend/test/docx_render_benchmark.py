@@ -0,0 +1,66 @@
+"""Benchmark of DocxTemplateRender on a large template.
+
+Builds a template of `--pages` pages, 20 paragraphs and one 3x3 table per page. Every fifth paragraph
+holds a placeholder, every third of them split across runs the way Word stores edited text, and
+`--variables` variables are rendered into it.
+
+    python test/docx_render_benchmark.py --pages 200 --variables 100
+"""
+import argparse
+import io
+import time
+
+from docx import Document
+
+from bisheng.utils.docx_temp import DocxTemplateRender
+
+
+def build_template(pages: int, variables: int) -> bytes:
+    doc = Document()
+    index = 0
+    for page in range(pages):
+        for i in range(20):
+            p = doc.add_paragraph()
+            p.add_run(f'Page {page} paragraph {i}, regulatory text that stays the same. ')
+            if i % 5 == 0:
+                name = f'var_{index % variables}'
+                index += 1
+                if index % 3 == 0:
+                    for text in ('{{', name, '}}'):
+                        p.add_run(text)
+                else:
+                    p.add_run('{{' + name + '}}')
+                p.add_run(' closing words.')
+        table = doc.add_table(rows=3, cols=3)
+        for r in range(3):
+            for c in range(3):
+                table.cell(r, c).text = f'cell {r}-{c}'
+        table.cell(1, 1).text = '{{var_' + str(page % variables) + '}}'
+        doc.add_page_break()
+    content = io.BytesIO()
+    doc.save(content)
+    return content.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--variables', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    template = build_template(args.pages, args.variables)
+    template_def = [['{{var_' + str(i) + '}}', f'value of variable {i}'] for i in range(args.variables)]
+    costs = []
+    for _ in range(args.rounds):
+        render = DocxTemplateRender(file_content=io.BytesIO(template))
+        start = time.perf_counter()
+        doc = render.render(template_def)
+        costs.append(time.perf_counter() - start)
+    left = sum('{{' in p.text for p in doc.paragraphs)
+    print(f'pages={args.pages} variables={args.variables} paragraphs={len(doc.paragraphs)} '
+          f'tables={len(doc.tables)} unreplaced={left} best={min(costs):.2f}s avg={sum(costs) / len(costs):.2f}s')
+
+
+if __name__ == '__main__':
+    main()
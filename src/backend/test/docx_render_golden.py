@@ -0,0 +1,169 @@
+"""Golden file check of DocxTemplateRender.
+
+Every case builds a template with python-docx, renders it and compares a snapshot of the document body
+(paragraph texts, table cell texts and the number of pictures of each block) with
+test/docx_render_golden.json, which holds the output of the renderer before the placeholder index.
+The only difference is the picture of `{{chart}}` in the table of the resources case, the former
+renderer inserted it into the cell and then overwrote it with the cell text.
+
+    python test/docx_render_golden.py            # compare
+    python test/docx_render_golden.py --update   # rewrite the golden file
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import tempfile
+
+from docx import Document
+from docx.oxml.ns import qn
+
+from bisheng.utils.docx_temp import DocxTemplateRender
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'docx_render_golden.json')
+PNG = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==')
+
+
+def paragraph(doc, *runs):
+    p = doc.add_paragraph()
+    for text in runs:
+        p.add_run(text)
+    return p
+
+
+def table(doc, rows):
+    t = doc.add_table(rows=len(rows), cols=len(rows[0]))
+    for i, row in enumerate(rows):
+        for j, runs in enumerate(row):
+            cell = t.cell(i, j)
+            for text in ([runs] if isinstance(runs, str) else runs):
+                cell.paragraphs[0].add_run(text)
+    return t
+
+
+def case_single_run(doc):
+    paragraph(doc, 'Title: {{title}}')
+    paragraph(doc, 'Twice {{name}} and {{name}} again, then {{title}}')
+    paragraph(doc, 'no placeholder here')
+    return [['{{title}}', 'Quarterly report'], ['{{name}}', 'bisheng']], None
+
+
+def case_split_runs(doc):
+    paragraph(doc, 'Split in two {{na', 'me}} end')
+    paragraph(doc, 'Split in three {{', 'name', '}} end')
+    paragraph(doc, 'Split in five {{', 'na', 'm', 'e', '}} end')
+    paragraph(doc, '{{', 'title', '}}', ' and ', '{{name}}')
+    return [['{{name}}', 'VALUE'], ['{{title}}', 'T']], None
+
+
+def case_tables(doc):
+    paragraph(doc, 'before table')
+    table(doc, [['Name', '{{name}}'], [['{{ti', 'tle}}'], 'plain'], ['{{name}} / {{title}}', '']])
+    paragraph(doc, 'after table {{title}}')
+    return [['{{name}}', 'cell value'], ['{{title}}', 'Report']], None
+
+
+def case_merged_cells(doc):
+    t = table(doc, [['{{name}} merged', ''], ['a', 'b']])
+    t.cell(0, 0).merge(t.cell(0, 1))
+    paragraph(doc, 'body {{name}}')
+    return [['{{name}}', 'M']], None
+
+
+def case_chained_values(doc):
+    paragraph(doc, 'outer {{a}} done')
+    return [['{{a}}', 'x {{b}} y'], ['{{b}}', 'inner']], None
+
+
+def case_resources(doc, image_path):
+    paragraph(doc, 'Figure: {{chart}} after figure')
+    paragraph(doc, 'Data {{data}} tail text')
+    paragraph(doc, 'Markdown {{md}}')
+    table(doc, [['label', '{{chart}}'], ['cell table', '{{data}}']])
+    variables = [['{{chart}}', '__RESOURCE_0001__'], ['{{data}}', 'see __RESOURCE_0002__'],
+                 ['{{md}}', '__RESOURCE_0003__']]
+    resources = {
+        'images': [{'placeholder': '__RESOURCE_0001__', 'local_path': image_path, 'alt_text': 'chart',
+                    'type': 'downloaded'}],
+        'excel_files': [],
+        'csv_files': [{'placeholder': '__RESOURCE_0002__', 'file_name': 'data.csv', 'type': 'csv',
+                       'table_data': [['h1', 'h2'], ['1', '2']]}],
+        'markdown_tables': [{'placeholder': '__RESOURCE_0003__', 'content': '| a | b |\n|---|---|\n| 1 | 2 |'}],
+    }
+    return variables, resources
+
+
+def case_missing_image(doc):
+    paragraph(doc, 'Broken {{img}} image')
+    resources = {'images': [{'placeholder': '__RESOURCE_0009__', 'local_path': '/not/found.png', 'alt_text': '',
+                             'type': 'failed'}]}
+    return [['{{img}}', '__RESOURCE_0009__']], resources
+
+
+CASES = {
+    'single_run': case_single_run,
+    'split_runs': case_split_runs,
+    'tables': case_tables,
+    'merged_cells': case_merged_cells,
+    'chained_values': case_chained_values,
+    'resources': case_resources,
+    'missing_image': case_missing_image,
+}
+
+
+def snapshot(doc) -> list:
+    """paragraphs and tables of the body in document order"""
+    blocks = []
+    for child in doc.element.body.iterchildren():
+        pictures = len(child.findall('.//' + qn('w:drawing')))
+        if child.tag == qn('w:p'):
+            text = ''.join(t.text or '' for t in child.iter(qn('w:t')))
+            blocks.append({'p': text, 'pictures': pictures})
+        elif child.tag == qn('w:tbl'):
+            rows = [[''.join(t.text or '' for t in tc.iter(qn('w:t'))) for tc in tr.iterchildren(qn('w:tc'))]
+                    for tr in child.iterchildren(qn('w:tr'))]
+            blocks.append({'table': rows, 'pictures': pictures})
+    return blocks
+
+
+def render_case(name: str, image_path: str) -> list:
+    doc = Document()
+    build = CASES[name]
+    template_def, resources = build(doc, image_path) if name == 'resources' else build(doc)
+    content = io.BytesIO()
+    doc.save(content)
+    content.seek(0)
+    return snapshot(DocxTemplateRender(file_content=content).render(template_def, resources))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--update', action='store_true', help='rewrite the golden file with the current output')
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as f:
+        f.write(PNG)
+    try:
+        results = {name: render_case(name, f.name) for name in CASES}
+    finally:
+        os.remove(f.name)
+
+    if args.update:
+        with open(GOLDEN_FILE, 'w', encoding='utf-8') as out:
+            json.dump(results, out, ensure_ascii=False, indent=2)
+        print(f'golden file updated: {GOLDEN_FILE}')
+        return
+
+    with open(GOLDEN_FILE, encoding='utf-8') as golden_file:
+        golden = json.load(golden_file)
+    failed = [name for name in CASES if results[name] != golden.get(name)]
+    for name in failed:
+        print(f'FAIL {name}\n  expected: {golden.get(name)}\n  actual:   {results[name]}')
+    print(f'{len(CASES) - len(failed)}/{len(CASES)} cases match the golden file')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
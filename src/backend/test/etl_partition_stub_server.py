@@ -0,0 +1,128 @@
+"""Stub of the etl4lm partition service.
+
+Answers every partition request with one Title and one NarrativeText element per page. The page
+numbers start at 0 in every request like the real service, element ids depend on the page content only.
+`--delay` seconds are spent per page and `--fail-rate` of the requests answer 503, to see the sharding,
+the concurrency and the retries.
+
+    python test/etl_partition_stub_server.py --port 8899 --delay 0.05
+    python test/etl_partition_stub_server.py --check big.pdf --port 8899
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_partitions(pdf_data: bytes, start: int = 0, n: int = None):
+    import fitz
+    with fitz.open(stream=pdf_data, filetype='pdf') as doc:
+        end = doc.page_count if n is None else min(doc.page_count, start + n)
+        partitions = []
+        for page in range(start, end):
+            content = doc[page].get_text().strip()
+            for label, text in (('Title', content.split('\n')[0][:30]), ('NarrativeText', content)):
+                partitions.append({
+                    'type': label,
+                    'text': text,
+                    'element_id': hashlib.md5(f'{label}{content}'.encode()).hexdigest(),
+                    'metadata': {'extra_data': {'bboxes': [[0, 0, 100, 20]], 'pages': [page],
+                                                'indexes': [[0, len(text)]], 'types': [label]}},
+                })
+    return partitions, end - start
+
+
+class Handler(BaseHTTPRequestHandler):
+    delay = 0.0
+    fail_rate = 0.0
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    requests = 0
+
+    def do_POST(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = b''
+            while (size := int(self.rfile.readline().strip(), 16)) > 0:
+                body += self.rfile.read(size)
+                self.rfile.readline()
+            self.rfile.readline()
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        cls = type(self)
+        with cls.lock:
+            cls.requests += 1
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            if random.random() < cls.fail_rate:
+                return self._answer(503, {'status_code': 503, 'status_message': 'busy'})
+            payload = json.loads(body)
+            parameters = payload.get('parameters') or {}
+            partitions, pages = fake_partitions(base64.b64decode(payload['b64_data'][0]),
+                                                parameters.get('start') or 0, parameters.get('n'))
+            time.sleep(cls.delay * pages)
+            self._answer(200, {'status_code': 200, 'partitions': partitions})
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def _answer(self, code: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def check(file_path: str, url: str, shard_pages: int, concurrency: int):
+    """partition a pdf with and without sharding, the merged partitions must be the same"""
+    from bisheng_langchain.document_loaders.parsers.partition_client import PartitionClient
+
+    fields = {'mode': 'partition'}
+    start = time.perf_counter()
+    whole = PartitionClient(url, shard_pages=0).partition(file_path, 'check.pdf', fields)
+    whole_cost = time.perf_counter() - start
+    start = time.perf_counter()
+    sharded = PartitionClient(url, shard_pages=shard_pages, max_workers=concurrency,
+                              backoff=0.1).partition(file_path, 'check.pdf', fields)
+    sharded_cost = time.perf_counter() - start
+    assert whole['partitions'] == sharded['partitions'], 'sharded partitions differ'
+    print(f'partitions={len(whole["partitions"])} whole={whole_cost:.2f}s sharded={sharded_cost:.2f}s '
+          f'requests={Handler.requests} max_in_flight={Handler.max_in_flight}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8899)
+    parser.add_argument('--delay', type=float, default=0.05, help='seconds spent per page')
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--check', default='', help='pdf file partitioned against the stub')
+    parser.add_argument('--shard-pages', type=int, default=50)
+    parser.add_argument('-c', '--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    Handler.delay = args.delay
+    Handler.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), Handler)
+    if not args.check:
+        server.serve_forever()
+        return
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        check(args.check, f'http://127.0.0.1:{args.port}', args.shard_pages, args.concurrency)
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
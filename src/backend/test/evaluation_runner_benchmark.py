@@ -0,0 +1,118 @@
+"""Wall time of an evaluation with simulated answer and scoring latency.
+
+The target and the scoring model are replaced by sleeps and redis by a dict, so only the scheduling of
+EvaluationRunner is measured: concurrency 1 with one score batch at the end (the former sequential task)
+against the configured concurrency with pipelined scoring. The last run is cancelled halfway and resumed
+from its checkpoint.
+
+    python test/evaluation_runner_benchmark.py -n 200 --answer-latency 0.05 --score-latency 0.01
+"""
+import argparse
+import asyncio
+import time
+
+from bisheng.api.services.evaluation import EvaluationRunner
+from bisheng.core.config.settings import EvaluationConf
+from bisheng.database.models.evaluation import Evaluation, ExecType
+
+
+class DictRedis(object):
+    def __init__(self):
+        self.data = {}
+
+    def setNx(self, key, value, expiration=3600):
+        return self.data.setdefault(key, value) is value
+
+    def set(self, key, value, expiration=3600):
+        self.data[key] = value
+
+    def hset(self, name, key=None, value=None, expiration=3600):
+        self.data.setdefault(name, {})[key] = value
+
+    def hgetall(self, name):
+        return self.data.get(name, {})
+
+    def expire_key(self, key, expiration):
+        pass
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class SimulatedRunner(EvaluationRunner):
+
+    def __init__(self, evaluation, conf, redis_client, args):
+        super().__init__(evaluation, conf, redis_client)
+        self.args = args
+        self.executed = 0
+
+    def _load_rows(self):
+        return [{'question': f'question {i}', 'ground_truth': f'answer {i}'} for i in range(self.args.n)]
+
+    async def _scoring_llm(self):
+        return None
+
+    async def _prepare_answerer(self):
+        async def answer(question):
+            self.executed += 1
+            await asyncio.sleep(self.args.answer_latency)
+            return question.replace('question', 'answer')
+
+        return lambda: answer
+
+    def _evaluate_batch(self, batch, llm):
+        time.sleep(self.args.score_latency * len(batch))
+        return [{'question': self.rows[i]['question'], 'answer': self.answers[i]} for i in batch]
+
+    def _finish(self):
+        assert len(self.scores) == len(self.rows)
+
+
+async def measure(args, conf: EvaluationConf, redis_client=None, cancel_after=None):
+    # a new target per run, the concurrency limit of a target is created once per process
+    evaluation = Evaluation(id=1, exec_type=ExecType.WORKFLOW.value, unique_id=str(conf), user_id=1, file_path='')
+    runner = SimulatedRunner(evaluation, conf, redis_client or DictRedis(), args)
+    runner.acquire()
+    start = time.perf_counter()
+    task = asyncio.create_task(runner.run())
+    if cancel_after:
+        await asyncio.sleep(cancel_after)
+        task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    return time.perf_counter() - start, runner
+
+
+async def run(args):
+    sequential = EvaluationConf(concurrency=1, score_batch_size=args.n, score_concurrency=1)
+    elapsed, _ = await measure(args, sequential)
+    print(f'sequential: {elapsed:.2f}s')
+
+    conf = EvaluationConf(concurrency=args.concurrency, score_batch_size=args.batch_size)
+    elapsed, _ = await measure(args, conf)
+    print(f'concurrency={conf.concurrency} batch={conf.score_batch_size}: {elapsed:.2f}s')
+
+    redis_client = DictRedis()
+    first, runner = await measure(args, conf, redis_client, cancel_after=elapsed / 2)
+    progress = redis_client.data[runner.progress_key]
+    second, resumed = await measure(args, conf, redis_client)
+    print(f'interrupted at {progress["progress"]}% ({progress["answered"]} answered, '
+          f'{progress["throughput"]} questions/min, eta {progress["eta"]}s), '
+          f'resumed in {second:.2f}s running {resumed.executed} questions')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=200)
+    parser.add_argument('--answer-latency', type=float, default=0.05)
+    parser.add_argument('--score-latency', type=float, default=0.01)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Request overhead of the HTTP middleware.
+
+Calls a FastAPI app in process through ASGI, without a server or network, with no middleware, with
+the former BaseHTTPMiddleware based CustomMiddleware and with RequestMiddleware. Log output is
+disabled so only the middleware work is measured. Prints the mean time per request and the
+time to the first chunk of a streaming response.
+
+    python test/http_middleware_benchmark.py -n 5000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from bisheng.core.logger import trace_id_generator, trace_id_var
+from bisheng.utils import get_request_ip
+from bisheng.utils.http_metrics import RequestMetrics
+from bisheng.utils.http_middleware import RequestMiddleware
+
+
+class LegacyMiddleware(BaseHTTPMiddleware):
+    """ the former CustomMiddleware """
+
+    async def dispatch(self, request: Request, call_next):
+        trace_id = request.headers.get('x-trace-id') or trace_id_generator()
+        ip = get_request_ip(request)
+        path = request.url
+        trace_id_var.set(trace_id)
+        logger.info(f"| {ip} | {request.method} {path}")
+        start_time = time.time()
+        response = await call_next(request)
+        process_time = round(time.time() - start_time, 4)
+        response.headers["X-Process-Time"] = str(process_time)
+        response.headers["X-Trace-ID"] = trace_id
+        logger.info(f"| {ip} | {request.method} {path} | process_time={process_time}s")
+        return response
+
+
+def build_app(middleware: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/items/{item_id}')
+    async def get_item(item_id: int):
+        return {'item_id': item_id}
+
+    @app.get('/stream')
+    async def stream():
+        async def chunks():
+            yield b'first'
+            await asyncio.sleep(0.05)
+            yield b'second'
+
+        return StreamingResponse(chunks())
+
+    if middleware == 'legacy':
+        app.add_middleware(LegacyMiddleware)
+    elif middleware == 'asgi':
+        app.add_middleware(RequestMiddleware, metrics=RequestMetrics())
+    return app
+
+
+async def call(app, path: str):
+    """ one request, returns the seconds until the first body chunk """
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+             'headers': [(b'host', b'bench')], 'client': ('127.0.0.1', 5000), 'server': ('bench', 80)}
+    start = time.perf_counter()
+    first_chunk = None
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal first_chunk
+        if message['type'] == 'http.response.body' and message.get('body') and first_chunk is None:
+            first_chunk = time.perf_counter() - start
+
+    await app(scope, receive, send)
+    return first_chunk
+
+
+async def run(n: int):
+    logger.remove()
+    for middleware in ('none', 'legacy', 'asgi'):
+        app = build_app(middleware)
+        for i in range(200):
+            await call(app, f'/items/{i}')
+        start = time.perf_counter()
+        for i in range(n):
+            await call(app, f'/items/{i}')
+        per_request = (time.perf_counter() - start) / n
+        first_chunk = await call(app, '/stream')
+        print(f'{middleware:>6}: {per_request * 1e6:.1f}us per request, stream first chunk {first_chunk * 1e3:.2f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args.n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Load test of the LangGraph run endpoint.
+
+Sends concurrent /run requests for one workflow and probes a light endpoint at the same time.
+While workflows run in the worker threads the probe latency should stay low, if it grows with
+the number of runs the event loop is blocked.
+
+    python test/langgraph_load_test.py --base-url http://127.0.0.1:7860/api/v1 --workflow-id xxx -c 32 -n 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def _percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _report(name, latencies, errors=0):
+    if not latencies:
+        print(f'{name}: no result, errors={errors}')
+        return
+    print(f'{name}: n={len(latencies)} errors={errors} mean={statistics.mean(latencies) * 1000:.1f}ms '
+          f'p50={_percentile(latencies, 0.5) * 1000:.1f}ms p95={_percentile(latencies, 0.95) * 1000:.1f}ms '
+          f'max={max(latencies) * 1000:.1f}ms')
+
+
+async def run_load(base_url: str, workflow_id: str, concurrency: int, total: int, message: str, cookie: str):
+    headers = {'Cookie': cookie} if cookie else {}
+    run_latencies, probe_latencies = [], []
+    errors = 0
+    done = asyncio.Event()
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=600) as client:
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                i = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    resp = await client.post(f'/langgraph/{workflow_id}/run',
+                                             json={'inputs': {'message': f'{message} {i}'}})
+                    if resp.status_code != 200 or resp.json().get('data', {}).get('status') != 'success':
+                        errors += 1
+                    run_latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    errors += 1
+                    print(f'run {i} error: {e}')
+
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get('/langgraph/node-types')
+                probe_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.1)
+
+        # probe latency without load as the baseline
+        for _ in range(10):
+            start = time.perf_counter()
+            await client.get('/langgraph/node-types')
+            probe_latencies.append(time.perf_counter() - start)
+        _report('probe idle', probe_latencies)
+        probe_latencies.clear()
+
+        start = time.perf_counter()
+        probe_task = asyncio.create_task(probe())
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        done.set()
+        await probe_task
+        cost = time.perf_counter() - start
+
+        _report('run', run_latencies, errors)
+        _report('probe under load', probe_latencies)
+        print(f'throughput={len(run_latencies) / cost:.2f} runs/s, total cost={cost:.1f}s')
+        resp = await client.get('/langgraph/execution-metrics')
+        print(f'execution metrics: {resp.json().get("data")}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base-url', default='http://127.0.0.1:7860/api/v1')
+    parser.add_argument('--workflow-id', required=True)
+    parser.add_argument('-c', '--concurrency', type=int, default=16)
+    parser.add_argument('-n', '--total', type=int, default=100)
+    parser.add_argument('--message', default='hello')
+    parser.add_argument('--cookie', default='', help='access_token_cookie=xxx when auth is required')
+    args = parser.parse_args()
+    asyncio.run(run_load(args.base_url, args.workflow_id, args.concurrency, args.total, args.message, args.cookie))
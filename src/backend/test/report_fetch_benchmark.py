@@ -0,0 +1,74 @@
+"""Benchmark of the report node resource download.
+
+Serves one PNG from a local HTTP server with `--delay` seconds per request and parses a report variable
+with `--images` markdown images, a quarter of them point to an image already used. The resources are
+downloaded one at a time and then with `--concurrency` workers.
+
+    python test/report_fetch_benchmark.py --images 100 --delay 0.2 -c 8
+"""
+import argparse
+import base64
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bisheng.workflow.nodes.report.report import ContentParser, ResourceDownloadManager
+
+PNG = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==')
+
+
+class Handler(BaseHTTPRequestHandler):
+    delay = 0.2
+    lock = threading.Lock()
+    requests = 0
+
+    def do_GET(self):
+        with Handler.lock:
+            Handler.requests += 1
+        time.sleep(Handler.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(PNG)))
+        self.end_headers()
+        self.wfile.write(PNG)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(content: str, max_workers: int):
+    _, resources = ContentParser(None).parse_variable_content('report', content)
+    manager = ResourceDownloadManager(None, max_workers=max_workers, timeout=10, max_size=1024 * 1024)
+    Handler.requests = 0
+    start = time.perf_counter()
+    stats = manager.download_all_resources(resources)
+    cost = time.perf_counter() - start
+    manager.cleanup()
+    return cost, stats, Handler.requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8898)
+    parser.add_argument('--images', type=int, default=100)
+    parser.add_argument('--delay', type=float, default=0.2, help='seconds spent per image request')
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    Handler.delay = args.delay
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    distinct = max(args.images * 3 // 4, 1)
+    content = '\n'.join(f'chart {i}\n![chart](http://127.0.0.1:{args.port}/img/{i % distinct}.png)\n'
+                        for i in range(args.images))
+    try:
+        for workers in (1, args.concurrency):
+            cost, stats, requests = run(content, workers)
+            print(f'workers={workers} images={args.images} ok={stats["images_success"]} '
+                  f'failed={stats["images_failed"]} requests={requests} cost={cost:.2f}s')
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
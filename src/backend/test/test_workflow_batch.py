@@ -0,0 +1,115 @@
+"""Batch items of a node running concurrently against the RedisCallback of the workflow.
+
+The database and redis are replaced by in memory fakes. Items finish in reverse order, the chat
+session must still be created once and the messages saved in item order.
+
+    python -m pytest test/test_workflow_batch.py   or   python test/test_workflow_batch.py
+"""
+import json
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from sqlalchemy.exc import IntegrityError
+
+from bisheng.worker.workflow import redis_callback
+from bisheng.worker.workflow.redis_callback import RedisCallback
+from bisheng.workflow.callback.event import StreamMsgData, StreamMsgOverData
+from bisheng.workflow.nodes.base import BaseNode
+
+ITEMS = 8
+
+
+class FakeSessionDao:
+    """ the chat_id primary key of the session table, get_one is slow to widen the race """
+
+    def __init__(self):
+        self.sessions = {}
+        self.inserts = 0
+        self._lock = threading.Lock()
+
+    def get_one(self, chat_id):
+        time.sleep(0.01)
+        return self.sessions.get(chat_id)
+
+    def insert_one(self, data):
+        with self._lock:
+            self.inserts += 1
+            if data.chat_id in self.sessions:
+                raise IntegrityError('insert', {}, Exception('Duplicate entry for key PRIMARY'))
+            self.sessions[data.chat_id] = data
+        return data
+
+
+class FakeMessageDao:
+    def __init__(self):
+        self.messages = []
+
+    def insert_one(self, message):
+        self.messages.append(message)
+        return SimpleNamespace(id=len(self.messages))
+
+
+class FakeBatchNode(BaseNode):
+    """ streams every item like the llm node, the last items answer first """
+
+    def __init__(self, callback, concurrency: int):
+        self.id = 'batch_node'
+        self.name = 'batch node'
+        self.node_params = {'batch_concurrency': concurrency}
+        self.stop_flag = False
+        self.callback_manager = callback
+
+    def _run_item(self, index: int, one: str) -> str:
+        time.sleep(0.01 * (ITEMS - index))
+        key = f'output_{index}'
+        self.callback_manager.on_stream_msg(StreamMsgData(node_id=self.id, name=self.name, msg=one,
+                                                          unique_id='run', output_key=key))
+        self.callback_manager.on_stream_over(StreamMsgOverData(node_id=self.id, name=self.name, msg=one,
+                                                               unique_id='run', output_key=key))
+        return one
+
+    def _run(self, unique_id: str):
+        items = [f'answer {i}' for i in range(ITEMS)]
+        return self.run_batch(items, self._run_item)
+
+
+def make_callback() -> RedisCallback:
+    callback = RedisCallback.__new__(RedisCallback)
+    callback.workflow_id = 'workflow'
+    callback.chat_id = 'chat'
+    callback.user_id = 1
+    callback.create_session = False
+    callback._session_lock = threading.Lock()
+    callback.source = 'platform'
+    callback.sent = []
+    callback.send_chat_response = lambda chat_response: callback.sent.append(chat_response)
+    return callback
+
+
+def test_batch_callback_creates_one_session_in_item_order():
+    session_dao, message_dao = FakeSessionDao(), FakeMessageDao()
+    callback = make_callback()
+    with mock.patch.object(redis_callback, 'MessageSessionDao', session_dao), \
+            mock.patch.object(redis_callback, 'ChatMessageDao', message_dao), \
+            mock.patch.object(redis_callback, 'FlowDao', SimpleNamespace(get_flow_by_id=lambda _: SimpleNamespace(name='flow'))), \
+            mock.patch.object(redis_callback, 'telemetry_service'), \
+            mock.patch.object(redis_callback, 'settings') as settings:
+        settings.get_minio_conf.return_value = SimpleNamespace(sharepoint='minio')
+        node = FakeBatchNode(callback, concurrency=ITEMS)
+        outputs = node._run('run')
+
+    assert outputs == [f'answer {i}' for i in range(ITEMS)]
+    assert node.callback_manager is callback
+    assert session_dao.inserts == 1 and list(session_dao.sessions) == ['chat']
+    saved = [json.loads(message.message)['msg'] for message in message_dao.messages]
+    assert saved == [f'answer {i}' for i in range(ITEMS)], saved
+    # stream chunks are sent as they come, the first chunk is of the last item
+    chunks = [one.message['output_key'] for one in callback.sent if one.type == 'stream']
+    assert chunks[0] == f'output_{ITEMS - 1}'
+
+
+if __name__ == '__main__':
+    test_batch_callback_creates_one_session_in_item_order()
+    print('ok')
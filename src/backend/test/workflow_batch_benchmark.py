@@ -0,0 +1,79 @@
+"""Benchmark of the batch execution of workflow nodes.
+
+Runs a node with a fake LLM of fixed latency over batches of different sizes, once with
+batch_concurrency=1 (the old sequential behaviour) and once with the given concurrency.
+The concurrent run should take about ceil(n / concurrency) times the latency of one call.
+
+    python test/workflow_batch_benchmark.py --latency 0.2 -c 5 --sizes 1,10,50
+"""
+import argparse
+import threading
+import time
+
+from bisheng.workflow.nodes.base import BaseNode
+
+
+class FakeLLM:
+    """answers after a fixed delay, like a remote model with stable latency"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self._in_flight -= 1
+        return f'answer of {prompt}'
+
+
+class FakeBatchNode(BaseNode):
+    """only the batch part of a node, the graph state and callbacks are not needed"""
+
+    def __init__(self, llm: FakeLLM, concurrency: int):
+        self.id = 'fake_batch_node'
+        self.name = 'fake batch node'
+        self.node_params = {'batch_concurrency': concurrency}
+        self.stop_flag = False
+        self.llm = llm
+
+    def _run(self, unique_id: str):
+        items = self.node_params['batch_variable']
+        outputs = self.run_batch(items, lambda index, one: self.llm.invoke(one))
+        return {f'output_{index}': one for index, one in enumerate(outputs)}
+
+
+def run_once(size: int, concurrency: int, latency: float) -> (float, int):
+    llm = FakeLLM(latency)
+    node = FakeBatchNode(llm, concurrency)
+    node.node_params['batch_variable'] = [f'item_{i}' for i in range(size)]
+    start = time.perf_counter()
+    result = node._run('benchmark')
+    cost = time.perf_counter() - start
+    assert list(result.values()) == [f'answer of item_{i}' for i in range(size)], 'batch output order changed'
+    return cost, llm.max_in_flight
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds of one fake llm call')
+    parser.add_argument('-c', '--concurrency', type=int, default=5)
+    parser.add_argument('--sizes', default='1,10,50')
+    args = parser.parse_args()
+
+    for size in [int(one) for one in args.sizes.split(',') if one]:
+        sequential, _ = run_once(size, 1, args.latency)
+        concurrent, in_flight = run_once(size, args.concurrency, args.latency)
+        print(f'items={size:<4} sequential={sequential:.2f}s concurrent={concurrent:.2f}s '
+              f'max_in_flight={in_flight} speedup={sequential / concurrent:.1f}x')
+
+
+if __name__ == '__main__':
+    main()